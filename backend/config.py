@@ -21,6 +21,31 @@ class Config:
     # 数据库配置 (未来扩展)
     DATABASE_URI = os.getenv('DATABASE_URI', 'sqlite:///study_assistant.db')
 
+    # 请求级截止时间（秒）：/api 路径按最长前缀匹配默认值，
+    # 客户端可通过 X-Request-Timeout 头缩短（不超过 REQUEST_DEADLINE_MAX）
+    # 录音转写的默认值只覆盖解码和语种探测：识别开始后按音频时长延长（ensure_request_deadline，
+    # 上限 REQUEST_DEADLINE_EXTEND_MAX），长录音不会因为路由截止时间返回 504
+    REQUEST_DEADLINE_DEFAULT = float(os.getenv('REQUEST_DEADLINE_DEFAULT', 30))
+    REQUEST_DEADLINE_MAX = float(os.getenv('REQUEST_DEADLINE_MAX', 300))
+    ROUTE_DEADLINES = {
+        '/api/error/upload': 90,
+        '/api/error/redo': 60,
+        '/api/error/redo_text': 50,
+        '/api/error/practice/generate-similar': 120,
+        '/api/error/practice/do_text': 50,
+        '/api/error/practice/do_image': 60,
+        '/api/error/practice/do_batch': 90,
+        '/api/map/generate': 120,
+        '/api/map/upload': 180,
+        '/api/map/generate-from-notes': 180,
+        '/api/note/transcribe': 240,
+        '/api/note/transcribe-note': 300,
+        '/api/note/generate': 90,
+        '/api/note/upload-file': 120,
+        '/api/chat/send': 60,
+        '/api/upload': 60,
+    }
+
 class DevelopmentConfig(Config):
     """开发环境配置"""
     DEBUG = True
@@ -24,8 +24,26 @@ else:
     DB_PATH = os.path.join(os.path.dirname(__file__), 'study_assistant.db')
 
 
+def _request_deadline():
+    """Deadline of the current HTTP request (see services.resilience), or None outside a request."""
+    try:
+        from services.resilience import current_deadline
+    except ImportError:
+        return None
+    return current_deadline()
+
+
 def get_conn():
-    conn = sqlite3.connect(DB_PATH)
+    deadline = _request_deadline()
+    if deadline is None:
+        conn = sqlite3.connect(DB_PATH)
+    else:
+        if deadline.expired():
+            from services.resilience import DeadlineExceeded
+            raise DeadlineExceeded('Request deadline exceeded before database access')
+        # Bound both the busy-wait for locks and statement execution by the request deadline
+        conn = sqlite3.connect(DB_PATH, timeout=max(0.05, min(5.0, deadline.remaining())))
+        conn.set_progress_handler(lambda: 1 if deadline.expired() else 0, 1000)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -192,6 +210,58 @@ def init_db():
     )
     ''')
     conn.commit()
+    
+    # Create chat conversation tables (server-side history + rolling summary)
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS chat_conversation (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT DEFAULT 'default',
+        session_id TEXT NOT NULL,
+        summary TEXT DEFAULT '',
+        summarized_until INTEGER DEFAULT 0,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(user_id, session_id)
+    )
+    ''')
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS chat_message (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        conversation_id INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_chat_message_conv ON chat_message(conversation_id, id)')
+    conn.commit()
+    
+    # Create ai_request_lock table for cross-worker single-flight of AI calls
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS ai_request_lock (
+        lock_key TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        status TEXT DEFAULT 'running',
+        result TEXT,
+        expires_at REAL NOT NULL
+    )
+    ''')
+    conn.commit()
+
+    # Create content_cache table: extraction / OCR / ASR results keyed by content hash
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS content_cache (
+        cache_key TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        value TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        hits INTEGER DEFAULT 0,
+        created_at REAL NOT NULL,
+        last_used_at REAL NOT NULL
+    )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_content_cache_used ON content_cache(last_used_at)')
+    conn.commit()
     conn.close()
 
 
@@ -1426,4 +1496,193 @@ def get_module_usage_daily(user_id=1, start_date=None, days=7):
     rows = cur.fetchall()
     conn.close()
     
-    return [{'date': row[0], 'module': row[1], 'duration_seconds': row[2]} for row in rows]
\ No newline at end of file
+    return [{'date': row[0], 'module': row[1], 'duration_seconds': row[2]} for row in rows]
+
+
+# ========== Chat Conversation Functions ==========
+
+def get_or_create_conversation(user_id, session_id):
+    """Return the conversation row for (user_id, session_id), creating it if needed."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('''
+        INSERT OR IGNORE INTO chat_conversation (user_id, session_id) VALUES (?, ?)
+    ''', (user_id, session_id))
+    conn.commit()
+    cur.execute('SELECT * FROM chat_conversation WHERE user_id=? AND session_id=?', (user_id, session_id))
+    row = cur.fetchone()
+    conn.close()
+    return dict(row)
+
+
+def get_conversation(conversation_id):
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('SELECT * FROM chat_conversation WHERE id=?', (conversation_id,))
+    row = cur.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def add_chat_messages(conversation_id, messages):
+    """Append [{'role', 'content'}, ...] to a conversation."""
+    conn = get_conn()
+    cur = conn.cursor()
+    now = datetime.now().isoformat()
+    cur.executemany('''
+        INSERT INTO chat_message (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)
+    ''', [(conversation_id, m['role'], m['content'], now) for m in messages])
+    cur.execute('UPDATE chat_conversation SET updated_at=? WHERE id=?', (now, conversation_id))
+    conn.commit()
+    conn.close()
+
+
+def list_chat_messages(conversation_id, after_id=0):
+    """Messages with id > after_id, oldest first."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT id, role, content FROM chat_message
+        WHERE conversation_id=? AND id>? ORDER BY id
+    ''', (conversation_id, after_id))
+    rows = cur.fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+def update_conversation_summary(conversation_id, summary, summarized_until):
+    """Store the rolling summary; only moves forward so a slow compaction can't undo a newer one."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('''
+        UPDATE chat_conversation SET summary=?, summarized_until=?, updated_at=?
+        WHERE id=? AND summarized_until<?
+    ''', (summary, summarized_until, datetime.now().isoformat(), conversation_id, summarized_until))
+    conn.commit()
+    conn.close()
+
+
+def delete_conversation(user_id, session_id):
+    """Delete one conversation with its messages."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('SELECT id FROM chat_conversation WHERE user_id=? AND session_id=?', (user_id, session_id))
+    ids = [r['id'] for r in cur.fetchall()]
+    for conv_id in ids:
+        cur.execute('DELETE FROM chat_message WHERE conversation_id=?', (conv_id,))
+        cur.execute('DELETE FROM chat_conversation WHERE id=?', (conv_id,))
+    conn.commit()
+    conn.close()
+    return len(ids)
+
+
+# ========== AI Request Lock Functions ==========
+
+def acquire_request_lock(lock_key, owner, ttl_seconds, replace_done=False):
+    """
+    Try to take the single-flight lock for an AI operation.
+    Returns (state, result): ('acquired', None) when the caller became the leader,
+    ('running', None) while another worker holds it, ('done', result_json) once
+    the leader has published its result.
+    replace_done drops an already published result first, for callers that arrived
+    after that call had finished and must not reuse it.
+    """
+    import time
+    conn = get_conn()
+    cur = conn.cursor()
+    now = time.time()
+    cur.execute('DELETE FROM ai_request_lock WHERE expires_at < ?', (now,))
+    if replace_done:
+        cur.execute("DELETE FROM ai_request_lock WHERE lock_key=? AND status='done'", (lock_key,))
+    cur.execute('''
+        INSERT OR IGNORE INTO ai_request_lock (lock_key, owner, status, result, expires_at)
+        VALUES (?, ?, 'running', NULL, ?)
+    ''', (lock_key, owner, now + ttl_seconds))
+    conn.commit()
+    if cur.rowcount == 1:
+        conn.close()
+        return 'acquired', None
+    cur.execute('SELECT status, result FROM ai_request_lock WHERE lock_key=?', (lock_key,))
+    row = cur.fetchone()
+    conn.close()
+    if not row:
+        return 'running', None
+    return row['status'], row['result']
+
+
+def complete_request_lock(lock_key, owner, result_json, result_ttl_seconds):
+    """Publish the leader's result so waiting workers can reuse it for a short time."""
+    import time
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('''
+        UPDATE ai_request_lock SET status='done', result=?, expires_at=?
+        WHERE lock_key=? AND owner=?
+    ''', (result_json, time.time() + result_ttl_seconds, lock_key, owner))
+    conn.commit()
+    conn.close()
+
+
+def release_request_lock(lock_key, owner):
+    """Drop the lock without a result (leader failed)."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('DELETE FROM ai_request_lock WHERE lock_key=? AND owner=?', (lock_key, owner))
+    conn.commit()
+    conn.close()
+
+
+# ========== Content Cache Functions ==========
+
+def get_content_cache(cache_key):
+    """Return the cached JSON value for cache_key (and mark it recently used), or None."""
+    import time
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('SELECT value FROM content_cache WHERE cache_key=?', (cache_key,))
+    row = cur.fetchone()
+    if row:
+        cur.execute('UPDATE content_cache SET hits=hits+1, last_used_at=? WHERE cache_key=?',
+                    (time.time(), cache_key))
+        conn.commit()
+    conn.close()
+    return row['value'] if row else None
+
+
+def put_content_cache(cache_key, kind, value_json, max_bytes):
+    """Store a value, then evict least recently used entries until the table fits in max_bytes."""
+    import time
+    now = time.time()
+    size = len(value_json.encode('utf-8'))
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('''
+        INSERT OR REPLACE INTO content_cache (cache_key, kind, value, size, hits, created_at, last_used_at)
+        VALUES (?, ?, ?, ?, 0, ?, ?)
+    ''', (cache_key, kind, value_json, size, now, now))
+    cur.execute('SELECT COALESCE(SUM(size), 0) AS total FROM content_cache')
+    excess = cur.fetchone()['total'] - max_bytes
+    evicted = 0
+    if excess > 0:
+        cur.execute('SELECT cache_key, size FROM content_cache ORDER BY last_used_at ASC')
+        victims = []
+        for row in cur.fetchall():
+            if excess <= 0:
+                break
+            victims.append((row['cache_key'],))
+            excess -= row['size']
+        cur.executemany('DELETE FROM content_cache WHERE cache_key=?', victims)
+        evicted = len(victims)
+    conn.commit()
+    conn.close()
+    return evicted
+
+
+def content_cache_usage():
+    """Entry count and total stored bytes of the content cache."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('SELECT COUNT(*) AS entries, COALESCE(SUM(size), 0) AS bytes FROM content_cache')
+    row = cur.fetchone()
+    conn.close()
+    return {'entries': row['entries'], 'bytes': row['bytes']}
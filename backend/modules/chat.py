@@ -1,45 +1,66 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, session
 from services.ai_service import ai_service
+from services.conversation import conversation_store
 
 chat_bp = Blueprint('chat', __name__, url_prefix='/api/chat')
 
 @chat_bp.route('/send', methods=['POST'])
 def send_message():
-    """处理聊天消息"""
+    """处理聊天消息（登录用户的历史保存在服务器端，按 user + session_id 区分）"""
     try:
         data = request.get_json()
-        
+
         if not data or 'message' not in data:
             return jsonify({
                 'success': False,
                 'error': 'Message is required'
             }), 400
-        
+
         user_message = data['message']
-        conversation_history = data.get('history', [])
-        
+        session_id = str(data.get('session_id') or 'default')
+
         if not user_message.strip():
             return jsonify({
                 'success': False,
                 'error': 'Message cannot be empty'
             }), 400
-        
+
+        # 未登录用户都落在 user_id 'default' 上，保存到服务器会互相读到对方的对话：只用客户端带来的历史
+        user_id = session.get('user_id')
+        conversation = None
+        if user_id is not None:
+            conversation = conversation_store.get_or_create(user_id, session_id)
+            # 兼容旧客户端：服务器端还没有记录时，用客户端带来的历史初始化
+            if data.get('history'):
+                conversation_store.seed_history(conversation, data['history'])
+
         # 调用 AI service 获取回复
         try:
-            ai_response = ai_service.chat(user_message, conversation_history)
-            
-            return jsonify({
-                'success': True,
-                'response': ai_response
-            })
-        
+            if conversation is not None:
+                recent_messages, summary = conversation_store.build_context(conversation)
+            else:
+                recent_messages, summary = conversation_store.context_from_history(data.get('history')), ''
+            ai_response = ai_service.chat(user_message, recent_messages, summary=summary)
+
         except Exception as e:
             print(f"Error calling AI service: {e}")
             return jsonify({
                 'success': False,
                 'error': 'Failed to get AI response'
             }), 500
-    
+
+        if conversation is not None:
+            conversation_store.append_turn(conversation, user_message, ai_response)
+            conversation_store.schedule_compaction(conversation['id'])
+
+        return jsonify({
+            'success': True,
+            'response': ai_response,
+            'session_id': session_id,
+            # False 时客户端每次都要带上本地历史
+            'persisted': conversation is not None
+        })
+
     except Exception as e:
         print(f"Error in chat endpoint: {e}")
         return jsonify({
@@ -49,11 +70,22 @@ def send_message():
 
 @chat_bp.route('/clear', methods=['POST'])
 def clear_history():
-    """清除对话历史"""
+    """清除一个会话的对话历史（必须指定 session_id）"""
     try:
+        data = request.get_json(silent=True) or {}
+        session_id = data.get('session_id')
+        if not session_id:
+            return jsonify({
+                'success': False,
+                'error': 'session_id is required'
+            }), 400
+        user_id = session.get('user_id')
+        # 未登录用户的历史只在客户端，服务器上没有可清除的内容
+        cleared = conversation_store.clear(user_id, str(session_id)) if user_id is not None else 0
         return jsonify({
             'success': True,
-            'message': 'Chat history cleared'
+            'message': 'Chat history cleared',
+            'cleared': cleared
         })
     except Exception as e:
         return jsonify({
@@ -22,6 +22,8 @@ import numpy as np
 import db_sqlite
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 from services.ai_service import ai_service
+from services.single_flight import single_flight, make_key
+from services.resilience import DeadlineExceeded, check_deadline, current_deadline, remaining_budget
 import os
 from dotenv import load_dotenv
 load_dotenv()
@@ -49,9 +51,10 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def crop_images_from_image(input_path, output_dir):
+def crop_images_from_image(input_path, output_dir, deadline=None):
     """
     裁剪图片中的图片块，保存到 output_dir，并返回每块图片的路径和坐标
+    deadline 到期时停止裁剪，返回已裁剪的部分
     """
     os.makedirs(output_dir, exist_ok=True)
     
@@ -76,6 +79,9 @@ def crop_images_from_image(input_path, output_dir):
     padding_ratio = 0.2
 
     for count, cnt in enumerate(contours):
+        if deadline is not None and deadline.expired():
+            print(f"[ERROR_BOOK] deadline reached, stopping crop after {len(results)} blocks")
+            break
         x, y, w, h = cv2.boundingRect(cnt)
         area_ratio = (w * h) / img_area
         if area_ratio > 0.01 and 0.3 < w / h < 5:
@@ -196,8 +202,14 @@ def upload_question():
         if not orig_rel_path.startswith("/"):
             orig_rel_path = "/" + orig_rel_path
 
-        # 裁剪图片
-        cropped_results = crop_images_from_image(orig_path, output_dir=UPLOAD_FOLDER)
+        # 裁剪图片（剩余时间只够识别原图时跳过裁剪，裁剪图只是辅助信息）
+        remaining = remaining_budget()
+        if remaining is not None and remaining < float(os.getenv('ERROR_UPLOAD_CROP_MIN_SECONDS', 20)):
+            print(f"[ERROR_BOOK] {remaining:.1f}s left, skipping crop")
+            cropped_results = []
+        else:
+            cropped_results = crop_images_from_image(orig_path, output_dir=UPLOAD_FOLDER,
+                                                     deadline=current_deadline())
 
         cropped_results = sort_bboxes_reading_order(cropped_results, y_tolerance=15)
         # 为每张裁剪图添加索引和路径
@@ -240,7 +252,8 @@ def upload_question():
             user_id = session.get('user_id', 'default')
             parsed['user_id'] = user_id
             
-            # 插入数据到数据库
+            # 插入数据到数据库（客户端已放弃时不再写入剩余题目）
+            check_deadline('saving questions')
             new_id = db_sqlite.insert_error(parsed)
             saved = db_sqlite.get_error_by_id(new_id, user_id)
             if isinstance(saved, dict) and 'success' in saved:
@@ -253,6 +266,13 @@ def upload_question():
             'questions': saved_list
         })
 
+    except DeadlineExceeded as e:
+        print(f"[ERROR_BOOK] upload abandoned: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Request deadline exceeded'
+        }), 504
+
     except Exception as e:
         traceback.print_exc()
         return jsonify({
@@ -400,6 +420,41 @@ def redo_error():
     # 所以 finally 里不再删除
 
 
+def _generate_similar_and_save(error_id, user_id, question_text, count):
+    """生成相似题并写入 practice_record，返回保存后的记录列表"""
+    # ===== 获取学生的 grade 信息 =====
+    grade = None
+    try:
+        error_record = db_sqlite.get_error_by_id(error_id, user_id)
+        if error_record and error_record.get('user_id'):
+            user_settings = db_sqlite.get_user_settings(error_record['user_id'])
+            if user_settings and user_settings.get('success'):
+                grade = user_settings.get('grade')
+                print(f"Found user grade: {grade} for user_id={error_record['user_id']}")
+    except Exception as e:
+        print(f"Failed to fetch user grade: {e}")
+        # Continue without grade (graceful degradation)
+
+    # 使用 AI 服务生成相似题目（传入 grade 信息）
+    similar_list = ai_service.generate_similar_questions(question_text, count, grade=grade)
+
+    # 统一处理 LaTeX，保证前端可渲染
+    for q in similar_list:
+        q['question_text'] = fix_latex_for_frontend(q.get('question_text', ''))
+        q["correct_answer"] = fix_latex_for_frontend(q.get("correct_answer", ''))
+        q['analysis_steps'] = [fix_latex_for_frontend(step) for step in q.get('analysis_steps', [])]
+
+    # ===== 存入数据库 =====
+    saved_list = []
+    for parsed in similar_list:
+        parsed["error_id"] = error_id
+        parsed["user_id"] = user_id
+        new_id = db_sqlite.insert_practice(parsed)
+        saved = db_sqlite.get_practice_by_id(new_id, user_id)
+        saved_list.append(saved)
+    return saved_list
+
+
 # ===== 路由：生成相似练习题 =====
 @error_bp.route('/practice/generate-similar', methods=['POST'])
 def generate_similar_exercises():
@@ -429,38 +484,20 @@ def generate_similar_exercises():
                 "data": {"similar_problems": existing_practice[:count]}
             })
 
-        # ===== 获取学生的 grade 信息 =====
-        grade = None
-        try:
-            error_record = db_sqlite.get_error_by_id(error_id, user_id)
-            if error_record and error_record.get('user_id'):
-                user_settings = db_sqlite.get_user_settings(error_record['user_id'])
-                if user_settings and user_settings.get('success'):
-                    grade = user_settings.get('grade')
-                    print(f"Found user grade: {grade} for user_id={error_record['user_id']}")
-        except Exception as e:
-            print(f"Failed to fetch user grade: {e}")
-            # Continue without grade (graceful degradation)
-
-        
-
-        # 使用 AI 服务生成相似题目（传入 grade 信息）
-        similar_list = ai_service.generate_similar_questions(question_text, count, grade=grade)
-
-        # 统一处理 LaTeX，保证前端可渲染
-        for q in similar_list:
-            q['question_text'] = fix_latex_for_frontend(q.get('question_text', ''))
-            q["correct_answer"] = fix_latex_for_frontend(q.get("correct_answer", ''))
-            q['analysis_steps'] = [fix_latex_for_frontend(step) for step in q.get('analysis_steps', [])]
-
-        # ===== 存入数据库 =====
-        saved_list = []
-        for parsed in similar_list:
-            parsed["error_id"] = error_id
-            parsed["user_id"] = user_id
-            new_id = db_sqlite.insert_practice(parsed)
-            saved = db_sqlite.get_practice_by_id(new_id, user_id)
-            saved_list.append(saved)
+        # ===== 合并并发的相同请求（双击、多标签页），只调用一次 AI 并只插入一次 =====
+        def _generate_and_save():
+            # 拿到锁之后再查一次，避免前一个请求刚写完又重复生成
+            if not force:
+                existing = db_sqlite.list_practice_by_error_id(error_id=error_id, user_id=user_id)
+                if existing and len(existing) >= count:
+                    return existing[:count]
+            return _generate_similar_and_save(error_id, user_id, question_text, count)
+
+        saved_list = single_flight.run(
+            make_key('similar', user_id, error_id, count, bool(force)),
+            _generate_and_save,
+            ttl=180
+        )
 
         return jsonify({
             "success": True,
@@ -670,6 +707,117 @@ def do_image_practice():
     # 注意：这里没有删除图片的逻辑，因为现在我们使用的是"redo_"前缀，并且可能需要保留这些图片
 
 
+# ===== 批量作答接口 =====
+@error_bp.route('/practice/do_batch', methods=['POST'])
+def do_batch_practice():
+    """
+    一组练习题一次提交、一次判定
+    请求 JSON:
+    {
+        "answers": [
+            {"practice_id": 1, "user_answer_text": "B"},
+            {"practice_id": 2, "redo_answer": "data:image/png;base64,..."}
+        ]
+    }
+    """
+    data = request.json or {}
+    answers = data.get("answers") or []
+    user_id = session.get('user_id', 'default')
+
+    if not isinstance(answers, list) or not answers:
+        return jsonify({"success": False, "error": "Missing answers"}), 400
+    max_items = int(os.getenv('PRACTICE_BATCH_MAX_ITEMS', 30))
+    if len(answers) > max_items:
+        return jsonify({"success": False, "error": f"At most {max_items} answers per batch"}), 400
+
+    try:
+        results = []
+        pending = []  # (结果下标, 判定项, 练习记录, 图片相对路径)
+        for answer in answers:
+            answer = answer if isinstance(answer, dict) else {}
+            entry = {"practice_id": answer.get("practice_id"), "success": False}
+            results.append(entry)
+
+            user_answer_text = (answer.get("user_answer_text") or "").strip()
+            redo_image = answer.get("redo_answer") or ""
+            if not entry["practice_id"] or not (user_answer_text or redo_image):
+                entry["error"] = "Missing practice_id or answer"
+                continue
+            try:
+                practice_id = int(entry["practice_id"])
+            except (TypeError, ValueError):
+                entry["error"] = "Invalid practice_id format"
+                continue
+            entry["practice_id"] = practice_id
+
+            practice = db_sqlite.get_practice_by_id(practice_id, user_id)
+            if not practice:
+                entry["error"] = "Practice question not found"
+                continue
+            question_text = practice.get("question_text", "").strip()
+            if not question_text:
+                entry["error"] = "Original question is empty"
+                continue
+
+            item = {"question_text": question_text, "correct_answer": practice.get("correct_answer", "")}
+            rel_path = None
+            if user_answer_text:
+                item["user_answer"] = user_answer_text
+            else:
+                filename = f"redo_{int(time.time() * 1000)}_{practice_id}.png"
+                saved_image_path = os.path.join(UPLOAD_FOLDER, filename)
+                try:
+                    with open(saved_image_path, "wb") as f:
+                        f.write(base64.b64decode(redo_image.split(",")[-1]))
+                except (ValueError, OSError) as e:
+                    entry["error"] = f"Invalid image: {e}"
+                    continue
+                item["image_path"] = saved_image_path
+                rel_path = os.path.relpath(saved_image_path, start=os.getcwd()).replace("\\", "/")
+                if not rel_path.startswith("/"):
+                    rel_path = "/" + rel_path
+            pending.append((len(results) - 1, item, practice, rel_path))
+
+        # 所有有效作答一次判定
+        judged = ai_service.judge_answers_batch([item for _, item, _, _ in pending]) if pending else []
+
+        for (position, item, practice, rel_path), result in zip(pending, judged):
+            practice_id = results[position]["practice_id"]
+            if result.get('method') == 'failed':
+                # 判定服务失败不是判错：不保存作答，让用户重试
+                results[position]["error"] = result.get('reason') or "Grading failed, please retry"
+                if item.get("image_path") and os.path.exists(item["image_path"]):
+                    os.remove(item["image_path"])
+                continue
+            if rel_path:
+                db_sqlite.update_practice_user_answer(practice_id, result['user_answer'], [rel_path])
+            else:
+                db_sqlite.update_practice_user_answer(practice_id, item["user_answer"])
+            results[position].update({
+                "success": True,
+                "correct": result['is_correct'],
+                "user_answer": result['user_answer'],
+                "correct_answer": practice.get("correct_answer", ""),
+                "ai_reason": result['reason']
+            })
+
+        return jsonify({
+            "success": True,
+            "results": results,
+            "summary": {
+                "total": len(results),
+                "graded": sum(1 for r in results if r["success"]),
+                "correct": sum(1 for r in results if r.get("correct")),
+                "failed": sum(1 for r in results if not r["success"])
+            }
+        })
+
+    except Exception as e:
+        print("do_batch_practice failed:", e)
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
 
 @error_bp.route('/practice/favorite', methods=['POST'])
 def favorite_practice():
@@ -14,6 +14,10 @@ import db_sqlite
 # 添加services路径
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 from services.ai_service import ai_service
+from services.single_flight import single_flight, make_key
+from services.extractive import extractive_engine
+from services.resumable_upload import UploadError, upload_sessions
+from services.content_cache import content_cache, file_digest
 
 
 map_bp = Blueprint('map_generation', __name__, url_prefix='/api/map')
@@ -69,63 +73,32 @@ def generate_mermaid_from_text(topic, depth=3, context='', style='TD'):
     使用DeepSeek API
     """
     try:
-        mermaid_code = ai_service.generate_mindmap_mermaid(topic, depth, context, style)
+        mermaid_code = single_flight.run(
+            make_key('mindmap_text', topic, depth, context, style),
+            lambda: ai_service.generate_mindmap_mermaid(topic, depth, context, style),
+            ttl=180
+        )
         return mermaid_code
     except Exception as e:
         print(f"Error generating mindmap with AI: {e}")
         # 后备方案
-        return _generate_fallback_mindmap(topic, depth, style)
-
-def _generate_fallback_mindmap(topic, depth, style='TD'):
-    """后备方案：生成基础思维导图"""
-    if style == 'radial':
-        # 发散型
-        mermaid_code = f"""graph TD
-    A[{topic}]
-    A --> B1[Concept 1]
-    A --> B2[Concept 2]
-    A --> B3[Concept 3]
-    A --> B4[Concept 4]
-    """
-        if depth >= 2:
-            mermaid_code += """    B1 --> C1[Detail 1.1]
-    B2 --> C2[Detail 2.1]
-    B3 --> C3[Detail 3.1]
-    B4 --> C4[Detail 4.1]
-    """
-    else:
-        # 层级型
-        graph_dir = style if style in ['TD', 'LR'] else 'TD'
-        mermaid_code = f"""graph {graph_dir}
-    A[{topic}]
-    """
-        
-        if depth >= 1:
-            mermaid_code += """    A --> B1[Core Concept 1]
-    A --> B2[Core Concept 2]
-    A --> B3[Core Concept 3]
-    """
-        
-        if depth >= 2:
-            mermaid_code += """    B1 --> C1[Subtopic 1.1]
-    B1 --> C2[Subtopic 1.2]
-    B2 --> C3[Subtopic 2.1]
-    B2 --> C4[Subtopic 2.2]
-    B3 --> C5[Subtopic 3.1]
-    """
-        
-        if depth >= 3:
-            mermaid_code += """    C1 --> D1[Detail 1.1.1]
-    C2 --> D2[Detail 1.2.1]
-    C3 --> D3[Detail 2.1.1]
-    """
-        
-        if depth >= 4:
-            mermaid_code += """    D1 --> E1[Example 1]
-    D2 --> E2[Example 2]
-    """
-    
-    return mermaid_code.strip()
+        return _generate_fallback_mindmap(topic, depth, style, context)
+
+def _generate_fallback_mindmap(topic, depth, style='TD', context=''):
+    """后备方案：本地抽取关键短语生成思维导图（无需网络）"""
+    return extractive_engine.mindmap(topic, context, depth, style)
+
+def _extract_pdf_text(filepath):
+    try:
+        import PyPDF2
+        with open(filepath, 'rb') as f:
+            reader = PyPDF2.PdfReader(f)
+            pages = [page.extract_text() or '' for page in reader.pages]
+        return '\n\n'.join(p.strip() for p in pages if p.strip())
+    except Exception as e:
+        print(f"PDF extraction failed for {filepath}: {e}")
+        return ''
+
 
 def extract_text_from_file(filepath):
     """
@@ -140,8 +113,13 @@ def extract_text_from_file(filepath):
             return f.read()
     
     elif ext in ['pdf']:
-        # TODO: 使用PyPDF2或pdfplumber提取PDF文本
-        return f"[PDF文件内容提取功能待实现] 文件: {os.path.basename(filepath)}"
+        # 提取全文，长文档由 ai_service 分块压缩后再生成导图；同一文件只解析一次
+        text = content_cache.get_or_compute(
+            'map_pdf', file_digest(filepath), lambda: _extract_pdf_text(filepath), cacheable=bool
+        )
+        if text:
+            return text
+        return f"[PDF文本提取失败，可能是扫描版] 文件: {os.path.basename(filepath)}"
     
     elif ext in ['doc', 'docx']:
         # TODO: 使用python-docx提取Word文本
@@ -229,14 +207,23 @@ def upload_file_for_mindmap():
         files = request.files.getlist('files')
         
         # Fallback to single file for backward compatibility
-        if not files:
-            if 'file' not in request.files:
-                return jsonify({
-                    'success': False,
-                    'error': 'No file uploaded'
-                }), 400
+        if not files and 'file' in request.files:
             files = [request.files['file']]
         
+        # 分块上传（/api/upload）已合并好的文件，可以和直接上传的文件混用
+        upload_ids = request.form.getlist('upload_id')
+        if not files and not upload_ids:
+            return jsonify({
+                'success': False,
+                'error': 'No file uploaded'
+            }), 400
+        chunked_files = []
+        for upload_id in upload_ids:
+            try:
+                chunked_files.append(upload_sessions.path(upload_id, session.get('user_id', 'default')))
+            except UploadError as e:
+                return jsonify({'success': False, 'error': str(e)}), e.status
+        
         topic = request.form.get('topic', '')
         context = request.form.get('context', '')
         depth_value = request.form.get('depth', 3)
@@ -264,6 +251,12 @@ def upload_file_for_mindmap():
                     'success': False,
                     'error': f'File type not allowed for {file.filename}. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'
                 }), 400
+        for _, filename in chunked_files:
+            if not allowed_file(filename):
+                return jsonify({
+                    'success': False,
+                    'error': f'File type not allowed for {filename}. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'
+                }), 400
         
         # Process all files and extract content
         all_file_contents = []
@@ -277,7 +270,10 @@ def upload_file_for_mindmap():
             filepath = os.path.join(UPLOAD_FOLDER, unique_filename)
             file.save(filepath)
             saved_files.append((filepath, filename))
-            
+        
+        # 分块上传的文件原地读取，不复制、不在这里删除（由上传会话过期清理）
+        all_files = saved_files + chunked_files
+        for filepath, filename in all_files:
             # 提取文件内容
             file_content = extract_text_from_file(filepath)
             if file_content and not file_content.startswith('['):
@@ -296,17 +292,17 @@ def upload_file_for_mindmap():
                 full_context = f"{context}\n\nFiles content:\n{combined_file_content}"
             
             # Use first filename or user topic
-            main_topic = topic or (files[0].filename if len(files) == 1 else f"{len(files)} Files Analysis")
+            main_topic = topic or (all_files[0][1] if len(all_files) == 1 else f"{len(all_files)} Files Analysis")
             
-            mermaid_code = ai_service.generate_mindmap_from_content(
-                main_topic, 
-                full_context, 
-                depth,
-                style
+            # 相同文件内容的并发请求只调用一次 AI
+            mermaid_code = single_flight.run(
+                make_key('mindmap_content', main_topic, full_context, depth, style),
+                lambda: ai_service.generate_mindmap_from_content(main_topic, full_context, depth, style),
+                ttl=180
             )
         except Exception as e:
             print(f"Error generating mindmap from files: {e}")
-            combined_context = f"Files: {', '.join([f[1] for f in saved_files])}"
+            combined_context = f"Files: {', '.join([f[1] for f in all_files])}"
             if topic:
                 combined_context += f"\nTopic: {topic}"
             if context:
@@ -316,17 +312,17 @@ def upload_file_for_mindmap():
         # 创建思维导图记录
         
         # Get main file info
-        first_filename = saved_files[0][1] if saved_files else 'unknown'
+        first_filename = all_files[0][1] if all_files else 'unknown'
         file_type = first_filename.rsplit('.', 1)[1].lower() if '.' in first_filename else 'unknown'
         
         # Store filenames for multi-file case
-        if len(saved_files) > 1:
-            source_file = f"{len(saved_files)} files: " + ", ".join([f[1] for f in saved_files])
+        if len(all_files) > 1:
+            source_file = f"{len(all_files)} files: " + ", ".join([f[1] for f in all_files])
         else:
-            source_file = saved_files[0][0].split(os.sep)[-1] if saved_files else 'unknown'
+            source_file = all_files[0][0].split(os.sep)[-1] if all_files else 'unknown'
         
         # Determine title
-        base_title = topic or (first_filename.rsplit('.', 1)[0] if len(saved_files) == 1 else f"{len(saved_files)} Files Analysis")
+        base_title = topic or (first_filename.rsplit('.', 1)[0] if len(all_files) == 1 else f"{len(all_files)} Files Analysis")
         
         # Get user_id from session
         user_id = session.get('user_id', 'default')
@@ -465,8 +461,10 @@ def generate_from_notes():
 
         # Use AI service to generate mermaid from combined note content
         try:
-            mermaid_code = ai_service.generate_mindmap_from_content(
-                topic, combined_content, depth, style
+            mermaid_code = single_flight.run(
+                make_key('mindmap_content', topic, combined_content, depth, style),
+                lambda: ai_service.generate_mindmap_from_content(topic, combined_content, depth, style),
+                ttl=180
             )
         except Exception as e:
             print('AI service error while generating from notes:', e)
@@ -2,15 +2,24 @@
 This is a safe replacement for the previously corrupted `note_assistant.py`.
 """
 
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, Response, request, jsonify, session
 import os
 import json
+import itertools
 import traceback
 from datetime import datetime
 import requests
 import db_sqlite
 from werkzeug.utils import secure_filename
 from services.ai_service import ai_service
+from services.audio_segments import Segment, split_on_silence
+from services.audio_decode import AudioDecodeError, iter_pcm_chunks, iter_segments
+from services.vad import SilenceTrimmer, vad_enabled
+from services.note_pipeline import LectureNotePipeline
+from services.content_cache import content_cache, file_digest
+from services.resumable_upload import UploadError, upload_sessions
+from services.streaming_asr import transcription_streams
+from services.resilience import remaining_budget
 
 import logging
 
@@ -21,6 +30,7 @@ bp = Blueprint('note_assistant', __name__, url_prefix='/api/note')
 SEGMENT_DURATION_SECONDS = 55
 SAMPLE_RATE = 16000
 SAMPLE_WIDTH = 2
+FRAME_READ_BYTES = 3200  # 实时流每次从请求体读取 100ms 音频
 
 ALLOWED_AUDIO_EXTENSIONS = {'mp3', 'wav', 'pcm', 'webm', 'm4a', 'ogg'}
 ALLOWED_FILE_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'gif', 'bmp', 'txt', 'md'}
@@ -49,77 +59,264 @@ def _fallback_notes(text, subject):
     result = ai_service._fallback_note(text, subject or 'General')
     # Add 'subject' field for compatibility with old code
     result['subject'] = subject or 'General'
-    result['examples'] = []  # Add empty examples for compatibility
+    result.setdefault('examples', [])  # Add empty examples for compatibility
     return result
 
 
-def split_audio_to_segments(audio_data, segment_duration_seconds=55):
-    """Split audio into smaller segments."""
-    bytes_per_second = SAMPLE_RATE * SAMPLE_WIDTH * 1
-    segment_size = segment_duration_seconds * bytes_per_second
+def split_audio_to_segments(audio_data, segment_duration_seconds=SEGMENT_DURATION_SECONDS):
+    """Split audio into segments of at most ~segment_duration_seconds, cutting at pauses where possible."""
+    segments, overlaps = split_on_silence(audio_data, segment_duration_seconds, sample_rate=SAMPLE_RATE,
+                                          with_overlaps=True)
+    return [Segment(segment, overlapped) for segment, overlapped in zip(segments, overlaps)]
+
+def _upload_segments(audio_file):
+    """
+    上传流经 ffmpeg 管道解码成定长 PCM 块，VAD 压缩长静音后按停顿切段；不落盘、不在内存里保留整段音频。
+    返回 (segments, trimmer)；音频太短时 segments 为 None。
+    """
+    filename = secure_filename(audio_file.filename)
+    file_format = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'webm'
+    chunks = iter_pcm_chunks(audio_file.stream, file_format)
+    # VAD 压缩长静音：讯飞按实时速率发送、Whisper 按时长计费，去掉的静音直接省下识别时间和费用
+    trimmer = SilenceTrimmer() if vad_enabled() else None
+    if trimmer:
+        chunks = trimmer.trim(chunks)
+    segments = iter_segments(chunks, SEGMENT_DURATION_SECONDS, sample_rate=SAMPLE_RATE)
+    first = next(segments, None)
+    if first is None:
+        return None, trimmer
+    return itertools.chain([first], segments), trimmer
+
+
+def _upload_id():
+    """分块上传完成后的 upload_id（表单字段或 JSON）"""
+    return request.form.get('upload_id') or (request.get_json(silent=True) or {}).get('upload_id')
+
+
+def _uploaded_audio():
+    """取出请求里的音频文件（直接上传，或已完成的分块上传）；返回 (audio_file, error_response)"""
+    if 'audio' not in request.files and _upload_id():
+        try:
+            return upload_sessions.file_storage(_upload_id(), session.get('user_id', 'default')), None
+        except UploadError as e:
+            return None, (jsonify({'success': False, 'error': str(e)}), e.status)
+    if 'audio' not in request.files:
+        logging.error("No audio file uploaded")
+        return None, (jsonify({'success': False, 'error': 'No audio file uploaded'}), 400)
+    audio_file = request.files['audio']
+    if audio_file.filename == '':
+        logging.error("File name is empty")
+        return None, (jsonify({'success': False, 'error': 'File name is empty'}), 400)
+    return audio_file, None
+
+
+def _request_language(value):
+    """客户端选择的识别语种：auto（按开头探测）/ zh_cn / en_us，其它值按 auto 处理"""
+    return value if value in ('auto', 'zh_cn', 'en_us') else 'auto'
 
-    segments = []
-    total_size = len(audio_data)
 
-    for start in range(0, total_size, segment_size):
-        end = min(start + segment_size, total_size)
-        segment = audio_data[start:end]
+def _transcript_cache_key(audio_file, language='auto'):
+    """整个音频文件的缓存 key 参数：内容哈希 + 影响转写结果的设置（识别后端、VAD、切段长度、语种）"""
+    backend = 'whisper' if os.getenv('OPENAI_API_KEY') else 'xfyun'
+    return file_digest(audio_file.stream), backend, vad_enabled(), SEGMENT_DURATION_SECONDS, language
 
-        min_segment_size = int(0.5 * bytes_per_second)
-        if len(segment) >= min_segment_size:
-            segments.append(segment)
 
-    return segments
+def _vad_report(trimmer):
+    report = trimmer.report() if trimmer else None
+    if report:
+        logging.debug(f"VAD removed {report['removed_seconds']}s of {report['input_seconds']}s audio")
+    return report
+
 
 # Updating transcribe_audio to use Xfyun logic
 @bp.route('/transcribe', methods=['POST'])
 def transcribe_audio():
+    audio_file = None
     try:
         logging.debug("Starting transcription request")
 
-        if 'audio' not in request.files:
-            logging.error("No audio file uploaded")
-            return jsonify({'success': False, 'error': 'No audio file uploaded'}), 400
-
-        audio_file = request.files['audio']
-        if audio_file.filename == '':
-            logging.error("File name is empty")
-            return jsonify({'success': False, 'error': 'File name is empty'}), 400
-
-        filename = secure_filename(audio_file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-        unique_filename = f"{timestamp}_{filename}"
-        temp_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-        audio_file.save(temp_path)
-
-        file_size = os.path.getsize(temp_path)
-        logging.debug(f'Audio file saved: {temp_path}, size: {file_size} bytes')
-
-        # Convert audio to PCM if necessary
-        audio_data = None
-        file_format = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'webm'
-        if file_format in ['webm', 'm4a', 'mp3', 'ogg']:
-            from pydub import AudioSegment
-            audio = AudioSegment.from_file(temp_path, format=file_format)
-            audio = audio.set_frame_rate(SAMPLE_RATE).set_channels(1).set_sample_width(SAMPLE_WIDTH)
-            audio_data = audio.raw_data
-        else:
-            with open(temp_path, 'rb') as f:
-                audio_data = f.read()
+        audio_file, error_response = _uploaded_audio()
+        if error_response:
+            return error_response
 
-        if not audio_data:
-            return jsonify({'success': False, 'error': 'Unable to read audio data'}), 500
+        language = _request_language(request.form.get('language'))
+        # 同一文件重新上传：不解码、不识别，直接返回上次的转写
+        cache_key = _transcript_cache_key(audio_file, language)
+        cached = content_cache.get('transcript', *cache_key)
+        if cached is not None:
+            return jsonify({'success': True, 'text': cached, 'length': len(cached), 'vad': None, 'cached': True})
 
-        # Transcribe audio using centralized AI service (auto-detect language)
-        transcribed_text, error = ai_service.speech_to_text(audio_data, language='auto')
+        segments, trimmer = _upload_segments(audio_file)
+        if segments is None:
+            return jsonify({'success': False, 'error': 'Audio is too short'}), 400
+
+        # Transcribe audio using centralized AI service (auto-detect language unless the client chose one)
+        transcribed_text, error = ai_service.transcribe_segments(segments, language=language)
+        vad_report = _vad_report(trimmer)
         if error:
             return jsonify({'success': False, 'error': f'Recognition failed: {error}'}), 500
+        content_cache.put('transcript', cache_key[0], transcribed_text, *cache_key[1:])
 
-        return jsonify({'success': True, 'text': transcribed_text, 'length': len(transcribed_text)})
+        return jsonify({'success': True, 'text': transcribed_text, 'length': len(transcribed_text), 'vad': vad_report})
 
+    except AudioDecodeError as e:
+        logging.error(f"Audio decode failed: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         logging.exception("Transcription failed")
         return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if audio_file is not None:
+            audio_file.close()
+
+
+@bp.route('/transcribe-note', methods=['POST'])
+def transcribe_and_generate_note():
+    """
+    录音直接生成笔记：识别完成的片段先在后台压缩成提纲，后面的片段仍在识别，
+    识别结束后只剩一次笔记生成；结果通过 insert_note 保存。
+    """
+    audio_file = None
+    try:
+        audio_file, error_response = _uploaded_audio()
+        if error_response:
+            return error_response
+        subject = request.form.get('subject', '')
+        language = _request_language(request.form.get('language'))
+
+        cache_key = _transcript_cache_key(audio_file, language)
+        transcript = content_cache.get('transcript', *cache_key)
+        trimmer = None
+        if transcript is not None:
+            # 转写命中缓存：跳过识别，只生成笔记
+            pipeline = None
+            notes_data = ai_service.generate_note_from_text(transcript, subject or 'General')
+        else:
+            segments, trimmer = _upload_segments(audio_file)
+            if segments is None:
+                return jsonify({'success': False, 'error': 'Audio is too short'}), 400
+
+            pipeline = LectureNotePipeline(subject or 'General')
+            notes_data, transcript, error = pipeline.run(segments, language=language)
+            if error:
+                return jsonify({'success': False, 'error': f'Recognition failed: {error}'}), 500
+            content_cache.put('transcript', cache_key[0], transcript, *cache_key[1:])
+
+        user_id = session.get('user_id', 'default')
+        rec = {
+            'title': notes_data.get('title', 'Untitled'),
+            'subject': notes_data.get('subject', subject or 'General'),
+            'content': notes_data,
+            'original_text': transcript,
+            'user_id': user_id,
+            'source': 'audio'
+        }
+        nid = db_sqlite.insert_note(rec)
+        saved = db_sqlite.get_note_by_id(nid, user_id)
+        return jsonify({
+            'success': True,
+            'note_id': nid,
+            'note': saved,
+            'text': transcript,
+            'vad': _vad_report(trimmer),
+            'timings': pipeline.timings if pipeline else None,
+            'cached': pipeline is None
+        })
+
+    except AudioDecodeError as e:
+        logging.error(f"Audio decode failed: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logging.exception("Transcribe-to-note failed")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if audio_file is not None:
+            audio_file.close()
+
+
+# ---------- 实时转写：分块 HTTP 上传 PCM + SSE 推送识别结果 ----------
+
+@bp.route('/stream', methods=['POST'])
+def start_transcription_stream():
+    """开始一路实时转写。之后把 16kHz 16-bit 单声道 PCM 持续 POST 到 /stream/<id>/audio"""
+    payload = request.get_json(silent=True) or {}
+    # 与上传转写一致：默认 auto，由流在开头几秒音频上探测语种
+    language = _request_language(payload.get('language'))
+    stream = transcription_streams.create(language)
+    if stream is None:
+        return jsonify({'success': False, 'error': 'Too many active transcription streams'}), 429
+    return jsonify({
+        'success': True,
+        'stream_id': stream.id,
+        'language': language,
+        'format': 'pcm_s16le',
+        'sample_rate': SAMPLE_RATE
+    })
+
+
+@bp.route('/stream/<stream_id>/audio', methods=['POST'])
+def feed_transcription_stream(stream_id):
+    """追加音频：可以是多次短 POST，也可以是一个持续发送的分块（chunked）请求，边收边转发"""
+    stream = transcription_streams.get(stream_id)
+    if stream is None:
+        return jsonify({'success': False, 'error': 'Stream not found'}), 404
+    if stream.done:
+        return jsonify({'success': False, 'error': stream.error or 'Stream already finished'}), 409
+    while True:
+        chunk = request.stream.read(FRAME_READ_BYTES)
+        if not chunk:
+            break
+        stream.feed(chunk)
+    return jsonify({'success': True, 'received_bytes': stream.received_bytes})
+
+
+@bp.route('/stream/<stream_id>/events', methods=['GET'])
+def transcription_stream_events(stream_id):
+    """
+    Server-Sent Events：partial（当前会话的临时结果，会被后续 partial 覆盖）、
+    final（一个会话的最终结果）、error、done（全部结束，带完整文字）。
+    断线重连时浏览器会带上 Last-Event-ID，从该事件之后继续推送。
+    """
+    stream = transcription_streams.get(stream_id)
+    if stream is None:
+        return jsonify({'success': False, 'error': 'Stream not found'}), 404
+    try:
+        after = int(request.headers.get('Last-Event-ID') or request.args.get('after', 0))
+    except ValueError:
+        after = 0
+
+    def generate():
+        seq = after
+        while True:
+            events = stream.events_after(seq, timeout=15)
+            if not events:
+                if stream.done:
+                    return
+                yield ': keepalive\n\n'
+                continue
+            for event in events:
+                seq = event['seq']
+                yield f"id: {seq}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                if event['type'] == 'done':
+                    return
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@bp.route('/stream/<stream_id>/stop', methods=['POST'])
+def stop_transcription_stream(stream_id):
+    """录音结束：等最后一个会话出结果后返回完整文字"""
+    stream = transcription_streams.get(stream_id)
+    if stream is None:
+        return jsonify({'success': False, 'error': 'Stream not found'}), 404
+    stream.close()
+    if not stream.wait(timeout=remaining_budget(default=30)):
+        return jsonify({'success': False, 'error': 'Transcription is still running', 'text': stream.text}), 504
+    if stream.error and not stream.text:
+        return jsonify({'success': False, 'error': f'Recognition failed: {stream.error}'}), 500
+    return jsonify({'success': True, 'text': stream.text, 'length': len(stream.text),
+                    'lost_seconds': round(stream.lost_bytes / 32000, 2)})
 
 
 @bp.route('/generate', methods=['POST'])
@@ -246,32 +443,41 @@ def extract_text_from_file(file_path, file_ext):
         return None, str(e)
 
 
+def extract_pdf_text(file_path):
+    try:
+        import PyPDF2
+        with open(file_path, 'rb') as f:
+            reader = PyPDF2.PdfReader(f)
+            text = ""
+            for page in reader.pages:
+                page_text = page.extract_text()
+                if page_text:
+                    text += page_text + "\n"
+            if text.strip() and len(text.strip()) > 20:
+                logging.info(f"PyPDF2 extracted {len(text)} characters from PDF")
+                return text.strip(), None
+            else:
+                return None, "PDF文本提取失败或内容太少。该PDF可能是扫描版，暂不支持OCR。"
+    except ImportError:
+        return None, "需要安装PyPDF2来处理PDF文件。请运行: pip install PyPDF2 --break-system-packages"
+    except Exception as pdf_error:
+        logging.warning(f"PyPDF2 extraction failed: {pdf_error}")
+        return None, f"PDF处理失败: {str(pdf_error)}"
+
+
 def extract_text_with_ocr(file_path, file_ext):
     """提取文本 - PDF用PyPDF2，图片用Qwen-VL OCR"""
     try:
-        # PDF 文件：使用 PyPDF2 提取文本（Qwen-VL 不支持 PDF）
+        # PDF 文件：使用 PyPDF2 提取文本（Qwen-VL 不支持 PDF）；同一文件只解析一次
         if file_ext == 'pdf':
-            try:
-                import PyPDF2
-                with open(file_path, 'rb') as f:
-                    reader = PyPDF2.PdfReader(f)
-                    text = ""
-                    for page in reader.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text += page_text + "\n"
-                    if text.strip() and len(text.strip()) > 20:
-                        logging.info(f"PyPDF2 extracted {len(text)} characters from PDF")
-                        return text.strip(), None
-                    else:
-                        return None, "PDF文本提取失败或内容太少。该PDF可能是扫描版，暂不支持OCR。"
-            except ImportError:
-                return None, "需要安装PyPDF2来处理PDF文件。请运行: pip install PyPDF2 --break-system-packages"
-            except Exception as pdf_error:
-                logging.warning(f"PyPDF2 extraction failed: {pdf_error}")
-                return None, f"PDF处理失败: {str(pdf_error)}"
+            text, error = content_cache.get_or_compute(
+                'note_pdf', file_digest(file_path),
+                lambda: extract_pdf_text(file_path),
+                cacheable=lambda result: result[1] is None
+            )
+            return text, error
         
-        # 图片文件：使用 AI Service OCR
+        # 图片文件：使用 AI Service OCR（结果按图片内容缓存）
         if file_ext in ['png', 'jpg', 'jpeg', 'gif', 'bmp']:
             text, error = ai_service.ocr_image(file_path)
             if error:
@@ -287,25 +493,35 @@ def extract_text_with_ocr(file_path, file_ext):
 
 @bp.route('/upload-file', methods=['POST'])
 def upload_file_generate_note():
-    if 'file' not in request.files:
-        return jsonify({'success': False, 'error': 'No file provided'}), 400
-    uploaded_file = request.files['file']
-    if uploaded_file.filename == '':
-        return jsonify({'success': False, 'error': 'Empty filename'}), 400
-    filename = secure_filename(uploaded_file.filename)
+    upload_id = _upload_id()
+    if 'file' in request.files or not upload_id:
+        if 'file' not in request.files:
+            return jsonify({'success': False, 'error': 'No file provided'}), 400
+        uploaded_file = request.files['file']
+        if uploaded_file.filename == '':
+            return jsonify({'success': False, 'error': 'Empty filename'}), 400
+        filename = secure_filename(uploaded_file.filename)
+    else:
+        # 分块上传已合并好的文件：直接在原位置读取，由上传会话的过期清理负责删除
+        uploaded_file = None
+        try:
+            chunked_path, filename = upload_sessions.path(upload_id, session.get('user_id', 'default'))
+        except UploadError as e:
+            return jsonify({'success': False, 'error': str(e)}), e.status
     file_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
     if not allowed_file(filename):
         return jsonify({
             'success': False, 
             'error': f'File type not supported. Allowed: {", ".join(ALLOWED_FILE_EXTENSIONS)}'
         }), 400
-    subject = request.form.get('subject', '')
+    subject = request.form.get('subject', '') or (request.get_json(silent=True) or {}).get('subject', '')
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
     unique_filename = f"{timestamp}_{filename}"
-    temp_path = os.path.join(UPLOAD_FOLDER, unique_filename)
+    temp_path = os.path.join(UPLOAD_FOLDER, unique_filename) if uploaded_file else chunked_path
     try:
-        uploaded_file.save(temp_path)
-        logging.info(f"File saved to: {temp_path}")
+        if uploaded_file:
+            uploaded_file.save(temp_path)
+            logging.info(f"File saved to: {temp_path}")
         extracted_text, error = extract_text_from_file(temp_path, file_ext)
         if error:
             return jsonify({'success': False, 'error': f'Text extraction failed: {error}'}), 500
@@ -343,7 +559,7 @@ def upload_file_generate_note():
         return jsonify({'success': False, 'error': str(e)}), 500
     finally:
         try:
-            if os.path.exists(temp_path):
+            if uploaded_file and os.path.exists(temp_path):
                 os.remove(temp_path)
         except OSError:
             pass
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""
+Resumable Upload Module - chunked uploads for large lecture audio and documents
+"""
+
+from flask import Blueprint, request, jsonify, session
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from services.resumable_upload import UploadError, upload_sessions
+
+
+upload_bp = Blueprint('uploads', __name__, url_prefix='/api/upload')
+
+
+def _user_id():
+    return session.get('user_id', 'default')
+
+
+def _error(e):
+    return jsonify({'success': False, 'error': str(e)}), e.status
+
+
+@upload_bp.route('/init', methods=['POST'])
+def init_upload():
+    """
+    开始一次分块上传：{"filename", "size", "chunk_size"（可选）, "sha256"（可选，整文件校验）}。
+    返回 upload_id、分块大小和分块数；之后逐块 PUT /api/upload/<id>/chunk/<index>
+    """
+    payload = request.get_json(silent=True) or {}
+    try:
+        status = upload_sessions.init(
+            payload.get('filename'), payload.get('size'), _user_id(),
+            chunk_size=payload.get('chunk_size'), sha256=payload.get('sha256')
+        )
+    except UploadError as e:
+        return _error(e)
+    return jsonify(dict(status, success=True))
+
+
+@upload_bp.route('/<upload_id>/chunk/<int:index>', methods=['PUT'])
+def put_chunk(upload_id, index):
+    """上传一块（请求体为原始字节）；可带 X-Chunk-SHA256 头校验该块。重传同一块是安全的"""
+    try:
+        status = upload_sessions.put_chunk(
+            upload_id, index, request.stream, _user_id(),
+            chunk_sha256=request.headers.get('X-Chunk-SHA256')
+        )
+    except UploadError as e:
+        return _error(e)
+    return jsonify({
+        'success': True,
+        'received_chunks': status['received_chunks'],
+        'total_chunks': status['total_chunks']
+    })
+
+
+@upload_bp.route('/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """断线后查询已收到的分块，只需补传 missing_chunks"""
+    try:
+        status = upload_sessions.status(upload_id, _user_id())
+    except UploadError as e:
+        return _error(e)
+    return jsonify(dict(status, success=True))
+
+
+@upload_bp.route('/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    """所有分块到齐后合并；之后可把 upload_id 交给 /api/note/transcribe、/api/note/upload-file、/api/map/upload"""
+    try:
+        status = upload_sessions.finalize(upload_id, _user_id())
+    except UploadError as e:
+        return _error(e)
+    return jsonify(dict(status, success=True))
+
+
+@upload_bp.route('/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    try:
+        upload_sessions.abort(upload_id, _user_id())
+    except UploadError as e:
+        return _error(e)
+    return jsonify({'success': True})
@@ -3,7 +3,7 @@ AI Study Assistant - 启动文件
 整合所有模块和UI控制器
 """
 
-from flask import Flask, send_from_directory
+from flask import Flask, send_from_directory, request, g, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
@@ -22,6 +22,23 @@ from modules.settings import settings_bp
 from modules.notifications import notifications_bp
 from modules.track import track_bp
 from modules.auth import auth_bp
+from modules.uploads import upload_bp
+from services.resilience import DeadlineExceeded, reset_request_deadline, set_request_deadline
+
+
+def request_deadline_seconds(app, path, header_value):
+    """本次请求的截止时间（秒）：路由默认值，X-Request-Timeout 头只能缩短不能延长；非 /api 路径不设"""
+    if not path.startswith('/api/'):
+        return None
+    routes = app.config['ROUTE_DEADLINES']
+    matches = [prefix for prefix in routes if path == prefix or path.startswith(prefix + '/')]
+    seconds = routes[max(matches, key=len)] if matches else app.config['REQUEST_DEADLINE_DEFAULT']
+    if header_value:
+        try:
+            seconds = min(seconds, float(header_value))
+        except ValueError:
+            pass
+    return max(0.1, min(seconds, app.config['REQUEST_DEADLINE_MAX']))
 
 def create_app(config_name='development'):
     """应用工厂函数"""
@@ -50,6 +67,23 @@ def create_app(config_name='development'):
     app.register_blueprint(notifications_bp)
     app.register_blueprint(track_bp)
     app.register_blueprint(auth_bp)
+    app.register_blueprint(upload_bp)
+    
+    # 请求级截止时间：传递给 AIService、图片处理和 db_sqlite，剩余时间不足时跳过或缩短后续工作
+    @app.before_request
+    def start_request_deadline():
+        seconds = request_deadline_seconds(app, request.path, request.headers.get('X-Request-Timeout'))
+        g.deadline_token = set_request_deadline(seconds)
+
+    @app.teardown_request
+    def clear_request_deadline(exc):
+        token = g.pop('deadline_token', None)
+        if token is not None:
+            reset_request_deadline(token)
+
+    @app.errorhandler(DeadlineExceeded)
+    def deadline_exceeded(e):
+        return jsonify({'success': False, 'error': 'Request deadline exceeded'}), 504
     
     # 静态文件路由
     @app.route('/static/<path:path>')
@@ -67,7 +101,21 @@ def create_app(config_name='development'):
     # 健康检查
     @app.route('/api/health')
     def health():
-        return {'status': 'healthy', 'message': 'AI Study Assistant is running'}
+        from services.ai_service import ai_service
+        from services.content_cache import content_cache
+        providers = ai_service.provider_health()
+        # 任一 provider 熔断时 AI 功能走降级路径
+        degraded = any(p['state'] != 'closed' for p in providers.values())
+        return {
+            'status': 'degraded' if degraded else 'healthy',
+            'message': 'AI Study Assistant is running',
+            'ai_providers': providers,
+            'ai_hedging': ai_service.hedge_stats(),
+            'ai_json': ai_service.json_stats(),
+            'mindmap_validation': ai_service.mindmap_stats(),
+            'asr_sessions': ai_service.asr_stats(),
+            'content_cache': content_cache.stats()
+        }
     
     return app
 
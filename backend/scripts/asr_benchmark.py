@@ -0,0 +1,425 @@
+"""
+ASR pipeline benchmark - wall-clock time of the speech-recognition paths against the local simulator
+(Xfyun iat is paced in real time, so these numbers are dominated by audio length and concurrency)
+
+Usage (from backend/):
+    python scripts/asr_benchmark.py segments [--seconds 40] [--segment-seconds 10]
+    python scripts/asr_benchmark.py probe [--seconds 16]
+    python scripts/asr_benchmark.py stream [--seconds 20]
+    python scripts/asr_benchmark.py concurrency [--seconds 2] [--sessions 200]
+    python scripts/asr_benchmark.py decode [--seconds 3600] [--segment-seconds 55]
+    python scripts/asr_benchmark.py vad [--seconds 143] [--segment-seconds 55]
+    python scripts/asr_benchmark.py encode [--seconds 60]
+    python scripts/asr_benchmark.py pipeline [--seconds 36] [--segment-seconds 3]
+Every scenario also takes [--seed 1] [--json].
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_sqlite  # noqa: E402
+
+# 不写仓库里的 study_assistant.db；识别结果缓存也关掉，否则第二次运行全部命中
+db_sqlite.DB_PATH = os.path.join(tempfile.mkdtemp(prefix='asr-benchmark-'), 'benchmark.db')
+os.environ['CONTENT_CACHE_ENABLED'] = '0'
+
+from simulator.config import load_config  # noqa: E402
+from simulator.server import SimulatorServer  # noqa: E402
+
+SAMPLE_RATE = 16000
+
+
+def make_speech(seconds, seed, speech_seconds=4.5, pause_seconds=0.5, level=3000):
+    """按音节起伏调制的噪声，每 speech_seconds 秒之后停顿 pause_seconds 秒（底噪 RMS 30）"""
+    rng = np.random.default_rng(seed)
+    parts = []
+    total = 0.0
+    while total < seconds:
+        n = int(speech_seconds * SAMPLE_RATE)
+        t = np.arange(n) / SAMPLE_RATE
+        parts.append(rng.normal(0, 1, n) * level * (1 + 0.5 * np.sin(2 * np.pi * 4 * t)))
+        parts.append(rng.normal(0, 30, int(pause_seconds * SAMPLE_RATE)))
+        total += speech_seconds + pause_seconds
+    samples = np.concatenate(parts)[:int(seconds * SAMPLE_RATE)]
+    return np.clip(samples, -32768, 32767).astype('<i2').tobytes()
+
+
+class SpeechStream:
+    """按需生成 make_speech 音频的只读流（每 5 秒一块），长录音不必先放进内存"""
+
+    def __init__(self, seconds, seed, block_seconds=5):
+        self.blocks = int(seconds // block_seconds)
+        self.block_seconds = block_seconds
+        self.seed = seed
+        self._index = 0
+        self._buffer = b''
+
+    def _block(self):
+        self._index += 1
+        return make_speech(self.block_seconds, self.seed + self._index - 1)
+
+    def read(self, size=-1):
+        if size < 0:
+            data = b''.join([self._buffer] + [self._block() for _ in range(self._index, self.blocks)])
+            self._buffer = b''
+            return data
+        while len(self._buffer) < size and self._index < self.blocks:
+            self._buffer += self._block()
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def start_simulator(seed, overrides=None):
+    """启动模拟器，让 AIService 走讯飞路径"""
+    from simulator.config import _merge
+    config = _merge(load_config(seed=seed), {'endpoints': overrides or {}})
+    server = SimulatorServer(port=0, config=config).start()
+    os.environ.update(server.env())
+    os.environ.pop('OPENAI_API_KEY', None)
+    return server
+
+
+def ai_module():
+    # services 包把 ai_service 单例重新导出，模块本身要按名字取
+    return importlib.import_module('services.ai_service')
+
+
+def _timed(fn):
+    started = time.monotonic()
+    result = fn()
+    return round(time.monotonic() - started, 2), result
+
+
+# ---------- 场景 ----------
+
+def run_segments(args):
+    """整段一个会话 vs 按停顿切段后并发识别"""
+    from services.audio_decode import iter_segments
+    ai_service = ai_module().ai_service
+    audio = make_speech(args.seconds, args.seed)
+    server = start_simulator(args.seed)
+    try:
+        serial, _ = _timed(lambda: ai_service.speech_to_text(audio, 'zh_cn'))
+        chunks = [audio[i:i + 5 * 32000] for i in range(0, len(audio), 5 * 32000)]
+        segments = list(iter_segments(chunks, args.segment_seconds))
+        parallel, _ = _timed(lambda: ai_service.transcribe_segments(segments, language='zh_cn'))
+    finally:
+        server.shutdown()
+    return [
+        {'mode': 'one session', 'audio_s': args.seconds, 'sessions': 1, 'wall_s': serial},
+        {'mode': 'segmented', 'audio_s': args.seconds, 'sessions': len(segments), 'wall_s': parallel},
+    ]
+
+
+def print_segments(rows):
+    print(f"{'mode':<12} {'audio s':>8} {'sessions':>9} {'wall s':>7}")
+    for row in rows:
+        print(f"{row['mode']:<12} {row['audio_s']:>8} {row['sessions']:>9} {row['wall_s']:>7}")
+
+
+def run_probe(args):
+    """自动语种：整段中 / 英各识别一遍 vs 开头短探测 + 一遍识别"""
+    ai_service = ai_module().ai_service
+    audio = make_speech(args.seconds, args.seed)
+    probe = min(args.seconds, float(os.getenv('ASR_LANGUAGE_PROBE_SECONDS', 6)))
+    server = start_simulator(args.seed)
+    try:
+        sequential, _ = _timed(lambda: [ai_service._recognize_xfyun(audio, language)
+                                        for language in ('zh_cn', 'en_us')])
+        concurrent, _ = _timed(lambda: ai_service._recognize_xfyun_languages(audio))
+        probed, _ = _timed(lambda: ai_service._speech_to_text_xfyun(audio, 'auto'))
+    finally:
+        server.shutdown()
+    full = round(2 * args.seconds, 1)
+    return [
+        {'mode': 'two passes, sequential', 'audio_sent_s': full, 'wall_s': sequential},
+        {'mode': 'two passes, concurrent', 'audio_sent_s': full, 'wall_s': concurrent},
+        {'mode': 'probe + one pass', 'audio_sent_s': round(2 * probe + args.seconds, 1), 'wall_s': probed},
+    ]
+
+
+def print_probe(rows):
+    print(f"{'mode':<24} {'audio sent s':>13} {'wall s':>7}")
+    for row in rows:
+        print(f"{row['mode']:<24} {row['audio_sent_s']:>13} {row['wall_s']:>7}")
+
+
+def run_stream(args):
+    """录音结束后整段识别 vs 边录边识别（按实时节奏每 100ms 送一块）"""
+    import threading
+    from services.streaming_asr import TranscriptionStream
+    ai_service = ai_module().ai_service
+    audio = make_speech(args.seconds, args.seed)
+    # 模拟器每收到 1 秒音频推送一次中间结果（接近讯飞动态修正的节奏）
+    partial_seconds = 1
+    server = start_simulator(args.seed, {'iat': {'partial_seconds': partial_seconds}})
+    try:
+        batch, _ = _timed(lambda: ai_service.speech_to_text(audio, 'zh_cn'))
+
+        stream = TranscriptionStream('zh_cn')
+        started = time.monotonic()
+        partials = []
+
+        def watch():
+            seq = 0
+            while not stream.done:
+                for event in stream.events_after(seq, 1):
+                    seq = event['seq']
+                    if event['type'] == 'partial':
+                        # 第 n 条中间结果对应前 n 秒音频，按实时节奏在 started + n 时送完
+                        partials.append(time.monotonic() - started - (len(partials) + 1) * partial_seconds)
+
+        watcher = threading.Thread(target=watch, daemon=True)
+        watcher.start()
+        block = SAMPLE_RATE // 10 * 2
+        for offset in range(0, len(audio), block):
+            # 和麦克风一样：一块录完才送出
+            time.sleep(max(0.0, started + (offset + block) / 32000 - time.monotonic()))
+            stream.feed(audio[offset:offset + block])
+        stopped = time.monotonic()
+        stream.close()
+        stream.wait(args.seconds + 30)
+        final = round(time.monotonic() - stopped, 2)
+        watcher.join(2)
+    finally:
+        server.shutdown()
+    # 最后一条是结束帧之后的最终结果，不算在按秒推送的中间结果里
+    lag = sorted(partials[:int(args.seconds // partial_seconds)])
+    return [
+        {'mode': 'batch after stop', 'partials': 0, 'median_partial_lag_s': '-', 'stop_to_text_s': batch},
+        {'mode': 'streaming', 'partials': len(lag),
+         'median_partial_lag_s': round(lag[len(lag) // 2], 2) if lag else '-', 'stop_to_text_s': final},
+    ]
+
+
+def print_stream(rows):
+    print(f"{'mode':<17} {'partials':>9} {'median lag s':>13} {'stop to text s':>15}")
+    for row in rows:
+        print(f"{row['mode']:<17} {row['partials']:>9} {row['median_partial_lag_s']:>13} {row['stop_to_text_s']:>15}")
+
+
+def run_concurrency(args):
+    """共享事件循环上同时跑 N 路识别：耗时应接近单路音频时长，客户端线程数不随 N 增长"""
+    import threading
+    module = ai_module()
+    audio = make_speech(args.seconds, args.seed)
+    credentials = (os.getenv('XFYUN_APPID', 'appid'), os.getenv('XFYUN_API_KEY', 'key'),
+                   os.getenv('XFYUN_API_SECRET', 'secret'))
+    server = start_simulator(args.seed)
+    stop = threading.Event()
+
+    def client_threads():
+        # 模拟器和本进程同跑，它每个连接一个 process_request 线程，不计入客户端
+        return sum(1 for thread in threading.enumerate() if 'process_request' not in thread.name)
+
+    peak = [client_threads()]
+
+    def sample():
+        while not stop.wait(0.05):
+            peak[0] = max(peak[0], client_threads())
+
+    def shared_loop(count):
+        futures = [module.async_xfyun.submit(audio, 'zh_cn', *credentials) for _ in range(count)]
+        return [future.result() for future in futures]
+
+    rows = []
+    try:
+        threading.Thread(target=sample, daemon=True).start()
+        for count in sorted({max(1, args.sessions // 4), max(1, args.sessions // 2), args.sessions}):
+            peak[0] = baseline = client_threads()
+            elapsed, results = _timed(lambda: shared_loop(count))
+            rows.append({'sessions': count, 'audio_s': args.seconds, 'wall_s': elapsed,
+                         'failed': sum(1 for _, error in results if error), 'peak_extra_threads': peak[0] - baseline})
+    finally:
+        stop.set()
+        server.shutdown()
+    return rows
+
+
+def print_concurrency(rows):
+    print(f"{'sessions':>9} {'audio s':>8} {'wall s':>7} {'failed':>7} {'extra threads':>14}")
+    for row in rows:
+        print(f"{row['sessions']:>9} {row['audio_s']:>8} {row['wall_s']:>7} {row['failed']:>7} "
+              f"{row['peak_extra_threads']:>14}")
+
+
+def run_decode(args):
+    """整段读入后切段 vs 流式解码 → 静音压缩 → 切段，tracemalloc 峰值"""
+    import tracemalloc
+    from services.audio_decode import iter_pcm_chunks, iter_segments
+    from services.audio_segments import split_on_silence
+    from services.vad import SilenceTrimmer
+
+    def whole():
+        audio = SpeechStream(args.seconds, args.seed).read()
+        return len(split_on_silence(audio, args.segment_seconds))
+
+    def streaming():
+        chunks = iter_pcm_chunks(SpeechStream(args.seconds, args.seed), 'pcm')
+        return sum(1 for _ in iter_segments(SilenceTrimmer().trim(chunks), args.segment_seconds))
+
+    rows = []
+    tracemalloc.start()
+    try:
+        for mode, fn in (('read whole upload', whole), ('streaming decode', streaming)):
+            tracemalloc.reset_peak()
+            elapsed, segments = _timed(fn)
+            rows.append({'mode': mode, 'audio_s': args.seconds, 'segments': segments,
+                         'peak_mb': round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1), 'wall_s': elapsed})
+    finally:
+        tracemalloc.stop()
+    return rows
+
+
+def print_decode(rows):
+    print(f"{'mode':<18} {'audio s':>8} {'segments':>9} {'peak MB':>8} {'wall s':>7}")
+    for row in rows:
+        print(f"{row['mode']:<18} {row['audio_s']:>8} {row['segments']:>9} {row['peak_mb']:>8} {row['wall_s']:>7}")
+
+
+def run_vad(args):
+    """讲 5 秒停 4 秒（约 44% 停顿）的录音，不做 / 做静音压缩后切段识别"""
+    from services.audio_decode import iter_segments
+    from services.vad import SilenceTrimmer
+    ai_service = ai_module().ai_service
+    audio = make_speech(args.seconds, args.seed, speech_seconds=5, pause_seconds=4)
+    step = 5 * 32000
+    server = start_simulator(args.seed)
+    rows = []
+    try:
+        for mode, trimmer in (('no VAD', None), ('VAD', SilenceTrimmer())):
+            chunks = (audio[i:i + step] for i in range(0, len(audio), step))
+            if trimmer:
+                chunks = trimmer.trim(chunks)
+            segments = list(iter_segments(chunks, args.segment_seconds))
+            elapsed, _ = _timed(lambda: ai_service.transcribe_segments(segments, language='zh_cn'))
+            rows.append({'mode': mode, 'audio_s': args.seconds,
+                         'sent_s': round(sum(len(segment) for segment in segments) / 32000, 1),
+                         'sessions': len(segments), 'wall_s': elapsed})
+    finally:
+        server.shutdown()
+    return rows
+
+
+def print_vad(rows):
+    print(f"{'mode':<7} {'audio s':>8} {'sent s':>7} {'sessions':>9} {'wall s':>7}")
+    for row in rows:
+        print(f"{row['mode']:<7} {row['audio_s']:>8} {row['sent_s']:>7} {row['sessions']:>9} {row['wall_s']:>7}")
+
+
+def run_encode(args):
+    """Whisper 上传体积：WAV / FLAC / Opus；没有 ffmpeg 时 encode_pcm 退回 WAV，表里标出来"""
+    from services.audio_encode import encode_pcm
+    audio = make_speech(args.seconds, args.seed)
+    rows = []
+    for fmt in ('wav', 'flac', 'opus'):
+        elapsed, (filename, data) = _timed(lambda: encode_pcm(audio, fmt))
+        rows.append({'format': fmt, 'uploaded_as': filename,
+                     'fallback': fmt != 'wav' and filename == 'audio.wav',
+                     'kb_per_min': round(len(data) / 1024 / (args.seconds / 60), 1), 'wall_s': elapsed})
+    return rows
+
+
+def print_encode(rows):
+    print(f"{'format':<7} {'uploaded as':<12} {'KB/min':>8} {'wall s':>7}")
+    for row in rows:
+        note = '  (no ffmpeg, fell back to WAV)' if row['fallback'] else ''
+        print(f"{row['format']:<7} {row['uploaded_as']:<12} {row['kb_per_min']:>8} {row['wall_s']:>7}{note}")
+
+
+def run_pipeline(args):
+    """先识别完再生成笔记 vs 识别的同时按块起草提纲（LectureNotePipeline）"""
+    from services.audio_segments import Segment
+    from services.note_pipeline import LectureNotePipeline
+    ai_service = ai_module().ai_service
+    count = max(1, int(args.seconds // args.segment_seconds))
+    segments = [Segment(make_speech(args.segment_seconds, args.seed + i), overlapped=False) for i in range(count)]
+    # 每段约 60 token 的课堂转写；预算调小，让十来段的转写稿就需要分块起草
+    sentence = ('Today we continue with derivatives and see how the chain rule lets us differentiate '
+                'composite functions step by step, then check each result with a worked example. ')
+    os.environ.setdefault('AI_CONTENT_TOKEN_BUDGET', '200')
+    os.environ.setdefault('AI_CHUNK_TOKENS', '150')
+    server = start_simulator(args.seed, {'iat': {'rules': [{'match': r'(?s).*', 'content': sentence}]}})
+    try:
+        def sequential():
+            text, _ = ai_service.transcribe_segments(segments, language='zh_cn')
+            return ai_service.generate_note_from_text(text, 'Mathematics'), 0
+
+        def pipelined():
+            pipeline = LectureNotePipeline('Mathematics')
+            note, _, _ = pipeline.run(segments, language='zh_cn')
+            return note, pipeline.timings.get('drafts', 0)
+
+        rows = []
+        for mode, fn in (('transcribe, then note', sequential), ('pipelined', pipelined)):
+            elapsed, (note, drafts) = _timed(fn)
+            rows.append({'mode': mode, 'segments': count, 'drafts': drafts,
+                         'note_ok': bool(note), 'wall_s': elapsed})
+    finally:
+        server.shutdown()
+    return rows
+
+
+def print_pipeline(rows):
+    print(f"{'mode':<22} {'segments':>9} {'drafts':>7} {'note':>5} {'wall s':>7}")
+    for row in rows:
+        print(f"{row['mode']:<22} {row['segments']:>9} {row['drafts']:>7} {'ok' if row['note_ok'] else '-':>5} "
+              f"{row['wall_s']:>7}")
+
+
+# 子命令 -> (说明, 运行, 打印表格, 默认参数)；只有列出的参数会出现在该子命令里
+SCENARIOS = {
+    'segments': ('One recognition session vs segmented, concurrent recognition',
+                 run_segments, print_segments, {'seconds': 40, 'segment_seconds': 10}),
+    'probe': ('Automatic language detection',
+              run_probe, print_probe, {'seconds': 16}),
+    'stream': ('Batch vs streaming transcription',
+               run_stream, print_stream, {'seconds': 20}),
+    'concurrency': ('Concurrent sessions on the shared loop',
+                    run_concurrency, print_concurrency, {'seconds': 2, 'sessions': 200}),
+    'decode': ('Peak memory of whole vs streaming decode',
+               run_decode, print_decode, {'seconds': 3600, 'segment_seconds': 55}),
+    'vad': ('Recognition with and without silence trimming',
+            run_vad, print_vad, {'seconds': 143, 'segment_seconds': 55}),
+    'encode': ('Whisper upload size per format',
+               run_encode, print_encode, {'seconds': 60}),
+    'pipeline': ('Transcribe-then-note vs pipelined drafting',
+                 run_pipeline, print_pipeline, {'seconds': 36, 'segment_seconds': 3}),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time speech-recognition paths against the local simulator')
+    subparsers = parser.add_subparsers(dest='scenario', required=True)
+    for name, (description, run, report, defaults) in SCENARIOS.items():
+        sub = subparsers.add_parser(name, help=description, description=description)
+        sub.add_argument('--seconds', type=float, default=defaults['seconds'], help='Length of the generated audio')
+        if 'segment_seconds' in defaults:
+            sub.add_argument('--segment-seconds', type=float, default=defaults['segment_seconds'],
+                             help='Target segment length')
+        if 'sessions' in defaults:
+            sub.add_argument('--sessions', type=int, default=defaults['sessions'], help='Concurrent recognitions')
+        sub.add_argument('--seed', type=int, default=1)
+        sub.add_argument('--json', action='store_true', help='Print the report as JSON')
+        sub.set_defaults(run=run, report=report)
+    args = parser.parse_args()
+
+    rows = args.run(args)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+    args.report(rows)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Extractive engine benchmark - note() and mindmap() latency on generated documents of increasing size
+
+Usage (from backend/):
+    python scripts/extractive_benchmark.py [--sizes 2000,10000,60000] [--runs 5] [--seed 1] [--json]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.extractive import ExtractiveEngine  # noqa: E402
+
+# 中英混合的讲义句子模板，术语重复出现，接近真实课堂笔记的词频分布
+_TERMS_ZH = ['二次函数', '判别式', '一元二次方程', '顶点坐标', '对称轴', '求根公式', '抛物线', '二次项系数']
+_TERMS_EN = ['derivative', 'chain rule', 'limit', 'integral', 'tangent line', 'continuity', 'product rule']
+_TEMPLATES_ZH = ['{a}的性质决定了{b}的位置。', '例如，已知{a}，求{b}。', '{a}与{b}之间的关系需要重点掌握。',
+                 '利用{a}可以快速判断{b}。']
+_TEMPLATES_EN = ['The {a} is used to compute the {b}.', 'For example, find the {b} using the {a}.',
+                 'Students often confuse the {a} with the {b}.', 'We apply the {a} before checking {b}.']
+
+
+def make_document(chars, seed):
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < chars:
+        if rng.random() < 0.5:
+            sentence = rng.choice(_TEMPLATES_ZH).format(a=rng.choice(_TERMS_ZH), b=rng.choice(_TERMS_ZH))
+        else:
+            sentence = rng.choice(_TEMPLATES_EN).format(a=rng.choice(_TERMS_EN), b=rng.choice(_TERMS_EN))
+        if rng.random() < 0.1:
+            sentence += '\n\n'
+        parts.append(sentence)
+        length += len(sentence)
+    return ' '.join(parts)[:chars]
+
+
+def measure(chars, runs, seed):
+    engine = ExtractiveEngine()
+    text = make_document(chars, seed)
+    note_ms, mindmap_ms = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        engine.note(text, 'Mathematics')
+        note_ms.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        engine.mindmap('Mathematics', text)
+        mindmap_ms.append((time.perf_counter() - started) * 1000)
+    return {'chars': chars, 'note_ms': round(statistics.median(note_ms), 1),
+            'mindmap_ms': round(statistics.median(mindmap_ms), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the local extractive engine on generated documents')
+    parser.add_argument('--sizes', default='2000,10000,60000', help='Comma-separated document sizes in characters')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    rows = [measure(int(size), args.runs, args.seed) for size in args.sizes.split(',')]
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+    print(f"{'chars':>7} {'note ms':>9} {'mindmap ms':>11}")
+    for row in rows:
+        print(f"{row['chars']:>7} {row['note_ms']:>9} {row['mindmap_ms']:>11}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
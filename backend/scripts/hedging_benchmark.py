@@ -0,0 +1,107 @@
+"""
+Hedging benchmark - tail latency of concurrent note generations with and without hedging,
+against two local simulator instances (slow-tailed primary, steady backup)
+
+Usage (from backend/):
+    python scripts/hedging_benchmark.py [--requests 300] [--concurrency 16] [--seed 1] [--json]
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulator.config import _merge, load_config  # noqa: E402
+from simulator.server import SimulatorServer  # noqa: E402
+
+# 与 [user-033] 提交说明中的配置一致：主 provider 长尾明显，备用 provider 稳定但中位数略高
+PRIMARY = {'latency': {'dist': 'lognormal', 'median_ms': 150, 'sigma': 1.0}, 'stream_interval_ms': 0}
+BACKUP = {'latency': {'dist': 'lognormal', 'median_ms': 200, 'sigma': 0.2}, 'stream_interval_ms': 0}
+WARMUP = 40  # 对冲延迟需要 AI_HEDGE_MIN_SAMPLES（默认 20）个样本
+
+
+def _start(profile, seed):
+    config = _merge(load_config(seed=seed), {'endpoints': {'chat': profile}})
+    return SimulatorServer(port=0, config=config).start()
+
+
+def _percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def run_mode(hedge, requests, concurrency, seed):
+    """一种模式跑一遍：每次使用新的模拟器（同一 seed）和新的 Hedger，结果互不影响"""
+    from services import resilience
+    from services.hedging import Hedger
+
+    # services 包把 ai_service 单例重新导出，模块本身要按名字取
+    ai_module = importlib.import_module('services.ai_service')
+    primary, backup = _start(PRIMARY, seed), _start(BACKUP, seed + 1)
+    os.environ.update({
+        'DEEPSEEK_BASE_URL': f'{primary.url}/v1',
+        'DEEPSEEK_API_KEY': 'sim-deepseek-key',
+        'AI_PROVIDER_BACKUP_BASE_URL': f'{backup.url}/v1',
+        'AI_PROVIDER_BACKUP_API_KEY': 'sim-backup-key',
+        'AI_TEXT_PROVIDERS': 'deepseek,backup',
+        'AI_HEDGE_METHODS': 'note' if hedge else '',
+        'AI_HEDGE_WORKERS': str(concurrency * 2),
+    })
+    ai_module.hedger = Hedger()
+    ai_module.ai_service.transport._clients = {}
+    resilience._breakers = {}
+
+    def _one(i):
+        started = time.monotonic()
+        ai_module.ai_service._chat_completion(
+            'note', model='deepseek-chat',
+            messages=[{'role': 'user', 'content': f'Please generate a structured study note #{i}'}]
+        )
+        return time.monotonic() - started
+
+    try:
+        for i in range(WARMUP):
+            _one(-i)
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(_one, range(requests)))
+        hedge_stats = ai_module.hedger.stats()
+    finally:
+        primary.shutdown()
+        backup.shutdown()
+
+    return {
+        'mode': 'hedged' if hedge else 'failover only',
+        'p50': round(_percentile(latencies, 0.5), 3),
+        'p90': round(_percentile(latencies, 0.9), 3),
+        'p99': round(_percentile(latencies, 0.99), 3),
+        'max': round(max(latencies), 3),
+        'hedge_rate': hedge_stats['hedge_rate'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare tail latency with and without hedged requests')
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    rows = [run_mode(hedge, args.requests, args.concurrency, args.seed) for hedge in (False, True)]
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+    print(f"{'mode':<14} {'p50':>7} {'p90':>7} {'p99':>7} {'max':>7} {'hedges':>7}")
+    for row in rows:
+        print(f"{row['mode']:<14} {row['p50']:>7} {row['p90']:>7} {row['p99']:>7} {row['max']:>7} "
+              f"{row['hedge_rate']:>7.1%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+Prompt size benchmark - token counts per template; exits 1 when a template exceeds its budget
+
+Usage (from backend/):
+    python scripts/prompt_benchmark.py [--json]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.prompts import PROMPTS  # noqa: E402
+
+
+def collect():
+    rows = []
+    for name, template in sorted(PROMPTS.items()):
+        rows.append({
+            'name': name,
+            'static_tokens': template.static_tokens(),
+            'cacheable_prefix_tokens': template.prefix_tokens(),
+            'budget': template.budget,
+            'variables': template.fields,
+            'over_budget': template.budget is not None and template.static_tokens() > template.budget
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report prompt template sizes and enforce token budgets')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    rows = collect()
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(f"{'template':<24} {'static':>7} {'prefix':>7} {'budget':>7}  status")
+        for row in rows:
+            status = 'OVER BUDGET' if row['over_budget'] else 'ok'
+            budget = row['budget'] if row['budget'] is not None else '-'
+            print(f"{row['name']:<24} {row['static_tokens']:>7} {row['cacheable_prefix_tokens']:>7} {budget:>7}  {status}")
+        print(f"\ntotal static tokens: {sum(row['static_tokens'] for row in rows)}")
+
+    over = [row['name'] for row in rows if row['over_budget']]
+    if over:
+        print(f"\nTemplates over budget: {', '.join(over)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
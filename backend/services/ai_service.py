@@ -4,17 +4,176 @@ AI Service - DeepSeek API Integration & Qwen-VL Integration
 
 import os
 import json
-import re
-from openai import OpenAI
-from dashscope import MultiModalConversation
+import contextvars
+import hashlib
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .cassette import cassette
+from .resilience import (
+    ProviderHTTPError, bounded_deadline, breaker_states, call_with_retries, check_deadline,
+    current_deadline, ensure_request_deadline, get_breaker, remaining_budget
+)
+from .transport import transport
+from .hedging import stream_completion, hedged_methods, hedger, text_providers
+from .answer_checker import check_answer
+from .json_repair import model_json, parse_model_json
+from .mermaid_validator import mermaid_validator
+from .prompts import get_prompt
+from .extractive import extractive_engine
+from .audio_segments import leading_speech, split_on_silence, stitch_transcripts
+from .audio_encode import encode_pcm
+from .async_asr import async_xfyun
+from .content_cache import bytes_digest, content_cache, file_digest
+from .chunking import (
+    chunk_token_budget, content_token_budget, estimate_tokens, map_concurrently, map_streaming, split_text
+)
+
+# 每类调用的默认截止时间（秒），可通过环境变量 AI_TIMEOUT_<METHOD> 覆盖
+METHOD_TIMEOUTS = {
+    'mindmap': 90,
+    'chat': 45,
+    'similar': 90,
+    'judge': 45,
+    'note': 60,
+    'vision': 60,
+    'ocr': 45,
+    'transcribe': 180,
+    'summarize': 60
+}
+
 
 class AIService:
     def __init__(self):
-        self.client = OpenAI(
-            api_key=os.environ.get('DEEPSEEK_API_KEY'),
-            base_url="https://api.deepseek.com"
-        )
+        # 网络客户端由 transport 层按需创建并池化复用，这里不做任何连接初始化
+        self.transport = transport
         self.dashscope_api_key = os.getenv("DASHSCOPE_API_KEY", "sk-52e14360ea034580a43eee057212de78")
+
+    @property
+    def client(self):
+        """DeepSeek 客户端（懒加载，共享连接池）"""
+        return self.transport.openai_client('deepseek')
+
+    def _method_timeout(self, method):
+        return float(os.getenv(f'AI_TIMEOUT_{method.upper()}', METHOD_TIMEOUTS.get(method, 60)))
+
+    def _deadline(self, method):
+        """本次调用的截止时间：方法超时与请求剩余时间取小；剩余时间太少时直接跳过调用"""
+        check_deadline(method, float(os.getenv('AI_MIN_CALL_SECONDS', 2)))
+        return bounded_deadline(self._method_timeout(method))
+
+    def _chat_completion(self, method, **kwargs):
+        """
+        带截止时间、抖动重试和熔断的 chat completion 调用。
+        配置了多个文本 provider（AI_TEXT_PROVIDERS）时按顺序故障转移，
+        AI_HEDGE_METHODS 中的调用还会在主 provider 变慢时对冲到下一个 provider。
+        """
+        deadline = self._deadline(method)
+        providers = text_providers()
+        if len(providers) == 1:
+            return self._provider_completion(providers[0], deadline, kwargs)
+
+        def _attempt(provider, cancel):
+            return self._provider_completion(provider, deadline, kwargs, cancel)
+
+        prompt_tokens = sum(estimate_tokens(str(m.get('content', ''))) for m in kwargs.get('messages', []))
+        return hedger.run(
+            method, providers, _attempt, hedge=method in hedged_methods(), prompt_tokens=prompt_tokens
+        )
+
+    def _provider_completion(self, provider, deadline, kwargs, cancel=None):
+        """在某个 provider 上调用一次（含重试）；cancel 不为空时走可取消的流式调用"""
+        client = self.transport.openai_client(provider)
+        kwargs = {**kwargs, 'model': self.transport.model(provider, kwargs.get('model'))}
+
+        def _call(timeout):
+            if cancel is None:
+                return client.chat.completions.create(timeout=self.transport.call_timeout(timeout), **kwargs)
+            streamed = {k: v for k, v in kwargs.items() if k != 'stream'}
+            return stream_completion(client, streamed, cancel, self.transport.call_timeout(timeout))
+
+        return call_with_retries(_call, get_breaker(provider), deadline)
+
+    def _multimodal_call(self, method, messages, model='qwen-vl-plus'):
+        """带截止时间、抖动重试和熔断的 Qwen-VL 调用（限流和 5xx 视为可重试）"""
+        def _call(timeout):
+            response = self.transport.dashscope_multimodal(model, messages, self.dashscope_api_key, timeout)
+            status = response.status_code
+            if status == 429 or status >= 500:
+                raise ProviderHTTPError(status, getattr(response, 'message', ''))
+            return response
+
+        return call_with_retries(_call, get_breaker('dashscope'), self._deadline(method))
+
+    def provider_health(self):
+        """各 provider 熔断器状态"""
+        return breaker_states()
+
+    def json_stats(self):
+        """模型输出 JSON 解析统计（修复 / 截断抢救 / 失败即需重新请求的次数）"""
+        return model_json.stats()
+
+    def hedge_stats(self):
+        """对冲请求统计（对冲率、各 provider 胜出 / 取消次数和浪费的 token）"""
+        return hedger.stats()
+
+    def summarize_chunk(self, topic, chunk, index, total=None, target_tokens=None):
+        """
+        map 阶段：把一个分块压缩成层级提纲；失败时退化为分块开头的原文。
+        total 为分块总数；边识别边起草时总数还不知道，传 None（提示词里说明后面可能还有）
+        """
+        if target_tokens is None:
+            # 总数未知时每份提纲按四分之一预算，合并后超预算由 generate_note_from_outlines 再压缩一轮
+            target_tokens = max(200, content_token_budget() // (total or 4))
+        position = f"Part {index + 1} of {total}" if total else f"Part {index + 1} (more parts may follow)"
+        prompt = get_prompt('summarize_chunk').user_text(
+            topic=topic, target_tokens=target_tokens, position=position, chunk=chunk
+        )
+        try:
+            response = self._chat_completion(
+                'summarize',
+                model="deepseek-chat",
+                messages=[{"role": "user", "content": prompt}],
+                stream=False,
+                temperature=0.3,
+                max_tokens=target_tokens * 2
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            print(f"Error summarizing chunk {index + 1}/{total or '?'}: {e}")
+            return chunk[:target_tokens]
+
+    @staticmethod
+    def _join_outlines(outlines):
+        return '\n\n'.join(f"Part {i + 1}:\n{outline}" for i, outline in enumerate(outlines))
+
+    def _fit_content(self, topic, text, budget=None, max_rounds=2):
+        """
+        Map-reduce：文本超出 token 预算时，按结构切块、并发压缩成提纲再合并，
+        直到能放进一个 prompt。墙钟时间约等于单个分块的延迟而不是 N 倍。
+        """
+        if budget is None:
+            budget = content_token_budget()
+        remaining = remaining_budget()
+        if estimate_tokens(text) > budget and remaining is not None \
+                and remaining < float(os.getenv('AI_MAP_REDUCE_MIN_SECONDS', 20)):
+            # 请求剩余时间不够再跑一轮 map-reduce，直接截断
+            print(f"[CHUNKING] {remaining:.1f}s left, truncating instead of map-reduce")
+            return text[:budget]
+        for _ in range(max_rounds):
+            if estimate_tokens(text) <= budget:
+                return text
+            chunks = split_text(text, chunk_token_budget())
+            total = len(chunks)
+            print(f"[CHUNKING] {estimate_tokens(text)} tokens -> {total} chunks")
+            outlines = map_concurrently(
+                lambda item: self.summarize_chunk(topic, item[1], item[0], total),
+                list(enumerate(chunks))
+            )
+            text = self._join_outlines(outlines)
+        # 多轮压缩后仍超预算（极端情况）才截断
+        return text if estimate_tokens(text) <= budget else text[:budget]
     
     def generate_mindmap_mermaid(self, topic, depth=3, context='', style='TD'):
         """
@@ -25,159 +184,6 @@ class AIService:
         - Data Cleaning/Data Analysis: 1.0 (思维导图生成属于数据分析类任务)
         - 需要在准确性和创造性之间取得平衡
         """
-        # 根据样式设置不同的系统提示
-        if style == 'radial':
-            system_prompt = """You are a mind map generation assistant. Generate Mermaid MINDMAP syntax for radial mind maps.
-
-CRITICAL: Use Mermaid's native mindmap syntax following official specification.
-
-MINDMAP SYNTAX RULES (from https://mermaid.js.org/syntax/mindmap.html):
-1. Start with 'mindmap' keyword
-2. Root node: root((text)) - use circle shape
-3. Shape options for child nodes:
-   - Square brackets: [text]
-   - Rounded: (text)
-   - Circle: ((text))
-   - Cloud: )text(
-   - Hexagon: {{text}}
-   - Bang: ))text((
-   - Default: text
-4. Indentation: Use exactly 2 spaces per level (strict)
-5. Icons: ::icon(fa fa-icon-name) on same line after text
-6. All siblings MUST be at exact same indentation
-
-LABEL TEXT SAFETY RULES (CRITICAL to prevent parse errors):
-- NO parentheses ( ) inside labels - they conflict with shape syntax
-- NO square brackets [ ] inside labels - they conflict with shape syntax
-- NO curly braces { } inside labels - they conflict with shape syntax
-- NO special math symbols: π, ², ³, α, β, γ, θ, ∑, ∫, ≈, ≠, ≤, ≥
-- NO punctuation that could be operators: <, >, ~, |, &, ^
-- Use simple alternatives:
-  * "power of 2" or "squared" instead of ²
-  * "pi" instead of π
-  * "theta" instead of θ
-  * "approximately" instead of ≈
-  * "not equal" instead of ≠
-- For equations: use plain text like "E equals mc squared" or "z equals r times e to the i theta"
-- Keep labels simple, descriptive, use common words
-- If technical terms needed, use plain English/Chinese descriptions
-
-STRUCTURE PRINCIPLES for balanced distribution:
-- Root level: root((Topic))
-- Level 1: 4-8 main branches using (Branch) or [Branch]
-- Level 2: 2-4 items per branch
-- Level 3: 1-3 items per level 2 item
-- Keep branches balanced - similar number of children
-- Use shape variety: alternate between (text) and [text] for level 1
-
-EXAMPLE with proper structure:
-mindmap
-  root((Central Idea))
-    (Branch Alpha)
-      Item A1
-      Item A2
-      Item A3
-    [Branch Beta]
-      Item B1
-      Item B2
-    (Branch Gamma)
-      Item C1
-      Item C2
-      Item C3
-    [Branch Delta]
-      Item D1
-      Item D2
-
-OUTPUT: Only mindmap code, no ```mermaid blocks, no explanations"""
-        else:
-            graph_direction = 'TD' if style == 'TD' else 'LR'
-            system_prompt = f"""You are a mind map generation assistant. Generate Mermaid syntax for HIERARCHICAL mind maps.
-
-CRITICAL SYNTAX RULES (must follow strictly to avoid parse errors):
-1. Use 'graph {graph_direction}' for {'top-down' if style == 'TD' else 'left-right'} layout
-2. Node IDs: Use only [A-Z][A-Z0-9]* (e.g., A, B1, C2, ROOT)
-3. Node labels: Wrap in square brackets [Label Text]
-4. Connections: Use --> between nodes (e.g., A --> B1)
-
-LABEL TEXT SAFETY RULES (CRITICAL - most common source of parse errors):
-**FORBIDDEN CHARACTERS in labels:**
-- NO parentheses: ( )  - causes "Expecting 'SQE', got 'PS'" error
-- NO square brackets: [ ]  - conflicts with label delimiters
-- NO curly braces: {{ }}  - conflicts with special nodes
-- NO angle brackets: < >  - reserved syntax
-- NO pipes: |  - reserved for subgraphs
-- NO quotes: " '  - can break string parsing
-- NO backslashes: \  - escape character issues
-- NO special math symbols: π, ², ³, α, β, γ, θ, φ, ω, Δ, ∑, ∫, √, ∞
-- NO math operators in complex expressions: ^, ~, ≈, ≠, ≤, ≥, ±, ×, ÷
-- NO semicolons or colons in complex contexts: ; :
-
-**SAFE ALTERNATIVES:**
-- Mathematical expressions:
-  * "z = r e^(i theta)" → "z equals r times exponential of i theta"
-  * "f(x) = x²" → "f of x equals x squared"
-  * "∫ f(x) dx" → "integral of f x dx"
-  * "Σ(n=1 to ∞)" → "sum from n equals 1 to infinity"
-  * "θ₀ + 2kπ" → "theta-0 plus 2k pi"
-  
-- Use descriptive phrases:
-  * Instead of "f(x)", use "function f of x" or "f-x"
-  * Instead of "(a+b)²", use "a plus b squared"
-  * Instead of "cos(θ)", use "cosine theta" or "cos-theta"
-  
-- For technical terms, use hyphens or underscores:
-  * "euler_formula" instead of "Euler's formula (e^iθ)"
-  * "complex-form" instead of "(a + bi)"
-  * "nth-term" instead of "n-th term"
-
-**SAFE CHARACTERS:**
-- Letters: a-z, A-Z
-- Numbers: 0-9
-- Basic punctuation: . , ! ? (use sparingly)
-- Separators: space, hyphen -, underscore _
-- Safe operators in simple context: + - * / =
-
-6. Format rules:
-   - Each line: one node definition OR one connection
-   - Node definition: NodeID[Label]
-   - Connection: NodeID --> NodeID
-   - No inline comments or extra text
-
-7. Structure:
-   - Define ALL nodes first (one per line)
-   - Then define ALL connections (one per line)
-   - OR define node and its connections together
-
-EXAMPLE of CORRECT syntax:
-graph {graph_direction}
-    A[Central Topic]
-    B1[Branch One]
-    B2[Branch Two]
-    C1[Detail 1]
-    C2[Detail 2]
-    A --> B1
-    A --> B2
-    B1 --> C1
-    B1 --> C2
-
-EXAMPLE with math content (SAFE):
-graph {graph_direction}
-    A[Complex Numbers]
-    B1[Polar Form]
-    B2[Exponential Form]
-    C1[r times cosine theta plus i sine theta]
-    C2[r times e to the i theta]
-    A --> B1
-    A --> B2
-    B1 --> C1
-    B2 --> C2
-
-Rules for HIERARCHICAL style:
-- Clear parent-child relationships
-- Logical hierarchical structure
-- Keep labels simple and readable
-- Only output the Mermaid code, no explanations or markdown blocks"""
-
         # 处理depth参数
         if depth == 'auto' or depth == 'auto':
             depth_instruction = "Automatically determine the appropriate depth based on the topic complexity (typically 3-5 levels)"
@@ -189,181 +195,41 @@ Rules for HIERARCHICAL style:
                 depth = 3
                 depth_instruction = "Create 3 levels of hierarchy"
 
+        source_text = context
+        context = f'Additional context: {context}' if context else ''
         if style == 'radial':
-            user_prompt = f"""Generate a RADIAL mind map using Mermaid's mindmap syntax for: "{topic}"
-
-Style: Radial mindmap (refer to hierarchy style for similar visual appearance)
-Depth: {depth_instruction}
-{f'Additional context: {context}' if context else ''}
-
-STRICT REQUIREMENTS:
-- Use 'mindmap' syntax
-- Root node: root(({topic}))
-- Create 5-8 main branches from root
-- Use alternating shapes for level 1: (Branch1), [Branch2], (Branch3), [Branch4], etc.
-- Each main branch: 2-4 child items
-- Each child item: 0-2 sub-items (if depth allows)
-- CRITICAL: Use exactly 2 spaces for each indentation level
-- Keep siblings at EXACT same indentation
-- Balance branch sizes (similar number of children)
-- Use concise labels (3-8 words max)
-
-LABEL SAFETY (MOST IMPORTANT):
-- NO parentheses ( ), brackets [ ], braces {{ }} in any label text
-- NO mathematical symbols: π, ², ³, α, β, γ, θ, etc.
-- For equations, use plain English: "x squared" not "x²", "theta" not "θ"
-- Simple, clear, descriptive text only
-
-EXAMPLE STRUCTURE:
-mindmap
-  root(({topic}))
-    (Category A)
-      Detail A1
-      Detail A2
-        Sub A2.1
-    [Category B]
-      Detail B1
-      Detail B2
-      Detail B3
-    (Category C)
-      Detail C1
-      Detail C2
-
-OUTPUT: Only the mindmap code, starting with 'mindmap'"""
+            messages = get_prompt('mindmap_radial_topic').messages(
+                topic=topic, depth_instruction=depth_instruction, context=context
+            )
         else:
-            user_prompt = f"""Generate a HIERARCHICAL mind map in Mermaid syntax for: "{topic}"
-
-Style: {'Top-Down' if style == 'TD' else 'Left-Right'} hierarchy
-Depth: {depth_instruction}
-{f'Additional context: {context}' if context else ''}
-
-CRITICAL REQUIREMENTS to avoid syntax errors:
-1. Start with 'graph {style}'
-2. Node IDs: Simple alphanumeric only (A, B1, C2, ROOT, NODE1, etc.)
-3. Labels in [square brackets]: Follow SAFETY RULES below
-
-**LABEL SAFETY RULES (CRITICAL):**
-- NEVER use parentheses ( ) - causes immediate parse error
-- NEVER use square brackets [ ] - conflicts with label syntax
-- NEVER use curly braces {{ }} - conflicts with special nodes
-- NO mathematical symbols at all: π ² ³ α β γ θ φ ω Δ ∑ ∫ √ ∞
-- NO complex punctuation: < > | & ~ ^ ` quotes
-
-**For mathematical/technical content:**
-- Use plain text descriptions
-- Example: "z = re^i(theta0 + 2kpi)" → "z equals r e to the i theta"
-- Example: "f(x) = x²" → "function f-x equals x squared"
-- Example: "cos(θ)" → "cosine of theta" or "cos-theta"
-- Use hyphens/underscores for compound terms: "euler-formula", "complex_number"
-
-4. Structure:
-   - Define nodes first: A[Label Text]
-   - Then connections: A --> B
-   - Clear hierarchy from general to specific
-   
-5. Keep labels concise (3-8 words) and readable
-6. Each branch: 2-4 sub-nodes where appropriate
-
-EXAMPLE FORMAT:
-graph {style}
-    ROOT[{topic}]
-    A[Main Concept 1]
-    B[Main Concept 2]
-    ROOT --> A
-    ROOT --> B
-    A1[Detail 1.1]
-    A2[Detail 1.2]
-    A --> A1
-    A --> A2
-
-EXAMPLE with technical content:
-graph {style}
-    A[Complex Numbers]
-    B[Polar Representation]
-    C[r times e to the i theta]
-    D[Euler Formula Connection]
-    A --> B
-    B --> C
-    B --> D
-
-OUTPUT: Only valid Mermaid code, no markdown blocks, no explanations"""
+            direction = 'TD' if style == 'TD' else 'LR'
+            messages = get_prompt('mindmap_graph_topic').messages(
+                direction=direction, layout='top-down' if direction == 'TD' else 'left-right',
+                depth_instruction=depth_instruction, topic=topic, context=context
+            )
 
         try:
-            response = self.client.chat.completions.create(
+            response = self._chat_completion(
+                'mindmap',
                 model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=messages,
                 stream=False,
                 temperature=1.0,
                 max_tokens=8000
             )
             
-            mermaid_code = response.choices[0].message.content.strip()
-            
-            # 清理代码块标记
-            if mermaid_code.startswith('```mermaid'):
-                mermaid_code = mermaid_code.replace('```mermaid', '').replace('```', '').strip()
-            elif mermaid_code.startswith('```'):
-                mermaid_code = mermaid_code.replace('```', '').strip()
-            
-            return mermaid_code
+            return self._finalize_mindmap(response.choices[0].message.content, topic, depth, style, source_text)
             
         except Exception as e:
             print(f"Error calling DeepSeek API: {e}")
-            return self._generate_fallback_mindmap(topic, depth, style)
+            return self._finalize_mindmap(self._generate_fallback_mindmap(topic, depth, style, source_text), topic, depth, style)
     
     def generate_mindmap_from_content(self, topic, file_content, depth=3, style='TD'):
         """
         根据文件内容生成思维导图
         """
-        if style == 'radial':
-            system_prompt = """You are a mind map generation assistant. Analyze content and create a RADIAL mind map using Mermaid's mindmap syntax.
-
-Follow official Mermaid mindmap specification:
-- Use 'mindmap' keyword
-- Root: root((text)) with circle shape
-- Level 1: Use (text) or [text] shapes alternately
-- Exactly 2 spaces per indentation level
-- Siblings at exact same indentation
-- Balance branches (similar number of children)
-
-LABEL SAFETY (CRITICAL):
-- NO parentheses ( ), brackets [ ], braces {{ }} in label text
-- NO mathematical symbols: π, ², ³, α, β, γ, θ, etc.
-- NO operators that could conflict: <, >, |, &, ^
-- Use plain English/Chinese descriptions for technical terms
-- For equations: "x squared" not "x²", "pi" not "π", "theta" not "θ"
-
-Focus on extracting key concepts and organizing them hierarchically."""
-        else:
-            graph_direction = 'TD' if style == 'TD' else 'LR'
-            system_prompt = f"""You are a mind map generation assistant. Analyze the provided content and create a HIERARCHICAL mind map in Mermaid syntax using 'graph {graph_direction}'.
-
-CRITICAL SYNTAX RULES to prevent parse errors:
-1. Node IDs: Simple alphanumeric (A, B1, C2, ROOT)
-2. Labels: Plain text only in [brackets]
-3. Format: Define nodes, then connections
-4. One statement per line
-
-LABEL SAFETY RULES (MOST IMPORTANT):
-**NEVER use these characters in labels:**
-- Parentheses: ( )  - causes "Expecting 'SQE', got 'PS'" error
-- Brackets: [ ]  - conflicts with label delimiters
-- Braces: {{ }}  - conflicts with special syntax
-- Math symbols: π, ², ³, α, β, γ, θ, φ, ω, Δ, ∑, ∫, √, ∞
-- Operators: < > | & ~ ^ (except in simple contexts)
-- Quotes: " '
-
-**Use safe alternatives:**
-- "f(x) = x²" → "function f-x equals x squared"
-- "e^(iθ)" → "e to the i theta"
-- "∫ f(x) dx" → "integral of f-x dx"
-- "(a+b)²" → "a plus b squared"
-- "θ₀" → "theta-0"
-
-Focus on extracting key concepts, relationships, and hierarchies from the content."""
+        # 长文档先 map-reduce 压缩，保证全文都被覆盖
+        content = self._fit_content(topic, file_content)
 
         # 处理depth参数
         if depth == 'auto' or depth == 'auto':
@@ -376,158 +242,59 @@ Focus on extracting key concepts, relationships, and hierarchies from the conten
                 depth = 3
                 depth_instruction = "Create 3 levels of hierarchy"
 
+        # 与 generate_mindmap_mermaid 共用 system 前缀
         if style == 'radial':
-            user_prompt = f"""Create a mind map using Mermaid's mindmap syntax for: "{topic}"
-
-Based on this content:
-{file_content[:2000]}
-
-Style: Radial mindmap (refer to hierarchy for similar appearance)
-Depth: {depth_instruction}
-
-REQUIREMENTS:
-- Extract main concepts from content
-- Organize in mindmap structure: root((Topic))
-- Use alternating shapes for level 1: (Branch), [Branch]
-- Exactly 2 spaces per indentation
-- 5-8 main branches with 2-4 children each
-- Balance branch sizes
-
-CRITICAL LABEL SAFETY:
-- NO parentheses, brackets, or braces in any label
-- NO mathematical symbols (π, ², ³, θ, α, etc.)
-- Use plain descriptive text only
-- For technical terms: use simple English/Chinese
-
-OUTPUT: Only mindmap code, no markdown blocks"""
+            messages = get_prompt('mindmap_radial_content').messages(
+                depth_instruction=depth_instruction, topic=topic, content=content
+            )
         else:
-            user_prompt = f"""Create a mind map in Mermaid syntax for: "{topic}"
-
-Based on this content:
-{file_content[:2000]}
-
-Style: {'Top-Down' if style == 'TD' else 'Left-Right'} hierarchy
-Depth: {depth_instruction}
-
-CRITICAL SYNTAX REQUIREMENTS:
-- Start with 'graph {style}'
-- Node IDs: Alphanumeric only (ROOT, A, B1, C2)
-- Labels in [brackets]: Follow SAFETY rules
-
-**LABEL SAFETY (MOST CRITICAL):**
-- NEVER use parentheses ( ) in labels - causes parse error
-- NEVER use brackets [ ] or braces {{ }} in labels
-- NO math symbols: π, ², ³, α, β, γ, θ, etc.
-- Use plain text alternatives:
-  * "e^(iθ)" → "e to the i theta"
-  * "f(x)" → "function f-x" or "f of x"
-  * "x²" → "x squared"
-  * Use hyphens for compound terms: "euler-formula"
-
-- Define nodes, then connections
-- Clear hierarchy structure
-- Extract main ideas and organize {'top-down' if style == 'TD' else 'left-right'}
-
-OUTPUT: Only valid Mermaid code, no markdown, no explanations"""
+            direction = 'TD' if style == 'TD' else 'LR'
+            messages = get_prompt('mindmap_graph_content').messages(
+                direction=direction, layout='top-down' if direction == 'TD' else 'left-right',
+                depth_instruction=depth_instruction, topic=topic, content=content
+            )
 
         try:
-            response = self.client.chat.completions.create(
+            response = self._chat_completion(
+                'mindmap',
                 model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=messages,
                 stream=False,
                 temperature=1.0,
                 max_tokens=8000
             )
             
-            mermaid_code = response.choices[0].message.content.strip()
-            
-            # 清理代码块标记
-            if mermaid_code.startswith('```mermaid'):
-                mermaid_code = mermaid_code.replace('```mermaid', '').replace('```', '').strip()
-            elif mermaid_code.startswith('```'):
-                mermaid_code = mermaid_code.replace('```', '').strip()
-            
-            return mermaid_code
+            return self._finalize_mindmap(response.choices[0].message.content, topic, depth, style, file_content)
             
         except Exception as e:
             print(f"Error calling DeepSeek API: {e}")
-            return self._generate_fallback_mindmap(topic, depth, style)
+            return self._finalize_mindmap(self._generate_fallback_mindmap(topic, depth, style, file_content), topic, depth, style)
     
-    def _generate_fallback_mindmap(self, topic, depth, style='TD'):
-        """后备方案：生成基础思维导图"""
-        if style == 'radial':
-            # 使用原生 mindmap 语法，交替使用形状
-            mermaid_code = f"""mindmap
-  root(({topic}))
-    (Core Concept 1)
-      Key Point 1.1
-      Key Point 1.2
-      Key Point 1.3
-    [Core Concept 2]
-      Key Point 2.1
-      Key Point 2.2
-    (Core Concept 3)
-      Key Point 3.1
-      Key Point 3.2
-      Key Point 3.3
-    [Core Concept 4]
-      Key Point 4.1
-      Key Point 4.2
-    (Core Concept 5)
-      Key Point 5.1
-      Key Point 5.2"""
-            
-            if depth >= 3:
-                mermaid_code += """
-        Detail 1.1.1
-        Detail 1.1.2
-        Detail 2.1.1"""
-        else:
-            # 层级型思维导图
-            graph_dir = 'TD' if style == 'TD' else 'LR'
-            mermaid_code = f"""graph {graph_dir}
-    A[{topic}]
-    """
-            
-            if depth >= 1:
-                mermaid_code += """    A --> B1[Core Concept 1]
-    A --> B2[Core Concept 2]
-    A --> B3[Core Concept 3]
-    """
-            
-            if depth >= 2:
-                mermaid_code += """    B1 --> C1[Detail 1.1]
-    B1 --> C2[Detail 1.2]
-    B2 --> C3[Detail 2.1]
-    B2 --> C4[Detail 2.2]
-    B3 --> C5[Detail 3.1]
-    """
-            
-            if depth >= 3:
-                mermaid_code += """    C1 --> D1[Example 1.1.1]
-    C2 --> D2[Example 1.2.1]
-    C3 --> D3[Example 2.1.1]
-    """
-        
-        return mermaid_code.strip()
-    
-    
-    
-    
-    
-    
-    
-    
-    
-    
-    def chat(self, user_message, conversation_history=None):
+    def _finalize_mindmap(self, mermaid_code, topic, depth, style, source_text=''):
+        """保存前本地校验并修复 Mermaid 代码（去代码块、清理标签、规整缩进、修复断开的连线）；无法修复时用后备导图"""
+        repaired, _ = mermaid_validator.repair(mermaid_code, topic)
+        if repaired is None:
+            repaired, _ = mermaid_validator.repair(self._generate_fallback_mindmap(topic, depth, style, source_text), topic)
+        return repaired
+
+    def asr_stats(self):
+        """讯飞识别会话统计（事件循环上的活跃 / 峰值会话数、完成 / 失败 / 取消次数）"""
+        return async_xfyun.stats()
+
+    def mindmap_stats(self):
+        """Mermaid 校验 / 修复统计"""
+        return mermaid_validator.stats()
+
+    def _generate_fallback_mindmap(self, topic, depth, style='TD', text=''):
+        """后备方案：本地抽取关键短语生成思维导图（无需网络）"""
+        return extractive_engine.mindmap(topic, text, depth, style)
+
+    def chat(self, user_message, conversation_history=None, summary=None):
         """
         处理聊天对话
         user_message: 用户消息
         conversation_history: 历史对话列表，格式 [{'role': 'user/assistant', 'content': '...'}]
+        summary: 更早对话的滚动摘要（由 ConversationStore 提供，此时历史已按 token 预算裁剪）
         
         Temperature设置说明(官方推荐):
         - General Conversation: 1.3 (通用对话,需要更自然和多样化的回复)
@@ -537,28 +304,24 @@ OUTPUT: Only valid Mermaid code, no markdown, no explanations"""
         if conversation_history is None:
             conversation_history = []
         
-        system_prompt = """You are a helpful AI study assistant. You help students with:
-- Answering questions about their studies
-- Explaining concepts clearly
-- Providing learning guidance
-- Helping with homework and assignments
-- Organizing study materials
-
-Be friendly, clear, and concise in your responses. Use LaTeX notation for mathematical formulas (e.g., $x^2$ for inline math, $$\\frac{a}{b}$$ for display math). Format your answers well for readability."""
+        # 固定的 system 在最前面，摘要和历史在后面，保证请求前缀稳定
+        chat_prompt = get_prompt('chat')
+        messages = [{"role": "system", "content": chat_prompt.system}]
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
         
-        # 构建消息列表
-        messages = [{"role": "system", "content": system_prompt}]
-        
-        # 添加历史对话（最多保留最近10轮对话以控制token和速度）
+        # 添加历史对话（客户端传来的历史最多保留最近10轮对话以控制token和速度）
         if conversation_history:
-            recent_history = conversation_history[-10:] if len(conversation_history) > 10 else conversation_history
-            messages.extend(recent_history)
+            if summary is None and len(conversation_history) > 10:
+                conversation_history = conversation_history[-10:]
+            messages.extend(conversation_history)
         
         # 添加当前用户消息
         messages.append({"role": "user", "content": user_message})
         
         try:
-            response = self.client.chat.completions.create(
+            response = self._chat_completion(
+                'chat',
                 model="deepseek-chat",
                 messages=messages,
                 stream=False,
@@ -573,6 +336,30 @@ Be friendly, clear, and concise in your responses. Use LaTeX notation for mathem
             print(f"Error calling DeepSeek chat API: {e}")
             raise Exception("Failed to get AI response")
     
+    def summarize_conversation(self, previous_summary, messages):
+        """
+        把较早的对话轮次合并进滚动摘要
+
+        Args:
+            previous_summary: 已有摘要（可为空）
+            messages: [{'role': ..., 'content': ...}]，按时间顺序
+
+        Returns:
+            str: 更新后的摘要
+        """
+        transcript = '\n'.join(f"{m['role']}: {m['content']}" for m in messages)
+        prompt = get_prompt('chat_summary').user_text(previous_summary=previous_summary or '(none)', transcript=transcript)
+
+        response = self._chat_completion(
+            'summarize',
+            model="deepseek-chat",
+            messages=[{"role": "user", "content": prompt}],
+            stream=False,
+            temperature=0.3,
+            max_tokens=600
+        )
+        return response.choices[0].message.content.strip()
+    
     def generate_similar_questions(self, question_text, count=3, grade=None):
         """
         生成相似练习题
@@ -585,44 +372,13 @@ Be friendly, clear, and concise in your responses. Use LaTeX notation for mathem
         Returns:
             list: 相似题目列表，每个题目包含 question_text, correct_answer, subject, type, tags, analysis_steps
         """
-        grade_info = f"\n- **学生年级**: {grade}，请确保题目难度适合该年级水平" if grade else ""
+        grade_info = f"\n学生年级：{grade}，题目难度要适合该年级水平" if grade else ""
         
-        prompt = f"""
-你是一位资深中学教师，任务是根据以下原题生成 {{count}} 道"相似知识点、相似难度"的相似练习题，并为每道题提供标准答案。
-{grade_info}
-
-⚠️ 严格要求：
-- 题目必须相似但不重复（改变数字、情境、表达方式、求解内容）
-- 保持相似题型、科目、知识点
-- 每道题包含：题目（question_text）和标准答案（correct_answer），科目，题目类型，知识点，分析步骤
-- 科目（subject）从 Chinese, Mathematics, English, Physics, Chemistry, Politics, History, Geography, Biology 中选择。
-- 不要出有图片的题目
-- 只输出一个 JSON 数组，不要任何解释、注释或 Markdown
-- 数组长度必须等于 {{count}}
-- subject，type，tags用英语
-- **原题题目是英语的就全部用英语**
-- **输出的 JSON 必须是严格合法的，所有反斜杠必须双写（如 \\\\frac），确保能被 Python json.loads 直接解析。**
-
-输出格式示例：
-[
-  {{
-    "subject": "Mathematics",
-    "type": "Single choice",
-    "tags": ["Quadratic Equation", "Discriminant"],
-    "question_text": "题目原文",
-    "analysis_steps": ["步骤1", "步骤2"],
-    "correct_answer": "标准答案"
-  }}
-]
-
-原题如下：
-=====================
-{question_text}
-=====================
-"""
+        prompt = get_prompt('similar').user_text(count=count, grade_info=grade_info, question_text=question_text)
         
         try:
-            response = self.client.chat.completions.create(
+            response = self._chat_completion(
+                'similar',
                 model="deepseek-chat",
                 messages=[
                     {"role": "user", "content": prompt}
@@ -633,25 +389,8 @@ Be friendly, clear, and concise in your responses. Use LaTeX notation for mathem
                 response_format={"type": "json_object"}
             )
             
-            raw_output = response.choices[0].message.content.strip()
-            
-            # 清理可能的 Markdown 代码块
-            if raw_output.startswith('```json'):
-                raw_output = raw_output.replace('```json', '').replace('```', '').strip()
-            elif raw_output.startswith('```'):
-                raw_output = raw_output.replace('```', '').strip()
-            
-            # 提取 JSON 对象
-            import re
-            start = raw_output.find('[')
-            end = raw_output.rfind(']')
-            if start != -1 and end > start:
-                json_str = raw_output[start:end + 1]
-            else:
-                raise ValueError("No valid JSON array found in response")
-            
-            import json
-            similar_list = json.loads(json_str)
+            # 截断的输出保留完整的题目，不足的部分下面补齐
+            similar_list = parse_model_json(response.choices[0].message.content, 'similar')
             
             # 补齐或截断到指定数量
             similar_list = similar_list[:count]
@@ -683,91 +422,49 @@ Be friendly, clear, and concise in your responses. Use LaTeX notation for mathem
         Returns:
             dict: {'is_correct': bool, 'reason': str}
         """
-        prompt = f"""
-You are a strict middle school teacher. Please judge whether the student's answer is correct.
-
-Question:
-{question_text}
-
-'Standard Answer:
-{correct_answer}
-
-Accept simplified answers, such as numerical values or option letters.
-Accept numerical answers without units; slightly imprecise but correct final answers are acceptable.
-
-[Requirements]
-1. First, solve the problem completely by yourself to obtain the correct answer.
-2. Compare the student's answer with the correct answer, and use "is_correct" to indicate whether it is correct.
-3. Output only pure JSON:
-{{
-    "reason": "Give me the step-by-step derivation process of the correct answer, one point per line",
-    "is_correct": true or false
-}}
-
-Student's submitted answer:
-{user_answer}
-=====================
-"""
+        # 选项 / 判断 / 数值 / 代数式先在本地判定，确定时不调用 LLM
+        local = check_answer(user_answer, correct_answer, question_text) if correct_answer else None
+        if local and local['is_correct'] is not None:
+            print(f"[JUDGE] local ({local['method']}): {local['is_correct']}")
+            return {'is_correct': local['is_correct'], 'reason': f"Local check: {local['reason']}"}
+
+        messages = get_prompt('judge').messages(
+            question_text=question_text, correct_answer=correct_answer, user_answer=user_answer
+        )
         
         try:
-            response = self.client.chat.completions.create(
+            response = self._chat_completion(
+                'judge',
                 model="deepseek-chat",
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
+                messages=messages,
                 stream=False,
                 temperature=0.0,  # 判分需要精确性
                 max_tokens=8000
             )
             
-            raw_output = response.choices[0].message.content.strip()
-            
-            # 清理可能的 Markdown 包裹
-            if raw_output.startswith("```json"):
-                raw_output = raw_output.split("```json", 1)[1].split("```", 1)[0]
-            elif raw_output.startswith("```"):
-                raw_output = raw_output.split("```", 1)[1].split("```", 1)[0]
-            
-            import json
-            parsed = json.loads(raw_output.strip())
-            
-            
+            parsed = parse_model_json(response.choices[0].message.content, 'judge')
+
             return {
-                'is_correct': bool(parsed.get("is_correct", False)),
+                'is_correct': parsed['is_correct'],
                 'reason': str(parsed.get("reason", "")).strip()
             }
             
         except Exception as e:
             print(f"Error judging answer: {e}")
+            # failed: 结果不是真正的判定（批量作答据此不保存、提示重试）
+            if local and local['likely'] is not None:
+                # LLM 不可用时采用本地判定的倾向
+                return {
+                    'is_correct': local['likely'],
+                    'reason': f"AI 判定失败，按本地检查结果判定：{local['reason']}",
+                    'failed': True
+                }
             return {
                 'is_correct': False,
-                'reason': "AI 判定失败，默认判错"
+                'reason': "AI 判定失败，默认判错",
+                'failed': True
             }
 
-    def _clean_json_for_object(self, text: str) -> str:
-        """从文本中提取 JSON（对象或数组），并修复 LaTeX 导致的非法转义"""
-        text = text.strip()
-        text = re.sub(r'^```(?:json)?\s*', '', text)
-        text = re.sub(r'\s*```$', '', text)
-
-        # 尝试提取数组
-        start = text.find('[')
-        end = text.rfind(']')
-        if start != -1 and end > start:
-            extracted = text[start:end + 1]
-            # 关键修复：将所有 \ 转义为 \\，使 JSON 合法
-            return extracted.replace('\\', '\\\\')
-
-        # 尝试提取对象
-        start = text.find('{')
-        end = text.rfind('}')
-        if start != -1 and end > start:
-            extracted = text[start:end + 1]
-            # 同样修复
-            return extracted.replace('\\', '\\\\')
-
-        raise ValueError("No valid JSON found")
-
     def ocr_and_parse_question(self, orig_path, cropped_results):
         """
         使用 Qwen-VL 识别题目图片并解析
@@ -779,66 +476,27 @@ Student's submitted answer:
         Returns:
             解析后的题目列表（已处理 JSON）
         """
-        # 构建 prompt
-        prompt = (
-            "你是一位严谨的中学教师，请根据第一张图片识别题目内容、答案和解析。\n"
-            "【图像说明】\n"
-            "- 图像0：完整原题图片（包含题干、选项、答案等全部内容）\n"
-            "- 图像1, 2, 3, ...：系统自动裁剪的局部图（如选项图、实验图、坐标系等）\n"
-            "- 注意：**裁剪图的索引从 0 开始**，即：\n"
-            "    • 图像1 → 裁剪图索引 0\n"
-            "    • 图像2 → 裁剪图索引 1\n"
-            "    • 图像3 → 裁剪图索引 2\n"
-            "    • 以此类推\n"
-            "\n"
-            "**关键：为每道题指定它所依赖的裁剪图索引（crop_index）**\n"
-            "   - crop_index 是一个整数列表，例如 [0], [1,2], [0,1,2,3,4,5] 或 []。\n"
-            "   - **如果整张原图只包含一道题（无论多少小问），则该题必须包含所有裁剪图索引。**\n"
-            "   - 仅当原图明确包含多道独立题目时，才可将裁剪图分配给不同题。\n"
-            "   - 一道裁剪图只能属于一道题。\n"
-            "\n"
-            "1. 'question_text' 必须完整包含题目原文及所有选项。\n"
-            "2. 只输出合法 JSON 数组，不要解释、Markdown 或额外文字。\n"
-            "请严格输出 JSON 数组，只允许使用以下转义： \\\\, \\\", \\n, \\t, \\r,所有 LaTeX 公式中的反斜杠必须使用双反斜杠 \\\\，不要生成单反斜杠。"
-            "3. 科目（subject）从 Chinese, Mathematics, English, Physics, Chemistry, Politics, History, Geography, Biology 中选择。\n"
-            "4. 题型（type）、知识点（tags）使用英文描述。\n"
-            "5. 'correct_answer' 和 'analysis_steps' 必须基于题目推导，与用户答案无关。\n"
-            "6. 'user_answer' 为图片上的答案。\n"
-            "7.'difficulty' 为题目难度，从以下三个词中选择：easy,medium,hard"
-            "请按以下格式输出示例：\n"
-            "[\n"
-            "  {\n"
-            "    \"subject\": \"Chinese\",\n"
-            "    \"type\": \"Constructed-response question\",\n"
-            "    \"tags\": [\"Trigonometric Functions\",\"Induction Formulas\"],\n"
-            "    \"difficulty\": \"difficulty of question\",\n"
-            "    \"question_text\": \"题目原文\",\n"
-            "    \"analysis_steps\": [\"正确步骤1\",\"正确步骤2\"],\n"
-            "    \"correct_answer\": \"正确答案\",\n"
-            "    \"user_answer\": \"学生答案\",\n"
-            "    \"crop_index\": []\n"
-            "  },\n"
-            "  {... 第二题 ...}\n"
-            "]"
+        # 同一张图重新上传时直接用缓存的解析结果；裁剪已由调用方完成，题目数决定输出结构
+        return content_cache.get_or_compute(
+            'ocr_question', file_digest(orig_path),
+            lambda: self._ocr_and_parse_question(orig_path, cropped_results),
+            len(cropped_results),
+            cacheable=bool
         )
 
-        # 构建消息列表
+    def _ocr_and_parse_question(self, orig_path, cropped_results):
+        # 静态指令在前、图片在后，请求前缀稳定
         messages = [{
             "role": "user",
             "content": (
+                [{"text": get_prompt('ocr_question').user_text()}] +
                 [{"image": f"file://{os.path.abspath(orig_path)}"}] +
-                [{"image": f"file://{crop['abs_path']}"} for crop in cropped_results] +
-                [{"text": prompt}]
+                [{"image": f"file://{crop['abs_path']}"} for crop in cropped_results]
             )
         }]
 
         # 调用 Qwen-VL
-        response = MultiModalConversation.call(
-            model='qwen-vl-plus',
-            messages=messages,
-            api_key=self.dashscope_api_key,
-            result_format='message'
-        )
+        response = self._multimodal_call('vision', messages)
 
         if response.status_code != 200:
             raise Exception(f"Qwen-VL API Error {response.code}: {response.message}")
@@ -848,26 +506,7 @@ Student's submitted answer:
         print(repr(raw_output))
         print("=== END ===")
 
-        cleaned_json = self._clean_json_for_object(raw_output)
-
-        try:
-            parsed_list = json.loads(cleaned_json)
-        except json.JSONDecodeError as e:
-            print("JSON 解析失败，启动修复模式…")
-            print(e)
-
-            repaired = cleaned_json
-            # 尝试二次修复：去掉孤立反斜杠
-            repaired = repaired.replace("\\'", "'")
-            repaired = repaired.replace('\\"', '"')
-
-            # 再试
-            parsed_list = json.loads(repaired)
-
-        if not isinstance(parsed_list, list):
-            raise ValueError("模型返回的不是 JSON 数组，请检查输出格式。")
-
-        return parsed_list
+        return parse_model_json(raw_output, 'ocr_question')
 
     def judge_redo_answer_with_image(self, question_text, correct_answer, image_path):
         """
@@ -881,50 +520,22 @@ Student's submitted answer:
         Returns:
             dict: {'user_answer': str, 'is_correct': bool}
         """
-        prompt = f"""
-已知题目如下（文字形式提供，不需要识别图片中的题目）：
-{question_text}
-
-请严格完成以下任务：
-
-1. **仅识别用户上传图片中的答案部分**（不要包含题目、解析、草稿等）。
-2. **判断该答案是否与上述题目的学科和内容相关**：
-   - 如果题目是生物/化学/历史等非数学题，但答案包含大量数学公式、方程、符号（如 x=, ∫, ∑, Δ 等），视为**无效答案**，判错。
-   - 如果答案明显与题目主题无关（如题目问细胞结构，答案写"E=mc²"），判错。
-3. **仅当图片中答案内容合理且与题目匹配时**，才进行正确性判断。
-4. 输出必须是严格 JSON 格式，不要任何额外文字。
-
-输出格式：
-{{
-  "user_answer": "识别出的图片中的答案原文，不是原题目的答案（保留原始格式，包括 LaTeX）",
-  "is_correct": true 或 false
-}}
-"""
-
         messages = [{
             "role": "user",
             "content": [
-                {"image": f"file://{os.path.abspath(image_path)}"},
-                {"text": prompt}
+                {"text": get_prompt('vision_redo_judge').user_text(question_text=question_text)},
+                {"image": f"file://{os.path.abspath(image_path)}"}
             ]
         }]
 
-        response = MultiModalConversation.call(
-            model='qwen-vl-plus',
-            messages=messages,
-            api_key=self.dashscope_api_key,
-            result_format='message'
-        )
+        response = self._multimodal_call('vision', messages)
 
         raw_output = response.output.choices[0].message.content[0]['text']
-        
+        parsed = parse_model_json(raw_output, 'vision_judge')
 
-        parsed = json.loads(self._clean_json_for_object(raw_output))
-        
-        
         return {
             'user_answer': parsed.get("user_answer", "").strip(),
-            'is_correct': parsed.get("is_correct", False)
+            'is_correct': parsed['is_correct']
         }
 
     def judge_practice_answer_with_image(self, question_text, correct_answer, image_path):
@@ -939,42 +550,177 @@ Student's submitted answer:
         Returns:
             dict: {'user_answer': str, 'is_correct': bool}
         """
-        prompt = f"""
-            已知题目如下：
-            {question_text}
-
-            请自己做一次题目，给出对应的过程和答案，然后识别用户上传图片中的答案，并判断是否正确。
-
-            只能输出 JSON，不要输出任何除了json之外的东西:
-            {{
-            "correct_answer_and_analyse":"...",
-                "user_answer": "...",
-                "is_correct": true 或 false
-            }}
-            """
         messages = [{
             "role": "user",
             "content": [
-                {"image": f"file://{os.path.abspath(image_path)}"},
-                {"text": prompt}
+                {"text": get_prompt('vision_practice_judge').user_text(question_text=question_text)},
+                {"image": f"file://{os.path.abspath(image_path)}"}
             ]
         }]
 
-        response = MultiModalConversation.call(
-            model='qwen-vl-plus',
-            messages=messages,
-            api_key=self.dashscope_api_key,
-            result_format='message'
-        )
+        response = self._multimodal_call('vision', messages)
 
         raw_output = response.output.choices[0].message.content[0]['text']
-        parsed = json.loads(self._clean_json_for_object(raw_output))
+        parsed = parse_model_json(raw_output, 'vision_judge')
 
         return {
             'user_answer': parsed.get("user_answer", "").strip(),
-            'is_correct': parsed.get("is_correct", False)
+            'is_correct': parsed['is_correct']
         }
 
+    def _judge_text_batch(self, items):
+        """
+        一次调用判定多道文本题
+
+        Args:
+            items: [(index, item)]，index 从 1 开始编号
+
+        Returns:
+            dict: {index: {'is_correct': bool, 'reason': str}}，缺失的题目不在结果中
+        """
+        blocks = '\n\n'.join(
+            f"""### Item {index}
+Question:
+{item.get('question_text', '')}
+
+Standard Answer:
+{item.get('correct_answer') or ''}
+
+Student's submitted answer:
+{item.get('user_answer', '')}"""
+            for index, item in items
+        )
+        messages = get_prompt('judge_batch').messages(blocks=blocks)
+        response = self._chat_completion(
+            'judge',
+            model="deepseek-chat",
+            messages=messages,
+            stream=False,
+            temperature=0.0,
+            max_tokens=8000
+        )
+        parsed = parse_model_json(response.choices[0].message.content, 'judge_batch')
+        wanted = {index for index, _ in items}
+        return {
+            entry['index']: {'is_correct': entry['is_correct'], 'reason': entry.get('reason', '').strip()}
+            for entry in parsed if entry['index'] in wanted
+        }
+
+    def _judge_image_batch(self, items):
+        """
+        一次 Qwen-VL 调用判定多道图片作答题
+
+        Returns:
+            dict: {index: {'user_answer': str, 'is_correct': bool}}
+        """
+        content = [{"text": get_prompt('vision_judge_batch').user_text()}]
+        for index, item in items:
+            content.append({"text": f"### 题目 {index}\n{item.get('question_text', '')}\n### 题目 {index} 的作答图片："})
+            content.append({"image": f"file://{os.path.abspath(item['image_path'])}"})
+
+        response = self._multimodal_call('vision', [{"role": "user", "content": content}])
+        raw_output = response.output.choices[0].message.content[0]['text']
+        parsed = parse_model_json(raw_output, 'vision_judge_batch')
+        wanted = {index for index, _ in items}
+        return {
+            entry['index']: {'user_answer': entry.get('user_answer', '').strip(), 'is_correct': entry['is_correct']}
+            for entry in parsed if entry['index'] in wanted
+        }
+
+    def _judge_one(self, item):
+        """批量判定失败或缺项时逐题判定"""
+        try:
+            if item.get('image_path'):
+                result = self.judge_practice_answer_with_image(
+                    item.get('question_text', ''), item.get('correct_answer', ''), item['image_path']
+                )
+                return {**result, 'reason': '', 'method': 'single'}
+            result = self.judge_text_answer(
+                item.get('question_text', ''), item.get('user_answer', ''), item.get('correct_answer')
+            )
+            method = 'failed' if result.pop('failed', False) else 'single'
+            return {**result, 'user_answer': item.get('user_answer', ''), 'method': method}
+        except Exception as e:
+            print(f"Error judging answer: {e}")
+            return {
+                'is_correct': False,
+                'reason': "AI 判定失败，默认判错",
+                'user_answer': item.get('user_answer', ''),
+                'method': 'failed'
+            }
+
+    def judge_answers_batch(self, items):
+        """
+        一次结构化调用批量判定多道题（文本题一次 DeepSeek 调用，图片题一次 Qwen-VL 调用，两者并发）
+
+        Args:
+            items: [{'question_text', 'correct_answer', 'user_answer'} 或
+                    {'question_text', 'correct_answer', 'image_path'}]
+
+        Returns:
+            list: 与 items 顺序一致，每项 {'is_correct', 'reason', 'user_answer', 'method'}，
+                  method 为 local / batch / single / failed
+        """
+        results = [None] * len(items)
+        text_items, image_items = [], []
+        for position, item in enumerate(items):
+            if item.get('image_path'):
+                image_items.append((position + 1, item))
+                continue
+            correct_answer = item.get('correct_answer')
+            local = check_answer(
+                item.get('user_answer', ''), correct_answer, item.get('question_text')
+            ) if correct_answer else None
+            if local and local['is_correct'] is not None:
+                results[position] = {
+                    'is_correct': local['is_correct'],
+                    'reason': f"Local check: {local['reason']}",
+                    'user_answer': item.get('user_answer', ''),
+                    'method': 'local'
+                }
+            else:
+                text_items.append((position + 1, item))
+
+        batch_size = max(1, int(os.getenv('AI_JUDGE_BATCH_SIZE', 8)))
+        batches = [('text', text_items[i:i + batch_size]) for i in range(0, len(text_items), batch_size)]
+        batches += [('image', image_items[i:i + batch_size]) for i in range(0, len(image_items), batch_size)]
+
+        def _run_batch(batch):
+            kind, batch_items = batch
+            try:
+                if kind == 'text':
+                    return self._judge_text_batch(batch_items)
+                return self._judge_image_batch(batch_items)
+            except Exception as e:
+                print(f"Batch judging failed ({kind}, {len(batch_items)} items): {e}")
+                return {}
+
+        missing = []
+        for (kind, batch_items), judged in zip(batches, map_concurrently(_run_batch, batches)):
+            for index, item in batch_items:
+                if index not in judged:
+                    missing.append((index, item))
+                    continue
+                result = judged[index]
+                results[index - 1] = {
+                    'is_correct': result['is_correct'],
+                    'reason': result.get('reason', ''),
+                    'user_answer': result.get('user_answer', item.get('user_answer', '')),
+                    'method': 'batch'
+                }
+
+        if missing:
+            # 解析失败或缺项的题目逐题重新判定（并发）
+            print(f"[JUDGE] batch fallback for {len(missing)}/{len(items)} items")
+            for (index, _), result in zip(missing, map_concurrently(self._judge_one, [item for _, item in missing])):
+                results[index - 1] = result
+
+        print(f"[JUDGE] batch of {len(items)}: " + ', '.join(
+            f"{method}={sum(1 for r in results if r['method'] == method)}"
+            for method in ('local', 'batch', 'single', 'failed')
+        ))
+        return results
+
     def generate_note_from_text(self, text, subject='General'):
         """
         从文本生成结构化笔记
@@ -986,51 +732,37 @@ Student's submitted answer:
         Returns:
             dict: 包含 title, summary, key_points, examples, detailed_notes, tags
         """
+        # 长文本先 map-reduce 压缩成提纲
+        content = self._fit_content(subject or 'study notes', text)
+        return self.generate_note_from_content(content, text, subject)
+    
+    def generate_note_from_outlines(self, outlines, text, subject='General'):
+        """
+        reduce 阶段：用 summarize_chunk 得到的各部分提纲（按原文顺序）生成结构化笔记，
+        合并后超出预算时再压缩一轮；text 为完整原文
+        """
+        content = self._fit_content(subject or 'study notes', self._join_outlines(outlines))
+        return self.generate_note_from_content(content, text, subject)
+    
+    def generate_note_from_content(self, content, text, subject='General'):
+        """
+        用已经放得进 prompt 的内容（原文或各部分提纲）生成结构化笔记；
+        text 为完整原文，用于缺省字段和降级笔记。
+        """
         subject_instruction = f'Subject is: {subject}' if subject else 'Please identify the subject'
-        
-        prompt = f"""You are an experienced teacher. Based on the following learning content, generate a structured study note.
-
-Learning Content:
-{text}
-
-{subject_instruction}
-
-Please output strictly in JSON format with the following fields:
-{{
-  "title": "Note title (concise and clear)",
-  "summary": "Content summary (50-100 words)",
-  "key_points": ["Key point 1", "Key point 2", "Key point 3"],
-  "examples": ["Example 1", "Example 2"],
-  "detailed_notes": "Detailed note content (Markdown format, including headings, lists, highlights)",
-  "tags": ["Tag 1", "Tag 2"]
-}}
-
-Requirements:
-1. key_points should extract 3-5 core points
-2. examples should contain 1-3 representative examples if available, or an empty array if none
-3. detailed_notes should use Markdown format with clear sections
-4. tags should include relevant knowledge point tags
-5. Output JSON only, no additional explanation
-6. All output must be in English"""
+        messages = get_prompt('note').messages(subject_instruction=subject_instruction, content=content)
 
         try:
-            response = self.client.chat.completions.create(
+            response = self._chat_completion(
+                'note',
                 model="deepseek-chat",
-                messages=[{"role": "user", "content": prompt}],
+                messages=messages,
                 stream=False,
                 temperature=0.7,
                 max_tokens=4000
             )
             
-            raw_output = response.choices[0].message.content.strip()
-            
-            # 清理 Markdown 代码块
-            if raw_output.startswith('```json'):
-                raw_output = raw_output.replace('```json', '').replace('```', '').strip()
-            elif raw_output.startswith('```'):
-                raw_output = raw_output.replace('```', '').strip()
-            
-            parsed = json.loads(raw_output)
+            parsed = parse_model_json(response.choices[0].message.content, 'note')
             
             return {
                 'title': parsed.get('title', 'Untitled Note'),
@@ -1047,20 +779,8 @@ Requirements:
             return self._fallback_note(text, subject)
     
     def _fallback_note(self, text, subject):
-        """生成降级版笔记"""
-        sentences = [s.strip() for s in text.split('。') if s.strip()]
-        key_points = sentences[:min(3, len(sentences))]
-        title = sentences[0][:15] + "..." if sentences else "Note"
-        summary = text[:100] + "..." if len(text) > 100 else text
-        
-        return {
-            'title': title,
-            'summary': summary,
-            'key_points': key_points,
-            'examples': [],
-            'detailed_notes': text,
-            'tags': [subject, 'study note'] if subject and subject != 'General' else ['study note']
-        }
+        """生成降级版笔记：本地 TF-IDF / TextRank 抽取标题、摘要、要点和例子"""
+        return extractive_engine.note(text, subject)
     
     def ocr_image(self, image_path):
         """
@@ -1074,29 +794,25 @@ Requirements:
                 - text: 识别出的文字内容，失败时为 None
                 - error_message: 错误信息，成功时为 None
         """
+        # 只缓存成功的识别结果（JSON 里存成列表）
+        text, error = content_cache.get_or_compute(
+            'ocr_text', file_digest(image_path),
+            lambda: self._ocr_image(image_path),
+            cacheable=lambda result: result[1] is None
+        )
+        return text, error
+
+    def _ocr_image(self, image_path):
         try:
-            prompt = (
-                "请仔细识别这张图片中的所有文字内容。\n"
-                "要求：\n"
-                "1. 完整提取所有可见文字\n"
-                "2. 保持原有的段落结构\n"
-                "3. 如果有标题、列表等，请保留格式\n"
-                "4. 只输出识别到的文字内容，不要添加任何解释\n"
-            )
             messages = [{
                 "role": "user",
                 "content": [
-                    {"image": f"file://{os.path.abspath(image_path)}"},
-                    {"text": prompt}
+                    {"text": get_prompt('ocr_text').user_text()},
+                    {"image": f"file://{os.path.abspath(image_path)}"}
                 ]
             }]
             
-            response = MultiModalConversation.call(
-                model='qwen-vl-plus',
-                messages=messages,
-                api_key=self.dashscope_api_key,
-                result_format='message'
-            )
+            response = self._multimodal_call('ocr', messages)
             
             if response.status_code != 200:
                 return None, f"OCR API Error {response.code}: {response.message}"
@@ -1123,6 +839,17 @@ Requirements:
         Returns:
             tuple: (recognized_text, error)
         """
+        # 相同片段（重新上传、重试）不再发给 provider；结果取决于识别后端
+        backend = 'whisper' if os.getenv('OPENAI_API_KEY') else 'xfyun'
+        text, error = content_cache.get_or_compute(
+            'speech', bytes_digest(audio_data),
+            lambda: self._speech_to_text(audio_data, language),
+            language, backend,
+            cacheable=lambda result: bool(result[0])
+        )
+        return text, error
+
+    def _speech_to_text(self, audio_data, language='auto'):
         import logging
         import os
         
@@ -1138,37 +865,95 @@ Requirements:
         # Fallback to Xfyun ASR
         return self._speech_to_text_xfyun(audio_data, language)
     
+    def transcribe_segments(self, segments, language='auto', on_text=None):
+        """
+        并发识别多个音频片段（讯飞按实时速率发送音频，串行时耗时等于音频时长），
+        结果按顺序拼接并去掉重叠部分。并发数受 ASR_MAX_CONCURRENCY 限制（provider 的连接数上限）。
+        segments 可以是生成器（流式解码）：边解码边识别，同时在内存里的片段不超过并发数 + 1。
+        on_text(index, text, overlapped) 在调用线程里按片段顺序回调，前面的片段都识别完就立即通知（用于边识别边处理）；
+        overlapped 取自 Segment.overlapped（普通 bytes 视为不重叠），拼接时只在重叠边界上去重。
+        
+        Returns:
+            tuple: (recognized_text, error)；部分片段失败时返回其余片段的文字
+        """
+        segments = iter(segments)
+        first = next(segments, None)
+        if first is None:
+            return None, "Audio is too short"
+        
+        def _recognize(segment):
+            # 讯飞按实时速率发送：片段开始识别时保证请求还剩片段时长 + 余量，长录音不受路由截止时间限制
+            ensure_request_deadline(len(segment) / 32000 + float(os.getenv('ASR_DEADLINE_SLACK_SECONDS', 30)))
+            return self.speech_to_text(segment, language)
+        
+        second = next(segments, None)
+        if second is None:
+            text, error = _recognize(first)
+            if on_text:
+                on_text(0, text or '', False)
+            return text, error
+        
+        if language == 'auto' and not os.getenv('OPENAI_API_KEY'):
+            # 讯飞只在第一段上探测一次语种，所有片段共用
+            language = self.detect_language(first) or 'auto'
+        
+        started = time.time()
+        stats = {'count': 0, 'bytes': 0}
+        overlaps = []
+        
+        def _counted(items):
+            for segment in items:
+                stats['count'] += 1
+                stats['bytes'] += len(segment)
+                overlaps.append(getattr(segment, 'overlapped', False))
+                yield segment
+        
+        pending = _counted(itertools.chain([first, second], segments))
+        del first, second  # 只由生成器持有，识别完即可释放
+        results = []
+        for result in map_streaming(
+            _recognize,
+            pending,
+            max_workers=int(os.getenv('ASR_MAX_CONCURRENCY', 4))
+        ):
+            if on_text:
+                on_text(len(results), result[0] or '', overlaps[len(results)])
+            results.append(result)
+        failed = [i for i, (text, _) in enumerate(results) if not text]
+        print(f"[ASR] {stats['count']} segments, {stats['bytes'] / 32000:.0f}s audio in {time.time() - started:.1f}s"
+              f"{f', failed: {failed}' if failed else ''}")
+        
+        text = stitch_transcripts([text for text, _ in results], overlaps)
+        if not text:
+            return None, next((error for _, error in results if error), "Recognition failed")
+        return text, None
+    
     def _recognize_whisper(self, audio_data, api_key):
         """Use OpenAI Whisper API for speech recognition (supports mixed language)"""
-        import tempfile
-        import os
+        import io
         import logging
         
         try:
-            from openai import OpenAI
-            
-            # Save PCM data as WAV file (Whisper needs a file)
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
-                temp_path = f.name
-                # Write WAV header + PCM data
-                import wave
-                with wave.open(temp_path, 'wb') as wav:
-                    wav.setnchannels(1)
-                    wav.setsampwidth(2)  # 16-bit
-                    wav.setframerate(16000)
-                    wav.writeframes(audio_data)
+            # 在内存里压缩编码（默认 Ogg Opus），不写临时文件，上传量约为 WAV 的 1/10
+            filename, encoded = encode_pcm(audio_data)
+            limit = int(os.getenv('WHISPER_MAX_UPLOAD_BYTES', 25 * 1024 * 1024))
+            if len(encoded) > limit:
+                return self._recognize_whisper_split(audio_data, api_key, len(encoded), limit)
+            logging.debug(f'Whisper upload: {filename}, {len(encoded)} bytes ({len(audio_data)} bytes PCM)')
             
-            client = OpenAI(api_key=api_key)
+            client = self.transport.openai_client('whisper')
             
-            with open(temp_path, 'rb') as audio_file:
-                transcript = client.audio.transcriptions.create(
+            def _transcribe(timeout):
+                return client.audio.transcriptions.create(
                     model="whisper-1",
-                    file=audio_file,
-                    response_format="text"
+                    file=(filename, io.BytesIO(encoded)),
+                    response_format="text",
+                    timeout=self.transport.call_timeout(timeout)
                 )
             
-            # Clean up temp file
-            os.unlink(temp_path)
+            transcript = call_with_retries(
+                _transcribe, get_breaker('whisper'), self._deadline('transcribe')
+            )
             
             logging.debug(f'Whisper result: {len(transcript)} characters')
             return transcript.strip(), None
@@ -1177,59 +962,116 @@ Requirements:
             logging.error(f'Whisper recognition failed: {e}')
             return None, str(e)
     
+    def _recognize_whisper_split(self, audio_data, api_key, encoded_size, limit):
+        """编码后仍超过上传上限：按停顿切成每段约 90% 上限大小的片段，依次识别后拼接"""
+        seconds = len(audio_data) / 32000
+        # 目标时长不能设下限：超限的片段本身可能不足 10 秒，切不开就会无限递归
+        target = max(1.0, seconds * limit / encoded_size * 0.9)
+        parts, overlaps = split_on_silence(audio_data, target, min_seconds=0, with_overlaps=True)
+        print(f"[ASR] Whisper upload {encoded_size} bytes over {limit}, split into {len(parts)} parts")
+        if len(parts) < 2:
+            return None, f"Audio is too large to upload ({encoded_size} bytes over {limit})"
+        texts = []
+        for part in parts:
+            text, error = self._recognize_whisper(part, api_key)
+            if error:
+                return None, error
+            texts.append(text)
+        return stitch_transcripts(texts, overlaps), None
+    
     def _speech_to_text_xfyun(self, audio_data, language='auto'):
         """Xfyun ASR fallback - supports Chinese, English, and mixed content"""
         import logging
         
-        # Auto-detection: try both languages and select best result
+        # Auto-detection: 只在开头一小段上并发试两种语言，整段只识别一遍
         if language == 'auto':
-            logging.debug('Auto-detection mode: trying Chinese recognition...')
-            text_zh, error_zh = self._recognize_xfyun(audio_data, 'zh_cn')
-            zh_len = len(text_zh) if text_zh else 0
-            logging.debug(f'Chinese result: {zh_len} characters')
+            probe_seconds = float(os.getenv('ASR_LANGUAGE_PROBE_SECONDS', 6))
+            if len(audio_data) <= probe_seconds * 32000:
+                # 音频本身就很短，两种语言的结果直接可用
+                results = self._recognize_xfyun_languages(audio_data)
+                chosen = self._pick_language(results['zh_cn'][0], results['en_us'][0])
+                if chosen is None:
+                    return None, results['zh_cn'][1] or results['en_us'][1] or "Recognition failed"
+                return results[chosen]
+            language = self.detect_language(audio_data) or 'zh_cn'
+        
+        # Single language mode
+        return self._recognize_xfyun(audio_data, language)
+    
+    def detect_language(self, audio_data):
+        """
+        语种探测：跳过开头静音，取 ASR_LANGUAGE_PROBE_SECONDS 秒并发做中 / 英识别并比较字符构成。
+        返回 'zh_cn' / 'en_us'，两种都识别失败时返回 None。
+        """
+        import logging
+        
+        probe = leading_speech(audio_data, float(os.getenv('ASR_LANGUAGE_PROBE_SECONDS', 6)))
+        started = time.time()
+        results = self._recognize_xfyun_languages(probe)
+        chosen = self._pick_language(results['zh_cn'][0], results['en_us'][0])
+        logging.debug(f'Language probe ({len(probe) / 32000:.1f}s audio, {time.time() - started:.1f}s): {chosen}')
+        return chosen
+    
+    def _recognize_xfyun_languages(self, audio_data):
+        """同一段音频并发做中文、英文识别，返回 {language: (text, error)}"""
+        languages = ['zh_cn', 'en_us']
+        # 讯飞 websocket 会话不占 AI 并发名额（也避免在 map_concurrently 的任务里嵌套占用）
+        contexts = [contextvars.copy_context() for _ in languages]
+        with ThreadPoolExecutor(max_workers=len(languages)) as pool:
+            results = list(pool.map(
+                lambda ctx, language: ctx.run(self._recognize_xfyun, audio_data, language),
+                contexts, languages
+            ))
+        return dict(zip(languages, results))
+    
+    @staticmethod
+    def _pick_language(text_zh, text_en):
+        """根据中 / 英两种识别结果的字符构成选择语言；都为空时返回 None"""
+        import logging
+        
+        if text_zh and text_en:
+            # Calculate language confidence based on character composition
+            en_letter_count = sum(1 for c in text_en if c.isalpha())
+            en_ratio = en_letter_count / len(text_en)
             
-            logging.debug('Trying English recognition...')
-            text_en, error_en = self._recognize_xfyun(audio_data, 'en_us')
-            en_len = len(text_en) if text_en else 0
-            logging.debug(f'English result: {en_len} characters')
+            zh_char_count = sum(1 for c in text_zh if '\u4e00' <= c <= '\u9fff')
+            zh_ratio = zh_char_count / len(text_zh)
             
-            if text_zh and text_en:
-                # Calculate language confidence based on character composition
-                en_letter_count = sum(1 for c in text_en if c.isalpha())
-                en_ratio = en_letter_count / len(text_en) if text_en else 0
-                
-                zh_char_count = sum(1 for c in text_zh if '\u4e00' <= c <= '\u9fff')
-                zh_ratio = zh_char_count / len(text_zh) if text_zh else 0
-                
-                # Check for English words in Chinese result (mixed content detection)
-                en_words_in_zh = sum(1 for c in text_zh if c.isalpha() and ord(c) < 128)
-                mixed_ratio = en_words_in_zh / len(text_zh) if text_zh else 0
-                
-                logging.debug(f'Chinese ratio: {zh_ratio*100:.1f}%, English ratio: {en_ratio*100:.1f}%, Mixed ratio: {mixed_ratio*100:.1f}%')
-                
-                # If Chinese result contains English letters, it's likely mixed content
-                # Chinese mode can recognize English words, so prefer Chinese result for mixed content
-                if mixed_ratio > 0.1 and zh_ratio > 0.2:
-                    logging.debug('Detected mixed content, selecting Chinese result (supports mixed language)')
-                    return text_zh, None
-                elif en_ratio > 0.7 and zh_ratio < 0.1:
-                    # Pure English content
-                    logging.debug('Selecting English result (pure English detected)')
-                    return text_en, None
-                else:
-                    # Default to Chinese (better for mixed content)
-                    logging.debug('Selecting Chinese result (default for mixed/Chinese content)')
-                    return text_zh, None
+            # Check for English words in Chinese result (mixed content detection)
+            en_words_in_zh = sum(1 for c in text_zh if c.isalpha() and ord(c) < 128)
+            mixed_ratio = en_words_in_zh / len(text_zh)
             
-            elif text_en:
-                return text_en, None
-            elif text_zh:
-                return text_zh, None
-            else:
-                return None, error_zh or error_en or "Recognition failed"
+            logging.debug(f'Chinese ratio: {zh_ratio*100:.1f}%, English ratio: {en_ratio*100:.1f}%, Mixed ratio: {mixed_ratio*100:.1f}%')
+            
+            # If Chinese result contains English letters, it's likely mixed content
+            # Chinese mode can recognize English words, so prefer Chinese result for mixed content
+            if mixed_ratio > 0.1 and zh_ratio > 0.2:
+                return 'zh_cn'
+            elif en_ratio > 0.7 and zh_ratio < 0.1:
+                # Pure English content
+                return 'en_us'
+            # Default to Chinese (better for mixed content)
+            return 'zh_cn'
+        elif text_en:
+            return 'en_us'
+        elif text_zh:
+            return 'zh_cn'
+        return None
+    
+    def stream_xfyun(self, next_frame, language='zh_cn', on_update=None):
+        """
+        一次讯飞流式识别会话：音频帧来自 next_frame()（实时采集，不再按 40ms 节奏补发），
+        中间结果通过 on_update(text) 回调。讯飞单次会话最长 60 秒，由调用方负责切换会话。
         
-        # Single language mode
-        return self._recognize_xfyun(audio_data, language)
+        Returns:
+            tuple: (recognized_text, error)
+        """
+        XFYUN_APPID = os.getenv('XFYUN_APPID', 'f047ebc8')
+        XFYUN_API_SECRET = os.getenv('XFYUN_API_SECRET', 'M2MxZmM2MDdiYmYwNjlhYzFkNDdmOWZi')
+        XFYUN_API_KEY = os.getenv('XFYUN_API_KEY', '014159c78a774f99e8e49946b4757daa')
+        
+        return async_xfyun.stream(next_frame, language, XFYUN_APPID, XFYUN_API_KEY, XFYUN_API_SECRET,
+                                  on_update=on_update)
     
     def _recognize_xfyun(self, audio_data, language='zh_cn'):
         """Internal method: Recognize audio using Xfyun ASR."""
@@ -1240,210 +1082,19 @@ Requirements:
         XFYUN_API_SECRET = os.getenv('XFYUN_API_SECRET', 'M2MxZmM2MDdiYmYwNjlhYzFkNDdmOWZi')
         XFYUN_API_KEY = os.getenv('XFYUN_API_KEY', '014159c78a774f99e8e49946b4757daa')
         
-        asr = _XfyunASRClient(audio_data, language, XFYUN_APPID, XFYUN_API_KEY, XFYUN_API_SECRET)
-        return asr.recognize()
-
-
-# Xfyun WebSocket ASR Client (Internal Class)
-class _XfyunASRClient:
-    """Xfyun WebSocket ASR Client - Internal implementation."""
-
-    def __init__(self, audio_data, language, appid, api_key, api_secret):
-        self.audio_data = audio_data
-        self.language = language
-        self.appid = appid
-        self.api_key = api_key
-        self.api_secret = api_secret
-        self.result = []
-        self.is_finished = False
-        self.error = None
-
-    def on_message(self, ws, message):
-        import json
-        try:
-            data = json.loads(message)
-            code = data.get("code")
-
-            if code != 0:
-                self.error = f"Xfyun Error {code}: {data.get('message', 'Unknown error')}"
-                self.is_finished = True
-                ws.close()
-                return
-
-            result_data = data.get("data", {})
-            result = result_data.get("result", {})
-
-            pgs = result.get("pgs", "")
-            rg = result.get("rg", [])
-
-            ws_list = result.get("ws", [])
-            current_text = ""
-            for ws_item in ws_list:
-                cw_list = ws_item.get("cw", [])
-                for cw in cw_list:
-                    word = cw.get("w", "")
-                    if word:
-                        current_text += word
-
-            if pgs == "rpl" and len(rg) == 2:
-                start_idx = rg[0]
-                end_idx = rg[1]
-                if start_idx < len(self.result):
-                    self.result = self.result[:start_idx]
-                if current_text:
-                    self.result.append(current_text)
-            elif pgs == "apd" or not pgs:
-                if current_text:
-                    self.result.append(current_text)
-
-            status = result_data.get("status")
-            if status == 2:
-                self.is_finished = True
-                ws.close()
-
-        except Exception as e:
-            self.error = str(e)
-            self.is_finished = True
-            ws.close()
-
-    def on_error(self, ws, error):
-        self.error = str(error)
-        self.is_finished = True
-
-    def on_close(self, ws, close_status_code, close_msg):
-        self.is_finished = True
-
-    def on_open(self, ws):
-        import threading
-        import time
-        import json
-        import base64
-        
-        def send_audio():
-            try:
-                frame_size = 1280
-                interval = 0.04
-
-                status = 0
-                offset = 0
-                total_len = len(self.audio_data)
-
-                while offset < total_len:
-                    end = min(offset + frame_size, total_len)
-                    chunk = self.audio_data[offset:end]
-
-                    if offset == 0:
-                        status = 0
-                    elif end >= total_len:
-                        status = 2
-                    else:
-                        status = 1
-
-                    audio_base64 = base64.b64encode(chunk).decode('utf-8')
-
-                    if status == 0:
-                        message = {
-                            "common": {"app_id": self.appid},
-                            "business": {
-                                "language": self.language,
-                                "domain": "iat",
-                                "accent": "mandarin",
-                                "vad_eos": 3000,
-                                "ptt": 1
-                            },
-                            "data": {
-                                "status": status,
-                                "format": "audio/L16;rate=16000",
-                                "encoding": "raw",
-                                "audio": audio_base64
-                            }
-                        }
-                    else:
-                        message = {
-                            "data": {
-                                "status": status,
-                                "format": "audio/L16;rate=16000",
-                                "encoding": "raw",
-                                "audio": audio_base64
-                            }
-                        }
-
-                    ws.send(json.dumps(message))
-                    offset = end
-
-                    if status != 2:
-                        time.sleep(interval)
-
-            except Exception as e:
-                self.error = str(e)
-                ws.close()
-
-        threading.Thread(target=send_audio).start()
-
-    def recognize(self):
-        import websocket
-        import time
-        
-        try:
-            url = self._create_auth_url()
-
-            ws = websocket.WebSocketApp(
-                url,
-                on_message=self.on_message,
-                on_error=self.on_error,
-                on_close=self.on_close,
-                on_open=self.on_open
-            )
-
-            ws.run_forever()
-
-            timeout = 60
-            start_time = time.time()
-            while not self.is_finished and (time.time() - start_time) < timeout:
-                time.sleep(0.1)
-
-            if self.error:
-                return None, self.error
-
-            return ''.join(self.result), None
-
-        except Exception as e:
-            return None, str(e)
-    
-    def _create_auth_url(self):
-        """Create Xfyun WebSocket authentication URL."""
-        import base64
-        import hmac
-        import hashlib
-        from datetime import datetime
-        from time import mktime
-        from wsgiref.handlers import format_date_time
-        from urllib.parse import urlencode
-
-        now = datetime.now()
-        date = format_date_time(mktime(now.timetuple()))
-
-        signature_origin = f"host: ws-api.xfyun.cn\ndate: {date}\nGET /v2/iat HTTP/1.1"
-
-        signature_sha = hmac.new(
-            self.api_secret.encode('utf-8'),
-            signature_origin.encode('utf-8'),
-            digestmod=hashlib.sha256
-        ).digest()
-
-        signature_sha_base64 = base64.b64encode(signature_sha).decode('utf-8')
-
-        authorization_origin = f'api_key="{self.api_key}", algorithm="hmac-sha256", headers="host date request-line", signature="{signature_sha_base64}"'
-        authorization = base64.b64encode(authorization_origin.encode('utf-8')).decode('utf-8')
-
-        params = {
-            "authorization": authorization,
-            "date": date,
-            "host": "ws-api.xfyun.cn"
-        }
-
-        url = f"wss://ws-api.xfyun.cn/v2/iat?{urlencode(params)}"
-        return url
+        check_deadline('xfyun')
+        deadline = current_deadline()
+        # 会话在共享的事件循环里运行，调用线程只等待结果
+        # websocket 不经过 transport，单独按 (语言, 音频哈希) 录制 / 回放
+        result = cassette.call(
+            'xfyun',
+            [language, hashlib.sha256(audio_data).hexdigest()],
+            lambda: list(async_xfyun.recognize(audio_data, language, XFYUN_APPID, XFYUN_API_KEY,
+                                               XFYUN_API_SECRET, deadline=deadline))
+        )
+        if result is None:
+            return None, "No cassette entry for xfyun request"
+        return tuple(result)
 
 
 # 创建单例实例
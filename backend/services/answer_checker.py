@@ -0,0 +1,360 @@
+"""
+Local answer checker - decides option / true-false / numeric / symbolic answers without calling the LLM
+"""
+
+import math
+import os
+import random
+import re
+
+_PREFIX = re.compile(r'^\s*(?:答案|正确答案|标准答案|答|解|answer|ans|final answer)\s*[:：]?\s*', re.IGNORECASE)
+_TRAILING_PUNCT = re.compile(r'[\s。．.，,；;!！]+$')
+
+# 选项：A / (B) / B. xxx / 选C / C选项 / A,C / ACD（只认大写字母，小写的 "ab"、"c" 可能是代数式）
+_CHOICE_ONLY = re.compile(r'^\(?\s*([A-H](?:\s*[,，、和与&]?\s*[A-H])*)\s*\)?\s*(?:选项|项)?$')
+_CHOICE_LEADING = re.compile(r'^(?:选\s*)?[\(（]?\s*([A-H])\s*[\)）.．、:：]\s*\S')
+_CHOICE_PICK = re.compile(r'^选\s*([A-H]+)$', re.IGNORECASE)
+# 题干里的选项标记（A. / (B) / C、），至少有 A、B 两项才认为是选择题
+_QUESTION_OPTION = re.compile(r'(?:^|[\s(（])([A-Ha-h])\s*[.．、)）:：]')
+
+# 标准答案必须是明确的判断词才走判断题；单字母只在学生答案一侧作为缩写接受
+_TRUE_WORDS = {'对', '正确', '是', '√', '✓', 'true', 'yes', 'correct'}
+_FALSE_WORDS = {'错', '错误', '否', '不对', '×', '✗', 'false', 'no', 'incorrect', 'wrong'}
+_TRUE_ABBREVIATIONS = {'t', 'y'}
+_FALSE_ABBREVIATIONS = {'f', 'n'}
+
+_NUMBER = r'[-+−]?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?(?:[eE][-+]?\d+)?'
+# 可选的 "x =" 前缀 + 数值（小数 / 分数 / 百分数 / 科学计数法）+ 其余部分（必须是已知单位）
+_NUMERIC_ANSWER = re.compile(
+    r'^(?:(?P<var>[a-zA-Z][\w]*)\s*=\s*)?'
+    r'(?P<num>' + _NUMBER + r')'
+    r'(?:\s*/\s*(?P<den>' + _NUMBER + r'))?'
+    r'(?:\s*(?:×|x|\*|\\times)\s*10\s*\^\s*\{?(?P<exp>[-+−]?\d+)\}?)?'
+    r'\s*(?P<rest>.*)$'
+)
+# 数值后允许出现的单位（小写、去空格、^2 / ^3 写成 ² / ³ 后比较）；其它任何文字都交给 LLM
+_UNITS = {
+    'm', 'cm', 'mm', 'km', 'dm', 'μm', 'nm', 'm²', 'cm²', 'mm²', 'km²', 'dm²', 'm³', 'cm³', 'mm³', 'dm³',
+    'g', 'kg', 'mg', 't', 's', 'ms', 'min', 'h', 'l', 'ml', 'm/s', 'km/h', 'm/s²', 'cm/s',
+    'n', 'kn', 'j', 'kj', 'w', 'kw', 'v', 'mv', 'kv', 'a', 'ma', 'Ω', 'ω', 'kΩ', 'kω', 'pa', 'kpa', 'hz',
+    'mol', 'mol/l', 'g/mol', 'g/cm³', 'kg/m³', '°', '°c', '℃', 'k', 'rad', 'kwh', 'kw·h', 'cal', 'kcal',
+    '米', '厘米', '毫米', '千米', '分米', '公里', '平方米', '平方厘米', '平方千米', '立方米', '立方厘米',
+    '克', '千克', '毫克', '吨', '斤', '公斤', '秒', '分', '分钟', '时', '小时', '天', '日', '周', '月', '年',
+    '升', '毫升', '度', '元', '角', '个', '人', '只', '本', '次', '岁', '件', '条', '张', '辆', '棵', '页',
+    '牛', '焦', '瓦', '伏', '安', '欧', '帕',
+}
+_LATEX_FRAC = re.compile(r'\\[dt]?frac\s*\{([^{}]*)\}\s*\{([^{}]*)\}')
+# 代数式中允许出现的多字母单词（其余多字母单词视为自然语言，不做符号比较）
+_EXPR_WORDS = {'sin', 'cos', 'tan', 'ln', 'log', 'exp', 'sqrt', 'pi', 'frac', 'dfrac', 'tfrac',
+               'cdot', 'times', 'div', 'left', 'right'}
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+
+def _normalize(text):
+    text = str(text or '').strip()
+    text = text.replace('＄', '$').strip('$').strip()
+    text = _PREFIX.sub('', text)
+    text = _TRAILING_PUNCT.sub('', text)
+    # 全角转半角
+    return ''.join(
+        chr(ord(c) - 0xFEE0) if 0xFF01 <= ord(c) <= 0xFF5E else (' ' if c == '\u3000' else c) for c in text
+    ).strip()
+
+
+def _result(is_correct, method, reason, likely=None):
+    """
+    is_correct: True / False 表示本地可以确定；None 表示需要交给 LLM
+    likely: 不确定时的倾向（LLM 不可用时作为降级结果）
+    """
+    return {'is_correct': is_correct, 'method': method, 'reason': reason, 'likely': likely}
+
+
+# ---------- 选项 ----------
+
+def _choice_letters(text):
+    """提取选项字母集合；不是选项形式时返回 None"""
+    compact = text.replace(' ', '')
+    for pattern in (_CHOICE_PICK, _CHOICE_ONLY):
+        match = pattern.match(compact)
+        if match:
+            return frozenset(c.upper() for c in match.group(1) if c.isalpha())
+    match = _CHOICE_LEADING.match(text)
+    if match:
+        return frozenset(match.group(1).upper())
+    return None
+
+
+def _is_multiple_choice(question_text):
+    letters = {letter.upper() for letter in _QUESTION_OPTION.findall(question_text or '')}
+    return {'A', 'B'} <= letters
+
+
+def _check_choice(user, correct, question_text=None):
+    if _is_multiple_choice(question_text):
+        # 题干明确是选择题时小写字母也按选项处理
+        user, correct = user.upper(), correct.upper()
+    correct_letters = _choice_letters(correct)
+    if not correct_letters:
+        return None
+    user_letters = _choice_letters(user)
+    if user_letters is None:
+        # 学生写的是选项内容而不是字母，交给 LLM
+        return _result(None, 'choice', 'Answer is not an option letter')
+    if user_letters == correct_letters:
+        return _result(True, 'choice', f"Option {''.join(sorted(correct_letters))} matches the standard answer.")
+    return _result(False, 'choice',
+                   f"Chose {''.join(sorted(user_letters))}, the standard answer is {''.join(sorted(correct_letters))}.")
+
+
+# ---------- 判断题 ----------
+
+def _truth_value(text, abbreviations=False):
+    word = text.lower()
+    if word in _TRUE_WORDS or (abbreviations and word in _TRUE_ABBREVIATIONS):
+        return True
+    if word in _FALSE_WORDS or (abbreviations and word in _FALSE_ABBREVIATIONS):
+        return False
+    return None
+
+
+def _check_true_false(user, correct, question_text=None):
+    correct_value = _truth_value(correct)
+    if correct_value is None:
+        return None
+    user_value = _truth_value(user, abbreviations=True)
+    if user_value is None:
+        return _result(None, 'true_false', 'Answer is not a true/false value')
+    label = 'true' if correct_value else 'false'
+    if user_value == correct_value:
+        return _result(True, 'true_false', f"The statement is {label}, matching the standard answer.")
+    return _result(False, 'true_false', f"The standard answer is {label}.")
+
+
+# ---------- 数值 ----------
+
+def _to_float(text):
+    return float(text.replace(',', '').replace('−', '-'))
+
+
+def _decimals(text):
+    mantissa = re.split(r'[eE]', text)[0]
+    return len(mantissa.split('.', 1)[1]) if '.' in mantissa else 0
+
+
+def _unit(text):
+    """数值后面的部分规范化成单位；不是已知单位时返回 None"""
+    unit = text.replace(' ', '').lower().replace('^2', '²').replace('^3', '³').replace('*', '·')
+    return unit if unit in _UNITS else None
+
+
+def _parse_numeric(text):
+    """
+    解析 "x = 3.5 cm"、"3/4"、"50%"、"1.2×10^3 m"、"\\frac{1}{2}" 等形式
+
+    Returns:
+        dict(value, decimals, integer, unit, var, extra) 或 None（不以数值开头）。
+        数值后面跟的不是已知单位时 extra 为剩余文字（如 "2 or 3"、"12或13"、"6x"），不能按数值判定
+    """
+    text = _LATEX_FRAC.sub(r'\1/\2', text).replace('\\%', '%').replace('\\,', '').replace('\\ ', ' ')
+    match = _NUMERIC_ANSWER.match(text.strip())
+    if not match:
+        return None
+    try:
+        value = _to_float(match.group('num'))
+        decimals = _decimals(match.group('num'))
+        if match.group('den'):
+            denominator = _to_float(match.group('den'))
+            if denominator == 0:
+                return None
+            value /= denominator
+            decimals = None  # 分数是精确值
+        if match.group('exp'):
+            value *= 10 ** int(match.group('exp').replace('−', '-'))
+            decimals = None
+    except (ValueError, OverflowError):
+        return None
+    rest = match.group('rest').strip()
+    unit = ''
+    if rest == '%':
+        value /= 100.0
+        decimals = None
+    elif rest:
+        unit = _unit(rest)
+        if unit is None:
+            return {'extra': rest}
+    integer = decimals == 0 and rest != '%'
+    return {'value': value, 'decimals': decimals, 'integer': integer, 'unit': unit,
+            'var': match.group('var'), 'extra': None}
+
+
+def _check_numeric(user, correct, question_text=None):
+    expected = _parse_numeric(correct)
+    if expected is None or expected['extra']:
+        # 标准答案不是单纯的数值（如 "3 and 4"、"2x+1"），交给后面的代数式 / 文本比较
+        return None
+    given = _parse_numeric(user)
+    if given is None:
+        # 学生写的是表达式（如 \sqrt{2}、2^3）：交给代数式比较，与标准答案在前时的顺序一致
+        return None
+    if given['extra']:
+        return _result(None, 'numeric', 'Answer has text besides the number')
+    if given['var'] and expected['var'] and given['var'] != expected['var']:
+        # "y = 5" 对 "x = 5"：可能答的是另一个未知数
+        return _result(None, 'numeric', 'Variable names differ', likely=False)
+    if given['unit'] and expected['unit'] and given['unit'] != expected['unit']:
+        # 单位不同可能需要换算，交给 LLM
+        return _result(None, 'numeric', 'Units differ', likely=False)
+
+    a, b = given['value'], expected['value']
+    if given['integer'] and expected['integer']:
+        # 整数必须完全相等
+        if a == b:
+            return _result(True, 'numeric', f"{user} equals the standard answer {correct}.")
+        return _result(False, 'numeric', f"{user} does not equal the standard answer {correct}.")
+    # 小数只容忍浮点误差级别的差异
+    rel_tol = _env_float('ANSWER_CHECK_REL_TOL', 1e-9)
+    if math.isclose(a, b, rel_tol=rel_tol, abs_tol=1e-12):
+        return _result(True, 'numeric', f"{user} equals the standard answer {correct}.")
+    # 标准答案可能是近似值（如 3.14）：四舍五入后相等只说明可能正确（0.54 对 0.5 也满足），交给 LLM
+    if expected['decimals'] and round(a, expected['decimals']) == round(b, expected['decimals']):
+        return _result(None, 'numeric', 'Answer rounds to the standard answer', likely=True)
+    # 学生答案精度更低（如 3.1 对 3.14）：可能可以接受，交给 LLM
+    if given['decimals'] is not None and round(b, given['decimals']) == round(a, given['decimals']):
+        return _result(None, 'numeric', 'Answer is less precise than the standard answer', likely=True)
+    return _result(False, 'numeric', f"{user} does not equal the standard answer {correct}.")
+
+
+# ---------- 代数式 / LaTeX ----------
+
+def _latex_to_sympy_text(text):
+    text = text.strip().strip('$')
+    for _ in range(3):
+        text = _LATEX_FRAC.sub(r'((\1)/(\2))', text)
+    replacements = [
+        (r'\\left|\\right', ''), (r'\\sqrt\s*\{([^{}]*)\}', r'sqrt(\1)'),
+        (r'\\(?:cdot|times)', '*'), (r'\\div', '/'), (r'\\pi', 'pi'),
+        (r'\\(sin|cos|tan|ln|log|exp)', r'\1'), (r'\^\s*\{([^{}]*)\}', r'^(\1)'),
+        (r'[{]', '('), (r'[}]', ')'), (r'\\,|\\ |\\!', ''),
+    ]
+    for pattern, repl in replacements:
+        text = re.sub(pattern, repl, text)
+    return text.replace('^', '**').replace('−', '-').replace('×', '*').replace('÷', '/')
+
+
+def _parse_expression(text):
+    from sympy.parsing.sympy_parser import (
+        convert_xor, implicit_multiplication_application, parse_expr, standard_transformations
+    )
+    transformations = standard_transformations + (implicit_multiplication_application, convert_xor)
+    return parse_expr(_latex_to_sympy_text(text), transformations=transformations, evaluate=True)
+
+
+def _equivalent(a, b):
+    """符号化简 + 随机取点数值比较；返回 True / False / None（无法判断）"""
+    import sympy
+
+    difference = sympy.expand(a - b)
+    if difference == 0:
+        return True
+    symbols = sorted(difference.free_symbols, key=str)
+    if not symbols:
+        value = complex(difference.evalf())
+        return abs(value) < 1e-9
+    rng = random.Random(0)
+    for _ in range(6):
+        point = {s: rng.uniform(0.5, 3.0) for s in symbols}
+        try:
+            left = complex(a.evalf(subs=point))
+            right = complex(b.evalf(subs=point))
+        except (TypeError, ValueError, ZeroDivisionError):
+            return None
+        if not _close(left, right):
+            return False
+    return True
+
+
+def _close(x, y):
+    return abs(x - y) <= 1e-7 * max(1.0, abs(x), abs(y))
+
+
+def _rounds_to_decimal(text, other):
+    """text 是小数（如 1.414），other 是不含变量的精确值（如 sqrt(2)）且四舍五入到同样位数后相等"""
+    parsed = _parse_numeric(text)
+    if not parsed or parsed['extra'] or not parsed['decimals'] or other.free_symbols:
+        return False
+    try:
+        value = float(other.evalf())
+    except (TypeError, ValueError):
+        return False
+    return round(value, parsed['decimals']) == round(parsed['value'], parsed['decimals'])
+
+
+def _check_symbolic(user, correct, question_text=None):
+    max_len = int(os.getenv('ANSWER_CHECK_MAX_EXPR_CHARS', 120))
+    if len(user) > max_len or len(correct) > max_len:
+        return None
+    if re.search(r'[\u4e00-\u9fff]', user + correct):
+        return None
+    if any(word.lower() not in _EXPR_WORDS for word in re.findall(r'[A-Za-z]{2,}', user + ' ' + correct)):
+        return None
+    try:
+        import sympy  # noqa: F401 - 可选依赖，未安装时交给 LLM
+    except ImportError:
+        return None
+
+    def _sides(text):
+        # "y = 2x + 1" 比较右边；两边变量名必须一致
+        if text.count('=') == 1:
+            left, right = text.split('=')
+            return left.strip(), right.strip()
+        return None, text
+
+    user_lhs, user_rhs = _sides(user)
+    correct_lhs, correct_rhs = _sides(correct)
+    if user_lhs and correct_lhs and user_lhs.replace(' ', '') != correct_lhs.replace(' ', ''):
+        return None
+    try:
+        user_expr, correct_expr = _parse_expression(user_rhs), _parse_expression(correct_rhs)
+        verdict = _equivalent(user_expr, correct_expr)
+    except Exception:
+        return None
+    if verdict is None:
+        return None
+    if not verdict and (_rounds_to_decimal(user_rhs, correct_expr) or _rounds_to_decimal(correct_rhs, user_expr)):
+        # 1.414 对 \sqrt{2}（或反过来）：近似值是否可以接受由 LLM 按题意判断
+        return _result(None, 'symbolic', 'Decimal approximation of an exact value', likely=True)
+    if verdict:
+        return _result(True, 'symbolic', f"{user} is equivalent to the standard answer {correct}.")
+    return _result(False, 'symbolic', f"{user} is not equivalent to the standard answer {correct}.")
+
+
+# ---------- 入口 ----------
+
+def check_answer(user_answer, correct_answer, question_text=None):
+    """
+    本地判分：选项字母、判断题、数值（整数精确比较、已知单位）、代数式 / LaTeX（sympy 等价性）、规范化文本完全一致。
+    question_text 用于识别选择题（题干带 A. / B. 选项时小写字母也按选项处理）
+
+    Returns:
+        dict: {'is_correct': True/False/None, 'method': str, 'reason': str, 'likely': bool/None}
+              is_correct 为 None 表示无法确定，需要交给 LLM
+    """
+    user = _normalize(user_answer)
+    correct = _normalize(correct_answer)
+    if not user:
+        return _result(False, 'empty', 'No answer was submitted.')
+    if not correct:
+        return _result(None, 'none', 'No standard answer to compare with')
+
+    for check in (_check_choice, _check_true_false, _check_numeric, _check_symbolic):
+        result = check(user, correct, question_text)
+        if result is not None:
+            return result
+
+    squash = lambda s: re.sub(r'[\s$\\{}()（）.,，。]', '', s).lower()
+    if squash(user) == squash(correct):
+        return _result(True, 'text', 'Answer matches the standard answer.')
+    return _result(None, 'text', 'Free-form answer needs review')
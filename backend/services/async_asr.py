@@ -0,0 +1,301 @@
+"""
+Asyncio Xfyun iat client - every recognition session multiplexed on one background event loop
+"""
+
+import asyncio
+import atexit
+import base64
+import concurrent.futures
+import hashlib
+import hmac
+import json
+import os
+import threading
+from datetime import datetime
+from time import mktime
+from urllib.parse import urlencode, urlparse
+from wsgiref.handlers import format_date_time
+
+import aiohttp
+
+FRAME_SIZE = 1280  # 40ms of 16kHz 16-bit mono PCM
+FRAME_INTERVAL = 0.04
+
+
+def auth_url(api_key, api_secret):
+    """Create Xfyun WebSocket authentication URL (endpoint configurable via XFYUN_IAT_URL)."""
+    base_url = os.getenv('XFYUN_IAT_URL', 'wss://ws-api.xfyun.cn/v2/iat')
+    parsed = urlparse(base_url)
+    host = parsed.netloc
+    path = parsed.path or '/v2/iat'
+
+    date = format_date_time(mktime(datetime.now().timetuple()))
+    signature_origin = f"host: {host}\ndate: {date}\nGET {path} HTTP/1.1"
+    signature_sha = hmac.new(
+        api_secret.encode('utf-8'),
+        signature_origin.encode('utf-8'),
+        digestmod=hashlib.sha256
+    ).digest()
+    signature_sha_base64 = base64.b64encode(signature_sha).decode('utf-8')
+
+    authorization_origin = f'api_key="{api_key}", algorithm="hmac-sha256", headers="host date request-line", signature="{signature_sha_base64}"'
+    authorization = base64.b64encode(authorization_origin.encode('utf-8')).decode('utf-8')
+
+    params = {
+        "authorization": authorization,
+        "date": date,
+        "host": host
+    }
+    return f"{base_url}?{urlencode(params)}"
+
+
+def frame_message(status, chunk, appid, language):
+    """一帧音频的 iat 消息；第一帧（status=0）带上业务参数"""
+    message = {
+        "data": {
+            "status": status,
+            "format": "audio/L16;rate=16000",
+            "encoding": "raw",
+            "audio": base64.b64encode(chunk).decode('utf-8')
+        }
+    }
+    if status == 0:
+        message["common"] = {"app_id": appid}
+        message["business"] = {
+            "language": language,
+            "domain": "iat",
+            "accent": "mandarin",
+            "vad_eos": 3000,
+            "ptt": 1
+        }
+    return message
+
+
+class XfyunTranscript:
+    """iat 结果累积：按 sn 保存每句文字，动态修正（pgs=rpl）时替换 rg 闭区间内的句子"""
+
+    def __init__(self):
+        self.sentences = {}
+
+    def apply(self, result):
+        """合并一条 result，返回这条消息带来的文字（可能为空）"""
+        current_text = ''.join(
+            cw.get("w", "") for ws_item in result.get("ws", []) for cw in ws_item.get("cw", [])
+        )
+        rg = result.get("rg", [])
+        if result.get("pgs") == "rpl" and len(rg) == 2:
+            for replaced in range(rg[0], rg[1] + 1):
+                self.sentences.pop(replaced, None)
+        if current_text:
+            self.sentences[result.get("sn", len(self.sentences) + 1)] = current_text
+        return current_text
+
+    @property
+    def parts(self):
+        return [self.sentences[k] for k in sorted(self.sentences)]
+
+    @property
+    def text(self):
+        return ''.join(self.parts)
+
+
+class AsyncXfyunClient:
+    """
+    所有讯飞识别会话共用一个后台事件循环和一个 aiohttp 会话：
+    每路识别只是循环里的一个协程（发送、接收各一个 task），不再占用发送线程 + run_forever 线程。
+    Flask 线程通过 submit() 拿到 concurrent.futures.Future，recognize() 阻塞等待结果，超时会取消协程并关闭连接。
+    实时转写的 stream() 也在同一个循环里收发，调用线程只负责取帧。
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._session = None
+        self._lock = threading.Lock()
+        self._stats = {'started': 0, 'completed': 0, 'failed': 0, 'cancelled': 0, 'active': 0, 'peak_active': 0}
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='xfyun-asr-loop', daemon=True).start()
+                atexit.register(self.close)
+            return self._loop
+
+    def close(self):
+        """进程退出时关闭共享的 aiohttp 会话"""
+        if self._loop is not None and self._session is not None and not self._session.closed:
+            asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result(5)
+
+    async def _client_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=int(os.getenv('ASR_MAX_CONNECTIONS', 500)))
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def _count(self, key, delta=1):
+        with self._lock:
+            self._stats[key] += delta
+            self._stats['peak_active'] = max(self._stats['peak_active'], self._stats['active'])
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    # ---------- 同步入口（Flask 线程调用）----------
+
+    def submit(self, audio_data, language, appid, api_key, api_secret, timeout=60):
+        """提交一路识别，返回 Future，结果为 (text, error)"""
+        return asyncio.run_coroutine_threadsafe(
+            self._tracked(self._session_run(audio_data, language, appid, api_key, api_secret), timeout),
+            self._ensure_loop()
+        )
+
+    def recognize(self, audio_data, language, appid, api_key, api_secret, deadline=None):
+        timeout = 60 if deadline is None else max(0.1, min(60, deadline.remaining()))
+        future = self.submit(audio_data, language, appid, api_key, api_secret, timeout)
+        try:
+            # 协程内部已按 timeout 收尾，这里多给一点余量
+            return future.result(timeout + 5)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            return None, "Recognition timed out"
+        except concurrent.futures.CancelledError:
+            return None, "Recognition cancelled"
+
+    def stream(self, next_frame, language, appid, api_key, api_secret, on_update=None):
+        """
+        一次实时流式识别会话：调用线程从 next_frame() 取帧（阻塞等待采集，返回 None 表示本会话音频结束），
+        帧交给事件循环发送；识别结果（含 pgs=rpl 动态修正）每次变化都在循环里回调 on_update(text)。
+        讯飞单次会话最长 60 秒，由调用方负责切换会话。返回 (text, error)
+        """
+        loop = self._ensure_loop()
+        frames = asyncio.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            self._tracked(self._stream_run(frames, language, appid, api_key, api_secret, on_update)), loop
+        )
+        while not future.done():
+            chunk = next_frame()
+            loop.call_soon_threadsafe(frames.put_nowait, chunk)
+            if chunk is None:
+                break
+        try:
+            # 音频已经全部送出，只等最后的识别结果
+            return future.result(60)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            return None, "Recognition timed out"
+        except concurrent.futures.CancelledError:
+            return None, "Recognition cancelled"
+
+    # ---------- 事件循环内 ----------
+
+    async def _tracked(self, coroutine, timeout=None):
+        """统计会话数并把超时、连接错误转成 (None, error)"""
+        self._count('started')
+        self._count('active')
+        try:
+            result = await asyncio.wait_for(coroutine, timeout)
+            self._count('completed' if result[0] is not None else 'failed')
+            return result
+        except asyncio.TimeoutError:
+            self._count('failed')
+            return None, "Request deadline exceeded"
+        except asyncio.CancelledError:
+            self._count('cancelled')
+            raise
+        except (aiohttp.ClientError, ValueError) as e:
+            self._count('failed')
+            return None, str(e)
+        finally:
+            self._count('active', -1)
+
+    @staticmethod
+    async def _receive(ws, transcript, on_update=None):
+        """读取识别结果直到 status=2；返回 (finished, error)"""
+        async for message in ws:
+            if message.type != aiohttp.WSMsgType.TEXT:
+                break
+            data = json.loads(message.data)
+            code = data.get("code")
+            if code != 0:
+                return False, f"Xfyun Error {code}: {data.get('message', 'Unknown error')}"
+            result_data = data.get("data", {})
+            if transcript.apply(result_data.get("result", {})) and on_update:
+                on_update(transcript.text)
+            if result_data.get("status") == 2:
+                return True, None
+        return False, None
+
+    async def _session_run(self, audio_data, language, appid, api_key, api_secret):
+        session = await self._client_session()
+        transcript = XfyunTranscript()
+        async with session.ws_connect(auth_url(api_key, api_secret)) as ws:
+            sender = asyncio.ensure_future(self._send_audio(ws, audio_data, appid, language))
+            try:
+                finished, error = await self._receive(ws, transcript)
+            finally:
+                sender.cancel()
+            send_error = sender.exception() if sender.done() and not sender.cancelled() else None
+        if error:
+            return None, error
+        if send_error is not None and not finished:
+            return None, str(send_error)
+        return transcript.text, None
+
+    async def _stream_run(self, frames, language, appid, api_key, api_secret, on_update):
+        session = await self._client_session()
+        transcript = XfyunTranscript()
+        async with session.ws_connect(auth_url(api_key, api_secret)) as ws:
+            sender = asyncio.ensure_future(self._send_frames(ws, frames, appid, language))
+            try:
+                finished, error = await self._receive(ws, transcript, on_update)
+            finally:
+                sender.cancel()
+            send_error = sender.exception() if sender.done() and not sender.cancelled() else None
+        if error:
+            return None, error
+        if not finished:
+            # 没等到最终结果就断开：本会话的帧由调用方重发
+            return None, str(send_error or 'Connection closed before the final result')
+        return transcript.text, None
+
+    @staticmethod
+    async def _send_audio(ws, audio_data, appid, language):
+        """按实时速率发送：每 40ms 一帧 1280 字节，最后一帧 status=2"""
+        audio_data = memoryview(audio_data)  # 按帧切片时不复制
+        total_len = len(audio_data)
+        offset = 0
+        while offset < total_len or offset == 0:
+            end = min(offset + FRAME_SIZE, total_len)
+            if offset == 0:
+                status = 0 if end < total_len else 2
+            else:
+                status = 2 if end >= total_len else 1
+            if offset == 0 and status == 2:
+                # 只有一帧时也要先发 status=0 带上业务参数
+                await ws.send_str(json.dumps(frame_message(0, audio_data[:end], appid, language)))
+                await ws.send_str(json.dumps(frame_message(2, b'', appid, language)))
+                return
+            await ws.send_str(json.dumps(frame_message(status, audio_data[offset:end], appid, language)))
+            offset = end
+            if status != 2:
+                await asyncio.sleep(FRAME_INTERVAL)
+
+    @staticmethod
+    async def _send_frames(ws, frames, appid, language):
+        """实时流：帧由调用线程放入队列（None 表示音频结束），到达即发送，不再按 40ms 节奏补发"""
+        status = 0
+        while True:
+            chunk = await frames.get()
+            if chunk is None:
+                # 尾帧不带音频，只通知服务端音频结束（一帧都没有时先发带业务参数的首帧）
+                if not status:
+                    await ws.send_str(json.dumps(frame_message(0, b'', appid, language)))
+                await ws.send_str(json.dumps(frame_message(2, b'', appid, language)))
+                return
+            await ws.send_str(json.dumps(frame_message(status, chunk, appid, language)))
+            status = 1
+
+
+# 创建单例实例
+async_xfyun = AsyncXfyunClient()
@@ -0,0 +1,210 @@
+"""
+Streaming audio decoding - uploads piped through ffmpeg into fixed-size 16kHz mono PCM chunks
+"""
+
+import os
+import stat
+import subprocess
+import threading
+import wave
+
+from .audio_segments import SAMPLE_RATE, SAMPLE_WIDTH, Segment, split_on_silence
+
+PUMP_BLOCK = 64 * 1024  # 向 ffmpeg stdin 转发上传内容的块大小
+
+
+class AudioDecodeError(Exception):
+    """上传的音频无法解码（格式不支持、文件损坏或没有 ffmpeg）"""
+
+
+def _chunk_bytes():
+    """每次产出的 PCM 块大小（默认 5 秒音频，160KB）"""
+    seconds = float(os.getenv('ASR_DECODE_CHUNK_SECONDS', 5))
+    return max(1, int(seconds * SAMPLE_RATE)) * SAMPLE_WIDTH
+
+
+def _read_full(reader, size):
+    """从 reader 读满 size 字节（管道可能一次只返回一部分），到结尾时返回不足 size 的块"""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    filled = 0
+    while filled < size:
+        count = reader.readinto(view[filled:])
+        if not count:
+            break
+        filled += count
+    view.release()
+    if filled < size:
+        del buffer[filled:]
+    return buffer
+
+
+def _iter_raw(stream, chunk_size):
+    """已经是 16kHz 16-bit 单声道 PCM：按块直接读出"""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _wav_reader(stream):
+    """WAV 已是目标格式时返回 wave 读取器，否则回到开头交给 ffmpeg 处理"""
+    try:
+        start = stream.tell()
+    except (AttributeError, OSError):
+        return None
+    try:
+        reader = wave.open(stream, 'rb')
+        if (reader.getframerate(), reader.getnchannels(), reader.getsampwidth()) == (SAMPLE_RATE, 1, SAMPLE_WIDTH):
+            return reader
+    except (wave.Error, EOFError):
+        pass
+    stream.seek(start)
+    return None
+
+
+def _iter_wav(reader, chunk_size):
+    frames = chunk_size // SAMPLE_WIDTH
+    while True:
+        chunk = reader.readframes(frames)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _file_input(stream):
+    """
+    上传已落在临时文件里（werkzeug 对大文件会这样做）时，把文件描述符直接作为 ffmpeg 的 stdin，
+    按文件打开而不是管道：可以 seek，moov 在末尾的 m4a 也能解码，也省掉转发线程。
+    """
+    if os.name != 'posix':
+        return None
+    try:
+        fd = stream.fileno()
+        if stream.tell() != 0 or not stat.S_ISREG(os.fstat(fd).st_mode):
+            return None
+    except (AttributeError, OSError, ValueError):
+        return None
+    return fd
+
+
+def _pump(stream, pipe):
+    """把上传内容分块写入 ffmpeg stdin（ffmpeg 提前退出时停止）"""
+    try:
+        while True:
+            block = stream.read(PUMP_BLOCK)
+            if not block:
+                break
+            pipe.write(block)
+    except (BrokenPipeError, ValueError, OSError):
+        pass
+    finally:
+        try:
+            pipe.close()
+        except OSError:
+            pass
+
+
+def _drain(pipe, tail):
+    """持续读取 stderr（避免管道写满卡住 ffmpeg），只保留最后 2KB 用于报错"""
+    for line in pipe:
+        tail.append(line)
+        while sum(len(item) for item in tail) > 2048 and len(tail) > 1:
+            tail.pop(0)
+
+
+def _iter_ffmpeg(stream, file_format, chunk_size):
+    fd = _file_input(stream)
+    command = [
+        os.getenv('FFMPEG_BINARY', 'ffmpeg'), '-hide_banner', '-loglevel', 'error',
+        *(['-f', file_format] if file_format in ('mp3', 'ogg', 'webm') else []),
+        '-i', 'pipe:0' if fd is None else '/dev/stdin', '-vn', '-ac', '1', '-ar', str(SAMPLE_RATE), '-f', 's16le', 'pipe:1'
+    ]
+    try:
+        process = subprocess.Popen(
+            command,
+            stdin=fd if fd is not None else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+    except FileNotFoundError:
+        raise AudioDecodeError('ffmpeg is not installed (set FFMPEG_BINARY)')
+
+    threads = []
+    if fd is None:
+        threads.append(threading.Thread(target=_pump, args=(stream, process.stdin), daemon=True))
+    errors = []
+    threads.append(threading.Thread(target=_drain, args=(process.stderr, errors), daemon=True))
+    for thread in threads:
+        thread.start()
+
+    produced = 0
+    try:
+        while True:
+            chunk = _read_full(process.stdout, chunk_size)
+            if not chunk:
+                break
+            produced += len(chunk)
+            yield chunk
+        process.wait()
+        for thread in threads:
+            thread.join(5)
+        if process.returncode != 0 or not produced:
+            detail = b''.join(errors).decode('utf-8', 'replace').strip().splitlines()
+            raise AudioDecodeError(f"ffmpeg failed to decode audio: {detail[-1] if detail else process.returncode}")
+    finally:
+        # 调用方提前停止（识别失败、超时）时结束 ffmpeg
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+
+
+def iter_pcm_chunks(stream, file_format=None, chunk_size=None):
+    """
+    把上传的音频流解码成 16kHz 16-bit 单声道 PCM，逐块产出（最后一块可能不足 chunk_size）。
+    pcm / 目标格式的 wav 直接读取，其它格式通过 ffmpeg 管道转码；不写临时文件，内存占用与录音时长无关。
+    """
+    chunk_size = chunk_size or _chunk_bytes()
+    file_format = (file_format or '').lower()
+    if file_format == 'pcm':
+        return _iter_raw(stream, chunk_size)
+    if file_format == 'wav':
+        reader = _wav_reader(stream)
+        if reader is not None:
+            return _iter_wav(reader, chunk_size)
+    return _iter_ffmpeg(stream, file_format, chunk_size)
+
+
+def iter_segments(chunks, target_seconds=55, min_seconds=0.5, sample_rate=SAMPLE_RATE):
+    """
+    split_on_silence 的流式版本：缓冲区攒到两个目标片段长时切一次，产出除最后一段外的所有片段，
+    最后一段（可能含硬切重叠）留在缓冲区继续累积。缓冲区最多约 2 × target_seconds 的音频。
+    产出 Segment，overlapped 标出开头与上一段硬切重叠的片段。
+    """
+    target_bytes = int(target_seconds * sample_rate) * SAMPLE_WIDTH
+    buffer = bytearray()
+    carried = False  # 留在缓冲区的那段开头是否与已产出的上一段重叠
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) < 2 * target_bytes:
+            continue
+        with memoryview(buffer) as view:
+            pieces, overlaps = split_on_silence(view, target_seconds, min_seconds=0, sample_rate=sample_rate,
+                                                with_overlaps=True)
+            overlaps[0] = carried
+            keep_from = len(buffer) - len(pieces[-1])
+            # 片段要交给其它线程识别，而缓冲区马上会被修改，这里各复制一份
+            ready = [Segment(piece, overlapped) for piece, overlapped in zip(pieces[:-1], overlaps[:-1])]
+            carried = overlaps[-1]
+            for piece in pieces:
+                piece.release()
+        del buffer[:keep_from]
+        yield from ready
+    pieces, overlaps = split_on_silence(bytes(buffer), target_seconds, min_seconds, sample_rate=sample_rate,
+                                        with_overlaps=True)
+    if pieces:
+        overlaps[0] = carried
+    for piece, overlapped in zip(pieces, overlaps):
+        yield Segment(piece, overlapped)
@@ -0,0 +1,67 @@
+"""
+In-memory audio encoding - compress PCM before upload (Ogg Opus / FLAC through ffmpeg, WAV fallback)
+"""
+
+import io
+import os
+import subprocess
+import wave
+
+from .audio_segments import SAMPLE_RATE, SAMPLE_WIDTH
+
+# 格式 -> (ffmpeg 编码参数, 上传文件名)；Whisper 按文件扩展名识别格式
+ENCODERS = {
+    'opus': (['-c:a', 'libopus', '-application', 'voip', '-f', 'ogg'], 'audio.ogg'),
+    'flac': (['-c:a', 'flac', '-compression_level', '8', '-f', 'flac'], 'audio.flac'),
+}
+
+_warned = set()
+
+
+def upload_format():
+    """WHISPER_UPLOAD_FORMAT: opus（默认，约为 WAV 的 1/10）、flac（无损，约 1/2）或 wav"""
+    fmt = os.getenv('WHISPER_UPLOAD_FORMAT', 'opus').lower()
+    return fmt if fmt in ENCODERS or fmt == 'wav' else 'opus'
+
+
+def wav_bytes(audio_data, sample_rate=SAMPLE_RATE):
+    """16-bit 单声道 PCM 加上 WAV 头"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(sample_rate)
+        wav.writeframes(audio_data)
+    return buffer.getvalue()
+
+
+def _ffmpeg_encode(audio_data, fmt, sample_rate):
+    codec_args, filename = ENCODERS[fmt]
+    if fmt == 'opus':
+        codec_args = codec_args[:2] + ['-b:a', os.getenv('WHISPER_OPUS_BITRATE', '24k')] + codec_args[2:]
+    command = [
+        os.getenv('FFMPEG_BINARY', 'ffmpeg'), '-hide_banner', '-loglevel', 'error',
+        '-f', 's16le', '-ar', str(sample_rate), '-ac', '1', '-i', 'pipe:0',
+        *codec_args, 'pipe:1'
+    ]
+    # 片段最多几 MB，communicate 一次写入 / 读出，不会卡在管道上
+    result = subprocess.run(command, input=audio_data, capture_output=True, timeout=60)
+    if result.returncode != 0 or not result.stdout:
+        raise RuntimeError(result.stderr.decode('utf-8', 'replace').strip() or f'ffmpeg exited {result.returncode}')
+    return filename, result.stdout
+
+
+def encode_pcm(audio_data, fmt=None, sample_rate=SAMPLE_RATE):
+    """
+    在内存里把 PCM 编码成待上传的音频文件，返回 (filename, data)。
+    ffmpeg 不可用或编码失败时退回 WAV（只提示一次），识别不受影响。
+    """
+    fmt = fmt or upload_format()
+    if fmt in ENCODERS:
+        try:
+            return _ffmpeg_encode(audio_data, fmt, sample_rate)
+        except (OSError, RuntimeError, subprocess.TimeoutExpired) as e:
+            if fmt not in _warned:
+                _warned.add(fmt)
+                print(f"[AUDIO_ENCODE] {fmt} encoding unavailable, uploading WAV: {e}")
+    return 'audio.wav', wav_bytes(audio_data, sample_rate)
@@ -0,0 +1,162 @@
+"""
+Audio segmentation helpers - silence-aware PCM splitting and overlap-aware transcript stitching
+"""
+
+import os
+import re
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+FRAME_MS = 20
+
+# 拼接时的比较单位：单个汉字或一个英文单词 / 数字
+_UNIT = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]|[A-Za-z0-9]+(?:[\'.][A-Za-z0-9]+)*')
+_LEADING_PUNCT = re.compile(r'^[\s,.;:!?，。；：！？、]+')
+
+
+class Segment(bytes):
+    """PCM 片段；overlapped 表示开头与上一段重叠（硬切处），拼接文字时只在这种边界上去重"""
+
+    def __new__(cls, data, overlapped=False):
+        segment = super().__new__(cls, data)
+        segment.overlapped = bool(overlapped)
+        return segment
+
+
+def _search_seconds():
+    """在目标切点之前多长的窗口里找静音"""
+    return float(os.getenv('ASR_SILENCE_SEARCH_SECONDS', 8))
+
+
+def _overlap_seconds():
+    """找不到静音、只能硬切时，相邻片段重叠的时长"""
+    return float(os.getenv('ASR_SEGMENT_OVERLAP_SECONDS', 1.0))
+
+
+def frame_energy(audio_data, sample_rate=SAMPLE_RATE):
+    """16-bit 单声道 PCM 按 20ms 分帧的 RMS 能量"""
+    samples = np.frombuffer(audio_data[:len(audio_data) - len(audio_data) % SAMPLE_WIDTH], dtype='<i2')
+    frame = sample_rate * FRAME_MS // 1000
+    count = len(samples) // frame
+    if count == 0:
+        return np.zeros(0)
+    # float32 + einsum：不生成平方后的中间数组，长缓冲区上的临时内存约为 PCM 的两倍
+    frames = samples[:count * frame].reshape(count, frame).astype(np.float32)
+    return np.sqrt(np.einsum('ij,ij->i', frames, frames) / frame).astype(np.float64)
+
+
+def split_on_silence(audio_data, target_seconds=55, min_seconds=0.5, sample_rate=SAMPLE_RATE,
+                     with_overlaps=False):
+    """
+    把 PCM 切成约 target_seconds 以内的片段，切点选在目标位置前窗口内最后一段静音（句间停顿）的中点。
+    窗口内没有足够安静的位置时在目标处硬切，并让下一段向前重叠 ASR_SEGMENT_OVERLAP_SECONDS，
+    避免切断的词丢失（重叠部分的文字由 stitch_transcripts 去重）。
+
+    with_overlaps=True 时返回 (segments, overlaps)，overlaps[i] 表示第 i 段开头与上一段重叠，
+    需要传给 stitch_transcripts；在静音处切开的边界不重叠，也不能去重。
+    """
+    frame_bytes = sample_rate * FRAME_MS // 1000 * SAMPLE_WIDTH
+    frames_per_second = 1000 // FRAME_MS
+    energy = frame_energy(audio_data, sample_rate)
+    total_frames = len(energy)
+    target = max(1, int(target_seconds * frames_per_second))
+    if total_frames <= target:
+        segments = [audio_data] if len(audio_data) >= min_seconds * sample_rate * SAMPLE_WIDTH else []
+        return (segments, [False] * len(segments)) if with_overlaps else segments
+
+    # 200ms 滑动平均，避免单帧的瞬时静音（爆破音之间）被当作停顿
+    smooth = np.convolve(energy, np.ones(10) / 10, mode='same')
+    speech_level = np.percentile(energy, 90) or 1.0
+    # 静音阈值：底噪的两倍，但不超过语音能量的 30%（整段都很响时就找不到静音）
+    quiet = min(max(np.percentile(energy, 10) * 2, speech_level * 0.05), speech_level * 0.3)
+    search = int(_search_seconds() * frames_per_second)
+    overlap = int(_overlap_seconds() * frames_per_second)
+
+    bounds = []
+    overlaps = []
+    start = 0
+    while total_frames - start > target:
+        window_start = max(start + 1, start + target - search)
+        window = smooth[window_start:start + target]
+        silent = np.nonzero(window <= quiet)[0]
+        if len(silent):
+            # 取窗口内最后一段静音的中点，片段尽量长、会话数尽量少
+            end = silent[-1]
+            begin = end
+            while begin > 0 and window[begin - 1] <= quiet:
+                begin -= 1
+            cut = window_start + (begin + end) // 2
+            bounds.append((start, cut))
+            start = cut
+        else:
+            cut = start + target
+            bounds.append((start, cut))
+            start = max(start + 1, cut - overlap)
+        overlaps.append(start < bounds[-1][1])
+    if total_frames - start >= min_seconds * frames_per_second or not bounds:
+        bounds.append((start, total_frames))
+    else:
+        # 太短的尾巴并入上一段
+        bounds[-1] = (bounds[-1][0], total_frames)
+        overlaps.pop()
+
+    segments = [audio_data[s * frame_bytes:e * frame_bytes] for s, e in bounds]
+    # 不足一帧的零头
+    segments[-1] = audio_data[bounds[-1][0] * frame_bytes:]
+    return (segments, [False] + overlaps) if with_overlaps else segments
+
+
+def _overlap_cut(previous, following, max_units):
+    """previous 的结尾与 following 的开头重复的单位数对应的 following 截断位置"""
+    tail = [m.group().lower() for m in _UNIT.finditer(previous[-max_units * 12:])][-max_units:]
+    head = list(_UNIT.finditer(following))[:max_units]
+    head_units = [m.group().lower() for m in head]
+    for size in range(min(len(tail), len(head_units)), 1, -1):
+        if tail[-size:] == head_units[:size]:
+            return head[size - 1].end()
+    return 0
+
+
+def _join(left, right):
+    if not left:
+        return right
+    if not right:
+        return left
+    if left[-1].isascii() and left[-1].isalnum() and right[0].isascii() and right[0].isalnum():
+        return f'{left} {right}'
+    return left + right
+
+
+def stitch_transcripts(texts, overlaps=None, max_overlap_units=None):
+    """
+    按顺序拼接各片段的识别结果。只有 overlaps[i] 为真（第 i 段与上一段在硬切处重叠）且上一段有文字时，
+    才去掉第 i 段开头重复识别出的文字；在静音处切开的边界两侧本来就可能有相同的词，不能去重。
+    """
+    if max_overlap_units is None:
+        max_overlap_units = int(os.getenv('ASR_STITCH_MAX_UNITS', 30))
+    merged = ''
+    previous = ''
+    for index, text in enumerate(texts):
+        text = (text or '').strip()
+        overlapped = bool(overlaps and overlaps[index] and previous)
+        previous = text
+        if not text:
+            continue
+        cut = _overlap_cut(merged, text, max_overlap_units) if overlapped else 0
+        merged = _join(merged, _LEADING_PUNCT.sub('', text[cut:]) if cut else text)
+    return merged
+
+
+def leading_speech(audio_data, seconds, sample_rate=SAMPLE_RATE):
+    """跳过开头的静音，取之后 seconds 秒的音频（用于语种探测）"""
+    energy = frame_energy(audio_data, sample_rate)
+    frame_bytes = sample_rate * FRAME_MS // 1000 * SAMPLE_WIDTH
+    start = 0
+    if len(energy):
+        voiced = np.nonzero(energy > np.percentile(energy, 90) * 0.3)[0]
+        if len(voiced):
+            # 留 200ms 余量，避免切掉第一个音节的起音
+            start = max(0, voiced[0] - 200 // FRAME_MS) * frame_bytes
+    return audio_data[start:start + int(seconds * sample_rate) * SAMPLE_WIDTH]
@@ -0,0 +1,350 @@
+"""
+Record/replay cassettes for AI provider traffic (keys scrubbed, original or scaled latency)
+"""
+
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+# 录制/回放时会被抹掉的敏感信息
+_SECRET_ENV_VARS = (
+    'DEEPSEEK_API_KEY', 'OPENAI_API_KEY', 'DASHSCOPE_API_KEY',
+    'XFYUN_APPID', 'XFYUN_API_KEY', 'XFYUN_API_SECRET'
+)
+_SECRET_PATTERN = re.compile(r'sk-[A-Za-z0-9]{16,}')
+_MULTIPART_FILENAME = re.compile(rb'filename="[^"]*"')
+_KEPT_RESPONSE_HEADERS = ('content-type',)
+
+MODES = ('off', 'record', 'replay', 'auto')
+
+
+def _scrub(text):
+    for name in _SECRET_ENV_VARS:
+        value = os.getenv(name)
+        if value and len(value) >= 6:
+            text = text.replace(value, '***')
+    return _SECRET_PATTERN.sub('sk-***', text)
+
+
+def _normalize_body(body, content_type):
+    """去掉请求体中每次都会变化的部分（multipart boundary、临时文件名），JSON 规范化排序"""
+    content_type = content_type or ''
+    if 'multipart/form-data' in content_type and 'boundary=' in content_type:
+        boundary = content_type.split('boundary=', 1)[1].split(';')[0].strip('"').encode('ascii')
+        body = body.replace(boundary, b'BOUNDARY')
+        return _MULTIPART_FILENAME.sub(b'filename="file"', body)
+    if 'json' in content_type:
+        try:
+            return json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False).encode('utf-8')
+        except ValueError:
+            pass
+    return body
+
+
+def request_key(provider, method, url, body, content_type):
+    """匹配键：provider + 方法 + 路径（不含 host / query）+ 规范化后的请求体"""
+    digest = hashlib.sha256()
+    digest.update(f"{provider} {method.upper()} {urlsplit(url).path}\n".encode('utf-8'))
+    digest.update(_normalize_body(body or b'', content_type))
+    return digest.hexdigest()
+
+
+class Cassette:
+    """
+    provider 流量的录制 / 回放（AI_CASSETTE_MODE）：
+    - off:    直连 provider（默认）
+    - record: 直连并把请求 / 响应 / 耗时追加写入 {AI_CASSETTE_DIR}/{AI_CASSETTE_NAME}.jsonl
+    - replay: 只从 cassette 返回，未命中时返回 404（不会访问网络）
+    - auto:   命中则回放，未命中则直连并录制
+    同一个请求录制多次时按录制顺序依次回放，最后一条重复使用。
+    回放耗时 = 录制耗时 × AI_CASSETTE_LATENCY_SCALE（0 表示立即返回）。
+    """
+
+    def __init__(self):
+        self._entries = None
+        self._cursors = {}
+        self._lock = threading.Lock()
+
+    # ---------- 配置 ----------
+
+    def mode(self):
+        mode = os.getenv('AI_CASSETTE_MODE', 'off').lower()
+        return mode if mode in MODES else 'off'
+
+    def enabled(self):
+        return self.mode() != 'off'
+
+    def path(self):
+        directory = os.getenv('AI_CASSETTE_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cassettes'))
+        return os.path.join(directory, f"{os.getenv('AI_CASSETTE_NAME', 'default')}.jsonl")
+
+    def latency_scale(self):
+        return float(os.getenv('AI_CASSETTE_LATENCY_SCALE', 1.0))
+
+    # ---------- 存取 ----------
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        path = self.path()
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry['key'], []).append(entry)
+        print(f"[CASSETTE] loaded {sum(len(v) for v in self._entries.values())} interactions from {path}")
+
+    def lookup(self, key):
+        """按录制顺序取下一条匹配记录，没有则返回 None"""
+        with self._lock:
+            self._load()
+            entries = self._entries.get(key)
+            if not entries:
+                return None
+            index = self._cursors.get(key, 0)
+            self._cursors[key] = index + 1
+            return entries[min(index, len(entries) - 1)]
+
+    def save(self, entry):
+        entry = json.loads(_scrub(json.dumps(entry, ensure_ascii=False)))
+        path = self.path()
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            if self._entries is not None:
+                self._entries.setdefault(entry['key'], []).append(entry)
+
+    def reset(self):
+        """丢弃已加载的记录和回放游标（切换 cassette 时使用）"""
+        with self._lock:
+            self._entries = None
+            self._cursors = {}
+
+    def replay_delay(self, entry, timeout=None):
+        """
+        按比例重现录制时的耗时
+
+        Returns:
+            bool: False 表示耗时超过调用方超时（已等待到超时）
+        """
+        delay = entry.get('latency_ms', 0) / 1000.0 * self.latency_scale()
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            return False
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    def build_entry(self, key, provider, request, response, latency):
+        """
+        Args:
+            request: {'method', 'url', 'content_type', 'body'(bytes)}
+            response: {'status', 'headers'(dict), 'body'(bytes)}
+        """
+        max_body = int(os.getenv('AI_CASSETTE_MAX_REQUEST_BYTES', 65536))
+        req_body = request['body'] or b''
+        recorded_request = {
+            'method': request['method'],
+            'path': urlsplit(request['url']).path,
+            'body_sha256': hashlib.sha256(req_body).hexdigest()
+        }
+        if len(req_body) <= max_body:
+            try:
+                recorded_request['body'] = req_body.decode('utf-8')
+            except UnicodeDecodeError:
+                pass
+
+        resp_body = response['body'] or b''
+        recorded_response = {
+            'status': response['status'],
+            'headers': {
+                k.lower(): v for k, v in response['headers'].items() if k.lower() in _KEPT_RESPONSE_HEADERS
+            }
+        }
+        try:
+            recorded_response['body'] = resp_body.decode('utf-8')
+        except UnicodeDecodeError:
+            recorded_response['body_base64'] = base64.b64encode(resp_body).decode('ascii')
+
+        return {
+            'key': key,
+            'provider': provider,
+            'request': recorded_request,
+            'response': recorded_response,
+            'latency_ms': round(latency * 1000, 1),
+            'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+
+    @staticmethod
+    def response_body(entry):
+        response = entry['response']
+        if 'body_base64' in response:
+            return base64.b64decode(response['body_base64'])
+        return response.get('body', '').encode('utf-8')
+
+    @staticmethod
+    def miss_body(provider, key):
+        return json.dumps({
+            'error': {'message': f"No cassette entry for {provider} request {key[:12]}", 'type': 'cassette_miss'},
+            'code': 'CassetteMiss',
+            'message': f"No cassette entry for {provider} request {key[:12]}"
+        }).encode('utf-8')
+
+    # ---------- 非 HTTP 调用（如讯飞 websocket） ----------
+
+    def call(self, provider, key_parts, fn):
+        """
+        对返回值可 JSON 序列化的函数调用做录制 / 回放
+
+        Returns:
+            fn() 的结果；replay 未命中时返回 None
+        """
+        mode = self.mode()
+        if mode == 'off':
+            return fn()
+        key = request_key(provider, 'CALL', f'/{provider}',
+                          json.dumps(key_parts, sort_keys=True, default=str).encode('utf-8'), 'application/json')
+        if mode in ('replay', 'auto'):
+            entry = self.lookup(key)
+            if entry is not None:
+                self.replay_delay(entry)
+                return json.loads(entry['response']['body'])
+            if mode == 'replay':
+                print(f"[CASSETTE] miss for {provider} call {key[:12]}")
+                return None
+        start = time.monotonic()
+        result = fn()
+        self.save(self.build_entry(
+            key, provider,
+            {'method': 'CALL', 'url': f'/{provider}', 'body': None},
+            {'status': 200, 'headers': {}, 'body': json.dumps(result, ensure_ascii=False).encode('utf-8')},
+            time.monotonic() - start
+        ))
+        return result
+
+    # ---------- HTTP 客户端适配 ----------
+
+    def httpx_transport(self, provider, inner):
+        """包装 httpx 传输层（OpenAI SDK 使用）"""
+        import httpx
+
+        cassette = self
+
+        class _CassetteTransport(httpx.BaseTransport):
+            def handle_request(self, request):
+                mode = cassette.mode()
+                if mode == 'off':
+                    return inner.handle_request(request)
+                body = request.read()
+                key = request_key(provider, request.method, str(request.url), body,
+                                  request.headers.get('content-type'))
+                if mode in ('replay', 'auto'):
+                    entry = cassette.lookup(key)
+                    if entry is not None:
+                        timeout = (request.extensions.get('timeout') or {}).get('read')
+                        if not cassette.replay_delay(entry, timeout):
+                            raise httpx.ReadTimeout('Replayed latency exceeded timeout', request=request)
+                        return httpx.Response(
+                            entry['response']['status'],
+                            headers=entry['response']['headers'],
+                            content=cassette.response_body(entry),
+                            request=request
+                        )
+                    if mode == 'replay':
+                        print(f"[CASSETTE] miss for {provider} {request.method} {request.url.path}")
+                        return httpx.Response(404, headers={'content-type': 'application/json'},
+                                              content=cassette.miss_body(provider, key), request=request)
+
+                start = time.monotonic()
+                response = inner.handle_request(request)
+                try:
+                    content = response.read()
+                finally:
+                    response.close()
+                latency = time.monotonic() - start
+                cassette.save(cassette.build_entry(
+                    key, provider,
+                    {'method': request.method, 'url': str(request.url), 'body': body},
+                    {'status': response.status_code, 'headers': dict(response.headers), 'body': content},
+                    latency
+                ))
+                # 已解码的内容重新包装，去掉 content-encoding 等头
+                return httpx.Response(
+                    response.status_code,
+                    headers={'content-type': response.headers.get('content-type', 'application/json')},
+                    content=content,
+                    request=request
+                )
+
+            def close(self):
+                inner.close()
+
+        return _CassetteTransport()
+
+    def requests_adapter(self, provider, **adapter_kwargs):
+        """带录制 / 回放的 requests HTTPAdapter（DashScope 原生 HTTP 接口使用）"""
+        import requests
+        from requests.adapters import HTTPAdapter
+        from requests.structures import CaseInsensitiveDict
+        from requests.utils import get_encoding_from_headers
+
+        cassette = self
+
+        class _CassetteAdapter(HTTPAdapter):
+            def _build(self, request, status, headers, content):
+                response = requests.Response()
+                response.status_code = status
+                response.headers = CaseInsensitiveDict(headers)
+                response.encoding = get_encoding_from_headers(response.headers)
+                response._content = content
+                response.url = request.url
+                response.request = request
+                return response
+
+            def send(self, request, timeout=None, **kwargs):
+                mode = cassette.mode()
+                if mode == 'off':
+                    return super().send(request, timeout=timeout, **kwargs)
+                body = request.body or b''
+                if isinstance(body, str):
+                    body = body.encode('utf-8')
+                key = request_key(provider, request.method, request.url, body,
+                                  request.headers.get('Content-Type'))
+                if mode in ('replay', 'auto'):
+                    entry = cassette.lookup(key)
+                    if entry is not None:
+                        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+                        if not cassette.replay_delay(entry, read_timeout):
+                            raise requests.exceptions.ReadTimeout('Replayed latency exceeded timeout')
+                        return self._build(request, entry['response']['status'],
+                                           entry['response']['headers'], cassette.response_body(entry))
+                    if mode == 'replay':
+                        print(f"[CASSETTE] miss for {provider} {request.method} {urlsplit(request.url).path}")
+                        return self._build(request, 404, {'content-type': 'application/json'},
+                                           cassette.miss_body(provider, key))
+
+                start = time.monotonic()
+                response = super().send(request, timeout=timeout, **kwargs)
+                content = response.content
+                cassette.save(cassette.build_entry(
+                    key, provider,
+                    {'method': request.method, 'url': request.url, 'body': body},
+                    {'status': response.status_code, 'headers': dict(response.headers), 'body': content},
+                    time.monotonic() - start
+                ))
+                return response
+
+        return _CassetteAdapter(**adapter_kwargs)
+
+
+# 创建单例实例
+cassette = Cassette()
@@ -0,0 +1,168 @@
+"""
+Chunking helpers for long documents - structural splitting, token estimates, concurrent map
+"""
+
+import contextvars
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# 标题、文件分隔符（=== name ===）、空行视为结构边界
+_BLOCK_BOUNDARY = re.compile(r'\n\s*\n|\n(?=#{1,6}\s)|\n(?====)')
+# 句末标点；英文句号后必须跟空白，避免切开 3.14 之类的小数
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[。！？!?；;])|(?<=\.)\s+')
+_CJK = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]')
+
+# 进程内所有 AI 分块调用共享的并发上限
+_ai_slots = threading.BoundedSemaphore(int(os.getenv('AI_MAX_CONCURRENCY', 8)))
+
+
+def content_token_budget():
+    """单次 prompt 中放入原文内容的 token 预算"""
+    return int(os.getenv('AI_CONTENT_TOKEN_BUDGET', 3000))
+
+
+def chunk_token_budget():
+    """map 阶段每个分块的 token 预算"""
+    return int(os.getenv('AI_CHUNK_TOKENS', 2500))
+
+
+def max_chunks():
+    return int(os.getenv('AI_MAX_CHUNKS', 24))
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中日韩字符约 1 token/字，其它约 4 字符/token"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _hard_split(text, max_tokens):
+    """没有任何边界可用时按 token 估算硬切"""
+    pieces = []
+    start = 0
+    cost = 0.0
+    for i, ch in enumerate(text):
+        ch_cost = 1.0 if _CJK.match(ch) else 0.25
+        if cost + ch_cost > max_tokens and i > start:
+            pieces.append(text[start:i])
+            start = i
+            cost = 0.0
+        cost += ch_cost
+    if start < len(text):
+        pieces.append(text[start:])
+    return pieces
+
+
+def _split_oversized(block, max_tokens):
+    """超长块：先按句子聚合，单句仍超长则硬切"""
+    pieces = []
+    current = ''
+    for sentence in _SENTENCE_BOUNDARY.split(block):
+        if not sentence:
+            continue
+        if estimate_tokens(sentence) > max_tokens:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.extend(_hard_split(sentence, max_tokens))
+            continue
+        candidate = f"{current} {sentence}" if current else sentence
+        if estimate_tokens(candidate) > max_tokens:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_text(text, max_tokens=None):
+    """
+    按结构边界（标题、文件分隔符、段落、句子）把长文本切成不超过 max_tokens 的块。
+    块数超过 AI_MAX_CHUNKS 时自动放大块大小，保证成本有上限。
+    """
+    if max_tokens is None:
+        max_tokens = chunk_token_budget()
+    total = estimate_tokens(text)
+    max_tokens = max(max_tokens, -(-total // max_chunks()))
+
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    def _flush():
+        nonlocal current, current_tokens
+        if current:
+            chunks.append('\n\n'.join(current))
+        current = []
+        current_tokens = 0
+
+    for block in _BLOCK_BOUNDARY.split(text):
+        block = block.strip()
+        if not block:
+            continue
+        tokens = estimate_tokens(block)
+        if tokens > max_tokens:
+            _flush()
+            chunks.extend(_split_oversized(block, max_tokens))
+            continue
+        if current_tokens + tokens > max_tokens:
+            _flush()
+        current.append(block)
+        current_tokens += tokens
+    _flush()
+    return chunks
+
+
+def map_concurrently(fn, items, max_workers=None):
+    """
+    并发地对每个元素调用 fn，结果按输入顺序返回。
+    所有调用共享进程级的 AI 并发上限（AI_MAX_CONCURRENCY）。
+    """
+    if not items:
+        return []
+    if max_workers is None:
+        max_workers = int(os.getenv('AI_CHUNK_CONCURRENCY', 4))
+
+    def _limited(item):
+        with _ai_slots:
+            return fn(item)
+
+    # 每个任务带上调用方的 contextvars 副本（请求截止时间等）
+    contexts = [contextvars.copy_context() for _ in items]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+        return list(pool.map(lambda ctx, item: ctx.run(_limited, item), contexts, items))
+
+
+def map_streaming(fn, items, max_workers=None):
+    """
+    map_concurrently 的惰性版本：items 可以是生成器，边取边提交，同时最多 max_workers 个元素在处理中，
+    结果按输入顺序逐个产出。适合元素本身很大（音频片段）、不能一次全部物化的场景。
+    """
+    if max_workers is None:
+        max_workers = int(os.getenv('AI_CHUNK_CONCURRENCY', 4))
+    max_workers = max(1, max_workers)
+
+    def _limited(item):
+        with _ai_slots:
+            return fn(item)
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        try:
+            for item in items:
+                pending.append(pool.submit(contextvars.copy_context().run, _limited, item))
+                del item  # 提交后不再持有，片段识别完即可释放
+                if len(pending) >= max_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
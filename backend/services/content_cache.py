@@ -0,0 +1,135 @@
+"""
+Content-hash result cache - OCR, document extraction and transcription results keyed by SHA-256 of the input bytes
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from .prompts import get_prompt
+
+HASH_BLOCK = 1024 * 1024
+
+# 每条流水线的版本号：提取 / 识别逻辑改变时加一，旧结果自然失效
+PIPELINE_VERSIONS = {
+    'note_pdf': 1,  # note_assistant_db.extract_text_with_ocr 的 PDF 文字提取
+    'map_pdf': 1,  # map_generation.extract_text_from_file 的 PDF 文字提取
+    'ocr_text': 1,  # AIService.ocr_image
+    'ocr_question': 1,  # AIService.ocr_and_parse_question（裁剪由 image_processing 决定）
+    'transcript': 1,  # 整个上传文件的转写（解码 + VAD + 切段 + 识别）
+    'speech': 1,  # AIService.speech_to_text 单个 PCM 片段
+}
+
+# 依赖提示词的流水线：提示词改动同样使缓存失效
+_PIPELINE_PROMPTS = {
+    'ocr_text': 'ocr_text',
+    'ocr_question': 'ocr_question',
+}
+
+
+def bytes_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path_or_stream):
+    """文件（路径或可 seek 的流）内容的 SHA-256；流读完后回到原位置"""
+    digest = hashlib.sha256()
+    if isinstance(path_or_stream, (str, bytes, os.PathLike)):
+        with open(path_or_stream, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    position = path_or_stream.tell()
+    for block in iter(lambda: path_or_stream.read(HASH_BLOCK), b''):
+        digest.update(block)
+    path_or_stream.seek(position)
+    return digest.hexdigest()
+
+
+def pipeline_version(kind):
+    version = str(PIPELINE_VERSIONS[kind])
+    prompt = _PIPELINE_PROMPTS.get(kind)
+    if prompt:
+        version += ':' + hashlib.sha256(get_prompt(prompt).static_text().encode('utf-8')).hexdigest()[:8]
+    return version
+
+
+class ContentCache:
+    """
+    以 (流水线, 版本, 输入内容 SHA-256, 影响结果的参数) 为 key，把提取出的文字或解析后的 JSON
+    存在 db_sqlite 的 content_cache 表里：跨请求、跨用户、跨 worker 共享。
+    总大小超过 CONTENT_CACHE_MAX_BYTES 时按最近使用时间淘汰。只缓存成功的结果。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evicted': 0, 'errors': 0}
+
+    @staticmethod
+    def enabled():
+        return os.getenv('CONTENT_CACHE_ENABLED', '1').lower() not in ('0', 'false', 'no')
+
+    @staticmethod
+    def key(kind, digest, *params):
+        raw = json.dumps([kind, pipeline_version(kind), digest, *params], ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _count(self, name, delta=1):
+        with self._lock:
+            self._stats[name] += delta
+
+    def get(self, kind, digest, *params):
+        """命中时返回缓存的值，否则返回 None"""
+        if not self.enabled():
+            return None
+        import db_sqlite
+        try:
+            value = db_sqlite.get_content_cache(self.key(kind, digest, *params))
+        except Exception as e:
+            # 缓存表不可用时直接走原流程
+            print(f"[CONTENT_CACHE] lookup failed: {e}")
+            self._count('errors')
+            return None
+        self._count('hits' if value is not None else 'misses')
+        return json.loads(value) if value is not None else None
+
+    def put(self, kind, digest, value, *params):
+        if not self.enabled():
+            return
+        import db_sqlite
+        try:
+            evicted = db_sqlite.put_content_cache(
+                self.key(kind, digest, *params), kind, json.dumps(value, ensure_ascii=False),
+                int(os.getenv('CONTENT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+            )
+        except Exception as e:
+            print(f"[CONTENT_CACHE] store failed: {e}")
+            self._count('errors')
+            return
+        self._count('stores')
+        self._count('evicted', evicted)
+
+    def get_or_compute(self, kind, digest, compute, *params, cacheable=lambda value: value is not None):
+        """先查缓存，未命中时调用 compute()，结果满足 cacheable 才写入"""
+        cached = self.get(kind, digest, *params)
+        if cached is not None:
+            return cached
+        value = compute()
+        if cacheable(value):
+            self.put(kind, digest, value, *params)
+        return value
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        try:
+            import db_sqlite
+            stats.update(db_sqlite.content_cache_usage())
+        except Exception:
+            pass
+        return stats
+
+
+# 创建单例实例
+content_cache = ContentCache()
@@ -0,0 +1,124 @@
+"""
+Conversation Store - server-side chat history with rolling summarization
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import db_sqlite
+
+from .chunking import estimate_tokens
+
+
+class ConversationStore:
+    """
+    按 (user_id, session_id) 持久化登录用户的对话（未登录用户共享 'default'，不落库）。
+    - 组装 prompt：滚动摘要 + 预算内最近的原文消息
+    - 后台压缩：未摘要部分超过阈值时，把较早的轮次合并进摘要，只保留最近几条原文
+    这样无论对话多长，请求体和 prompt 大小都基本恒定。
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='chat-compact')
+        self._compacting = set()
+        self._lock = threading.Lock()
+
+    def context_budget(self):
+        return int(os.getenv('AI_CHAT_CONTEXT_TOKENS', 3000))
+
+    def compact_threshold(self):
+        return int(os.getenv('AI_CHAT_COMPACT_TOKENS', 2000))
+
+    def keep_recent(self):
+        return int(os.getenv('AI_CHAT_KEEP_RECENT', 6))
+
+    def get_or_create(self, user_id, session_id):
+        return db_sqlite.get_or_create_conversation(user_id, session_id)
+
+    def seed_history(self, conversation, history):
+        """旧客户端首次同步：服务器端为空时导入客户端本地历史"""
+        if db_sqlite.list_chat_messages(conversation['id']):
+            return
+        messages = [
+            {'role': m.get('role'), 'content': str(m.get('content', ''))}
+            for m in history
+            if m.get('role') in ('user', 'assistant') and m.get('content')
+        ]
+        if messages:
+            db_sqlite.add_chat_messages(conversation['id'], messages)
+
+    def build_context(self, conversation):
+        """
+        Returns:
+            tuple: (recent_messages, summary) —— recent_messages 为预算内最近的未摘要消息
+        """
+        pending = db_sqlite.list_chat_messages(conversation['id'], conversation.get('summarized_until', 0))
+        return self._recent_within_budget(pending), conversation.get('summary') or ''
+
+    def context_from_history(self, history):
+        """未登录用户不落库：只用客户端带来的历史，按同样的预算截取最近的消息"""
+        messages = [
+            {'role': m.get('role'), 'content': str(m.get('content', ''))}
+            for m in history or []
+            if isinstance(m, dict) and m.get('role') in ('user', 'assistant') and m.get('content')
+        ]
+        return self._recent_within_budget(messages)
+
+    def _recent_within_budget(self, messages):
+        budget = self.context_budget()
+        recent = []
+        used = 0
+        for message in reversed(messages):
+            tokens = estimate_tokens(message['content'])
+            if recent and used + tokens > budget:
+                break
+            recent.append({'role': message['role'], 'content': message['content']})
+            used += tokens
+        recent.reverse()
+        return recent
+
+    def append_turn(self, conversation, user_message, ai_response):
+        db_sqlite.add_chat_messages(conversation['id'], [
+            {'role': 'user', 'content': user_message},
+            {'role': 'assistant', 'content': ai_response}
+        ])
+
+    def schedule_compaction(self, conversation_id):
+        """未摘要部分超过阈值时在后台压缩（同一对话同时只跑一个压缩任务）"""
+        with self._lock:
+            if conversation_id in self._compacting:
+                return
+            self._compacting.add(conversation_id)
+        self._executor.submit(self._compact, conversation_id)
+
+    def _compact(self, conversation_id):
+        from .ai_service import ai_service
+
+        try:
+            conversation = db_sqlite.get_conversation(conversation_id)
+            if not conversation:
+                return
+            pending = db_sqlite.list_chat_messages(conversation_id, conversation['summarized_until'])
+            if sum(estimate_tokens(m['content']) for m in pending) <= self.compact_threshold():
+                return
+            to_fold = pending[:-self.keep_recent()] if self.keep_recent() else pending
+            if not to_fold:
+                return
+            summary = ai_service.summarize_conversation(conversation['summary'], to_fold)
+            db_sqlite.update_conversation_summary(conversation_id, summary, to_fold[-1]['id'])
+            print(f"[CHAT] conversation {conversation_id}: folded {len(to_fold)} messages into summary")
+        except Exception as e:
+            # 压缩失败不影响对话，下一轮再试
+            print(f"[CHAT] compaction failed for conversation {conversation_id}: {e}")
+        finally:
+            with self._lock:
+                self._compacting.discard(conversation_id)
+
+    def clear(self, user_id, session_id):
+        """只清除指定会话"""
+        return db_sqlite.delete_conversation(user_id, session_id)
+
+
+# 创建单例实例
+conversation_store = ConversationStore()
@@ -0,0 +1,387 @@
+"""
+Local extractive engine - TF-IDF / TextRank keyphrases and key sentences for degraded mode (no network)
+"""
+
+import math
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+_CJK_RUN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]+')
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9\-']*|[0-9]+(?:\.[0-9]+)?")
+_TOKEN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+|[A-Za-z][A-Za-z0-9\-']*|[0-9]+(?:\.[0-9]+)?")
+# 短语切分时标点也要作为边界
+_PHRASE_TOKEN = re.compile(_TOKEN.pattern + r"|\S")
+# 句末标点；英文句号后必须跟空白，避免切开小数
+_SENTENCE_END = re.compile(r'(?<=[。！？!?；;])|(?<=\.)\s+|\n+')
+_EXAMPLE_MARKERS = re.compile(r'例如|比如|例题|举例|譬如|for example|for instance|e\.g\.|such as|example', re.I)
+
+_EN_STOPWORDS = set("""
+a about above after again against all also am an and any are as at be because been before being below between
+both but by can could did do does doing down during each few for from further had has have having he her here
+hers him his how i if in into is it its itself just let me more most my no nor not now of off on once only or
+other our ours out over own same she should so some such than that the their theirs them then there these they
+this those through to too under until up very was we were what when where which while who whom why will with
+would you your yours one two first second also however therefore thus may might must shall used using use
+like well get gets got make makes made many much every within without via etc take takes taken place include
+includes including become becomes became another mostly called known
+""".split())
+
+# 中文没有分词器时，用虚词 / 停用字把汉字串切成候选短语
+_ZH_STOPWORDS = sorted("""
+我们 你们 他们 它们 这个 那个 这些 那些 一个 一种 以及 并且 而且 或者 因为 所以 如果 但是 然后 就是 也是 还是 可以 需要
+通过 进行 其中 什么 怎么 如何 为了 对于 关于 已经 不是 没有 这样 那样 比如 例如 这里 那里 之后 之前 时候 同时 之间 等等
+的 了 是 在 和 与 及 或 也 都 就 而 被 把 将 从 向 于 由 吗 呢 吧 啊 着 这 那
+""".split(), key=len, reverse=True)
+_ZH_SPLIT = re.compile('|'.join(re.escape(w) for w in _ZH_STOPWORDS))
+
+_GENERIC_BRANCHES = ['Definition', 'Key Concepts', 'Methods', 'Examples', 'Applications', 'Common Mistakes']
+
+
+def _max_sentences():
+    return int(os.getenv('EXTRACTIVE_MAX_SENTENCES', 400))
+
+
+def _max_terms():
+    return int(os.getenv('EXTRACTIVE_MAX_TERMS', 1500))
+
+
+def _max_outline_phrases():
+    """导图只从得分最高的这些短语里取节点，避免低分碎片成为叶子"""
+    return int(os.getenv('EXTRACTIVE_OUTLINE_PHRASES', 60))
+
+
+def split_sentences(text):
+    """按中英文句末标点和换行切句，去掉过短的碎片"""
+    sentences = []
+    for part in _SENTENCE_END.split(text or ''):
+        part = part.strip(' \t-*#>=|')
+        if len(_TOKEN.findall(part)) and len(part) >= 4:
+            sentences.append(part)
+    return sentences
+
+
+def _normalize(sentence):
+    """去重用的句子键：忽略大小写、空白和标点"""
+    return ''.join(_TOKEN.findall(sentence.lower()))
+
+
+def _terms(sentence):
+    """句子的词项：英文单词（去停用词）+ 汉字二元组"""
+    terms = []
+    for token in _TOKEN.findall(sentence):
+        if _CJK_RUN.fullmatch(token):
+            if len(token) == 1:
+                terms.append(token)
+            else:
+                terms.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            word = token.lower()
+            if word not in _EN_STOPWORDS and len(word) > 1 and not word[0].isdigit():
+                terms.append(word)
+    return terms
+
+
+def _phrases(sentence, repeated_ngrams):
+    """
+    候选关键短语 [(key, 原文写法)]：英文为标点 / 停用词之间连续的 1-3 个词，
+    中文为停用字之间的汉字串
+    """
+    phrases = []
+    run = []
+
+    def flush():
+        for n in range(min(3, len(run)), 0, -1):
+            for i in range(len(run) - n + 1):
+                words = run[i:i + n]
+                phrases.append((' '.join(words).lower(), ' '.join(words)))
+        run.clear()
+
+    for token in _PHRASE_TOKEN.findall(sentence):
+        if _CJK_RUN.fullmatch(token):
+            flush()
+            for segment in _ZH_SPLIT.split(token):
+                if 2 <= len(segment) <= 6:
+                    phrases.append((segment, segment))
+                elif len(segment) > 6:
+                    # 长汉字串里出现过多次的 2-6 字片段大概率是术语（repeated_ngrams 已对齐到词边界）
+                    phrases.extend(
+                        (segment[i:i + n], segment[i:i + n])
+                        for n in range(6, 1, -1) for i in range(len(segment) - n + 1)
+                        if segment[i:i + n] in repeated_ngrams
+                    )
+        elif _WORD.fullmatch(token) and token.lower() not in _EN_STOPWORDS \
+                and not token[0].isdigit() and len(token) > 1:
+            run.append(token)
+        else:
+            flush()
+    flush()
+    return phrases
+
+
+def _repeated_ngrams(text, longest=6):
+    """
+    出现 2 次以上、且对齐到词边界的 2-6 字汉字片段。
+    片段每次出现都被同一个更长的片段包含（次数相同）时，说明它的边界落在词中间
+    （如“二次项系数”里的“二次项系”“次项系数”），只保留更长的那个。
+    """
+    runs = _CJK_RUN.findall(text or '')
+    counts = Counter(run[i:i + n] for run in runs for n in range(2, longest + 1) for i in range(len(run) - n + 1))
+    inner = set()
+    for gram, count in counts.items():
+        if len(gram) > 2:
+            for part in (gram[:-1], gram[1:]):
+                if counts[part] == count:
+                    inner.add(part)
+    return {gram for gram, count in counts.items() if count >= 2 and gram not in inner}
+
+
+def _overlap(a, b):
+    """两个短语首尾重叠的长度（中文按字，英文按词），取两个方向中较大的"""
+    a_units = a.split() if ' ' in a or ' ' in b else list(a)
+    b_units = b.split() if ' ' in a or ' ' in b else list(b)
+    best = 0
+    for first, second in ((a_units, b_units), (b_units, a_units)):
+        for size in range(min(len(first), len(second)) - 1, best, -1):
+            if first[-size:] == second[:size]:
+                best = size
+                break
+    return best, min(len(a_units), len(b_units))
+
+
+def _phrase_terms(phrase):
+    return _terms(phrase) or [phrase]
+
+
+def _textrank(matrix, damping=0.85, iterations=50, tol=1e-6):
+    """在对称权重矩阵上做 PageRank 迭代"""
+    n = matrix.shape[0]
+    if n == 0:
+        return np.zeros(0)
+    out = matrix.sum(axis=1)
+    out[out == 0] = 1.0
+    transition = matrix / out[:, None]
+    scores = np.full(n, 1.0 / n)
+    for _ in range(iterations):
+        updated = (1 - damping) / n + damping * transition.T.dot(scores)
+        if np.abs(updated - scores).sum() < tol:
+            return updated
+        scores = updated
+    return scores
+
+
+class ExtractiveEngine:
+    """纯 CPU 的抽取式摘要：句子 TF-IDF 向量上的 TextRank 选关键句，词共现图上的 TextRank 选关键短语"""
+
+    def analyze(self, text):
+        """返回 {'sentences', 'sentence_scores', 'phrases': [(phrase, score)], 'phrase_sentences'}"""
+        sentences = split_sentences(text)[:_max_sentences()]
+        empty = {'sentences': sentences, 'sentence_scores': np.zeros(len(sentences)),
+                 'phrases': [], 'phrase_sentences': {}, 'labels': {}}
+        if not sentences:
+            return empty
+
+        sentence_terms = [_terms(s) for s in sentences]
+        frequency = Counter(t for terms in sentence_terms for t in terms)
+        vocabulary = {t: i for i, (t, _) in enumerate(frequency.most_common(_max_terms()))}
+        if not vocabulary:
+            return empty
+
+        # TF-IDF，把每个句子当作一篇文档
+        tf = np.zeros((len(sentences), len(vocabulary)))
+        for row, terms in enumerate(sentence_terms):
+            for term in terms:
+                if term in vocabulary:
+                    tf[row, vocabulary[term]] += 1
+        df = (tf > 0).sum(axis=0)
+        idf = np.log((1 + len(sentences)) / (1 + df)) + 1
+        tfidf = tf * idf
+        norms = np.linalg.norm(tfidf, axis=1)
+        norms[norms == 0] = 1.0
+        unit = tfidf / norms[:, None]
+
+        similarity = unit.dot(unit.T)
+        np.fill_diagonal(similarity, 0)
+        sentence_scores = _textrank(similarity) if len(sentences) > 1 else np.ones(1)
+
+        # 词共现图（同句内窗口 3）
+        cooccurrence = np.zeros((len(vocabulary), len(vocabulary)))
+        for terms in sentence_terms:
+            ids = [vocabulary[t] for t in terms if t in vocabulary]
+            for i, a in enumerate(ids):
+                for b in ids[i + 1:i + 3]:
+                    if a != b:
+                        cooccurrence[a, b] += 1
+                        cooccurrence[b, a] += 1
+        term_rank = _textrank(cooccurrence)
+        term_weight = term_rank / (term_rank.max() or 1.0) + tfidf.sum(axis=0) / (tfidf.sum(axis=0).max() or 1.0)
+
+        repeated = _repeated_ngrams(text)
+
+        phrase_sentences = {}
+        labels = {}
+        for row, sentence in enumerate(sentences):
+            for phrase, surface in _phrases(sentence, repeated):
+                phrase_sentences.setdefault(phrase, set()).add(row)
+                labels.setdefault(phrase, surface)
+
+        scored = []
+        for phrase, rows in phrase_sentences.items():
+            ids = [vocabulary[t] for t in _phrase_terms(phrase) if t in vocabulary]
+            if not ids:
+                continue
+            # 词权重之和按长度开方归一（偏向完整术语而非其片段）× 出现次数的对数加成
+            score = float(term_weight[ids].sum()) / math.sqrt(len(ids)) * (1 + math.log(len(rows)))
+            scored.append((phrase, score))
+        scored.sort(key=lambda item: -item[1])
+
+        return {'sentences': sentences, 'sentence_scores': sentence_scores,
+                'phrases': self._dedupe(scored), 'phrase_sentences': phrase_sentences, 'labels': labels}
+
+    @staticmethod
+    def _dedupe(scored):
+        """去掉与更高分短语互相包含、或首尾重叠超过较短者一半的候选（“二次项系”与“次项系数”）"""
+        kept = []
+        for phrase, score in scored:
+            if any(phrase in other or other in phrase for other, _ in kept):
+                continue
+            if any(2 * shared > shorter for shared, shorter in (_overlap(phrase, other) for other, _ in kept)):
+                continue
+            kept.append((phrase, score))
+        return kept
+
+    def key_sentences(self, text, limit=3, analysis=None):
+        """得分最高的若干句（重复的句子只取一次），按原文顺序返回"""
+        analysis = analysis or self.analyze(text)
+        sentences = analysis['sentences']
+        top = []
+        seen = set()
+        for i in np.argsort(-analysis['sentence_scores'], kind='stable'):
+            key = _normalize(sentences[i])
+            if key in seen:
+                continue
+            seen.add(key)
+            top.append(i)
+            if len(top) >= limit:
+                break
+        return [sentences[i] for i in sorted(top)]
+
+    def keyphrases(self, text, limit=10, analysis=None):
+        analysis = analysis or self.analyze(text)
+        return [analysis['labels'][phrase] for phrase, _ in analysis['phrases'][:limit]]
+
+    def outline(self, text, depth=3, branches=5, children=3, exclude=()):
+        """
+        关键短语层级：第一层为得分最高的短语，
+        子节点为与父节点同句出现、尚未使用的短语（按得分）
+        返回 [(label, [(label, [...]), ...]), ...]
+        """
+        analysis = self.analyze(text)
+        excluded = {e.lower() for e in exclude}
+        phrases = [item for item in analysis['phrases'][:_max_outline_phrases()] if item[0] not in excluded]
+        rank = {phrase: i for i, (phrase, _) in enumerate(phrases)}
+        located = analysis['phrase_sentences']
+        labels = analysis['labels']
+        used = set()
+
+        def related(parent):
+            rows = located.get(parent, set())
+            candidates = [p for p, _ in phrases
+                          if p not in used and located.get(p, set()) & rows
+                          and parent not in p and p not in parent]
+            return sorted(candidates, key=rank.get)[:children]
+
+        def build(parent, level):
+            if level >= depth:
+                return []
+            nodes = []
+            for phrase in related(parent):
+                used.add(phrase)
+                nodes.append(phrase)
+            return [(labels[phrase], build(phrase, level + 1)) for phrase in nodes]
+
+        roots = [p for p, _ in phrases[:branches]]
+        used.update(roots)
+        return [(labels[root], build(root, 2)) for root in roots]
+
+    def note(self, text, subject='General'):
+        """生成与 generate_note_from_text 相同结构的笔记"""
+        analysis = self.analyze(text)
+        key_points = self.key_sentences(text, limit=5, analysis=analysis)
+        summary_sentences = self.key_sentences(text, limit=2, analysis=analysis)
+        phrases = self.keyphrases(text, limit=5, analysis=analysis)
+        sentences = analysis['sentences']
+        examples = {}
+        for sentence in sentences:
+            if _EXAMPLE_MARKERS.search(sentence):
+                examples.setdefault(_normalize(sentence), sentence)
+        examples = list(examples.values())[:3]
+
+        if phrases:
+            title = ' · '.join(phrases[:2])
+        elif sentences:
+            title = sentences[0][:15] + ("..." if len(sentences[0]) > 15 else "")
+        else:
+            title = "Note"
+        summary = ' '.join(summary_sentences) or text[:100]
+
+        detailed = []
+        if phrases:
+            detailed.append('## Key Terms\n' + ', '.join(f'**{p}**' for p in phrases))
+        if key_points:
+            detailed.append('## Key Points\n' + '\n'.join(f'- {s}' for s in key_points))
+        if examples:
+            detailed.append('## Examples\n' + '\n'.join(f'- {s}' for s in examples))
+        detailed.append('## Original Text\n' + text)
+
+        tags = [subject] if subject and subject != 'General' else []
+        return {
+            'title': title,
+            'summary': summary,
+            'key_points': key_points,
+            'examples': examples,
+            'detailed_notes': '\n\n'.join(detailed),
+            'tags': tags + (phrases[:3] or ['study note'])
+        }
+
+    def mindmap(self, topic, text='', depth=3, style='TD'):
+        """把关键短语层级渲染成 Mermaid；文本不足时用按主题命名的通用结构"""
+        try:
+            depth = max(2, min(int(depth), 5))
+        except (TypeError, ValueError):
+            depth = 3
+        tree = self.outline(text, depth=depth, exclude=[topic]) if text else []
+        if len(tree) < 2:
+            tree = [(f'{topic} {branch}'.strip(), []) for branch in _GENERIC_BRANCHES]
+
+        if style == 'radial':
+            lines = ['mindmap', f'  root(({topic}))']
+
+            def emit(nodes, indent):
+                for i, (label, kids) in enumerate(nodes):
+                    if indent == 4:
+                        label = f'({label})' if i % 2 == 0 else f'[{label}]'
+                    lines.append(' ' * indent + label)
+                    emit(kids, indent + 2)
+
+            emit(tree, 4)
+            return '\n'.join(lines)
+
+        lines = [f"graph {'LR' if style == 'LR' else 'TD'}", f'    ROOT[{topic}]']
+        counter = [0]
+
+        def emit_graph(parent, nodes):
+            for label, kids in nodes:
+                counter[0] += 1
+                node_id = f'N{counter[0]}'
+                lines.append(f'    {parent} --> {node_id}[{label}]')
+                emit_graph(node_id, kids)
+
+        emit_graph('ROOT', tree)
+        return '\n'.join(lines)
+
+
+# 创建单例实例
+extractive_engine = ExtractiveEngine()
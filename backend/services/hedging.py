@@ -0,0 +1,270 @@
+"""
+Hedged requests across an ordered list of OpenAI-compatible text providers
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from types import SimpleNamespace
+
+from .chunking import estimate_tokens
+
+
+class HedgeCancelled(Exception):
+    """对冲失败的一方被取消（partial 为取消前已生成的内容）"""
+
+    def __init__(self, partial=''):
+        super().__init__('Hedged request cancelled')
+        self.partial = partial
+
+
+def text_providers():
+    """文本生成 provider 顺序列表，第一个为主 provider"""
+    names = [p.strip() for p in os.getenv('AI_TEXT_PROVIDERS', 'deepseek').split(',') if p.strip()]
+    return names or ['deepseek']
+
+
+def hedged_methods():
+    return {m.strip() for m in os.getenv('AI_HEDGE_METHODS', 'note,chat').split(',') if m.strip()}
+
+
+class LatencyTracker:
+    """每个 (provider, method) 最近成功调用的耗时窗口"""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def count(self):
+        with self._lock:
+            return len(self._samples)
+
+    def quantile(self, q):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def stream_completion(client, kwargs, cancel, timeout):
+    """
+    以流式方式调用 chat completion 并组装成普通响应对象；
+    每个 chunk 之间检查取消标志，取消时关闭连接（provider 随之停止生成）
+    """
+    if cancel.is_set():
+        raise HedgeCancelled()
+    stream = client.chat.completions.create(stream=True, timeout=timeout, **kwargs)
+    parts = []
+    finish_reason = None
+    usage = None
+    try:
+        for chunk in stream:
+            if cancel.is_set():
+                raise HedgeCancelled(''.join(parts))
+            if getattr(chunk, 'usage', None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            if choice.delta and choice.delta.content:
+                parts.append(choice.delta.content)
+            finish_reason = choice.finish_reason or finish_reason
+    finally:
+        stream.close()
+
+    return SimpleNamespace(
+        choices=[SimpleNamespace(
+            index=0,
+            finish_reason=finish_reason,
+            message=SimpleNamespace(role='assistant', content=''.join(parts))
+        )],
+        usage=usage
+    )
+
+
+class Hedger:
+    """
+    对冲请求：主 provider 在自适应延迟（该 method 最近耗时的 p90）内没有返回时，
+    向下一个 provider 发送同样的请求，先返回有效结果的一方胜出，另一方在下一个 chunk 时被取消。
+    主 provider 直接失败时立即切换到下一个（故障转移，不计入对冲）。
+
+    额外开销有上限：令牌桶每次调用累积 AI_HEDGE_BUDGET 个令牌，每次对冲消耗 1 个，
+    因此长期对冲率不超过 AI_HEDGE_BUDGET。
+    """
+
+    def __init__(self):
+        self._trackers = {}
+        self._stats = {}
+        self._budget = 0.0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    # ---------- 配置 ----------
+
+    def _quantile(self):
+        return float(os.getenv('AI_HEDGE_QUANTILE', 0.9))
+
+    def _min_samples(self):
+        return int(os.getenv('AI_HEDGE_MIN_SAMPLES', 20))
+
+    def _default_delay(self):
+        return float(os.getenv('AI_HEDGE_DEFAULT_DELAY', 3.0))
+
+    def _budget_rate(self):
+        return float(os.getenv('AI_HEDGE_BUDGET', 0.1))
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv('AI_HEDGE_WORKERS', 16)), thread_name_prefix='ai-hedge'
+                )
+            return self._executor
+
+    # ---------- 统计 ----------
+
+    def _tracker(self, provider, method):
+        with self._lock:
+            return self._trackers.setdefault((provider, method), LatencyTracker())
+
+    def _bump(self, provider, **fields):
+        with self._lock:
+            stats = self._stats.setdefault(provider, {
+                'requests': 0, 'wins': 0, 'failures': 0, 'cancelled': 0,
+                'hedges_sent': 0, 'failovers': 0, 'wasted_tokens': 0
+            })
+            for field, value in fields.items():
+                stats[field] += value
+
+    def hedge_delay(self, provider, method):
+        """主 provider 的自适应对冲延迟；样本不足时用默认值"""
+        tracker = self._tracker(provider, method)
+        if tracker.count() < self._min_samples():
+            return self._default_delay()
+        return tracker.quantile(self._quantile())
+
+    def _take_budget(self):
+        with self._lock:
+            if self._budget >= 1.0:
+                self._budget -= 1.0
+                return True
+            return False
+
+    def _add_budget(self):
+        with self._lock:
+            # 上限避免长时间空闲后突发大量对冲
+            self._budget = min(self._budget + self._budget_rate(), 10.0)
+
+    def stats(self):
+        with self._lock:
+            providers = {name: dict(s) for name, s in self._stats.items()}
+            calls = sum(s['wins'] for s in providers.values())
+            hedges = sum(s['hedges_sent'] for s in providers.values())
+            return {
+                'providers': providers,
+                'hedge_rate': round(hedges / calls, 4) if calls else 0.0,
+                'budget_tokens': round(self._budget, 2),
+                'delays': {
+                    f'{p}:{m}': round(t.quantile(self._quantile()) or 0.0, 3)
+                    for (p, m), t in self._trackers.items()
+                }
+            }
+
+    # ---------- 调用 ----------
+
+    def run(self, method, providers, attempt, hedge=True, prompt_tokens=0):
+        """
+        Args:
+            method: 调用类别（用于分别统计耗时）
+            providers: provider 顺序列表
+            attempt: attempt(provider, cancel_event) -> response
+            hedge: False 时只做故障转移
+            prompt_tokens: 估算的输入 token 数（用于统计被取消方的开销）
+
+        Returns:
+            胜出的 response
+        """
+        self._add_budget()
+        pool = self._pool()
+        cancels = {}
+        futures = {}
+        started = {}
+        pending_providers = list(providers)
+        last_error = None
+
+        def _launch(provider):
+            cancel = threading.Event()
+            cancels[provider] = cancel
+            started[provider] = time.monotonic()
+            self._bump(provider, requests=1)
+            futures[pool.submit(attempt, provider, cancel)] = provider
+
+        primary = pending_providers.pop(0)
+        _launch(primary)
+        hedge_at = time.monotonic() + self.hedge_delay(primary, method) if hedge else None
+
+        try:
+            while futures:
+                timeout = None
+                if hedge_at is not None and pending_providers:
+                    timeout = max(0.0, hedge_at - time.monotonic())
+                done, _ = wait(list(futures), timeout=timeout, return_when=FIRST_COMPLETED)
+
+                if not done:
+                    # 到达对冲时间仍未返回
+                    hedge_at = None
+                    if self._take_budget():
+                        provider = pending_providers.pop(0)
+                        self._bump(provider, hedges_sent=1)
+                        _launch(provider)
+                    continue
+
+                for future in done:
+                    provider = futures.pop(future)
+                    try:
+                        response = future.result()
+                    except Exception as e:
+                        last_error = e
+                        self._bump(provider, failures=1)
+                        continue
+                    self._tracker(provider, method).record(time.monotonic() - started[provider])
+                    self._bump(provider, wins=1)
+                    return response
+
+                if not futures and pending_providers:
+                    # 所有在途请求都失败：立即故障转移到下一个
+                    provider = pending_providers.pop(0)
+                    self._bump(provider, failovers=1)
+                    _launch(provider)
+            raise last_error
+        finally:
+            for future, provider in futures.items():
+                cancels[provider].set()
+                self._bump(provider, cancelled=1)
+                future.add_done_callback(lambda f, p=provider: self._count_waste(p, f, prompt_tokens))
+
+    def _count_waste(self, provider, future, prompt_tokens):
+        """被取消方的估算开销（输入 + 已生成部分），用于控制额外花费"""
+        error = future.exception()
+        if error is None:
+            response = future.result()
+            usage = getattr(response, 'usage', None)
+            tokens = getattr(usage, 'total_tokens', None) or prompt_tokens + estimate_tokens(
+                response.choices[0].message.content
+            )
+        elif isinstance(error, HedgeCancelled):
+            tokens = prompt_tokens + estimate_tokens(error.partial)
+        else:
+            tokens = prompt_tokens
+        self._bump(provider, wasted_tokens=tokens)
+
+
+# 创建单例实例
+hedger = Hedger()
@@ -0,0 +1,393 @@
+"""
+Tolerant JSON extraction, repair and schema validation for model outputs
+"""
+
+import json
+import re
+import threading
+
+_FENCE = re.compile(r'```[a-zA-Z]*\s*\n?(.*?)(?:```|$)', re.DOTALL)
+_HEX4 = re.compile(r'[0-9a-fA-F]{4}')
+
+# 以 JSON 合法转义字母开头的常见 LaTeX 命令（\frac 里的 \f、\times 里的 \t 等），这些需要双写反斜杠
+_LATEX_COMMANDS = {
+    'b': {'bar', 'beta', 'begin', 'binom', 'bf', 'boldsymbol', 'bot', 'bullet', 'big', 'Big', 'bigg',
+          'bmod', 'boxed', 'because', 'backslash'},
+    'f': {'frac', 'forall', 'flat', 'frown'},
+    'n': {'neq', 'ne', 'nabla', 'nu', 'not', 'ni', 'neg', 'newline', 'nleq', 'ngeq', 'nmid', 'notin',
+          'nearrow', 'nexists'},
+    'r': {'rho', 'right', 'rightarrow', 'Rightarrow', 'rangle', 'rfloor', 'rceil', 'rm', 'rVert', 'rvert'},
+    't': {'times', 'theta', 'tau', 'tan', 'tanh', 'text', 'textbf', 'textit', 'tfrac', 'to', 'top',
+          'triangle', 'therefore', 'tilde', 'textrm', 'textstyle'},
+}
+
+_MISSING = object()
+
+
+class JSONParseError(ValueError):
+    """模型输出无法修复成符合 schema 的 JSON"""
+
+    def __init__(self, message, raw=''):
+        super().__init__(message)
+        self.raw = raw
+
+
+# 各调用的输出 schema：type 为 object / array；required / optional 为 {字段: 类型}
+SCHEMAS = {
+    'judge': {
+        'type': 'object',
+        'required': {'is_correct': bool},
+        'optional': {'reason': str}
+    },
+    'judge_batch': {
+        'type': 'array',
+        'items': {'type': 'object', 'required': {'index': int, 'is_correct': bool}, 'optional': {'reason': str}}
+    },
+    'similar': {
+        'type': 'array',
+        'items': {
+            'type': 'object',
+            'required': {'question_text': str},
+            'optional': {'subject': str, 'type': str, 'tags': list, 'analysis_steps': list, 'correct_answer': str}
+        }
+    },
+    'ocr_question': {
+        'type': 'array',
+        'items': {
+            'type': 'object',
+            'required': {'question_text': str},
+            'optional': {
+                'subject': str, 'type': str, 'tags': list, 'difficulty': str, 'analysis_steps': list,
+                'correct_answer': str, 'user_answer': str, 'crop_index': list
+            }
+        }
+    },
+    'vision_judge': {
+        'type': 'object',
+        'required': {'is_correct': bool},
+        'optional': {'user_answer': str}
+    },
+    'vision_judge_batch': {
+        'type': 'array',
+        'items': {'type': 'object', 'required': {'index': int, 'is_correct': bool}, 'optional': {'user_answer': str}}
+    },
+    'note': {
+        'type': 'object',
+        'required': {},
+        'optional': {
+            'title': str, 'summary': str, 'key_points': list, 'examples': list, 'detailed_notes': str, 'tags': list
+        }
+    },
+}
+
+
+# ---------- 提取 ----------
+
+def _strip_fences(text):
+    """取第一个 ``` 代码块的内容（允许缺少结尾的 ```）；没有代码块时原样返回"""
+    match = _FENCE.search(text)
+    if match and ('{' in match.group(1) or '[' in match.group(1)):
+        return match.group(1)
+    return text
+
+
+def _start_index(text, expect):
+    openers = {'object': '{', 'array': '['}.get(expect, '{[')
+    positions = [text.find(c) for c in openers if text.find(c) != -1]
+    return min(positions) if positions else -1
+
+
+# ---------- 修复 ----------
+
+def _repair(text):
+    """
+    逐字符修复（只处理字符串内部和结构上的问题）：
+    - LaTeX 单反斜杠（\\frac、\\alpha、\\( 等）双写；已经双写的和合法转义（\\n、\\"、\\uXXXX）保留
+    - 字符串中的裸换行 / 制表符转义
+    - 去掉 ] 和 } 前多余的逗号
+    """
+    out = []
+    in_string = False
+    i = 0
+    length = len(text)
+    while i < length:
+        c = text[i]
+        if in_string:
+            if c == '\\':
+                nxt = text[i + 1] if i + 1 < length else ''
+                if nxt in ('"', '\\', '/'):
+                    out.append(c + nxt)
+                    i += 2
+                    continue
+                if nxt == 'u' and _HEX4.match(text, i + 2):
+                    out.append(text[i:i + 6])
+                    i += 6
+                    continue
+                if nxt in _LATEX_COMMANDS:
+                    word = re.match(r'[A-Za-z]+', text[i + 1:]).group(0)
+                    if len(word) == 1 or word not in _LATEX_COMMANDS[nxt]:
+                        out.append(c + nxt)  # 真正的 \n \t 等转义
+                        i += 2
+                        continue
+                out.append('\\\\')  # LaTeX 或非法转义：双写
+                i += 1
+                continue
+            if c == '"':
+                in_string = False
+            elif c == '\n':
+                c = '\\n'
+            elif c == '\t':
+                c = '\\t'
+            elif c == '\r':
+                c = '\\r'
+            out.append(c)
+            i += 1
+            continue
+        if c == '"':
+            in_string = True
+        elif c in ']}':
+            # 去掉多余的尾逗号
+            j = len(out) - 1
+            while j >= 0 and out[j].isspace():
+                j -= 1
+            if j >= 0 and out[j] == ',':
+                del out[j]
+        out.append(c)
+        i += 1
+    return ''.join(out)
+
+
+def _salvage(text):
+    """
+    截断输出的抢救：保留最外层容器中所有完整的元素（数组元素 / 对象键值对），补齐括号
+
+    Returns:
+        str 或 None（没有可保留的完整元素）
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    last_complete = None
+    for i, c in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == '\\':
+                escaped = True
+            elif c == '"':
+                in_string = False
+                if len(stack) == 1 and stack[0] == '[':
+                    last_complete = i + 1
+            continue
+        if c == '"':
+            in_string = True
+        elif c in '[{':
+            stack.append(c)
+        elif c in ']}':
+            if not stack:
+                break
+            stack.pop()
+            if not stack:
+                return text[:i + 1]
+            if len(stack) == 1:
+                last_complete = i + 1
+        elif c == ',' and len(stack) == 1:
+            # 顶层的逗号：前面的元素（含标量值）已经完整
+            last_complete = i
+    if not stack or last_complete is None:
+        return None
+    body = text[:last_complete].rstrip().rstrip(',')
+    if stack[0] == '{' and body.rstrip().endswith(':'):
+        return None
+    return body + (']' if stack[0] == '[' else '}')
+
+
+# ---------- 校验 ----------
+
+def _coerce(value, expected):
+    """把模型常见的类型偏差转成期望类型；无法转换时返回 _MISSING"""
+    if expected is bool:
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, (int, float)) and value in (0, 1):
+            return bool(value)
+        if isinstance(value, str):
+            lowered = value.strip().lower()
+            if lowered in ('true', 'yes', '1', '正确', '对', '是'):
+                return True
+            if lowered in ('false', 'no', '0', '错误', '错', '否'):
+                return False
+        return _MISSING
+    if expected is int:
+        if isinstance(value, bool):
+            return _MISSING
+        if isinstance(value, int):
+            return value
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, str) and value.strip().isdigit():
+            return int(value.strip())
+        return _MISSING
+    if expected is str:
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        return _MISSING
+    if expected is list:
+        if isinstance(value, list):
+            return value
+        if isinstance(value, str):
+            return [value] if value.strip() else []
+        return _MISSING
+    return value
+
+
+def _validate_object(data, schema):
+    if not isinstance(data, dict):
+        return None
+    result = dict(data)
+    for field, expected in schema.get('required', {}).items():
+        value = _coerce(data.get(field, _MISSING), expected) if field in data else _MISSING
+        if value is _MISSING:
+            return None
+        result[field] = value
+    for field, expected in schema.get('optional', {}).items():
+        if field in data and data[field] is not None:
+            value = _coerce(data[field], expected)
+            if value is _MISSING:
+                result.pop(field)
+            else:
+                result[field] = value
+    return result
+
+
+def validate(data, schema):
+    """
+    按 schema 校验并规整类型
+
+    Returns:
+        (data, dropped): 数组中不合格的元素会被丢弃并计数
+    Raises:
+        JSONParseError: 顶层类型不对、必需字段缺失或数组中没有合格元素
+    """
+    if schema['type'] == 'object':
+        # 模型有时把单个对象包在数组里
+        if isinstance(data, list) and len(data) == 1:
+            data = data[0]
+        validated = _validate_object(data, schema)
+        if validated is None:
+            raise JSONParseError('JSON object does not match schema')
+        return validated, 0
+
+    if isinstance(data, dict):
+        # 模型有时把数组包在对象里（如 response_format=json_object 时的 {"questions": [...]}）
+        lists = [v for v in data.values() if isinstance(v, list)]
+        data = lists[0] if len(lists) == 1 else [data]
+    if not isinstance(data, list):
+        raise JSONParseError('Expected a JSON array')
+    item_schema = schema.get('items')
+    if not item_schema:
+        return data, 0
+    items = [_validate_object(item, item_schema) for item in data]
+    valid = [item for item in items if item is not None]
+    if data and not valid:
+        raise JSONParseError('No array element matches schema')
+    return valid, len(items) - len(valid)
+
+
+class ModelJSONParser:
+    """
+    模型输出的 JSON 解析：去掉 Markdown 代码块和前后说明文字 → 严格解析 → 修复转义 / 尾逗号 →
+    截断抢救（保留完整的数组元素）→ 按调用的 schema 校验。
+    按调用类别统计结果，failed 即需要重新请求模型的次数，repaired + salvaged 为避免的重新请求。
+    """
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _bump(self, method, outcome, dropped=0):
+        with self._lock:
+            stats = self._stats.setdefault(method, {
+                'parsed': 0, 'repaired': 0, 'salvaged': 0, 'failed': 0, 'dropped_items': 0
+            })
+            stats[outcome] += 1
+            stats['dropped_items'] += dropped
+
+    def stats(self):
+        with self._lock:
+            methods = {name: dict(s) for name, s in self._stats.items()}
+        failed = sum(s['failed'] for s in methods.values())
+        recovered = sum(s['repaired'] + s['salvaged'] for s in methods.values())
+        return {'methods': methods, 'rerequests': failed, 'rerequests_avoided': recovered}
+
+    def _decode(self, text, start):
+        """解析 start 处开始的第一个 JSON 值，忽略其后的说明文字"""
+        return json.JSONDecoder().raw_decode(text, start)[0]
+
+    def parse(self, text, method, expect=None):
+        """
+        Args:
+            text: 模型原始输出
+            method: 调用类别，对应 SCHEMAS 中的 schema（没有 schema 时只做解析）
+            expect: 'object' / 'array'，默认取 schema 的顶层类型
+
+        Returns:
+            解析并校验后的数据
+        Raises:
+            JSONParseError
+        """
+        schema = SCHEMAS.get(method)
+        expect = expect or (schema['type'] if schema else None)
+        text = _strip_fences(str(text or '').strip())
+        start = _start_index(text, expect)
+        if start == -1:
+            # 期望数组但模型只给了对象（或反之）
+            start = _start_index(text, None)
+        if start == -1:
+            self._bump(method, 'failed')
+            raise JSONParseError('No JSON found in model output', text)
+
+        outcome = 'parsed'
+        data = _MISSING
+        # 先做 LaTeX 转义修复再解析：\frac 这类单反斜杠严格解析也能“成功”，但内容已被破坏
+        repaired = _repair(text[start:])
+        try:
+            data = self._decode(repaired, 0)
+            if repaired != text[start:]:
+                outcome = 'repaired'
+        except ValueError:
+            salvaged = _salvage(repaired)
+            if salvaged is not None:
+                try:
+                    data = self._decode(salvaged, 0)
+                    outcome = 'salvaged'
+                except ValueError:
+                    pass
+        if data is _MISSING:
+            self._bump(method, 'failed')
+            raise JSONParseError('Model output is not valid JSON', text)
+
+        if schema is None:
+            self._bump(method, outcome)
+            return data
+        try:
+            data, dropped = validate(data, schema)
+        except JSONParseError as e:
+            self._bump(method, 'failed')
+            e.raw = text
+            raise
+        self._bump(method, outcome, dropped)
+        if outcome != 'parsed' or dropped:
+            print(f"[JSON] {method}: {outcome}" + (f", dropped {dropped} invalid items" if dropped else ''))
+        return data
+
+
+# 创建单例实例
+model_json = ModelJSONParser()
+
+
+def parse_model_json(text, method, expect=None):
+    """model_json.parse 的快捷方式"""
+    return model_json.parse(text, method, expect)
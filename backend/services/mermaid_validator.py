@@ -0,0 +1,340 @@
+"""
+Mermaid validator - parse, sanitize and repair the graph TD/LR and mindmap subsets used for mindmaps
+"""
+
+import re
+import threading
+
+_FENCE = re.compile(r'```[a-zA-Z]*\s*\n?(.*?)(?:```|$)', re.DOTALL)
+_GRAPH_HEADER = re.compile(r'^(?:graph|flowchart)\s+(TD|TB|BT|LR|RL)\b', re.IGNORECASE)
+_MINDMAP_HEADER = re.compile(r'^mindmap\b', re.IGNORECASE)
+_DIRECTIVE = re.compile(r'^(?:classDef|class|style|linkStyle|click|direction)\b')
+
+# graph 节点 ID 与连线
+# ID 中间的空格是模型常见错误，整体视为一个 ID 再重新编号
+_NODE_ID = re.compile(r'[A-Za-z0-9_\u4e00-\u9fff.]+(?: +[A-Za-z0-9_\u4e00-\u9fff.]+)*')
+_LINK = re.compile(r'\s*(<?(?:-->|---|-\.->|-\.-|==>|===|--\s*[^-<>|\s][^-<>|]*?\s*-->)(?:\s*\|[^|\n]*\|)?)\s*')
+_GRAPH_SHAPES = [
+    ('((', '))'), ('([', '])'), ('[[', ']]'), ('[(', ')]'), ('{{', '}}'),
+    ('[/', '/]'), ('[\\', '\\]'), ('[', ']'), ('(', ')'), ('{', '}'), ('>', ']')
+]
+# 不加引号时会破坏 graph 标签解析的字符
+_GRAPH_UNSAFE = re.compile(r'[()\[\]{}<>|";:#&]')
+
+# mindmap 节点形状：开符号 -> 闭符号
+_MINDMAP_SHAPES = [('((', '))'), ('))', '(('), ('{{', '}}'), ('(', ')'), ('[', ']'), (')', '(')]
+_MINDMAP_NODE = re.compile(r'^([\w-]*?)(\(\(|\)\)|\{\{|\(|\[|\))(.*)$')
+_MINDMAP_DECORATION = re.compile(r'\s*(::icon\([^)]*\)|:::\s*[\w ]+)\s*$')
+_MINDMAP_UNSAFE = re.compile(r'[()\[\]{}]')
+
+
+def _strip_fences(code):
+    match = _FENCE.search(code)
+    return match.group(1) if match else code
+
+
+def _collapse(text):
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class _Graph:
+    """graph TD/LR 子集的解析与修复"""
+
+    def __init__(self, direction, issues):
+        self.direction = direction.upper()
+        self.issues = issues
+        self.statements = []  # ('chain', [node, link, node, ...]) / ('raw', line)
+        self.ids = {}
+        self.order = []
+        self.labelled = set()
+        self.edges = []
+        self.subgraph_depth = 0
+
+    def _node_id(self, raw):
+        """非法 ID（空格、特殊字符、关键字）映射成稳定的新 ID"""
+        if re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', raw) and raw.lower() not in ('end', 'graph', 'subgraph'):
+            node_id = raw
+        else:
+            if raw not in self.ids:
+                self.issues.append('node_id')
+                self.ids[raw] = f'N{len(self.ids) + 1}'
+            node_id = self.ids[raw]
+        if node_id not in self.order:
+            self.order.append(node_id)
+        return node_id
+
+    def _label(self, raw):
+        label = _collapse(raw)
+        if _GRAPH_UNSAFE.search(label):
+            self.issues.append('label')
+            return '"' + label.replace('"', "'").replace('#', '＃') + '"'
+        return label
+
+    def _parse_node(self, text, pos):
+        """解析 pos 处的一个节点引用，返回 (渲染结果, 节点 ID, 新位置) 或 None"""
+        match = _NODE_ID.match(text, pos)
+        if not match:
+            return None
+        node_id = self._node_id(match.group(0))
+        pos = match.end()
+        for opener, closer in _GRAPH_SHAPES:
+            if text.startswith(opener, pos):
+                # 标签一直到下一个连线或行尾，允许标签里出现括号
+                link = _LINK.search(text, pos + len(opener))
+                end = link.start() if link else len(text)
+                inner = text[pos + len(opener):end].rstrip()
+                if inner.endswith(closer):
+                    inner = inner[:-len(closer)]
+                else:
+                    self.issues.append('unterminated_label')
+                    inner = inner.rstrip(')]}/\\')
+                self.labelled.add(node_id)
+                return f'{node_id}{opener}{self._label(inner) or node_id}{closer}', node_id, end
+        return node_id, node_id, pos
+
+    def add_line(self, line):
+        if line.startswith('%%') or _DIRECTIVE.match(line):
+            self.statements.append(('raw', line))
+            return
+        if re.match(r'^subgraph\b', line):
+            self.subgraph_depth += 1
+            self.statements.append(('raw', line))
+            return
+        if line == 'end':
+            if self.subgraph_depth:
+                self.subgraph_depth -= 1
+                self.statements.append(('raw', line))
+            else:
+                self.issues.append('unmatched_end')
+            return
+
+        parts = []
+        pos = 0
+        previous = None
+        pending_link = None
+        line = line.rstrip(';')
+        while pos < len(line):
+            link = _LINK.match(line, pos)
+            if link:
+                if previous is None or pending_link is not None:
+                    self.issues.append('dangling_edge')
+                else:
+                    pending_link = link.group(1)
+                pos = link.end()
+                continue
+            node = self._parse_node(line, pos)
+            if node is None:
+                self.issues.append('garbage')
+                break
+            rendered, node_id, pos = node
+            if pending_link is not None:
+                parts += [pending_link, rendered]
+                self.edges.append((previous, node_id))
+                pending_link = None
+            elif previous is None:
+                parts.append(rendered)
+            else:
+                # 两个节点之间缺少连线：作为新的一行
+                self.statements.append(('chain', parts))
+                parts = [rendered]
+            previous = node_id
+            while pos < len(line) and line[pos] == ' ':
+                pos += 1
+        if pending_link is not None:
+            self.issues.append('dangling_edge')
+        if parts and not (len(parts) == 1 and parts[0] in self.order[:-1]):
+            # 只剩一个已出现过的裸 ID（断掉的连线）时不单独成行
+            self.statements.append(('chain', parts))
+
+    def render(self):
+        if not self.order:
+            return None
+        lines = [f'graph {self.direction}']
+        for kind, value in self.statements:
+            lines.append('    ' + (value if kind == 'raw' else ' '.join(value)))
+        lines += ['    end'] * self.subgraph_depth
+        if self.subgraph_depth:
+            self.issues.append('unclosed_subgraph')
+
+        # 不连通的部分挂到根节点下，保证是一棵树
+        root = self.order[0]
+        parent = {node: node for node in self.order}
+
+        def _find(node):
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        for a, b in self.edges:
+            parent[_find(a)] = _find(b)
+        targets = {b for _, b in self.edges}
+        heads = {}
+        for node in self.order:
+            group = _find(node)
+            if group == _find(root):
+                continue
+            # 每个不连通部分优先挂没有入边的节点
+            if group not in heads or (heads[group] in targets and node not in targets):
+                heads[group] = node
+        for node in heads.values():
+            lines.append(f'    {root} --> {node}')
+        if heads:
+            self.issues.append('orphan')
+        return '\n'.join(lines)
+
+
+class _Mindmap:
+    """mindmap 子集的解析与修复"""
+
+    def __init__(self, issues, topic=''):
+        self.issues = issues
+        self.topic = topic
+        self.nodes = []  # (indent, text)
+
+    def _node(self, text):
+        decoration = ''
+        match = _MINDMAP_DECORATION.search(text)
+        if match:
+            decoration = ' ' + match.group(1)
+            text = text[:match.start()]
+        match = _MINDMAP_NODE.match(text)
+        if match:
+            node_id, opener, rest = match.groups()
+            closer = dict(_MINDMAP_SHAPES)[opener]
+            if rest.endswith(closer) and not _MINDMAP_UNSAFE.search(rest[:-len(closer)]):
+                return text + decoration
+            if rest.endswith(closer):
+                inner = rest[:-len(closer)]
+                self.issues.append('label')
+                return f'{node_id}{opener}{self._clean(inner) or node_id or "Node"}{closer}{decoration}'
+        if _MINDMAP_UNSAFE.search(text):
+            self.issues.append('label')
+            text = self._clean(text)
+        return (text + decoration) if text else None
+
+    def _clean(self, text):
+        return _collapse(_MINDMAP_UNSAFE.sub(' ', text))
+
+    def add_line(self, line, raw):
+        if line.startswith('%%'):
+            return
+        indent = len(raw.expandtabs(4)) - len(raw.expandtabs(4).lstrip())
+        node = self._node(line)
+        if node:
+            self.nodes.append((indent, node, raw.rstrip()))
+
+    def render(self):
+        if not self.nodes:
+            return None
+        levels = []
+        stack = []
+        for indent, _, _ in self.nodes:
+            while stack and indent < stack[-1]:
+                stack.pop()
+            if not stack or indent > stack[-1]:
+                stack.append(indent)
+            levels.append(len(stack) - 1)
+
+        nodes = [text for _, text, _ in self.nodes]
+        if levels.count(0) > 1:
+            # mindmap 只能有一个根：补一个根节点，其余整体下移一级
+            self.issues.append('multiple_roots')
+            label = self._clean(self.topic) or 'Mind Map'
+            nodes.insert(0, f'root(({label}))')
+            levels = [-1] + levels
+            levels = [level + 1 for level in levels]
+
+        lines = ['mindmap']
+        for level, text in zip(levels, nodes):
+            lines.append('  ' * (level + 1) + text)
+        if 'multiple_roots' not in self.issues and any(
+                '  ' * (level + 1) != raw[:len(raw) - len(raw.lstrip())]
+                for level, (_, _, raw) in zip(levels, self.nodes)):
+            self.issues.append('indentation')
+        return '\n'.join(lines)
+
+
+class MermaidValidator:
+    """
+    保存前对生成的思维导图代码做本地校验和修复（graph TD/LR 与 mindmap 子集）：
+    - 去掉 Markdown 代码块和首尾说明文字，缺少的 graph / mindmap 头自动补上
+    - graph：含括号等特殊字符的标签加引号，非法节点 ID 重新编号，缺端点的连线删除，
+      未闭合的标签和 subgraph 补齐，不连通的节点挂到根节点
+    - mindmap：标签中的括号去掉，缩进规整为每级 2 个空格，多个根时补一个根节点
+    按问题类型统计修复次数。
+    """
+
+    def __init__(self):
+        self._stats = {'checked': 0, 'valid': 0, 'repaired': 0, 'unrecoverable': 0, 'issues': {}}
+        self._lock = threading.Lock()
+
+    def _record(self, issues, ok):
+        with self._lock:
+            self._stats['checked'] += 1
+            if not ok:
+                self._stats['unrecoverable'] += 1
+            elif issues:
+                self._stats['repaired'] += 1
+            else:
+                self._stats['valid'] += 1
+            for issue in set(issues):
+                self._stats['issues'][issue] = self._stats['issues'].get(issue, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'issues': dict(self._stats['issues'])}
+
+    def repair(self, code, topic=''):
+        """
+        Returns:
+            (code, issues): 修复后的代码和发现的问题列表；无法修复时 code 为 None
+        """
+        issues = []
+        text = str(code or '').strip()
+        if '```' in text:
+            issues.append('fence')
+            text = _strip_fences(text)
+        raw_lines = [line for line in text.splitlines() if line.strip()]
+
+        # 找到 graph / mindmap 头，之前的说明文字丢弃
+        kind = None
+        start = 0
+        for index, line in enumerate(raw_lines):
+            stripped = line.strip()
+            if _GRAPH_HEADER.match(stripped) or _MINDMAP_HEADER.match(stripped):
+                kind = stripped
+                start = index + 1
+                if index:
+                    issues.append('leading_text')
+                break
+        if kind is None:
+            issues.append('header')
+            indents = {len(line) - len(line.lstrip()) for line in raw_lines}
+            if any(_LINK.search(line) for line in raw_lines):
+                kind = 'graph TD'
+            elif len(raw_lines) > 1 and len(indents) > 1:
+                kind = 'mindmap'
+
+        result = None
+        if kind is not None:
+            body = raw_lines[start:]
+            graph_header = _GRAPH_HEADER.match(kind)
+            if graph_header:
+                parser = _Graph(graph_header.group(1), issues)
+                for line in body:
+                    parser.add_line(line.strip())
+            else:
+                parser = _Mindmap(issues, topic)
+                for line in body:
+                    parser.add_line(line.strip(), line)
+            result = parser.render()
+
+        self._record(issues, result is not None)
+        if issues:
+            print(f"[MERMAID] {'repaired' if result else 'unrecoverable'}: {', '.join(sorted(set(issues)))}")
+        return result, issues
+
+
+# 创建单例实例
+mermaid_validator = MermaidValidator()
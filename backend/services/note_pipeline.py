@@ -0,0 +1,79 @@
+"""
+Record-to-note pipeline - drafts note outlines from finished transcript segments while later ones are still recognized
+"""
+
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .ai_service import ai_service
+from .audio_segments import stitch_transcripts
+from .chunking import chunk_token_budget, content_token_budget, estimate_tokens
+from .resilience import ensure_request_deadline
+
+
+class LectureNotePipeline:
+    """
+    把识别和笔记生成重叠起来：片段按顺序识别完成后追加到转写稿，
+    转写稿超出一个 prompt 的预算后，每攒够一个分块（AI_CHUNK_TOKENS）就立即在后台压缩成提纲（map 阶段），
+    识别结束时只剩最后一块的提纲和一次笔记生成（reduce 阶段）。
+    短录音不产生草稿，直接用完整转写稿生成笔记，与 generate_note_from_text 一致。
+    """
+
+    def __init__(self, subject='General'):
+        self.subject = subject or 'General'
+        self.transcript = ''
+        self._last_text = ''
+        self._drafted_upto = 0
+        self._drafts = []
+        self._pool = ThreadPoolExecutor(max_workers=int(os.getenv('NOTE_PIPELINE_DRAFT_WORKERS', 2)))
+        self.timings = {}
+
+    def _submit_draft(self, text):
+        index = len(self._drafts)
+        context = contextvars.copy_context()
+        # 总分块数事先未知（total=None）
+        self._drafts.append(self._pool.submit(
+            context.run, ai_service.summarize_chunk, self.subject, text, index, None
+        ))
+
+    def on_text(self, index, text, overlapped=False):
+        """transcribe_segments 的回调：按顺序收到每个片段的文字（overlapped：与上一段在硬切处重叠）"""
+        # 与整体拼接一致：上一段没有文字时，重叠部分无从比较，不去重
+        self.transcript = stitch_transcripts([self.transcript, text], [False, overlapped and bool(self._last_text)])
+        self._last_text = text or ''
+        pending = self.transcript[self._drafted_upto:]
+        if estimate_tokens(self.transcript) > content_token_budget() and \
+                estimate_tokens(pending) >= chunk_token_budget():
+            self._submit_draft(pending)
+            self._drafted_upto = len(self.transcript)
+
+    def run(self, segments, language='auto'):
+        """识别 segments 并生成笔记，返回 (note, transcript, error)"""
+        started = time.time()
+        try:
+            text, error = ai_service.transcribe_segments(segments, language=language, on_text=self.on_text)
+            self.timings['transcribe_seconds'] = round(time.time() - started, 2)
+            if error and not self.transcript:
+                return None, '', error
+            # on_text 里的增量拼接与 transcribe_segments 的整体拼接逐段相同，草稿位置以增量结果为准
+            self.transcript = self.transcript or text or ''
+            # 长录音的识别已经把截止时间延长到识别结束，笔记生成再留出与 /api/note/generate 相同的时间
+            ensure_request_deadline(float(os.getenv('NOTE_PIPELINE_NOTE_SECONDS', 90)))
+
+            if not self._drafts:
+                note = ai_service.generate_note_from_text(self.transcript, self.subject)
+            else:
+                remaining = self.transcript[self._drafted_upto:]
+                if remaining.strip():
+                    self._submit_draft(remaining)
+                outlines = [draft.result() for draft in self._drafts]
+                note = ai_service.generate_note_from_outlines(outlines, self.transcript, self.subject)
+            self.timings['total_seconds'] = round(time.time() - started, 2)
+            self.timings['drafts'] = len(self._drafts)
+            print(f"[NOTE_PIPELINE] transcribed in {self.timings['transcribe_seconds']}s, "
+                  f"note ready at {self.timings['total_seconds']}s ({len(self._drafts)} drafts)")
+            return note, self.transcript, None
+        finally:
+            self._pool.shutdown(wait=False, cancel_futures=True)
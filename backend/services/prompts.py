@@ -0,0 +1,228 @@
+"""
+Prompt template registry - shared static prefixes first, request-specific values last
+"""
+
+from string import Formatter
+
+from .chunking import estimate_tokens
+
+
+class PromptTemplate:
+    """
+    system 为完全静态的文本，user 用 str.format 占位符（字面量大括号需双写）。
+    变量都放在 user 的末尾，使同一类调用的请求前缀完全一致，命中 provider 的前缀缓存。
+    budget 为静态部分（变量替换为空）允许的最大 token 数，由 scripts/prompt_benchmark.py 检查。
+    """
+
+    def __init__(self, name, user, system=None, budget=None):
+        self.name = name
+        self.user = user
+        self.system = system
+        self.budget = budget
+        self.fields = [field for _, field, _, _ in Formatter().parse(user) if field]
+
+    def user_text(self, **values):
+        return self.user.format(**values)
+
+    def messages(self, **values):
+        """渲染成 chat messages（system 在前）"""
+        messages = [{"role": "system", "content": self.system}] if self.system else []
+        messages.append({"role": "user", "content": self.user_text(**values)})
+        return messages
+
+    def static_text(self):
+        return (self.system or '') + self.user.format(**{field: '' for field in self.fields})
+
+    def static_tokens(self):
+        return estimate_tokens(self.static_text())
+
+    def prefix_tokens(self):
+        """第一个变量之前的 token 数（跨请求不变、可被缓存的前缀）"""
+        literal = ''
+        for text, field, _, _ in Formatter().parse(self.user):
+            literal += text
+            if field:
+                break
+        return estimate_tokens((self.system or '') + literal)
+
+
+# ---------- 共享前缀 ----------
+
+_GRAPH_SYSTEM = """You generate mind maps as Mermaid flowcharts.
+Syntax:
+- First line: graph TD or graph LR, as requested
+- One statement per line: a node ID[Label] or an edge ID --> ID
+- Node IDs: letters and digits only, e.g. ROOT, A, B1
+- Labels: 3-8 plain words. No ( ) [ ] { } < > | " ' ; or math symbols inside labels; write formulas in words, e.g. "f of x equals x squared", "theta"
+Structure: one root, 3-6 main branches, 2-4 children per branch, general to specific.
+Output only the Mermaid code, no Markdown fences or explanations.
+Example:
+graph TD
+    ROOT[Complex Numbers]
+    A[Polar Form]
+    A1[r times e to the i theta]
+    ROOT --> A
+    A --> A1"""
+
+_MINDMAP_SYSTEM = """You generate radial mind maps in Mermaid mindmap syntax.
+Syntax:
+- First line: mindmap
+- Root: root((Topic))
+- Exactly 2 spaces of indentation per level; siblings share the same indentation
+- Level 1 branches alternate shapes (Branch) and [Branch]; deeper nodes are plain text
+- Labels: 3-8 plain words. No ( ) [ ] { } < > | or math symbols inside labels; write formulas in words, e.g. "x squared", "theta"
+Structure: 5-8 balanced main branches, 2-4 children each, 0-2 sub-items where depth allows.
+Output only the mindmap code, no Markdown fences or explanations.
+Example:
+mindmap
+  root((Central Idea))
+    (Branch A)
+      Item A1
+        Detail
+    [Branch B]
+      Item B1"""
+
+_JUDGE_SYSTEM = """You are a strict middle school teacher grading student answers.
+Accept simplified answers such as numerical values or option letters, and numerical answers without units; slightly imprecise but correct final answers are acceptable.
+For every answer, first solve the problem yourself, then compare the student's answer with the correct answer.
+Output only pure JSON, no Markdown."""
+
+_VISION_JUDGE_PREFIX = """你是严格的中学教师。先自己做一遍题目，再识别图片中用户写的答案（只识别答案，不含题目、草稿；保留 LaTeX），判断是否正确。
+答案与题目学科或内容明显无关（如生物题写了一堆数学公式）时判错。
+只输出 JSON，不要任何其它文字。
+"""
+
+# ---------- 模板 ----------
+
+PROMPTS = {}
+
+
+def register(template):
+    PROMPTS[template.name] = template
+    return template
+
+
+register(PromptTemplate('mindmap_graph_topic', system=_GRAPH_SYSTEM, budget=205, user="""Create a hierarchical mind map for the topic below.
+Layout: graph {direction} ({layout})
+Depth: {depth_instruction}
+Topic: "{topic}"
+{context}"""))
+
+register(PromptTemplate('mindmap_graph_content', system=_GRAPH_SYSTEM, budget=225, user="""Create a hierarchical mind map from the content below: extract its main concepts and organise them from general to specific.
+Layout: graph {direction} ({layout})
+Depth: {depth_instruction}
+Topic: "{topic}"
+Content:
+{content}"""))
+
+register(PromptTemplate('mindmap_radial_topic', system=_MINDMAP_SYSTEM, budget=205, user="""Create a radial mind map for the topic below, with root(({topic})).
+Depth: {depth_instruction}
+{context}"""))
+
+register(PromptTemplate('mindmap_radial_content', system=_MINDMAP_SYSTEM, budget=215, user="""Create a radial mind map from the content below: extract its main concepts.
+Depth: {depth_instruction}
+Topic: "{topic}"
+Content:
+{content}"""))
+
+register(PromptTemplate('summarize_chunk', budget=80, user="""Condense one part of a long document into a hierarchical outline of its key concepts, definitions, formulas and examples.
+Use nested "-" bullets with 2-space indentation. Keep the document's language. Output only the outline.
+
+Document topic: "{topic}"
+Length: about {target_tokens} tokens at most
+{position}:
+{chunk}"""))
+
+register(PromptTemplate('chat_summary', budget=85, user="""Update the running summary of a conversation between a student and a study assistant.
+Keep what matters for future turns: the student's goals and level, questions asked, key explanations, answers and open issues.
+At most 200 words. Output only the updated summary.
+
+Previous summary:
+{previous_summary}
+
+New turns:
+{transcript}"""))
+
+register(PromptTemplate('chat', budget=120, user="{message}", system="""You are a helpful AI study assistant. You help students with:
+- Answering questions about their studies
+- Explaining concepts clearly
+- Providing learning guidance
+- Helping with homework and assignments
+- Organizing study materials
+
+Be friendly, clear, and concise in your responses. Use LaTeX notation for mathematical formulas (e.g., $x^2$ for inline math, $$\\frac{a}{b}$$ for display math). Format your answers well for readability."""))
+
+register(PromptTemplate('similar', budget=260, user="""你是资深中学教师，请根据下面的原题生成"相似知识点、相似难度"的相似练习题，并给出标准答案。
+要求：
+- 与原题相似但不重复（改变数字、情境、表达方式或所求内容），题型、科目、知识点保持一致，不出需要图片的题
+- subject 从 Chinese, Mathematics, English, Physics, Chemistry, Politics, History, Geography, Biology 中选择；subject、type、tags 用英语
+- 原题是英语的就全部用英语
+- 只输出一个 JSON 数组，长度等于题目数量，不要解释或 Markdown；反斜杠必须双写（如 \\\\frac）
+格式：
+[{{"subject": "Mathematics", "type": "Single choice", "tags": ["Quadratic Equation"], "question_text": "题目", "analysis_steps": ["步骤1", "步骤2"], "correct_answer": "标准答案"}}]
+
+题目数量：{count}{grade_info}
+原题：
+{question_text}"""))
+
+register(PromptTemplate('judge', system=_JUDGE_SYSTEM, budget=165, user="""Judge whether the student's answer is correct. Output:
+{{"reason": "step-by-step derivation of the correct answer, one point per line", "is_correct": true or false}}
+
+Question:
+{question_text}
+
+Standard Answer:
+{correct_answer}
+
+Student's submitted answer:
+{user_answer}"""))
+
+register(PromptTemplate('judge_batch', system=_JUDGE_SYSTEM, budget=170, user="""Grade each numbered student answer below. Keep each "reason" to the key derivation steps, one point per line.
+Output a JSON array with exactly one object per item, in item order:
+[{{"index": 1, "reason": "...", "is_correct": true or false}}]
+
+{blocks}"""))
+
+register(PromptTemplate('note', budget=130, system="You are an experienced teacher who writes structured study notes.", user="""Based on the learning content below, generate a structured study note. Output strictly JSON, no additional explanation:
+{{"title": "concise title", "summary": "50-100 words", "key_points": ["3-5 core points"], "examples": ["0-3 representative examples"], "detailed_notes": "Markdown with headings, lists and highlights", "tags": ["knowledge point tags"]}}
+All output must be in English.
+{subject_instruction}
+
+Learning Content:
+{content}"""))
+
+register(PromptTemplate('ocr_question', budget=390, user="""你是严谨的中学教师，请根据图片识别题目内容、答案和解析。
+图像说明：图像0 是完整原题；图像1、2、3… 是自动裁剪的局部图，裁剪图索引从 0 开始（图像1 → 索引 0，图像2 → 索引 1，以此类推）。
+要求：
+1. question_text 完整包含题目原文及所有选项。
+2. crop_index 是该题依赖的裁剪图索引列表，如 [0]、[1,2] 或 []。原图只有一道题（无论几个小问）时必须包含全部裁剪图索引；每张裁剪图只属于一道题。
+3. subject 从 Chinese, Mathematics, English, Physics, Chemistry, Politics, History, Geography, Biology 中选择；type、tags 用英文。
+4. correct_answer 和 analysis_steps 基于题目推导，与用户答案无关；user_answer 为图片上的学生答案；difficulty 为 easy、medium 或 hard。
+5. 只输出合法 JSON 数组，不要解释或 Markdown；LaTeX 中的反斜杠必须双写（\\\\），只允许 \\\\、\\"、\\n、\\t、\\r 转义。
+格式：
+[{{"subject": "Mathematics", "type": "Constructed-response question", "tags": ["Trigonometric Functions"], "difficulty": "medium", "question_text": "题目原文", "analysis_steps": ["步骤1", "步骤2"], "correct_answer": "正确答案", "user_answer": "学生答案", "crop_index": []}}]"""))
+
+register(PromptTemplate('vision_redo_judge', budget=180, user=_VISION_JUDGE_PREFIX + """只有答案内容合理且与题目匹配时才判断正误。
+输出：{{"user_answer": "图片中识别出的答案原文", "is_correct": true 或 false}}
+
+题目（已以文字提供，不需要识别图片中的题目）：
+{question_text}"""))
+
+register(PromptTemplate('vision_practice_judge', budget=135, user=_VISION_JUDGE_PREFIX + """输出：{{"correct_answer_and_analyse": "...", "user_answer": "...", "is_correct": true 或 false}}
+
+题目：
+{question_text}"""))
+
+register(PromptTemplate('vision_judge_batch', budget=175, user=_VISION_JUDGE_PREFIX + """请逐题识别：下面每道题后面紧跟该题的作答图片。
+输出 JSON 数组，每道题一个对象：[{{"index": 题目编号, "correct_answer_and_analyse": "...", "user_answer": "...", "is_correct": true 或 false}}]"""))
+
+register(PromptTemplate('ocr_text', budget=85, user="""请仔细识别这张图片中的所有文字内容。
+要求：
+1. 完整提取所有可见文字
+2. 保持原有的段落结构
+3. 如果有标题、列表等，请保留格式
+4. 只输出识别到的文字内容，不要添加任何解释"""))
+
+
+def get_prompt(name):
+    return PROMPTS[name]
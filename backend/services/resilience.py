@@ -0,0 +1,301 @@
+"""
+Resilience helpers for AI provider calls - deadlines, jittered retries and circuit breakers
+"""
+
+import contextvars
+import os
+import random
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，调用被直接拒绝"""
+
+    def __init__(self, provider):
+        super().__init__(f"Circuit breaker for '{provider}' is open")
+        self.provider = provider
+
+
+class DeadlineExceeded(Exception):
+    """剩余时间不足以发起（或重试）调用"""
+
+
+class ProviderHTTPError(Exception):
+    """Provider 返回的非 2xx 响应（用于不会主动抛异常的 SDK，如 dashscope）"""
+
+    def __init__(self, status_code, message=''):
+        super().__init__(f"Provider HTTP {status_code}: {message}")
+        self.status_code = status_code
+
+
+class Deadline:
+    """一次逻辑调用的截止时间（单调时钟）"""
+
+    def __init__(self, seconds, request_bound=False):
+        self.seconds = seconds
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + seconds
+        # True 表示截止时间由请求剩余时间（而不是调用自身的超时）决定
+        self.request_bound = request_bound
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+# 当前 HTTP 请求的截止时间（由 run.py 的 before_request 设置）
+_request_deadline = contextvars.ContextVar('request_deadline', default=None)
+
+
+def set_request_deadline(seconds):
+    """为当前请求设置截止时间，返回用于 reset_request_deadline 的 token"""
+    return _request_deadline.set(Deadline(seconds) if seconds else None)
+
+
+def reset_request_deadline(token):
+    _request_deadline.reset(token)
+
+
+def current_deadline():
+    """当前请求的 Deadline；不在请求上下文中（如后台线程）时为 None"""
+    return _request_deadline.get()
+
+
+def remaining_budget(default=None):
+    """当前请求剩余的秒数；没有请求截止时间时返回 default"""
+    deadline = _request_deadline.get()
+    return deadline.remaining() if deadline is not None else default
+
+
+_extend_lock = threading.Lock()
+
+
+def ensure_request_deadline(seconds):
+    """
+    保证当前请求至少还剩 seconds 秒：识别按实时速率进行，长录音所需时间与音频时长成正比，
+    由开始识别的片段按自身时长延长请求截止时间。总时长不超过 REQUEST_DEADLINE_EXTEND_MAX（从请求开始算）
+    """
+    deadline = _request_deadline.get()
+    if deadline is None:
+        return
+    limit = deadline.started_at + float(os.getenv('REQUEST_DEADLINE_EXTEND_MAX', 3600))
+    with _extend_lock:
+        # Deadline 对象在复制的 context 之间共享，工作线程里延长对请求线程同样生效
+        deadline.expires_at = max(deadline.expires_at, min(limit, time.monotonic() + seconds))
+
+
+def bounded_deadline(seconds):
+    """单个阶段的截止时间：不超过请求剩余时间"""
+    remaining = remaining_budget()
+    if remaining is not None and remaining < seconds:
+        return Deadline(remaining, request_bound=True)
+    return Deadline(seconds)
+
+
+def check_deadline(stage, min_seconds=0.0):
+    """剩余时间不足 min_seconds 时直接放弃该阶段（客户端很可能已经放弃了请求）"""
+    remaining = remaining_budget()
+    if remaining is not None and remaining <= min_seconds:
+        raise DeadlineExceeded(f"Not enough time left for {stage} ({remaining:.1f}s remaining)")
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker.
+
+    closed    -> 正常放行，连续失败达到阈值后 open
+    open      -> 直接拒绝，recovery_timeout 之后进入 half_open
+    half_open -> 只放行一个探测请求，成功则 closed，失败则重新 open
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._total_failures = 0
+        self._total_rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self):
+        """是否允许发起一次调用"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self._total_rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def release(self):
+        """调用结果不说明 provider 健康状况（如客户端截止时间太短）：只释放 half-open 探测位"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._total_failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def snapshot(self):
+        with self._lock:
+            state = self._current_state()
+            retry_in = 0.0
+            if state == self.OPEN:
+                retry_in = max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'total_failures': self._total_failures,
+                'rejected_calls': self._total_rejected,
+                'retry_in_seconds': round(retry_in, 1)
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider):
+    """获取（或创建）某个 provider 的熔断器"""
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                provider,
+                failure_threshold=int(os.getenv('AI_BREAKER_FAILURE_THRESHOLD', 5)),
+                recovery_timeout=float(os.getenv('AI_BREAKER_RECOVERY_SECONDS', 30))
+            )
+            _breakers[provider] = breaker
+        return breaker
+
+
+def breaker_states():
+    """所有 provider 熔断器状态，用于健康检查"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {b.name: b.snapshot() for b in breakers}
+
+
+def is_retryable(exc):
+    """超时、连接错误、限流和 5xx 可以重试；4xx 等调用方错误不重试"""
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+
+    try:
+        import openai
+        if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError)):
+            return True
+    except ImportError:
+        pass
+
+    try:
+        import requests
+        if isinstance(exc, (requests.Timeout, requests.ConnectionError)):
+            return True
+    except ImportError:
+        pass
+
+    status = getattr(exc, 'status_code', None)
+    if isinstance(status, int):
+        return status in (408, 409, 429) or status >= 500
+    return False
+
+
+def call_with_retries(fn, breaker, deadline, max_attempts=None, base_delay=None, max_delay=None):
+    """
+    在截止时间内调用 fn(timeout)，对可重试错误做带抖动的指数退避重试。
+
+    Args:
+        fn: 接收剩余超时秒数的可调用对象
+        breaker: CircuitBreaker
+        deadline: Deadline
+        max_attempts: 最大尝试次数（含首次）
+        base_delay / max_delay: 退避基准与上限（秒）
+
+    Raises:
+        CircuitOpenError: 熔断器打开
+        DeadlineExceeded: 截止时间已到
+        其它: 最后一次调用的异常
+    """
+    if max_attempts is None:
+        max_attempts = int(os.getenv('AI_RETRY_MAX_ATTEMPTS', 3))
+    if base_delay is None:
+        base_delay = float(os.getenv('AI_RETRY_BASE_DELAY', 0.5))
+    if max_delay is None:
+        max_delay = float(os.getenv('AI_RETRY_MAX_DELAY', 4.0))
+
+    attempt = 0
+    while True:
+        # 先检查截止时间再占 half-open 探测位，否则探测位被占住后再也不会释放
+        if deadline.expired():
+            raise DeadlineExceeded(f"Deadline exceeded before calling '{breaker.name}'")
+        if not breaker.allow():
+            raise CircuitOpenError(breaker.name)
+
+        timeout = deadline.remaining()
+        if timeout <= 0:
+            breaker.release()
+            raise DeadlineExceeded(f"Deadline exceeded before calling '{breaker.name}'")
+
+        attempt += 1
+        try:
+            result = fn(timeout)
+        except Exception as e:
+            if not is_retryable(e):
+                # 调用方错误既不说明 provider 健康也不说明故障：只释放 half-open 探测位，不关闭熔断、不清零失败计数
+                breaker.release()
+                raise
+            if deadline.expired():
+                # 请求截止时间比 provider 超时更短导致的超时不计入熔断
+                if deadline.request_bound:
+                    breaker.release()
+                else:
+                    breaker.record_failure()
+                raise DeadlineExceeded(f"Deadline exceeded calling '{breaker.name}': {e}") from e
+            breaker.record_failure()
+            if attempt >= max_attempts:
+                raise
+            # Full jitter: sleep in [0, min(max_delay, base * 2^n)]
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** (attempt - 1))))
+            if delay >= deadline.remaining():
+                raise
+            print(f"[AI_RETRY] {breaker.name} attempt {attempt} failed ({e}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+            continue
+
+        breaker.record_success()
+        return result
@@ -0,0 +1,295 @@
+"""
+Resumable chunked uploads - init / put chunk / finalize, hashed while receiving, assembled under uploads/chunked
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from werkzeug.datastructures import FileStorage
+from werkzeug.utils import secure_filename
+
+UPLOAD_ROOT = os.path.join(os.path.dirname(__file__), '..', 'uploads', 'chunked')
+COPY_BLOCK = 256 * 1024
+
+
+class UploadError(Exception):
+    """分块上传请求不合法；status 为对应的 HTTP 状态码"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def default_chunk_size():
+    """默认分块 4MB，远小于 MAX_CONTENT_LENGTH，断线只需重传一块"""
+    return int(os.getenv('UPLOAD_CHUNK_BYTES', 4 * 1024 * 1024))
+
+
+def max_upload_bytes():
+    return int(os.getenv('UPLOAD_MAX_BYTES', 1024 * 1024 * 1024))
+
+
+class _UploadState:
+    """单个会话的内存状态：会话锁、按顺序累加的整文件哈希、正在写入的分块请求数"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hasher = hashlib.sha256()
+        self.hashed = 0
+        self.writers = 0
+
+
+class UploadSessions:
+    """
+    每个上传会话一个目录：meta.json（文件名、大小、分块大小、已收到的分块）+ data.part（按偏移直接写入）。
+    分块可以乱序、重复、并发上传；按顺序到达的分块边收边计算整文件 SHA-256，
+    finalize 时只需补算乱序部分。未完成的会话超过 UPLOAD_SESSION_TTL_SECONDS、
+    已完成但未再使用的文件超过 UPLOAD_FINALIZED_TTL_SECONDS 后被清理。
+    全局锁只保护会话表；读写 meta.json、哈希和改名都在各会话自己的锁里，一个会话的大块哈希不会挡住其他会话。
+    """
+
+    def __init__(self, root=UPLOAD_ROOT):
+        self.root = root
+        self._lock = threading.Lock()
+        self._uploads = {}  # upload_id -> _UploadState
+        self._last_gc = 0.0
+        os.makedirs(self.root, exist_ok=True)
+
+    # ---------- 存储 ----------
+
+    def _dir(self, upload_id):
+        if not upload_id or not all(c in '0123456789abcdef' for c in upload_id):
+            raise UploadError('Invalid upload id', 404)
+        return os.path.join(self.root, upload_id)
+
+    def _load(self, upload_id, user_id=None):
+        try:
+            with open(os.path.join(self._dir(upload_id), 'meta.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            raise UploadError('Upload not found', 404)
+        if user_id is not None and meta['user_id'] != user_id:
+            raise UploadError('Upload not found', 404)
+        return meta
+
+    def _save(self, meta):
+        path = os.path.join(self._dir(meta['upload_id']), 'meta.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(path + '.tmp', path)
+
+    def _state(self, upload_id):
+        with self._lock:
+            return self._uploads.setdefault(upload_id, _UploadState())
+
+    def _forget(self, upload_id):
+        with self._lock:
+            self._uploads.pop(upload_id, None)
+
+    @staticmethod
+    def _status(meta):
+        received = set(meta['received'])
+        return {
+            'upload_id': meta['upload_id'],
+            'filename': meta['filename'],
+            'size': meta['size'],
+            'chunk_size': meta['chunk_size'],
+            'total_chunks': meta['total_chunks'],
+            'received_chunks': len(received),
+            'missing_chunks': [i for i in range(meta['total_chunks']) if i not in received],
+            'finalized': meta['finalized'],
+            'sha256': meta.get('sha256') if meta['finalized'] else None
+        }
+
+    # ---------- 协议 ----------
+
+    def init(self, filename, size, user_id='default', chunk_size=None, sha256=None):
+        """创建上传会话，返回状态（含 upload_id、分块大小和分块数）"""
+        self.collect_garbage()
+        filename = secure_filename(filename or '')
+        if not filename:
+            raise UploadError('filename is required')
+        try:
+            size = int(size)
+            chunk_size = int(chunk_size or default_chunk_size())
+        except (TypeError, ValueError):
+            raise UploadError('size and chunk_size must be integers')
+        if size <= 0:
+            raise UploadError('size must be positive')
+        if size > max_upload_bytes():
+            raise UploadError(f'File too large (max {max_upload_bytes()} bytes)', 413)
+        # 单块不超过默认值的两倍，保证每个请求都在 MAX_CONTENT_LENGTH 之内
+        chunk_size = max(64 * 1024, min(chunk_size, 2 * default_chunk_size()))
+
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._dir(upload_id))
+        with open(os.path.join(self._dir(upload_id), 'data.part'), 'wb') as f:
+            f.truncate(size)
+        meta = {
+            'upload_id': upload_id,
+            'user_id': user_id,
+            'filename': filename,
+            'size': size,
+            'chunk_size': chunk_size,
+            'total_chunks': (size + chunk_size - 1) // chunk_size,
+            'expected_sha256': (sha256 or '').lower() or None,
+            'received': [],
+            'finalized': False,
+            'created_at': time.time(),
+            'updated_at': time.time()
+        }
+        with self._state(upload_id).lock:
+            self._save(meta)
+        return self._status(meta)
+
+    def put_chunk(self, upload_id, index, stream, user_id='default', chunk_sha256=None):
+        """写入第 index 块（从 stream 分段读取，不整块放进内存）；重复上传同一块会覆盖"""
+        self._load(upload_id, user_id)
+        state = self._state(upload_id)
+        with state.lock:
+            meta = self._load(upload_id, user_id)
+            if meta['finalized']:
+                raise UploadError('Upload already finalized', 409)
+            if not 0 <= index < meta['total_chunks']:
+                raise UploadError('Chunk index out of range', 416)
+            # 同一会话的分块可以并发写入；有写入在进行时 finalize 不会改名
+            state.writers += 1
+        expected = min(meta['chunk_size'], meta['size'] - index * meta['chunk_size'])
+
+        digest = hashlib.sha256()
+        written = 0
+        try:
+            with open(os.path.join(self._dir(upload_id), 'data.part'), 'r+b') as f:
+                f.seek(index * meta['chunk_size'])
+                while written < expected:
+                    block = stream.read(min(COPY_BLOCK, expected - written))
+                    if not block:
+                        break
+                    f.write(block)
+                    digest.update(block)
+                    written += len(block)
+        except FileNotFoundError:
+            # 会话在写入前被取消或清理
+            raise UploadError('Upload already finalized or aborted', 409)
+        finally:
+            with state.lock:
+                state.writers -= 1
+        if written < expected:
+            raise UploadError(f'Chunk {index} must be {expected} bytes, got {written}')
+        if stream.read(1):
+            raise UploadError(f'Chunk {index} is larger than {expected} bytes')
+        if chunk_sha256 and digest.hexdigest() != chunk_sha256.lower():
+            raise UploadError(f'Chunk {index} checksum mismatch', 422)
+
+        with state.lock:
+            meta = self._load(upload_id, user_id)
+            if index not in meta['received']:
+                meta['received'].append(index)
+            elif index < state.hashed:
+                # 已计入哈希的块被重传（内容可能不同），从头重算
+                state.hasher, state.hashed = hashlib.sha256(), 0
+            meta['updated_at'] = time.time()
+            self._save(meta)
+            self._advance_hash(meta, state)
+        return self._status(meta)
+
+    def _advance_hash(self, meta, state):
+        """按顺序到达的分块接着累加整文件哈希（调用方持有该会话的锁）"""
+        received = set(meta['received'])
+        if state.hashed in received:
+            with open(os.path.join(self._dir(meta['upload_id']), 'data.part'), 'rb') as f:
+                f.seek(state.hashed * meta['chunk_size'])
+                while state.hashed in received:
+                    # 刚写完的块还在页缓存里，重读的代价很小
+                    offset = state.hashed * meta['chunk_size']
+                    state.hasher.update(f.read(min(meta['chunk_size'], meta['size'] - offset)))
+                    state.hashed += 1
+        return state.hasher
+
+    def status(self, upload_id, user_id='default'):
+        return self._status(self._load(upload_id, user_id))
+
+    def finalize(self, upload_id, user_id='default'):
+        """检查分块齐全、校验 SHA-256，把 data.part 改名为原文件名；返回状态"""
+        self._load(upload_id, user_id)
+        state = self._state(upload_id)
+        with state.lock:
+            meta = self._load(upload_id, user_id)
+            if meta['finalized']:
+                return self._status(meta)
+            status = self._status(meta)
+            if status['missing_chunks']:
+                raise UploadError(f"{len(status['missing_chunks'])} chunk(s) missing", 409)
+            if state.writers:
+                raise UploadError('Chunk upload still in progress', 409)
+            # 进程重启后内存里的哈希状态丢失，_advance_hash 会从头重算（只占用这个会话的锁）
+            sha256 = self._advance_hash(meta, state).hexdigest()
+            if meta['expected_sha256'] and sha256 != meta['expected_sha256']:
+                raise UploadError('File checksum mismatch', 422)
+            directory = self._dir(upload_id)
+            os.replace(os.path.join(directory, 'data.part'), os.path.join(directory, meta['filename']))
+            meta.update(finalized=True, sha256=sha256, updated_at=time.time())
+            self._save(meta)
+        return self._status(meta)
+
+    def abort(self, upload_id, user_id='default'):
+        self._load(upload_id, user_id)
+        self._remove(upload_id)
+
+    def _remove(self, upload_id):
+        self._forget(upload_id)
+        shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+
+    # ---------- 使用已完成的上传 ----------
+
+    def path(self, upload_id, user_id='default'):
+        """已完成上传的 (文件路径, 文件名)；同时刷新使用时间，避免正在处理时被清理"""
+        self._load(upload_id, user_id)
+        with self._state(upload_id).lock:
+            meta = self._load(upload_id, user_id)
+            if not meta['finalized']:
+                raise UploadError('Upload not finalized', 409)
+            meta['updated_at'] = time.time()
+            self._save(meta)
+        return os.path.join(self._dir(upload_id), meta['filename']), meta['filename']
+
+    def file_storage(self, upload_id, user_id='default'):
+        """已完成上传包装成 FileStorage，可以直接交给原来处理 request.files 的代码（用完需 close）"""
+        path, filename = self.path(upload_id, user_id)
+        return FileStorage(stream=open(path, 'rb'), filename=filename)
+
+    # ---------- 清理 ----------
+
+    def collect_garbage(self, force=False):
+        """删除过期会话；默认每分钟最多扫描一次"""
+        now = time.time()
+        if not force and now - self._last_gc < 60:
+            return 0
+        self._last_gc = now
+        pending_ttl = float(os.getenv('UPLOAD_SESSION_TTL_SECONDS', 24 * 3600))
+        finalized_ttl = float(os.getenv('UPLOAD_FINALIZED_TTL_SECONDS', 3600))
+        removed = 0
+        for upload_id in os.listdir(self.root):
+            try:
+                meta = self._load(upload_id)
+                expired = now - meta['updated_at'] > (finalized_ttl if meta['finalized'] else pending_ttl)
+            except UploadError:
+                # 没有 meta.json 的残留目录（init 中途失败）
+                directory = os.path.join(self.root, upload_id)
+                expired = os.path.isdir(directory) and now - os.path.getmtime(directory) > pending_ttl
+            if expired:
+                shutil.rmtree(os.path.join(self.root, upload_id), ignore_errors=True)
+                self._forget(upload_id)
+                removed += 1
+        if removed:
+            print(f"[UPLOAD] Removed {removed} expired upload session(s)")
+        return removed
+
+
+# 创建单例实例
+upload_sessions = UploadSessions()
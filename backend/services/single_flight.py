@@ -0,0 +1,121 @@
+"""
+Single-flight request coalescing - identical concurrent AI operations share one call
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+from .resilience import DeadlineExceeded, remaining_budget
+
+
+def make_key(*parts):
+    """把逻辑操作（如 ('similar', user_id, error_id, count)）转换成稳定的 key"""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    进程内：同一个 key 只有一个 leader 真正执行，其它线程等待并共享结果。
+    跨 worker：leader 通过 db_sqlite 的 ai_request_lock 表加锁，并在完成后把结果
+    （JSON）保留 result_ttl 秒，其它 worker 的调用方轮询该表直接拿结果。
+    只合并在 leader 执行期间到达的调用：leader 完成后才到达的调用重新执行，不复用旧结果。
+    """
+
+    def __init__(self, poll_interval=0.2, result_ttl=10):
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, fn, ttl=120, shared=True):
+        """
+        Args:
+            key: make_key() 生成的 key
+            fn: 无参可调用对象，返回值需可 JSON 序列化（shared=True 时）
+            ttl: 跨 worker 锁的最长持有时间（秒），leader 崩溃后锁自动过期
+            shared: 是否跨 worker 协调
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            # 跟随者最多等到自己请求的截止时间
+            if not call.event.wait(timeout=remaining_budget()):
+                raise DeadlineExceeded(f"Deadline exceeded waiting for in-flight request {key[:12]}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_across_workers(key, fn, ttl) if shared else fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def _run_across_workers(self, key, fn, ttl):
+        import db_sqlite
+
+        owner = f"{os.getpid()}:{threading.get_ident()}:{uuid.uuid4().hex[:8]}"
+        wait_until = time.monotonic() + min(ttl, remaining_budget(ttl))
+        acquired = False
+        seen_running = False
+
+        while True:
+            try:
+                # 第一次看到的若是已完成的结果，说明那次调用在本调用到达前就结束了：替换掉重新执行
+                state, result = db_sqlite.acquire_request_lock(key, owner, ttl, replace_done=not seen_running)
+            except Exception as e:
+                # 锁表不可用时退化为仅进程内合并
+                print(f"[SINGLE_FLIGHT] lock table unavailable: {e}")
+                return fn()
+
+            if state == 'acquired':
+                acquired = True
+                break
+            if state == 'done' and result is not None:
+                return json.loads(result)
+            seen_running = True
+            if time.monotonic() >= wait_until:
+                break
+            time.sleep(self.poll_interval)
+
+        try:
+            result = fn()
+        except Exception:
+            if acquired:
+                db_sqlite.release_request_lock(key, owner)
+            raise
+
+        if acquired:
+            try:
+                db_sqlite.complete_request_lock(
+                    key, owner, json.dumps(result, ensure_ascii=False), self.result_ttl
+                )
+            except (TypeError, ValueError):
+                db_sqlite.release_request_lock(key, owner)
+        return result
+
+
+# 创建单例实例
+single_flight = SingleFlight()
@@ -0,0 +1,248 @@
+"""
+Streaming transcription - live microphone PCM forwarded to Xfyun as it arrives, partial / final results as events
+"""
+
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+import numpy as np
+
+from .ai_service import ai_service
+from .audio_segments import frame_energy, stitch_transcripts
+
+FRAME_BYTES = 1280  # 40ms of 16kHz 16-bit mono PCM
+
+
+def _session_bytes():
+    """讯飞单次会话最长 60 秒音频，提前切换到新会话"""
+    return int(float(os.getenv('ASR_STREAM_SESSION_SECONDS', 55)) * 32000)
+
+
+def _rollover_window_bytes():
+    """会话最后这段时间内遇到停顿就提前切换，避免在词中间切断"""
+    return int(float(os.getenv('ASR_STREAM_ROLLOVER_WINDOW_SECONDS', 5)) * 32000)
+
+
+def _idle_seconds():
+    """超过这么久没有收到音频就当作录音结束"""
+    return float(os.getenv('ASR_STREAM_IDLE_SECONDS', 30))
+
+
+class TranscriptionStream:
+    """
+    一路实时转写。音频按 40ms 帧排队，后台线程连续开讯飞会话（每个约 55 秒）把帧转发出去；
+    每次识别结果变化产生 partial 事件，每个会话结束产生 final 事件，全部结束产生 done 事件。
+    会话失败时，这个会话已发出的帧会在下一个会话开头重发；重试次数用完仍未识别的音频时长记在 done 事件的 lost_seconds。
+    """
+
+    def __init__(self, language='zh_cn'):
+        self.id = uuid.uuid4().hex
+        self.language = language
+        self.created_at = time.time()
+        self.last_active = self.created_at
+        self.received_bytes = 0
+        self.finals = []  # 每个已结束会话的文字
+        self.text = ''
+        self.done = False
+        self.error = None
+        self._frames = queue.Queue()
+        self._pending = bytearray()
+        self._carry = None
+        self._sent_frames = []  # 当前会话已发出的帧，会话失败时重发
+        self._replay = deque()
+        self.lost_bytes = 0
+        self._speech_level = 0.0
+        self._end_of_audio = False
+        self._events = []
+        self._changed = threading.Condition()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    # ---------- 输入 ----------
+
+    def feed(self, data):
+        """追加一段 PCM（任意长度），凑满 40ms 的帧入队"""
+        with self._lock:
+            if self.done:
+                return
+            self.last_active = time.time()
+            self.received_bytes += len(data)
+            self._pending.extend(data)
+            while len(self._pending) >= FRAME_BYTES:
+                self._frames.put(bytes(self._pending[:FRAME_BYTES]))
+                del self._pending[:FRAME_BYTES]
+
+    def close(self):
+        """录音结束：剩余不足一帧的音频也发出去"""
+        with self._lock:
+            if self._pending:
+                self._frames.put(bytes(self._pending))
+                self._pending.clear()
+            self._frames.put(None)
+
+    # ---------- 事件 ----------
+
+    def _publish(self, kind, **data):
+        with self._changed:
+            self._events.append(dict(data, type=kind, seq=len(self._events) + 1))
+            self._changed.notify_all()
+
+    def events_after(self, seq, timeout):
+        """seq 之后的事件；没有新事件时最多等待 timeout 秒"""
+        with self._changed:
+            if len(self._events) <= seq and not self.done:
+                self._changed.wait(timeout)
+            return self._events[seq:]
+
+    def wait(self, timeout):
+        with self._changed:
+            self._changed.wait_for(lambda: self.done, timeout)
+        return self.done
+
+    # ---------- 后台会话 ----------
+
+    def _next_frame(self, sent):
+        """给讯飞会话的帧来源；会话音频达到上限或录音结束时返回 None"""
+        if sent[0] >= _session_bytes():
+            return None
+        if self._replay:
+            # 上一个会话失败：先重发它的帧
+            chunk = self._replay.popleft()
+            self._sent_frames.append(chunk)
+            sent[0] += len(chunk)
+            return chunk
+        if self._carry is not None:
+            # 上一个会话留下的帧，直接作为本会话的第一帧
+            chunk, self._carry = self._carry, None
+            self._sent_frames.append(chunk)
+            sent[0] += len(chunk)
+            return chunk
+        if self._end_of_audio:
+            return None
+        try:
+            chunk = self._frames.get(timeout=_idle_seconds())
+        except queue.Empty:
+            chunk = None
+        if chunk is None:
+            self._end_of_audio = True
+            return None
+        energy = frame_energy(chunk)
+        level = float(energy.max()) if len(energy) else 0.0
+        self._speech_level = max(level, self._speech_level * 0.999)
+        window = min(_rollover_window_bytes(), _session_bytes() // 2)
+        if sent[0] >= _session_bytes() - window and level < self._speech_level * 0.1:
+            # 接近会话上限且正好是停顿：这一帧留给下一个会话
+            self._carry = chunk
+            sent[0] = _session_bytes()
+            return None
+        self._sent_frames.append(chunk)
+        sent[0] += len(chunk)
+        return chunk
+
+    def _probe_language(self):
+        """
+        language='auto'：先攒 ASR_LANGUAGE_PROBE_SECONDS 秒音频做语种探测（与上传转写相同），
+        攒下的帧放进重发队列，作为第一个会话的开头。第一条中间结果因此晚到约两倍探测时长
+        """
+        probe_bytes = int(float(os.getenv('ASR_LANGUAGE_PROBE_SECONDS', 6)) * 32000)
+        frames = []
+        size = 0
+        while size < probe_bytes:
+            try:
+                chunk = self._frames.get(timeout=_idle_seconds())
+            except queue.Empty:
+                chunk = None
+            if chunk is None:
+                self._end_of_audio = True
+                break
+            frames.append(chunk)
+            size += len(chunk)
+        if frames:
+            self.language = ai_service.detect_language(b''.join(frames)) or 'zh_cn'
+        else:
+            self.language = 'zh_cn'
+        self._replay.extend(frames)
+        print(f"[ASR_STREAM] {self.id} language: {self.language}")
+
+    def _run(self):
+        failures = 0
+        if self.language == 'auto':
+            self._probe_language()
+        while not self._end_of_audio or self._replay:
+            # 有音频时才开会话（讯飞连接建立后 10 秒内没有音频会断开）
+            if self._carry is None and not self._replay:
+                try:
+                    self._carry = self._frames.get(timeout=_idle_seconds())
+                except queue.Empty:
+                    self._carry = None
+            if self._carry is None and not self._replay:
+                break
+
+            segment = len(self.finals)
+            sent = [0]
+            self._sent_frames = []
+            text, error = ai_service.stream_xfyun(
+                lambda: self._next_frame(sent),
+                self.language,
+                on_update=lambda partial: self._publish('partial', segment=segment, text=partial)
+            )
+            if error:
+                failures += 1
+                print(f"[ASR_STREAM] {self.id} session {segment} failed: {error}")
+                self._publish('error', segment=segment, error=error)
+                # 已发出的帧放回重发队列最前面（还没来得及重发的帧排在后面）
+                self._replay.extendleft(reversed(self._sent_frames))
+                if failures >= int(os.getenv('ASR_STREAM_MAX_FAILURES', 3)):
+                    self.error = error
+                    self.lost_bytes += sum(len(frame) for frame in self._replay)
+                    self._replay.clear()
+                    break
+                continue
+            failures = 0
+            self.finals.append(text or '')
+            # 会话之间没有重叠音频，直接拼接，不做去重
+            self.text = stitch_transcripts(self.finals)
+            self._publish('final', segment=segment, text=text or '')
+
+        self._end_of_audio = True
+        self.done = True
+        self._publish('done', text=self.text, error=self.error, lost_seconds=round(self.lost_bytes / 32000, 2))
+
+
+class TranscriptionStreams:
+    """进程内的实时转写注册表；结束或空闲的流在 ASR_STREAM_TTL_SECONDS 后清理"""
+
+    def __init__(self):
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def create(self, language='zh_cn'):
+        self._cleanup()
+        with self._lock:
+            active = sum(1 for stream in self._streams.values() if not stream.done)
+            if active >= int(os.getenv('ASR_STREAM_MAX_ACTIVE', 20)):
+                return None
+            stream = TranscriptionStream(language)
+            self._streams[stream.id] = stream
+        return stream
+
+    def get(self, stream_id):
+        with self._lock:
+            return self._streams.get(stream_id)
+
+    def _cleanup(self):
+        ttl = float(os.getenv('ASR_STREAM_TTL_SECONDS', 600))
+        now = time.time()
+        with self._lock:
+            for stream_id in [i for i, s in self._streams.items() if now - s.last_active > ttl]:
+                stream = self._streams.pop(stream_id)
+                if not stream.done:
+                    stream.close()
+
+
+# 创建单例实例
+transcription_streams = TranscriptionStreams()
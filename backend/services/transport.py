@@ -0,0 +1,204 @@
+"""
+AI Transport - long-lived, pooled HTTP clients per provider (created lazily)
+"""
+
+import base64
+import mimetypes
+import os
+import threading
+from types import SimpleNamespace
+
+from .cassette import cassette
+
+# provider -> (base URL 环境变量, 默认 base URL, API key 环境变量)
+PROVIDERS = {
+    'deepseek': ('DEEPSEEK_BASE_URL', 'https://api.deepseek.com', 'DEEPSEEK_API_KEY'),
+    'whisper': ('OPENAI_BASE_URL', 'https://api.openai.com/v1', 'OPENAI_API_KEY'),
+    'dashscope': ('DASHSCOPE_BASE_URL', 'https://dashscope.aliyuncs.com/api/v1', 'DASHSCOPE_API_KEY'),
+}
+
+DASHSCOPE_MULTIMODAL_PATH = '/services/aigc/multimodal-generation/generation'
+
+
+class DashScopeResponse:
+    """与 dashscope SDK 的 MultiModalConversation 返回对象同形，调用方无需改动"""
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.code = body.get('code', '')
+        self.message = body.get('message', '')
+        self.request_id = body.get('request_id', '')
+        self.usage = body.get('usage')
+        choices = []
+        for choice in (body.get('output') or {}).get('choices', []):
+            message = choice.get('message') or {}
+            choices.append(SimpleNamespace(
+                finish_reason=choice.get('finish_reason'),
+                message=SimpleNamespace(
+                    role=message.get('role', 'assistant'),
+                    content=message.get('content') or []
+                )
+            ))
+        self.output = SimpleNamespace(choices=choices)
+
+
+def _inline_local_images(messages):
+    """把 file:// 图片转换成 base64 data URI（原生 HTTP 接口不会替我们上传本地文件）"""
+    inlined = []
+    for message in messages:
+        content = message.get('content')
+        if not isinstance(content, list):
+            inlined.append(message)
+            continue
+        items = []
+        for item in content:
+            image = item.get('image') if isinstance(item, dict) else None
+            if image and image.startswith('file://'):
+                path = image[len('file://'):]
+                mime = mimetypes.guess_type(path)[0] or 'image/png'
+                with open(path, 'rb') as f:
+                    encoded = base64.b64encode(f.read()).decode('ascii')
+                item = {**item, 'image': f'data:{mime};base64,{encoded}'}
+            items.append(item)
+        inlined.append({**message, 'content': items})
+    return inlined
+
+
+class AITransport:
+    """
+    每个 provider 一个长连接池化的 HTTP 客户端，首次使用时才创建：
+    - DeepSeek / Whisper: OpenAI SDK + 共享的 httpx.Client
+    - DashScope: 共享的 requests.Session（原生 HTTP 接口）
+    AI_CASSETTE_MODE 开启时，传输层会被包装成录制 / 回放（见 services/cassette.py）。
+    这样 TLS 握手在请求之间复用，且 import services 时不做任何网络客户端初始化。
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    # ---------- 配置 ----------
+
+    def _provider_config(self, provider):
+        """内置 provider 或 AI_PROVIDER_<NAME>_BASE_URL / _API_KEY 配置的额外 OpenAI 兼容 provider"""
+        if provider in PROVIDERS:
+            return PROVIDERS[provider]
+        prefix = f'AI_PROVIDER_{provider.upper()}'
+        return (f'{prefix}_BASE_URL', None, f'{prefix}_API_KEY')
+
+    def base_url(self, provider):
+        env_name, default, _ = self._provider_config(provider)
+        return os.getenv(env_name) or default
+
+    def api_key(self, provider):
+        return os.getenv(self._provider_config(provider)[2])
+
+    def model(self, provider, default):
+        """provider 对应的模型名（AI_PROVIDER_<NAME>_MODEL），未配置时沿用调用方的模型"""
+        return os.getenv(f'AI_PROVIDER_{provider.upper()}_MODEL') or default
+
+    def connect_timeout(self):
+        return float(os.getenv('AI_CONNECT_TIMEOUT', 5))
+
+    def read_timeout(self):
+        return float(os.getenv('AI_READ_TIMEOUT', 120))
+
+    def _pool_size(self):
+        return int(os.getenv('AI_POOL_MAXSIZE', 20))
+
+    # ---------- 客户端 ----------
+
+    def _get_or_create(self, name, factory):
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                client = factory()
+                self._clients[name] = client
+            return client
+
+    def openai_client(self, provider):
+        """OpenAI 兼容客户端（deepseek / whisper / 额外文本 provider），SDK 重试关闭，由 resilience 层负责"""
+        def _factory():
+            import httpx
+            from openai import OpenAI
+
+            limits = httpx.Limits(
+                max_connections=self._pool_size(),
+                max_keepalive_connections=self._pool_size(),
+                keepalive_expiry=float(os.getenv('AI_KEEPALIVE_SECONDS', 60))
+            )
+            http_transport = httpx.HTTPTransport(limits=limits)
+            if cassette.enabled():
+                http_transport = cassette.httpx_transport(provider, http_transport)
+            http_client = httpx.Client(
+                transport=http_transport,
+                timeout=httpx.Timeout(self.read_timeout(), connect=self.connect_timeout())
+            )
+            return OpenAI(
+                # 缺少 key 时不在构造阶段报错，调用时失败并走降级路径
+                api_key=self.api_key(provider) or 'missing-api-key',
+                base_url=self.base_url(provider),
+                max_retries=0,
+                http_client=http_client
+            )
+
+        return self._get_or_create(provider, _factory)
+
+    def http_session(self, provider):
+        """普通 HTTP provider 的共享 requests.Session"""
+        def _factory():
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter_kwargs = {'pool_connections': 1, 'pool_maxsize': self._pool_size(), 'max_retries': 0}
+            if cassette.enabled():
+                adapter = cassette.requests_adapter(provider, **adapter_kwargs)
+            else:
+                adapter = HTTPAdapter(**adapter_kwargs)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            return session
+
+        return self._get_or_create(f'{provider}:session', _factory)
+
+    def call_timeout(self, remaining):
+        """单次调用的 httpx 超时：读超时不超过剩余截止时间"""
+        import httpx
+        read = min(self.read_timeout(), remaining)
+        return httpx.Timeout(read, connect=min(self.connect_timeout(), read))
+
+    # ---------- DashScope ----------
+
+    def dashscope_multimodal(self, model, messages, api_key, timeout):
+        """
+        调用 DashScope 多模态生成接口（result_format=message）
+
+        Returns:
+            DashScopeResponse
+        """
+        url = self.base_url('dashscope').rstrip('/') + DASHSCOPE_MULTIMODAL_PATH
+        payload = {
+            'model': model,
+            'input': {'messages': _inline_local_images(messages)},
+            'parameters': {'result_format': 'message'}
+        }
+        read = min(self.read_timeout(), timeout)
+        response = self.http_session('dashscope').post(
+            url,
+            json=payload,
+            headers={'Authorization': f'Bearer {api_key}'},
+            timeout=(min(self.connect_timeout(), read), read)
+        )
+        try:
+            body = response.json()
+        except ValueError:
+            body = {'code': str(response.status_code), 'message': response.text[:200]}
+        return DashScopeResponse(response.status_code, body)
+
+
+# 创建单例实例
+transport = AITransport()
@@ -0,0 +1,182 @@
+"""
+Voice activity trimming - energy / zero-crossing VAD that compresses long pauses before speech recognition
+"""
+
+import os
+from collections import deque
+
+import numpy as np
+
+from .audio_segments import FRAME_MS, SAMPLE_RATE, SAMPLE_WIDTH, frame_energy
+
+HISTORY_FRAMES = 1500  # 阈值按最近 30 秒的帧统计，适应录音过程中底噪的变化
+EXTEND_FRAMES = 12  # 语音段两侧 240ms 内按较低阈值 / 过零率继续延伸（清辅音、弱尾音）
+
+
+def vad_enabled():
+    return os.getenv('ASR_VAD_ENABLED', '1').lower() not in ('0', 'false', 'no')
+
+
+def zero_crossing_rate(audio_data, sample_rate=SAMPLE_RATE):
+    """16-bit 单声道 PCM 按 20ms 分帧的过零率（0~1）"""
+    samples = np.frombuffer(audio_data[:len(audio_data) - len(audio_data) % SAMPLE_WIDTH], dtype='<i2')
+    frame = sample_rate * FRAME_MS // 1000
+    count = len(samples) // frame
+    if count == 0:
+        return np.zeros(0)
+    signs = np.signbit(samples[:count * frame].reshape(count, frame))
+    return (signs[:, 1:] != signs[:, :-1]).mean(axis=1)
+
+
+def _dilate(mask, radius):
+    """布尔掩码向两侧扩展 radius 帧"""
+    if not mask.any() or radius <= 0:
+        return mask
+    # full 再截取：掩码比卷积核短（小块）时 mode='same' 返回的是核的长度
+    full = np.convolve(mask.astype(np.int32), np.ones(2 * radius + 1, dtype=np.int32))
+    return full[radius:radius + len(mask)] > 0
+
+
+class SilenceTrimmer:
+    """
+    流式 VAD：逐块接收 PCM，按 20ms 帧计算能量和过零率判断是否为语音，
+    超过 keep_silence 的静音段压缩为 keep_silence（前后各留一半作为句间停顿，
+    后续 split_on_silence 仍能在这些停顿处切段），其余音频原样输出。
+    只持有一个块和不超过 keep_silence / 2 的静音，内存与录音长度无关。
+    """
+
+    def __init__(self, keep_silence=None, sample_rate=SAMPLE_RATE):
+        if keep_silence is None:
+            keep_silence = float(os.getenv('ASR_VAD_KEEP_SILENCE_SECONDS', 0.6))
+        self.sample_rate = sample_rate
+        self.frame_bytes = sample_rate * FRAME_MS // 1000 * SAMPLE_WIDTH
+        self.pad = max(1, int(keep_silence * 1000 / FRAME_MS) // 2)
+        self.min_rms = float(os.getenv('ASR_VAD_MIN_RMS', 100))
+        self._energy_history = deque(maxlen=HISTORY_FRAMES)
+        self._zcr_history = deque(maxlen=HISTORY_FRAMES)
+        self._remainder = b''
+        self._held = bytearray()  # 当前静音段末尾最多 pad 帧，下一段语音到来时作为前导
+        self._silent_run = 0  # 当前静音段已经过的帧数（含 _held）
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.compressed_pauses = 0
+
+    # ---------- 判决 ----------
+
+    def _speech_mask(self, energy, zcr):
+        self._energy_history.extend(energy.tolist())
+        self._zcr_history.extend(zcr.tolist())
+        history = np.fromiter(self._energy_history, dtype=np.float64)
+        noise = np.percentile(history, 10)
+        speech_level = np.percentile(history, 90)
+        # 双门限：高门限确定语音，低门限只在语音附近延伸
+        if speech_level < noise * 2:
+            # 动态范围很小（录音开头只有底噪，或整段一直有声音）：分不出停顿，只去掉低于 min_rms 的静音，
+            # 不能拿固定的“语音电平”比较，否则轻声但平稳的讲话会被整段删掉
+            upper = self.min_rms
+        else:
+            upper = max(self.min_rms, noise * 2, min(max(noise * 3, speech_level * 0.1), speech_level * 0.5))
+        lower = max(self.min_rms, (noise + upper) / 2 if upper > noise else upper)
+        zcr_history = np.fromiter(self._zcr_history, dtype=np.float64)
+        quiet_zcr = zcr_history[history <= max(noise * 1.5, self.min_rms)]
+        # 清辅音能量低但过零率明显高于背景
+        zcr_limit = quiet_zcr.mean() + 2 * quiet_zcr.std() if len(quiet_zcr) > 10 else 0.5
+        primary = energy > upper
+        candidate = (energy > lower) | ((zcr > zcr_limit) & (energy > self.min_rms))
+        return primary | (_dilate(primary, EXTEND_FRAMES) & candidate)
+
+    # ---------- 流式处理 ----------
+
+    def process(self, chunk):
+        """处理一块 PCM，返回压缩静音后可以立即输出的音频"""
+        self.input_bytes += len(chunk)
+        data = self._remainder + bytes(chunk) if self._remainder else chunk
+        usable = len(data) - len(data) % self.frame_bytes
+        self._remainder = bytes(data[usable:])
+        if usable == 0:
+            return b''
+        with memoryview(data) as view:
+            frames = view[:usable]
+            speech = self._speech_mask(frame_energy(frames, self.sample_rate),
+                                       zero_crossing_rate(frames, self.sample_rate))
+            out = self._emit(frames, speech)
+            frames.release()
+        self.output_bytes += len(out)
+        return out
+
+    def _emit(self, frames, speech):
+        count = len(speech)
+        index = np.arange(count)
+        # 距上一个语音帧的帧数（块开头的静音接着上一块的静音计数）
+        last = np.maximum.accumulate(np.where(speech, index, -1))
+        since = np.where(last >= 0, index - last, index + 1 + self._silent_run)
+        # 距下一个语音帧的帧数（块尾的静音暂时未知，按无穷大处理）
+        following = np.minimum.accumulate(np.where(speech, index, count)[::-1])[::-1]
+        until = np.where(following < count, following - index, np.iinfo(np.int64).max)
+        keep = (since <= self.pad) | (until <= self.pad)
+
+        out = bytearray()
+        if speech.any():
+            # 上一块末尾保留的静音正好是这段语音的前导
+            voiced = np.flatnonzero(speech)
+            first = int(voiced[0])
+            lead = len(self._held) // self.frame_bytes
+            out += self._held[max(0, lead - max(0, self.pad - first)) * self.frame_bytes:]
+            self._held.clear()
+            # 被压缩的停顿：块开头接上一块的静音 + 块内语音帧之间的长间隔
+            gaps = np.diff(voiced) - 1
+            self.compressed_pauses += int(self._silent_run + first > 2 * self.pad) + int((gaps > 2 * self.pad).sum())
+
+        # 保留的帧连成区间，一次拷贝一段
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], keep.view(np.int8), [0]))))
+        for start, end in zip(edges[::2], edges[1::2]):
+            out += frames[start * self.frame_bytes:end * self.frame_bytes]
+
+        if speech.any():
+            self._silent_run = count - 1 - int(voiced[-1])
+        else:
+            self._silent_run += count
+        # 块尾不在前导保留范围内的静音：只留最后 pad 帧，等待下一段语音
+        trailing_start = count - min(self._silent_run, count)
+        dropped = np.flatnonzero(~keep[trailing_start:])
+        if len(dropped):
+            self._held += frames[(trailing_start + int(dropped[0])) * self.frame_bytes:]
+            del self._held[:max(0, len(self._held) - self.pad * self.frame_bytes)]
+        return bytes(out)
+
+    def flush(self):
+        """录音结束：不足一帧的零头原样输出，结尾的长静音丢弃"""
+        out, self._remainder = self._remainder, b''
+        self._held.clear()
+        self.output_bytes += len(out)
+        return out
+
+    def trim(self, chunks):
+        """包装 PCM 块生成器，产出压缩静音后的块"""
+        for chunk in chunks:
+            out = self.process(chunk)
+            if out:
+                yield out
+        tail = self.flush()
+        if tail:
+            yield tail
+
+    def report(self):
+        bytes_per_second = self.sample_rate * SAMPLE_WIDTH
+        removed = max(0, self.input_bytes - self.output_bytes)
+        return {
+            'input_seconds': round(self.input_bytes / bytes_per_second, 2),
+            'kept_seconds': round(self.output_bytes / bytes_per_second, 2),
+            'removed_seconds': round(removed / bytes_per_second, 2),
+            'removed_ratio': round(removed / self.input_bytes, 3) if self.input_bytes else 0.0,
+            'compressed_pauses': self.compressed_pauses
+        }
+
+
+def trim_silence(audio_data, keep_silence=None, sample_rate=SAMPLE_RATE):
+    """整段 PCM 的静音压缩，返回 (trimmed_audio, report)"""
+    trimmer = SilenceTrimmer(keep_silence, sample_rate)
+    step = 5 * sample_rate * SAMPLE_WIDTH  # 与流式解码相同的 5 秒一块，阈值随录音推进更新
+    with memoryview(audio_data) as view:
+        trimmed = b''.join(trimmer.trim(view[i:i + step] for i in range(0, len(view), step)))
+    return trimmed, trimmer.report()
@@ -0,0 +1,12 @@
+"""
+Local AI provider simulator for offline load testing
+
+Serves stand-ins for the DeepSeek (OpenAI-compatible), DashScope Qwen-VL,
+OpenAI Whisper and Xfyun iat APIs with configurable latency, errors and responses.
+Run with: python -m simulator --port 8900 [--config simulator.json] [--seed 42]
+"""
+
+from .config import DEFAULT_CONFIG, load_config
+from .server import SimulatorServer
+
+__all__ = ['DEFAULT_CONFIG', 'load_config', 'SimulatorServer']
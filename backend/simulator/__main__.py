@@ -0,0 +1,34 @@
+"""
+python -m simulator - start the local AI provider simulator
+"""
+
+import argparse
+
+from .server import SimulatorServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local DeepSeek / DashScope / Whisper / Xfyun simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--config', help='JSON file overriding latency, error rates and response rules')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible latency and fault injection')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args()
+
+    server = SimulatorServer(args.host, args.port, config_path=args.config, seed=args.seed, verbose=args.verbose)
+    print(f"AI simulator listening on {server.url}")
+    print("Point the backend at it with:")
+    for key, value in server.env().items():
+        print(f"  export {key}={value}")
+    print("(unset OPENAI_API_KEY to exercise the Xfyun iat path instead of Whisper)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
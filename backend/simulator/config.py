@@ -0,0 +1,229 @@
+"""
+Simulator configuration - per-endpoint latency distributions, error injection and response rules
+"""
+
+import copy
+import json
+import math
+import random
+import threading
+
+# 每个 endpoint 的默认配置；用户配置文件按 endpoint 深度合并，rules 会排在默认规则之前
+DEFAULT_CONFIG = {
+    'seed': None,
+    'endpoints': {
+        # OpenAI 兼容 chat completions（DeepSeek）
+        'chat': {
+            'latency': {'dist': 'lognormal', 'median_ms': 800, 'sigma': 0.4},
+            'error_rate': 0.0,
+            'error_statuses': [429, 500, 503],
+            'timeout_rate': 0.0,
+            'timeout_seconds': 300,
+            # 流式响应：每个 chunk 的字符数与间隔
+            'stream_chunk_chars': 8,
+            'stream_interval_ms': 20,
+            'rules': [
+                {
+                    'match': r'Condense one part of a long document',
+                    'content': '- Key concept\n  - Definition\n  - Worked example\n- Related formula\n  - When to use it'
+                },
+                {
+                    'match': r'Update the running summary',
+                    'content': 'The student is reviewing course material and asked several follow-up questions.'
+                },
+                {
+                    'match': r'Layout: graph (?P<dir>TD|LR)',
+                    'content': (
+                        'graph ${dir}\n'
+                        '    ROOT[Simulated Topic]\n'
+                        '    A[Core Concept]\n'
+                        '    B[Key Method]\n'
+                        '    A1[Definition]\n'
+                        '    B1[Worked Example]\n'
+                        '    ROOT --> A\n'
+                        '    ROOT --> B\n'
+                        '    A --> A1\n'
+                        '    B --> B1'
+                    )
+                },
+                {
+                    'match': r'(?i)mindmap syntax|only mindmap code',
+                    'content': (
+                        'mindmap\n'
+                        '  root((Simulated Topic))\n'
+                        '    Core Concept\n'
+                        '      Definition\n'
+                        '      Properties\n'
+                        '    Key Method\n'
+                        '      Worked Example'
+                    )
+                },
+                {
+                    'match': r'相似练习题',
+                    'content': json.dumps([
+                        {
+                            'subject': 'Mathematics',
+                            'type': 'Single choice',
+                            'tags': ['Linear Equation'],
+                            'question_text': f'Solve for x: {n}x + 3 = {n * 2 + 3}',
+                            'analysis_steps': ['Subtract 3 from both sides', f'Divide both sides by {n}'],
+                            'correct_answer': 'x = 2'
+                        }
+                        for n in (2, 3, 4)
+                    ], ensure_ascii=False)
+                },
+                {
+                    'match': r'Grade each numbered student answer',
+                    'each': r'### Item (?P<index>\d+)',
+                    'content': '{"index": ${index}, "reason": "Simulated judgement.", "is_correct": true}'
+                },
+                {
+                    'match': r"(?i)judge whether the student's answer",
+                    'content': '{"reason": "Simulated judgement.", "is_correct": true}'
+                },
+                {
+                    'match': r'generate a structured study note',
+                    'content': json.dumps({
+                        'title': 'Simulated Note',
+                        'summary': 'A simulated summary of the learning content.',
+                        'key_points': ['Key point 1', 'Key point 2', 'Key point 3'],
+                        'examples': ['Example 1'],
+                        'detailed_notes': '## Simulated Note\n\n- Key point 1\n- Key point 2\n- Key point 3',
+                        'tags': ['simulated']
+                    })
+                },
+                {
+                    'match': r'(?s).*',
+                    'content': 'This is a simulated response from ${model}.'
+                }
+            ]
+        },
+        # DashScope MultiModalConversation（Qwen-VL）
+        'multimodal': {
+            'latency': {'dist': 'lognormal', 'median_ms': 1500, 'sigma': 0.4},
+            'error_rate': 0.0,
+            'error_statuses': [429, 500],
+            'timeout_rate': 0.0,
+            'timeout_seconds': 300,
+            'rules': [
+                {
+                    'match': r'识别题目内容',
+                    'content': json.dumps([{
+                        'subject': 'Mathematics',
+                        'type': 'Constructed-response question',
+                        'tags': ['Linear Equation'],
+                        'difficulty': 'easy',
+                        'question_text': 'Solve for x: 2x + 3 = 7',
+                        'analysis_steps': ['Subtract 3 from both sides', 'Divide both sides by 2'],
+                        'correct_answer': 'x = 2',
+                        'user_answer': 'x = 2',
+                        'crop_index': []
+                    }])
+                },
+                {
+                    'match': r'逐题识别',
+                    'each': r'### 题目 (?P<index>\d+)',
+                    'content': (
+                        '{"index": ${index}, "correct_answer_and_analyse": "x = 2", '
+                        '"user_answer": "x = 2", "is_correct": true}'
+                    )
+                },
+                {
+                    'match': r'user_answer',
+                    'content': '{"correct_answer_and_analyse": "x = 2", "user_answer": "x = 2", "is_correct": true}'
+                },
+                {
+                    'match': r'(?s).*',
+                    'content': 'Simulated OCR text.\nSecond line of recognized text.'
+                }
+            ]
+        },
+        # OpenAI Whisper audio transcriptions
+        'transcription': {
+            'latency': {'dist': 'lognormal', 'median_ms': 2000, 'sigma': 0.3},
+            'error_rate': 0.0,
+            'error_statuses': [429, 500],
+            'timeout_rate': 0.0,
+            'timeout_seconds': 300,
+            'rules': [
+                {'match': r'(?s).*', 'content': 'This is a simulated transcript.'}
+            ]
+        },
+        # 讯飞 iat websocket（按 business.language 匹配）
+        'iat': {
+            'latency': {'dist': 'uniform', 'min_ms': 100, 'max_ms': 300},
+            'error_rate': 0.0,
+            'error_codes': [10165, 10313],
+            'timeout_rate': 0.0,
+            'timeout_seconds': 300,
+            'rules': [
+                {'match': r'^en_us$', 'content': 'this is a simulated transcript'},
+                {'match': r'(?s).*', 'content': '这是模拟的语音识别结果'}
+            ]
+        }
+    }
+}
+
+
+def _merge(base, override):
+    merged = dict(base)
+    for key, value in override.items():
+        if key == 'rules':
+            merged[key] = list(value) + list(base.get(key, []))
+        elif isinstance(value, dict) and isinstance(base.get(key), dict) and key != 'latency':
+            merged[key] = _merge(base[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def load_config(path=None, seed=None):
+    """
+    加载配置：默认配置 + 可选 JSON 文件覆盖
+
+    Args:
+        path: JSON 配置文件路径
+        seed: 随机种子（优先于配置文件中的 seed）
+    """
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            config = _merge(config, json.load(f))
+    if seed is not None:
+        config['seed'] = seed
+    return config
+
+
+class Sampler:
+    """共享的带锁随机数源：固定 seed 且请求顺序相同时，延迟和故障注入序列可复现"""
+
+    def __init__(self, seed=None):
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def latency(self, spec):
+        """按分布采样延迟（秒）"""
+        with self._lock:
+            dist = spec.get('dist', 'fixed')
+            if dist == 'fixed':
+                ms = spec.get('ms', 0)
+            elif dist == 'uniform':
+                ms = self._rng.uniform(spec.get('min_ms', 0), spec.get('max_ms', 0))
+            elif dist == 'normal':
+                ms = self._rng.gauss(spec.get('mean_ms', 0), spec.get('std_ms', 0))
+            elif dist == 'lognormal':
+                ms = self._rng.lognormvariate(math.log(max(spec.get('median_ms', 1), 1e-3)), spec.get('sigma', 0))
+            else:
+                raise ValueError(f"Unknown latency distribution: {dist}")
+        ms = min(ms, spec.get('max_cap_ms', ms))
+        return max(ms, 0) / 1000.0
+
+    def chance(self, rate):
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < rate
+
+    def choice(self, items):
+        with self._lock:
+            return self._rng.choice(items)
@@ -0,0 +1,418 @@
+"""
+Simulator server - OpenAI-compatible, DashScope and Xfyun iat stand-ins on one local port
+"""
+
+import base64
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from string import Template
+
+from . import websocket
+from .config import Sampler, load_config
+
+DASHSCOPE_MULTIMODAL_PATH = '/services/aigc/multimodal-generation/generation'
+IAT_PATH = '/v2/iat'
+
+
+def render_response(rules, text, context):
+    """
+    按顺序匹配规则，返回第一条命中规则渲染后的内容（模板变量：上下文 + 正则命名分组）。
+    规则带 each 时，对 each 的每个匹配渲染一次 content，拼成 JSON 数组（用于批量请求）。
+    """
+    for rule in rules:
+        match = re.search(rule.get('match', r'(?s).*'), text)
+        if match:
+            values = dict(context)
+            values.update({k: v for k, v in match.groupdict().items() if v is not None})
+            template = Template(rule.get('content', ''))
+            if rule.get('each'):
+                items = []
+                for item in re.finditer(rule['each'], text):
+                    item_values = dict(values)
+                    item_values.update({k: v for k, v in item.groupdict().items() if v is not None})
+                    items.append(template.safe_substitute(item_values))
+                return '[' + ', '.join(items) + ']'
+            return template.safe_substitute(values)
+    return ''
+
+
+def _message_text(content):
+    """OpenAI 的字符串 content 或 DashScope / OpenAI 的多段 content 统一转成文本"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return '\n'.join(
+            item.get('text', '') for item in content if isinstance(item, dict) and item.get('text')
+        )
+    return ''
+
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+class SimulatorStats:
+    """按 endpoint 统计请求数、注入的错误和超时，以及客户端中途断开（如对冲取消）的次数"""
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def incr(self, endpoint, field):
+        with self._lock:
+            counts = self._counts.setdefault(endpoint, {'requests': 0, 'errors': 0, 'timeouts': 0, 'disconnects': 0})
+            counts[field] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(counts) for name, counts in self._counts.items()}
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'AIStudySimulator/1.0'
+
+    # ---------- 通用 ----------
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _profile(self, endpoint):
+        return self.server.config['endpoints'][endpoint]
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_text(self, status, text):
+        payload = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _inject(self, endpoint):
+        """
+        按 endpoint 配置注入延迟与故障
+
+        Returns:
+            None 表示正常响应；'timeout' 表示挂起后断开；int 表示要返回的错误码
+        """
+        profile = self._profile(endpoint)
+        sampler = self.server.sampler
+        self.server.stats.incr(endpoint, 'requests')
+
+        if sampler.chance(profile.get('timeout_rate', 0)):
+            self.server.stats.incr(endpoint, 'timeouts')
+            time.sleep(profile.get('timeout_seconds', 300))
+            self.close_connection = True
+            return 'timeout'
+
+        time.sleep(sampler.latency(profile.get('latency', {})))
+
+        if sampler.chance(profile.get('error_rate', 0)):
+            self.server.stats.incr(endpoint, 'errors')
+            return sampler.choice(profile.get('error_statuses') or profile.get('error_codes') or [500])
+        return None
+
+    def _context(self, **extra):
+        context = {'n': next(self.server.counter), 'time': int(time.time())}
+        context.update(extra)
+        return context
+
+    # ---------- 路由 ----------
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path.endswith(IAT_PATH) and self.headers.get('Upgrade', '').lower() == 'websocket':
+            return self._handle_iat()
+        if path == '/_simulator/health':
+            return self._send_json(200, {'status': 'ok'})
+        if path == '/_simulator/stats':
+            return self._send_json(200, self.server.stats.snapshot())
+        self._send_json(404, {'error': {'message': f'Unknown path {path}'}})
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0].rstrip('/')
+        if path.endswith('/chat/completions'):
+            endpoint, handler = 'chat', self._handle_chat
+        elif path.endswith('/audio/transcriptions'):
+            endpoint, handler = 'transcription', self._handle_transcription
+        elif path.endswith(DASHSCOPE_MULTIMODAL_PATH):
+            endpoint, handler = 'multimodal', self._handle_multimodal
+        else:
+            self._read_body()
+            return self._send_json(404, {'error': {'message': f'Unknown path {path}'}})
+        try:
+            handler()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端已放弃（超时、截止时间或对冲取消）
+            self.server.stats.incr(endpoint, 'disconnects')
+            self.close_connection = True
+
+    # ---------- OpenAI chat completions ----------
+
+    def _handle_chat(self):
+        request = json.loads(self._read_body() or b'{}')
+        model = request.get('model', 'simulated-model')
+        prompt = '\n'.join(_message_text(m.get('content')) for m in request.get('messages', []))
+
+        outcome = self._inject('chat')
+        if outcome == 'timeout':
+            return
+        if outcome is not None:
+            return self._send_json(outcome, {'error': {
+                'message': f'Simulated error {outcome}', 'type': 'simulated_error', 'code': outcome
+            }})
+
+        context = self._context(model=model, prompt_excerpt=prompt[-80:])
+        content = render_response(self._profile('chat')['rules'], prompt, context)
+        completion_id = f"chatcmpl-sim-{context['n']}"
+
+        if request.get('stream'):
+            return self._stream_chat(completion_id, model, content)
+
+        prompt_tokens, completion_tokens = _estimate_tokens(prompt), _estimate_tokens(content)
+        self._send_json(200, {
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': context['time'],
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'logprobs': None,
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        })
+
+    def _stream_chat(self, completion_id, model, content):
+        """SSE 流式输出（chunked 编码），首包延迟已在 _inject 中注入"""
+        profile = self._profile('chat')
+        size = max(1, int(profile.get('stream_chunk_chars', 8)))
+        interval = profile.get('stream_interval_ms', 20) / 1000.0
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def _chunk(delta, finish_reason=None):
+            return {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'logprobs': None, 'finish_reason': finish_reason}]
+            }
+
+        def _write_event(data):
+            payload = f"data: {data}\n\n".encode('utf-8')
+            self.wfile.write(f"{len(payload):x}\r\n".encode('ascii') + payload + b"\r\n")
+            self.wfile.flush()
+
+        _write_event(json.dumps(_chunk({'role': 'assistant', 'content': ''})))
+        for start in range(0, len(content), size):
+            time.sleep(interval)
+            _write_event(json.dumps(_chunk({'content': content[start:start + size]}), ensure_ascii=False))
+        _write_event(json.dumps(_chunk({}, 'stop')))
+        _write_event('[DONE]')
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    # ---------- OpenAI audio transcriptions ----------
+
+    def _handle_transcription(self):
+        body = self._read_body()
+        match = re.search(rb'name="response_format"\r\n\r\n([a-z_]+)', body)
+        response_format = match.group(1).decode('ascii') if match else 'json'
+
+        outcome = self._inject('transcription')
+        if outcome == 'timeout':
+            return
+        if outcome is not None:
+            return self._send_json(outcome, {'error': {
+                'message': f'Simulated error {outcome}', 'type': 'simulated_error', 'code': outcome
+            }})
+
+        text = render_response(self._profile('transcription')['rules'], '', self._context(bytes=len(body)))
+        if response_format == 'text':
+            return self._send_text(200, text)
+        self._send_json(200, {'text': text})
+
+    # ---------- DashScope MultiModalConversation ----------
+
+    def _handle_multimodal(self):
+        request = json.loads(self._read_body() or b'{}')
+        model = request.get('model', 'qwen-vl-plus')
+        messages = (request.get('input') or {}).get('messages', [])
+        prompt = '\n'.join(_message_text(m.get('content')) for m in messages)
+
+        outcome = self._inject('multimodal')
+        if outcome == 'timeout':
+            return
+        context = self._context(model=model, prompt_excerpt=prompt[-80:])
+        request_id = f"sim-{context['n']}"
+        if outcome is not None:
+            return self._send_json(outcome, {
+                'code': 'Throttling' if outcome == 429 else 'InternalError',
+                'message': f'Simulated error {outcome}',
+                'request_id': request_id
+            })
+
+        content = render_response(self._profile('multimodal')['rules'], prompt, context)
+        self._send_json(200, {
+            'request_id': request_id,
+            'output': {'choices': [{
+                'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': [{'text': content}]}
+            }]},
+            'usage': {'input_tokens': _estimate_tokens(prompt), 'output_tokens': _estimate_tokens(content)}
+        })
+
+    # ---------- 讯飞 iat websocket ----------
+
+    @staticmethod
+    def _iat_result(sn, text):
+        """第 sn 句结果；sn > 1 时替换之前的全部中间结果"""
+        result = {'sn': sn, 'ls': False, 'pgs': 'apd', 'ws': [{'bg': 0, 'cw': [{'w': text}]}]}
+        if sn > 1:
+            result.update(pgs='rpl', rg=[1, sn - 1])
+        return result
+
+    def _handle_iat(self):
+        self.close_connection = True
+        self.send_response(101, 'Switching Protocols')
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', websocket.accept_key(self.headers.get('Sec-WebSocket-Key', '')))
+        self.end_headers()
+        self.wfile.flush()
+
+        language = 'zh_cn'
+        audio_bytes = 0
+        # partial_seconds > 0 时每收到这么多秒音频推送一次中间结果（pgs=rpl 覆盖之前的结果）
+        partial_bytes = int(float(self._profile('iat').get('partial_seconds', 0)) * 32000)
+        sn = 0
+        try:
+            while True:
+                opcode, payload = websocket.read_message(self.rfile, self.wfile)
+                if opcode == websocket.OP_CLOSE:
+                    websocket.send_close(self.wfile)
+                    return
+                frame = json.loads(payload.decode('utf-8'))
+                language = (frame.get('business') or {}).get('language', language)
+                data = frame.get('data') or {}
+                audio_bytes += len(base64.b64decode(data.get('audio') or ''))
+                if data.get('status') == 2:
+                    break
+                if partial_bytes and audio_bytes >= (sn + 1) * partial_bytes:
+                    sn += 1
+                    text = render_response(self._profile('iat')['rules'], language,
+                                           {'language': language, 'audio_seconds': round(audio_bytes / 32000, 2)})
+                    websocket.send_text(self.wfile, json.dumps({
+                        'code': 0,
+                        'message': 'success',
+                        'data': {'status': 1, 'result': self._iat_result(sn, text[:max(1, len(text) * sn // (sn + 2))])}
+                    }, ensure_ascii=False))
+
+            context = self._context(language=language, audio_seconds=round(audio_bytes / 32000, 2))
+            sid = f"iat-sim-{context['n']}"
+            outcome = self._inject('iat')
+            if outcome == 'timeout':
+                return
+            if outcome is not None:
+                websocket.send_text(self.wfile, json.dumps({
+                    'code': outcome, 'message': f'Simulated error {outcome}', 'sid': sid
+                }))
+            else:
+                text = render_response(self._profile('iat')['rules'], language, context)
+                websocket.send_text(self.wfile, json.dumps({
+                    'code': 0,
+                    'message': 'success',
+                    'sid': sid,
+                    'data': {'status': 2, 'result': dict(self._iat_result(sn + 1, text), ls=True)}
+                }, ensure_ascii=False))
+            websocket.send_close(self.wfile)
+        except (ConnectionError, OSError, ValueError):
+            return
+
+
+class SimulatorServer:
+    """
+    本地 AI provider 模拟服务。示例：
+        server = SimulatorServer(port=8900).start()
+        os.environ.update(server.env())
+    """
+
+    def __init__(self, host='127.0.0.1', port=8900, config=None, config_path=None, seed=None, verbose=False):
+        self.config = config or load_config(config_path, seed)
+        self.httpd = ThreadingHTTPServer((host, port), SimulatorHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.config = self.config
+        self.httpd.sampler = Sampler(self.config.get('seed'))
+        self.httpd.stats = SimulatorStats()
+        self.httpd.counter = itertools.count(1)
+        self.httpd.verbose = verbose
+        self._thread = None
+
+    @property
+    def host(self):
+        return self.httpd.server_address[0]
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def stats(self):
+        return self.httpd.stats.snapshot()
+
+    def env(self):
+        """把 AIService 指向模拟器所需的环境变量"""
+        return {
+            'DEEPSEEK_BASE_URL': f"{self.url}/v1",
+            'DEEPSEEK_API_KEY': 'sim-deepseek-key',
+            'OPENAI_BASE_URL': f"{self.url}/v1",
+            'OPENAI_API_KEY': 'sim-openai-key',
+            'DASHSCOPE_BASE_URL': f"{self.url}/api/v1",
+            'DASHSCOPE_API_KEY': 'sim-dashscope-key',
+            'XFYUN_IAT_URL': f"ws://{self.host}:{self.port}{IAT_PATH}",
+        }
+
+    def start(self):
+        """后台线程启动"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='ai-simulator', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
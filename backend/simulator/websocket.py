@@ -0,0 +1,93 @@
+"""
+Minimal RFC 6455 server-side websocket helpers (stdlib only, enough for the Xfyun iat protocol)
+"""
+
+import base64
+import hashlib
+import struct
+
+_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+def accept_key(client_key):
+    digest = hashlib.sha1((client_key + _GUID).encode('ascii')).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def _read_exact(rfile, size):
+    data = rfile.read(size)
+    if len(data) < size:
+        raise ConnectionError('websocket closed by peer')
+    return data
+
+
+def read_frame(rfile):
+    """读取一帧，返回 (fin, opcode, payload)；客户端帧必须带掩码"""
+    b1, b2 = _read_exact(rfile, 2)
+    fin = bool(b1 & 0x80)
+    opcode = b1 & 0x0F
+    masked = bool(b2 & 0x80)
+    length = b2 & 0x7F
+    if length == 126:
+        length = struct.unpack('>H', _read_exact(rfile, 2))[0]
+    elif length == 127:
+        length = struct.unpack('>Q', _read_exact(rfile, 8))[0]
+    mask = _read_exact(rfile, 4) if masked else None
+    payload = _read_exact(rfile, length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return fin, opcode, payload
+
+
+def read_message(rfile, wfile):
+    """
+    读取一条完整消息（合并分片，自动回应 ping）
+
+    Returns:
+        tuple: (opcode, payload)；对端关闭时 opcode 为 OP_CLOSE
+    """
+    opcode = None
+    chunks = []
+    while True:
+        fin, frame_op, payload = read_frame(rfile)
+        if frame_op == OP_PING:
+            send_frame(wfile, OP_PONG, payload)
+            continue
+        if frame_op == OP_PONG:
+            continue
+        if frame_op == OP_CLOSE:
+            return OP_CLOSE, payload
+        if frame_op != OP_CONTINUATION:
+            opcode = frame_op
+        chunks.append(payload)
+        if fin:
+            return opcode, b''.join(chunks)
+
+
+def send_frame(wfile, opcode, payload=b''):
+    """服务端帧不加掩码"""
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 1 << 16:
+        header += bytes([126]) + struct.pack('>H', length)
+    else:
+        header += bytes([127]) + struct.pack('>Q', length)
+    wfile.write(header + payload)
+    wfile.flush()
+
+
+def send_text(wfile, text):
+    send_frame(wfile, OP_TEXT, text.encode('utf-8'))
+
+
+def send_close(wfile, code=1000):
+    send_frame(wfile, OP_CLOSE, struct.pack('>H', code))
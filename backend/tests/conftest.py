@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import db_sqlite  # noqa: E402
+
+# 各模块 import 时会调用 init_db：测试期间绝不能写仓库里的 study_assistant.db
+db_sqlite.DB_PATH = os.path.join(tempfile.mkdtemp(prefix='ai-study-tests-'), 'import.db')
+
+
+@pytest.fixture
+def tmp_db(tmp_path, monkeypatch):
+    """每个测试一个独立的 SQLite 数据库"""
+    import db_sqlite
+    monkeypatch.setattr(db_sqlite, 'DB_PATH', str(tmp_path / 'test.db'))
+    db_sqlite.init_db()
+    return db_sqlite
+
+
+@pytest.fixture
+def make_simulator(monkeypatch):
+    """
+    启动本地 AI provider 模拟器（默认零延迟）并把 AIService 指向它。
+    overrides 按 simulator 配置文件的格式深度合并，例如 {'chat': {'error_rate': 1.0}}。
+    """
+    from services import resilience
+    from services.transport import transport
+    from simulator.config import _merge, load_config
+    from simulator.server import SimulatorServer
+
+    servers = []
+
+    def _start(overrides=None, openai=False):
+        config = load_config(seed=1)
+        for endpoint in config['endpoints'].values():
+            endpoint['latency'] = {'dist': 'fixed', 'ms': 0}
+        config = _merge(config, {'endpoints': overrides or {}})
+        server = SimulatorServer(port=0, config=config).start()
+        servers.append(server)
+        for key, value in server.env().items():
+            monkeypatch.setenv(key, value)
+        if not openai:
+            # 默认走讯飞路径
+            monkeypatch.delenv('OPENAI_API_KEY')
+        # 客户端和熔断器都是进程级单例，按测试隔离
+        monkeypatch.setattr(transport, '_clients', {})
+        monkeypatch.setattr(resilience, '_breakers', {})
+        return server
+
+    yield _start
+    for server in servers:
+        server.shutdown()
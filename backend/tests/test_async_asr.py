@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+from services.async_asr import AsyncXfyunClient, XfyunTranscript
+
+AUDIO = bytes(8000)  # 0.25 秒，按实时速率发送约 7 帧
+
+
+class _Deadline:
+    def __init__(self, seconds):
+        self.expires = time.time() + seconds
+
+    def remaining(self):
+        return self.expires - time.time()
+
+
+@pytest.fixture
+def client():
+    client = AsyncXfyunClient()
+    yield client
+    client.close()
+
+
+def _recognize(client, language='zh_cn', deadline=None):
+    return client.recognize(AUDIO, language, 'appid', 'key', 'secret', deadline)
+
+
+def test_transcript_applies_replacements():
+    transcript = XfyunTranscript()
+    transcript.apply({'sn': 1, 'ws': [{'cw': [{'w': '今天'}]}]})
+    transcript.apply({'sn': 2, 'ws': [{'cw': [{'w': '学习'}]}]})
+    transcript.apply({'sn': 3, 'pgs': 'rpl', 'rg': [1, 2], 'ws': [{'cw': [{'w': '今天学习函数'}]}]})
+    assert transcript.text == '今天学习函数'
+
+
+def test_recognizes_by_language(make_simulator, client):
+    make_simulator()
+    assert _recognize(client, 'en_us') == ('this is a simulated transcript', None)
+    assert _recognize(client, 'zh_cn') == ('这是模拟的语音识别结果', None)
+    assert client.stats()['completed'] == 2
+
+
+def test_sessions_share_one_loop(make_simulator, client):
+    make_simulator({'iat': {'latency': {'dist': 'fixed', 'ms': 200}}})
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(_recognize(client))) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [('这是模拟的语音识别结果', None)] * 6
+    stats = client.stats()
+    assert stats['completed'] == 6 and stats['active'] == 0
+    assert stats['peak_active'] > 1
+    # 所有会话跑在同一个事件循环线程上
+    assert sum(t.name == 'xfyun-asr-loop' for t in threading.enumerate()) >= 1
+
+
+def test_provider_error_is_returned(make_simulator, client):
+    make_simulator({'iat': {'error_rate': 1.0, 'error_codes': [10165]}})
+    text, error = _recognize(client)
+    assert text is None and 'Xfyun Error 10165' in error
+    assert client.stats()['failed'] == 1
+
+
+def test_deadline_cancels_session(make_simulator, client):
+    make_simulator({'iat': {'timeout_rate': 1.0, 'timeout_seconds': 5}})
+    started = time.time()
+    text, error = _recognize(client, deadline=_Deadline(0.6))
+    assert text is None and error == 'Request deadline exceeded'
+    assert time.time() - started < 3
+    assert client.stats()['active'] == 0
+
+
+def _stream(client, frames, on_update=None):
+    frames = iter(frames)
+    return client.stream(lambda: next(frames, None), 'zh_cn', 'appid', 'key', 'secret', on_update=on_update)
+
+
+def _client_threads():
+    # 模拟器的 websocket 服务端每个连接一个 process_request 线程，结束时间不确定，不计入
+    return sum(1 for thread in threading.enumerate() if 'process_request' not in thread.name)
+
+
+def test_stream_runs_on_the_shared_loop(make_simulator, client):
+    make_simulator({'iat': {'partial_seconds': 0.1}})
+    updates = []
+    before = _client_threads()
+    text, error = _stream(client, [bytes(1280)] * 10, on_update=updates.append)
+    assert (text, error) == ('这是模拟的语音识别结果', None)
+    assert updates and updates[-1] == text
+    assert client.stats()['completed'] == 1
+    # 除了共享的事件循环线程（第一次使用时启动），会话不再占用发送 / run_forever 线程
+    assert _client_threads() <= before + 1
+
+
+def test_stream_without_audio_still_finishes(make_simulator, client):
+    make_simulator()
+    assert _stream(client, []) == ('这是模拟的语音识别结果', None)
+
+
+def test_stream_provider_error_is_returned(make_simulator, client):
+    make_simulator({'iat': {'error_rate': 1.0, 'error_codes': [10313]}})
+    text, error = _stream(client, [bytes(1280)] * 3)
+    assert text is None and 'Xfyun Error 10313' in error
@@ -0,0 +1,81 @@
+import io
+import os
+import wave
+
+import pytest
+
+from services.audio_decode import AudioDecodeError, iter_pcm_chunks, iter_segments
+
+
+def _wav(pcm, rate=16000, channels=1):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as writer:
+        writer.setnchannels(channels)
+        writer.setsampwidth(2)
+        writer.setframerate(rate)
+        writer.writeframes(pcm)
+    buffer.seek(0)
+    return buffer
+
+
+def _script(tmp_path, body):
+    """用 shell 脚本代替 ffmpeg"""
+    path = tmp_path / 'fake-ffmpeg'
+    path.write_text('#!/bin/sh\n' + body + '\n')
+    path.chmod(0o755)
+    return str(path)
+
+
+def test_pcm_is_chunked_directly():
+    pcm = os.urandom(10000)
+    chunks = list(iter_pcm_chunks(io.BytesIO(pcm), 'pcm', chunk_size=4096))
+    assert [len(c) for c in chunks] == [4096, 4096, 1808]
+    assert b''.join(chunks) == pcm
+
+
+def test_target_format_wav_skips_ffmpeg(monkeypatch):
+    monkeypatch.setenv('FFMPEG_BINARY', '/nonexistent/ffmpeg')
+    pcm = os.urandom(32000)
+    chunks = list(iter_pcm_chunks(_wav(pcm), 'WAV', chunk_size=12000))
+    assert b''.join(chunks) == pcm
+    assert len(chunks) == 3
+
+
+def test_other_wav_goes_through_ffmpeg(monkeypatch, tmp_path):
+    monkeypatch.setenv('FFMPEG_BINARY', _script(tmp_path, 'cat'))
+    source = _wav(os.urandom(4000), rate=44100)
+    expected = source.getvalue()
+    # 假 ffmpeg 原样输出，说明整个文件（从头开始）都经过了管道
+    assert b''.join(iter_pcm_chunks(source, 'wav', chunk_size=1000)) == expected
+
+
+def test_pipe_output_is_read_in_full_chunks(monkeypatch, tmp_path):
+    monkeypatch.setenv('FFMPEG_BINARY', _script(tmp_path, 'cat'))
+    data = os.urandom(300000)
+    chunks = list(iter_pcm_chunks(io.BytesIO(data), 'webm', chunk_size=64000))
+    assert [len(c) for c in chunks[:-1]] == [64000] * 4
+    assert b''.join(chunks) == data
+
+
+def test_decode_errors_are_reported(monkeypatch, tmp_path):
+    monkeypatch.setenv('FFMPEG_BINARY', _script(tmp_path, 'cat > /dev/null\necho "Invalid data found" >&2\nexit 1'))
+    with pytest.raises(AudioDecodeError, match='Invalid data found'):
+        list(iter_pcm_chunks(io.BytesIO(b'not audio'), 'mp3'))
+    monkeypatch.setenv('FFMPEG_BINARY', '/nonexistent/ffmpeg')
+    with pytest.raises(AudioDecodeError, match='not installed'):
+        list(iter_pcm_chunks(io.BytesIO(b'not audio'), 'mp3'))
+
+
+def test_iter_segments_covers_stream_without_gaps():
+    pcm = bytes(range(256)) * 2500  # 20 秒没有停顿的音频，只能硬切
+    chunks = [pcm[i:i + 32000] for i in range(0, len(pcm), 32000)]
+    segments = list(iter_segments(chunks, target_seconds=4))
+    joined = b''
+    for segment in segments:
+        # 重叠部分只拼一次
+        if segment.overlapped:
+            overlap = 32000
+            assert joined[-overlap:] == segment[:overlap]
+            segment = segment[overlap:]
+        joined += segment
+    assert joined == pcm
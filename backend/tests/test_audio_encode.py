@@ -0,0 +1,81 @@
+import io
+import wave
+
+import numpy as np
+import pytest
+
+from services import audio_encode
+from services.ai_service import ai_service
+from services.audio_encode import encode_pcm, upload_format, wav_bytes
+
+PCM = bytes(3200)
+
+
+@pytest.fixture(autouse=True)
+def fresh_warnings(monkeypatch):
+    monkeypatch.setattr(audio_encode, '_warned', set())
+
+
+def _script(tmp_path, body):
+    path = tmp_path / 'fake-ffmpeg'
+    path.write_text('#!/bin/sh\n' + body + '\n')
+    path.chmod(0o755)
+    return str(path)
+
+
+def test_upload_format_defaults_to_opus(monkeypatch):
+    assert upload_format() == 'opus'
+    monkeypatch.setenv('WHISPER_UPLOAD_FORMAT', 'FLAC')
+    assert upload_format() == 'flac'
+    monkeypatch.setenv('WHISPER_UPLOAD_FORMAT', 'mp3')
+    assert upload_format() == 'opus'
+
+
+def test_wav_bytes_round_trip():
+    with wave.open(io.BytesIO(wav_bytes(PCM))) as reader:
+        assert (reader.getframerate(), reader.getnchannels(), reader.getsampwidth()) == (16000, 1, 2)
+        assert reader.readframes(reader.getnframes()) == PCM
+
+
+def test_encoder_output_is_used(monkeypatch, tmp_path):
+    args = tmp_path / 'args'
+    monkeypatch.setenv('FFMPEG_BINARY', _script(tmp_path, f'echo "$@" > {args}\ncat > /dev/null\nprintf OggS'))
+    monkeypatch.setenv('WHISPER_OPUS_BITRATE', '16k')
+    assert encode_pcm(PCM, 'opus') == ('audio.ogg', b'OggS')
+    assert '-c:a libopus -b:a 16k' in args.read_text()
+    assert encode_pcm(PCM, 'flac') == ('audio.flac', b'OggS')
+
+
+def test_falls_back_to_wav_and_warns_once(monkeypatch, tmp_path, capsys):
+    monkeypatch.setenv('FFMPEG_BINARY', '/nonexistent/ffmpeg')
+    assert encode_pcm(PCM, 'opus') == ('audio.wav', wav_bytes(PCM))
+    assert encode_pcm(PCM, 'opus') == ('audio.wav', wav_bytes(PCM))
+    assert capsys.readouterr().out.count('[AUDIO_ENCODE]') == 1
+
+    monkeypatch.setenv('FFMPEG_BINARY', _script(tmp_path, 'cat > /dev/null\necho "Unknown encoder" >&2\nexit 1'))
+    assert encode_pcm(PCM, 'flac')[0] == 'audio.wav'
+    assert 'Unknown encoder' in capsys.readouterr().out
+
+
+def test_oversize_upload_is_split_at_pauses(make_simulator, monkeypatch):
+    server = make_simulator(openai=True)
+    monkeypatch.setenv('WHISPER_UPLOAD_FORMAT', 'wav')
+    monkeypatch.setenv('WHISPER_MAX_UPLOAD_BYTES', '200000')
+    monkeypatch.setenv('AI_RETRY_MAX_ATTEMPTS', '1')
+    rng = np.random.default_rng(0)
+    speech = [rng.normal(0, 3000, 3 * 16000).astype('<i2').tobytes() for _ in range(3)]
+    audio = b''.join(part + bytes(16000 * 2) for part in speech)  # 12 秒，约 384KB 的 WAV
+    text, error = ai_service._recognize_whisper(audio, 'sim-openai-key')
+    assert error is None
+    requests = server.stats['transcription']['requests']
+    assert requests >= 2
+    # 在停顿处切开：每段的文字都保留
+    assert text.count('This is a simulated transcript.') == requests
+
+
+def test_unsplittable_upload_fails_instead_of_recursing(make_simulator, monkeypatch):
+    make_simulator(openai=True)
+    monkeypatch.setenv('WHISPER_UPLOAD_FORMAT', 'wav')
+    monkeypatch.setenv('WHISPER_MAX_UPLOAD_BYTES', '100')
+    text, error = ai_service._recognize_whisper(bytes(16000), 'sim-openai-key')
+    assert text is None and 'too large' in error
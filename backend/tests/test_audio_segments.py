@@ -0,0 +1,87 @@
+import numpy as np
+
+from services.ai_service import ai_service
+from services.audio_decode import iter_segments
+from services.audio_segments import SAMPLE_RATE, Segment, split_on_silence, stitch_transcripts
+from services.note_pipeline import LectureNotePipeline
+
+
+def _noise(seconds, level=3000, seed=0):
+    samples = np.random.default_rng(seed).normal(0, level, int(seconds * SAMPLE_RATE))
+    return samples.astype('<i2').tobytes()
+
+
+def _silence(seconds):
+    return bytes(int(seconds * SAMPLE_RATE) * 2)
+
+
+def test_cut_at_pause_does_not_overlap():
+    audio = _noise(8) + _silence(1) + _noise(5, seed=1)
+    segments, overlaps = split_on_silence(audio, target_seconds=10, with_overlaps=True)
+    assert len(segments) == 2 and overlaps == [False, False]
+    assert sum(len(s) for s in segments) == len(audio)
+
+
+def test_hard_cut_is_reported(monkeypatch):
+    monkeypatch.setenv('ASR_SEGMENT_OVERLAP_SECONDS', '1')
+    audio = _noise(25)
+    segments, overlaps = split_on_silence(audio, target_seconds=10, with_overlaps=True)
+    assert overlaps == [False, True, True]
+    # 每个硬切边界重复 1 秒
+    assert sum(len(s) for s in segments) == len(audio) + 2 * SAMPLE_RATE * 2
+    assert split_on_silence(audio, target_seconds=10) == segments
+
+
+def test_stitch_only_dedupes_overlapping_boundaries():
+    texts = ['I have 1 apple', '1 apple is good']
+    assert stitch_transcripts(texts) == 'I have 1 apple 1 apple is good'
+    assert stitch_transcripts(texts, [False, False]) == 'I have 1 apple 1 apple is good'
+    assert stitch_transcripts(texts, [False, True]) == 'I have 1 apple is good'
+    assert stitch_transcripts(['今天我们学习函数', '学习函数的定义'], [False, True]) == '今天我们学习函数的定义'
+
+
+def test_stitch_skips_dedupe_after_failed_segment():
+    texts = ['the first part ends here', '', 'ends here again']
+    assert stitch_transcripts(texts, [False, True, True]) == 'the first part ends here ends here again'
+
+
+def test_iter_segments_marks_hard_cuts(monkeypatch):
+    monkeypatch.setenv('ASR_SEGMENT_OVERLAP_SECONDS', '1')
+    audio = _noise(50)
+    chunks = [audio[i:i + 64000] for i in range(0, len(audio), 64000)]
+    segments = list(iter_segments(chunks, target_seconds=10))
+    assert all(isinstance(s, Segment) for s in segments)
+    assert [s.overlapped for s in segments] == [False] + [True] * (len(segments) - 1)
+
+    paused = _noise(8) + _silence(1) + _noise(8, seed=1) + _silence(1) + _noise(8, seed=2)
+    segments = list(iter_segments([paused], target_seconds=10))
+    assert len(segments) == 3 and not any(s.overlapped for s in segments)
+
+
+def test_transcribe_segments_threads_overlaps(monkeypatch):
+    texts = {b'a': 'I have 1 apple', b'b': '1 apple is good', b'c': 'is good news'}
+    monkeypatch.setattr(ai_service, 'speech_to_text', lambda segment, language='auto': (texts[bytes(segment)], None))
+    monkeypatch.setattr(ai_service, 'detect_language', lambda audio: 'en')
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    calls = []
+    segments = [Segment(b'a'), Segment(b'b', overlapped=False), Segment(b'c', overlapped=True)]
+    text, error = ai_service.transcribe_segments(segments, on_text=lambda *args: calls.append(args))
+    assert error is None
+    assert text == 'I have 1 apple 1 apple is good news'
+    assert [overlapped for _, _, overlapped in calls] == [False, False, True]
+
+
+def test_pipeline_on_text_matches_full_stitch():
+    pipeline = LectureNotePipeline()
+    try:
+        pipeline.on_text(0, 'I have 1 apple', False)
+        pipeline.on_text(1, '1 apple is good', False)
+        pipeline.on_text(2, '', True)
+        pipeline.on_text(3, 'is good again', True)
+        pipeline.on_text(4, 'good again and done', True)
+    finally:
+        pipeline._pool.shutdown()
+    assert pipeline.transcript == stitch_transcripts(
+        ['I have 1 apple', '1 apple is good', '', 'is good again', 'good again and done'],
+        [False, False, True, True, True])
+    assert pipeline.transcript == 'I have 1 apple 1 apple is good is good again and done'
@@ -0,0 +1,65 @@
+import pytest
+from flask import Flask
+
+from services.ai_service import ai_service
+
+
+@pytest.fixture
+def no_retries(monkeypatch):
+    monkeypatch.setenv('AI_RETRY_MAX_ATTEMPTS', '1')
+
+
+def test_local_and_batch_results_keep_input_order(make_simulator, no_retries):
+    make_simulator()
+    results = ai_service.judge_answers_batch([
+        {'question_text': '1 + 1 = ?', 'correct_answer': '2', 'user_answer': '2'},
+        {'question_text': 'Explain photosynthesis', 'correct_answer': 'Plants make sugar from light',
+         'user_answer': 'Plants use light to make food'},
+        {'question_text': '2 + 2 = ?', 'correct_answer': '4', 'user_answer': '5'},
+    ])
+    assert [r['method'] for r in results] == ['local', 'batch', 'local']
+    assert [r['is_correct'] for r in results] == [True, True, False]
+
+
+def test_provider_failure_is_reported_as_failed(make_simulator, no_retries):
+    make_simulator({'chat': {'error_rate': 1.0, 'error_statuses': [503]}})
+    results = ai_service.judge_answers_batch([
+        {'question_text': 'Explain photosynthesis', 'correct_answer': 'Plants make sugar from light',
+         'user_answer': 'Plants use light to make food'},
+    ])
+    assert results[0]['method'] == 'failed'
+
+
+@pytest.fixture
+def client(tmp_db):
+    from modules.error_book import error_bp
+
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.register_blueprint(error_bp)
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 'u1'
+    return client
+
+
+def _practice(db, question, answer):
+    return db.insert_practice({'user_id': 'u1', 'question_text': question, 'correct_answer': answer})
+
+
+def test_failed_items_are_not_saved_as_wrong(client, tmp_db, make_simulator, no_retries):
+    make_simulator({'chat': {'error_rate': 1.0, 'error_statuses': [503]}})
+    local_id = _practice(tmp_db, '3 + 4 = ?', '7')
+    llm_id = _practice(tmp_db, 'Explain osmosis', 'Water moves across a membrane')
+
+    r = client.post('/api/error/practice/do_batch', json={'answers': [
+        {'practice_id': local_id, 'user_answer_text': '7'},
+        {'practice_id': llm_id, 'user_answer_text': 'water diffuses'},
+    ]})
+    body = r.get_json()
+    assert body['summary'] == {'total': 2, 'graded': 1, 'correct': 1, 'failed': 1}
+    failed = body['results'][1]
+    assert failed['success'] is False
+    assert 'AI' in failed['error']
+    assert tmp_db.get_practice_by_id(llm_id, 'u1')['user_answer'] == ''
+    assert tmp_db.get_practice_by_id(local_id, 'u1')['user_answer'] == '7'
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from services.cassette import Cassette, _scrub, request_key
+
+
+@pytest.fixture
+def cassette(tmp_path, monkeypatch):
+    monkeypatch.setenv('AI_CASSETTE_DIR', str(tmp_path))
+    monkeypatch.setenv('AI_CASSETTE_NAME', 'test')
+    monkeypatch.setenv('AI_CASSETTE_LATENCY_SCALE', '0')
+    return Cassette()
+
+
+def test_request_key_ignores_json_order_host_and_multipart_boundary():
+    a = request_key('deepseek', 'post', 'https://a/v1/chat', b'{"a": 1, "b": 2}', 'application/json')
+    b = request_key('deepseek', 'POST', 'http://b/v1/chat?x=1', b'{"b": 2, "a": 1}', 'application/json')
+    assert a == b
+    body = b'--XYZ\r\nContent-Disposition: form-data; name="file"; filename="tmp123.wav"\r\n\r\nRIFF\r\n--XYZ--'
+    other = body.replace(b'XYZ', b'QQQ').replace(b'tmp123', b'tmp999')
+    assert request_key('whisper', 'POST', '/a', body, 'multipart/form-data; boundary=XYZ') == \
+        request_key('whisper', 'POST', '/a', other, 'multipart/form-data; boundary=QQQ')
+
+
+def test_scrub_removes_configured_keys(monkeypatch):
+    monkeypatch.setenv('DASHSCOPE_API_KEY', 'dash-secret-value')
+    assert _scrub('Bearer dash-secret-value sk-abcdefghijklmnopqrst') == 'Bearer *** sk-***'
+
+
+def test_call_records_then_replays_in_order(cassette, monkeypatch):
+    results = iter(['first', 'second'])
+    monkeypatch.setenv('AI_CASSETTE_MODE', 'record')
+    assert cassette.call('xfyun', ['audio-hash'], lambda: next(results)) == 'first'
+    assert cassette.call('xfyun', ['audio-hash'], lambda: next(results)) == 'second'
+
+    monkeypatch.setenv('AI_CASSETTE_MODE', 'replay')
+    replay = Cassette()
+    never = lambda: pytest.fail('replay must not call the provider')
+    assert replay.call('xfyun', ['audio-hash'], never) == 'first'
+    assert replay.call('xfyun', ['audio-hash'], never) == 'second'
+    assert replay.call('xfyun', ['audio-hash'], never) == 'second'  # 最后一条重复使用
+    assert replay.call('xfyun', ['other'], never) is None
+
+
+def test_http_traffic_replays_without_the_provider(cassette, make_simulator, monkeypatch):
+    from services import transport as transport_module
+
+    server = make_simulator()
+    monkeypatch.setattr(transport_module, 'cassette', cassette)
+    monkeypatch.setenv('AI_CASSETTE_MODE', 'record')
+    client = transport_module.AITransport().openai_client('deepseek')
+    messages = [{'role': 'user', 'content': 'hello'}]
+    recorded = client.chat.completions.create(model='deepseek-chat', messages=messages)
+    with open(cassette.path(), encoding='utf-8') as f:
+        entry = json.loads(f.readline())
+    assert 'sim-deepseek-key' not in json.dumps(entry)
+
+    server.shutdown()
+    monkeypatch.setenv('AI_CASSETTE_MODE', 'replay')
+    cassette.reset()
+    client = transport_module.AITransport().openai_client('deepseek')
+    replayed = client.chat.completions.create(model='deepseek-chat', messages=messages)
+    assert replayed.choices[0].message.content == recorded.choices[0].message.content
@@ -0,0 +1,66 @@
+import pytest
+from flask import Flask
+
+from modules import chat
+from services.conversation import conversation_store
+
+
+@pytest.fixture
+def client(tmp_db, monkeypatch):
+    seen = []
+
+    def fake_chat(message, history, summary=''):
+        seen.append(list(history))
+        return f'reply to {message}'
+
+    monkeypatch.setattr(chat.ai_service, 'chat', fake_chat)
+    monkeypatch.setattr(conversation_store, 'schedule_compaction', lambda conversation_id: None)
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.register_blueprint(chat.chat_bp)
+    client = app.test_client()
+    client.seen = seen
+    return client
+
+
+def login(client, user_id):
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+
+
+def test_logged_in_history_is_kept_per_session(client):
+    login(client, 7)
+    client.post('/api/chat/send', json={'message': 'hi', 'session_id': 's1'})
+    r = client.post('/api/chat/send', json={'message': 'again', 'session_id': 's1'})
+    assert r.get_json()['persisted'] is True
+    assert client.seen[-1] == [{'role': 'user', 'content': 'hi'}, {'role': 'assistant', 'content': 'reply to hi'}]
+
+    client.post('/api/chat/send', json={'message': 'other', 'session_id': 's2'})
+    assert client.seen[-1] == []
+
+
+def test_anonymous_users_do_not_share_history(client, tmp_db):
+    r = client.post('/api/chat/send', json={'message': 'secret', 'session_id': 'default'})
+    assert r.get_json()['persisted'] is False
+    r = client.post('/api/chat/send', json={'message': 'what did they say?'})
+    assert client.seen[-1] == []
+    conn = tmp_db.get_conn()
+    assert conn.execute('SELECT COUNT(*) FROM chat_message').fetchone()[0] == 0
+    conn.close()
+
+
+def test_anonymous_context_comes_from_client_history(client):
+    history = [{'role': 'user', 'content': 'q'}, {'role': 'assistant', 'content': 'a'}, {'role': 'system', 'content': 'x'}]
+    client.post('/api/chat/send', json={'message': 'next', 'history': history})
+    assert client.seen[-1] == history[:2]
+
+
+def test_clear_requires_session_id(client):
+    login(client, 7)
+    client.post('/api/chat/send', json={'message': 'hi', 'session_id': 's1'})
+    client.post('/api/chat/send', json={'message': 'hi', 'session_id': 's2'})
+    assert client.post('/api/chat/clear', json={}).status_code == 400
+    r = client.post('/api/chat/clear', json={'session_id': 's1'})
+    assert r.get_json()['cleared'] == 1
+    client.post('/api/chat/send', json={'message': 'again', 'session_id': 's2'})
+    assert len(client.seen[-1]) == 2
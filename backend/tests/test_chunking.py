@@ -0,0 +1,65 @@
+import threading
+import time
+
+from services.chunking import estimate_tokens, map_concurrently, map_streaming, split_text
+
+
+def test_estimate_tokens_counts_cjk_per_character():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('二次函数') == 4
+    assert estimate_tokens('abcdefgh') == 2
+
+
+def test_split_text_respects_paragraphs_and_budget():
+    paragraphs = ['段落%d。' % i + '内容' * 40 for i in range(10)]
+    chunks = split_text('\n\n'.join(paragraphs), max_tokens=200)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 200 for chunk in chunks)
+    # 段落不会被切开
+    assert '\n\n'.join(chunks).count('段落') == 10
+
+
+def test_split_text_keeps_decimals_intact():
+    text = ' '.join(['The value of pi is 3.14 and e is 2.71.'] * 50)
+    chunks = split_text(text, max_tokens=40)
+    assert all('3.14' in chunk for chunk in chunks)
+
+
+def test_split_text_caps_chunk_count(monkeypatch):
+    monkeypatch.setenv('AI_MAX_CHUNKS', '4')
+    chunks = split_text('\n\n'.join(['字' * 100] * 20), max_tokens=100)
+    assert len(chunks) <= 4
+
+
+def test_map_concurrently_keeps_order():
+    def slow(x):
+        time.sleep(0.01 * (5 - x))
+        return x * 2
+    assert map_concurrently(slow, [1, 2, 3, 4]) == [2, 4, 6, 8]
+
+
+def test_map_streaming_pulls_items_lazily():
+    pulled = []
+    active = []
+    peak = [0]
+    lock = threading.Lock()
+
+    def items():
+        for i in range(10):
+            pulled.append(i)
+            yield i
+
+    def work(x):
+        with lock:
+            active.append(x)
+            peak[0] = max(peak[0], len(active))
+        time.sleep(0.01)
+        with lock:
+            active.remove(x)
+        return x
+
+    stream = map_streaming(work, items(), max_workers=2)
+    assert next(stream) == 0
+    assert len(pulled) <= 3
+    assert list(stream) == list(range(1, 10))
+    assert peak[0] <= 2
@@ -0,0 +1,90 @@
+import io
+import time
+
+import pytest
+
+from services import content_cache as cache_module
+from services.ai_service import ai_service
+from services.content_cache import ContentCache, bytes_digest, file_digest
+
+
+@pytest.fixture
+def cache(tmp_db):
+    return ContentCache()
+
+
+def test_hits_are_keyed_by_content_and_params(cache):
+    digest = bytes_digest(b'lecture.pdf bytes')
+    assert cache.get('note_pdf', digest) is None
+    cache.put('note_pdf', digest, {'text': '第一章'})
+    assert cache.get('note_pdf', digest) == {'text': '第一章'}
+    # 不同的流水线或参数是不同的 key
+    assert cache.get('map_pdf', digest) is None
+    assert cache.get('note_pdf', digest, 'ocr') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['stores']) == (1, 3, 1)
+    assert stats['entries'] == 1
+
+
+def test_version_and_prompt_changes_invalidate(cache, monkeypatch):
+    digest = bytes_digest(b'image')
+    cache.put('ocr_text', digest, 'text')
+    monkeypatch.setitem(cache_module.PIPELINE_VERSIONS, 'ocr_text', 2)
+    assert cache.get('ocr_text', digest) is None
+    monkeypatch.setitem(cache_module.PIPELINE_VERSIONS, 'ocr_text', 1)
+    assert cache.get('ocr_text', digest) == 'text'
+    prompt = cache_module.get_prompt('ocr_text')
+    monkeypatch.setattr(prompt, 'user', prompt.user + '\n5. 保留公式')
+    assert cache.get('ocr_text', digest) is None
+
+
+def test_least_recently_used_entries_are_evicted(cache, monkeypatch):
+    monkeypatch.setenv('CONTENT_CACHE_MAX_BYTES', '250')
+    for name in ('a', 'b', 'c'):
+        cache.put('transcript', name, name * 100)
+        time.sleep(0.01)
+    # 只能放两条：a 最久未使用，被淘汰
+    assert cache.get('transcript', 'a') is None
+    assert cache.get('transcript', 'b') == 'b' * 100
+    time.sleep(0.01)
+    cache.put('transcript', 'd', 'd' * 100)
+    assert cache.get('transcript', 'c') is None
+    assert cache.get('transcript', 'b') is not None
+    assert cache.stats()['evicted'] == 2
+
+
+def test_failed_results_are_not_cached(tmp_db, monkeypatch):
+    results = [(None, 'timeout'), ('hello', None)]
+    calls = []
+
+    def fake(audio_data, language='auto'):
+        calls.append(language)
+        return results[len(calls) - 1]
+
+    monkeypatch.setattr(ai_service, '_speech_to_text', fake)
+    assert ai_service.speech_to_text(b'pcm', 'zh_cn') == (None, 'timeout')
+    assert tuple(ai_service.speech_to_text(b'pcm', 'zh_cn')) == ('hello', None)
+    assert tuple(ai_service.speech_to_text(b'pcm', 'zh_cn')) == ('hello', None)
+    assert len(calls) == 2
+
+
+def test_get_or_compute_respects_cacheable(cache):
+    calls = []
+    compute = lambda: calls.append(1) or []  # noqa: E731
+    assert cache.get_or_compute('ocr_question', 'img', compute, 1, cacheable=bool) == []
+    assert cache.get_or_compute('ocr_question', 'img', compute, 1, cacheable=bool) == []
+    assert len(calls) == 2
+
+
+def test_disabled_cache_is_bypassed(cache, monkeypatch):
+    monkeypatch.setenv('CONTENT_CACHE_ENABLED', '0')
+    cache.put('note_pdf', 'x', 'value')
+    assert cache.get('note_pdf', 'x') is None
+    assert cache.stats()['stores'] == 0
+
+
+def test_file_digest_restores_stream_position():
+    stream = io.BytesIO(b'0123456789')
+    stream.seek(3)
+    assert file_digest(stream) == bytes_digest(b'3456789')
+    assert stream.tell() == 3
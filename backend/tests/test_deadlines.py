@@ -0,0 +1,85 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from run import request_deadline_seconds
+from services.resilience import (
+    DeadlineExceeded, bounded_deadline, check_deadline, ensure_request_deadline, remaining_budget,
+    reset_request_deadline, set_request_deadline
+)
+
+APP = SimpleNamespace(config={
+    'ROUTE_DEADLINES': {'/api/note': 120, '/api/chat': 30},
+    'REQUEST_DEADLINE_DEFAULT': 30,
+    'REQUEST_DEADLINE_MAX': 300,
+})
+
+
+@pytest.mark.parametrize('path, header, expected', [
+    ('/api/chat/send', None, 30),
+    ('/api/note/generate', None, 120),
+    ('/api/other', None, 30),
+    ('/static/app.js', None, None),
+    ('/api/chat/send', '5', 5),
+    # 头只能缩短路由默认值，不能延长
+    ('/api/chat/send', '300', 30),
+    ('/api/chat/send', 'soon', 30),
+    ('/api/chat/send', '-1', 0.1),
+])
+def test_request_deadline_seconds(path, header, expected):
+    assert request_deadline_seconds(APP, path, header) == expected
+
+
+def test_stage_deadlines_are_bounded_by_the_request():
+    token = set_request_deadline(1.0)
+    try:
+        deadline = bounded_deadline(60)
+        assert deadline.request_bound
+        assert deadline.remaining() <= 1.0
+        assert bounded_deadline(0.5).request_bound is False
+        with pytest.raises(DeadlineExceeded):
+            check_deadline('ocr', min_seconds=2)
+    finally:
+        reset_request_deadline(token)
+    assert remaining_budget() is None
+
+
+def test_long_recording_outlasts_the_route_deadline(monkeypatch):
+    from services.ai_service import ai_service
+
+    # 路由只给 0.3 秒；4 个 0.2 秒的片段串行识别，每个按实时速率耗时 0.2 秒
+    monkeypatch.setenv('ASR_MAX_CONCURRENCY', '1')
+    monkeypatch.setenv('ASR_DEADLINE_SLACK_SECONDS', '0.2')
+    seen = []
+
+    def paced(audio_data, language='auto'):
+        check_deadline('xfyun')
+        time.sleep(len(audio_data) / 32000)
+        check_deadline('xfyun')
+        seen.append(remaining_budget())
+        return 'part', None
+
+    monkeypatch.setattr(ai_service, 'speech_to_text', paced)
+    token = set_request_deadline(0.3)
+    try:
+        text, error = ai_service.transcribe_segments([bytes(6400)] * 4, language='zh_cn')
+    finally:
+        reset_request_deadline(token)
+    assert error is None and text
+    assert len(seen) == 4 and all(remaining > 0 for remaining in seen)
+
+
+def test_deadline_extension_is_capped(monkeypatch):
+    monkeypatch.setenv('REQUEST_DEADLINE_EXTEND_MAX', '5')
+    token = set_request_deadline(1.0)
+    try:
+        ensure_request_deadline(0.5)
+        assert remaining_budget() <= 1.0
+        ensure_request_deadline(60)
+        assert 4 < remaining_budget() <= 5
+    finally:
+        reset_request_deadline(token)
+    # 请求之外没有截止时间可延长
+    ensure_request_deadline(60)
+    assert remaining_budget() is None
@@ -0,0 +1,43 @@
+from services.extractive import ExtractiveEngine, _repeated_ngrams
+
+ZH_TEXT = ("一元二次方程的二次项系数不能为零。求根公式适用于任何二次项系数不为零的方程。"
+           "判别式由二次项系数和常数项决定。二次项系数决定抛物线开口方向。")
+EN_TEXT = ("Newton's law states force equals mass times acceleration. "
+           "Newton's law states force equals mass times acceleration. "
+           "Energy is conserved in closed systems. Momentum is conserved too.")
+
+
+def test_ngrams_snap_to_word_boundaries():
+    grams = _repeated_ngrams(ZH_TEXT)
+    assert '二次项系数' in grams
+    # 只作为“二次项系数”的一部分出现的片段不是独立的词
+    assert not {'二次项系', '次项系数', '项系数', '次项系'} & grams
+
+
+def test_overlapping_phrases_are_dropped():
+    phrases = ExtractiveEngine().keyphrases(ZH_TEXT, limit=10)
+    assert phrases[0] == '二次项系数'
+    assert not {'二次项系', '次项系数', '项系数'} & set(phrases)
+
+
+def test_overlap_dedupe_keeps_distinct_english_terms():
+    kept = ExtractiveEngine._dedupe([('linear equation', 2.0), ('equation system', 1.5),
+                                     ('first order linear', 1.2), ('order linear equation', 1.0)])
+    assert [p for p, _ in kept] == ['linear equation', 'equation system', 'first order linear']
+
+
+def test_repeated_sentences_are_selected_once():
+    engine = ExtractiveEngine()
+    assert engine.key_sentences(EN_TEXT, limit=2) == [
+        "Newton's law states force equals mass times acceleration.",
+        'Energy is conserved in closed systems.',
+    ]
+    note = engine.note(EN_TEXT + ' For example, a falling ball. For example, a falling ball!')
+    assert len(note['key_points']) == len(set(note['key_points']))
+    assert note['examples'] == ['For example, a falling ball.']
+
+
+def test_mindmap_falls_back_without_text():
+    code = ExtractiveEngine().mindmap('Algebra')
+    assert code.startswith('graph TD\n    ROOT[Algebra]')
+    assert 'Algebra Definition' in code
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from services.hedging import HedgeCancelled, Hedger, LatencyTracker
+
+
+@pytest.fixture
+def hedger(monkeypatch):
+    monkeypatch.setenv('AI_HEDGE_DEFAULT_DELAY', '0.05')
+    monkeypatch.setenv('AI_HEDGE_BUDGET', '1.0')
+    return Hedger()
+
+
+def _attempt(delays, calls):
+    """按 provider 延迟返回结果；被取消时抛 HedgeCancelled"""
+    def attempt(provider, cancel):
+        calls.append(provider)
+        delay = delays[provider]
+        if isinstance(delay, Exception):
+            raise delay
+        if cancel.wait(delay):
+            raise HedgeCancelled('partial')
+        return provider
+    return attempt
+
+
+def test_latency_tracker_quantile():
+    tracker = LatencyTracker(window=10)
+    for i in range(1, 11):
+        tracker.record(i)
+    assert tracker.quantile(0.9) == 10
+    assert tracker.quantile(0.5) == 6
+
+
+def test_fast_primary_is_not_hedged(hedger):
+    calls = []
+    assert hedger.run('note', ['a', 'b'], _attempt({'a': 0.0, 'b': 0.0}, calls)) == 'a'
+    assert calls == ['a']
+
+
+def test_slow_primary_is_hedged_and_cancelled(hedger):
+    calls = []
+    started = time.monotonic()
+    assert hedger.run('note', ['a', 'b'], _attempt({'a': 2.0, 'b': 0.01}, calls)) == 'b'
+    assert time.monotonic() - started < 1.0
+    assert calls == ['a', 'b']
+    time.sleep(0.05)
+    stats = hedger.stats()['providers']
+    assert stats['b']['hedges_sent'] == 1
+    assert stats['a']['cancelled'] == 1
+
+
+def test_failure_fails_over_immediately(hedger):
+    calls = []
+    result = hedger.run('note', ['a', 'b'], _attempt({'a': ConnectionError('down'), 'b': 0.0}, calls), hedge=False)
+    assert result == 'b'
+    assert hedger.stats()['providers']['b']['failovers'] == 1
+
+
+def test_all_providers_failing_raises_last_error(hedger):
+    with pytest.raises(ValueError):
+        hedger.run('note', ['a', 'b'], _attempt({'a': ConnectionError(), 'b': ValueError('bad')}, []))
+
+
+def test_budget_caps_hedge_rate(monkeypatch):
+    monkeypatch.setenv('AI_HEDGE_DEFAULT_DELAY', '0.01')
+    monkeypatch.setenv('AI_HEDGE_BUDGET', '0.25')
+    hedger = Hedger()
+    for _ in range(8):
+        hedger.run('note', ['a', 'b'], _attempt({'a': 0.05, 'b': 0.0}, []))
+    # 每次调用累积 0.25 个令牌：8 次调用最多对冲 2 次
+    assert hedger.stats()['providers']['b']['hedges_sent'] == 2
+
+
+def test_adaptive_delay_uses_recent_latency(monkeypatch):
+    monkeypatch.setenv('AI_HEDGE_MIN_SAMPLES', '5')
+    hedger = Hedger()
+    assert hedger.hedge_delay('a', 'note') == 3.0
+    for _ in range(5):
+        hedger._tracker('a', 'note').record(0.2)
+    assert hedger.hedge_delay('a', 'note') == 0.2
@@ -0,0 +1,71 @@
+import pytest
+
+from services.json_repair import JSONParseError, ModelJSONParser, _salvage, validate, SCHEMAS
+
+
+@pytest.fixture
+def parser():
+    return ModelJSONParser()
+
+
+def test_plain_json_is_parsed(parser):
+    assert parser.parse('{"is_correct": true, "reason": "ok"}', 'judge') == {'is_correct': True, 'reason': 'ok'}
+    assert parser.stats()['methods']['judge']['parsed'] == 1
+
+
+def test_fences_and_surrounding_text_are_stripped(parser):
+    text = '下面是结果：\n```json\n{"is_correct": false}\n```\n希望有帮助'
+    assert parser.parse(text, 'judge') == {'is_correct': False}
+
+
+def test_latex_backslashes_survive(parser):
+    # \frac 的 \f、\times 的 \t 不能被当成 JSON 转义
+    data = parser.parse('{"is_correct": true, "reason": "\\frac{1}{2} \\times 2 = 1\\nok"}', 'judge')
+    assert data['reason'] == '\\frac{1}{2} \\times 2 = 1\nok'
+    assert parser.stats()['methods']['judge']['repaired'] == 1
+
+
+def test_trailing_commas_and_raw_newlines_are_repaired(parser):
+    data = parser.parse('[{"index": 1, "is_correct": true, "reason": "line1\nline2",},]', 'judge_batch')
+    assert data == [{'index': 1, 'is_correct': True, 'reason': 'line1\nline2'}]
+
+
+def test_truncated_array_keeps_complete_items(parser):
+    text = '[{"question_text": "a"}, {"question_text": "b"}, {"question_text": "c'
+    assert parser.parse(text, 'similar') == [{'question_text': 'a'}, {'question_text': 'b'}]
+    assert parser.stats()['methods']['similar']['salvaged'] == 1
+
+
+def test_salvage_gives_up_without_complete_items():
+    assert _salvage('[{"question_text": "a') is None
+    assert _salvage('{"key":') is None
+
+
+def test_types_are_coerced_and_invalid_items_dropped(parser):
+    text = '[{"index": "1", "is_correct": "是"}, {"index": 2}, {"index": 3.0, "is_correct": 0}]'
+    assert parser.parse(text, 'judge_batch') == [
+        {'index': 1, 'is_correct': True},
+        {'index': 3, 'is_correct': False},
+    ]
+    assert parser.stats()['methods']['judge_batch']['dropped_items'] == 1
+
+
+def test_wrapped_containers_are_unwrapped():
+    assert validate([{'is_correct': True}], SCHEMAS['judge'])[0] == {'is_correct': True}
+    data, dropped = validate({'questions': [{'question_text': 'q'}]}, SCHEMAS['similar'])
+    assert data == [{'question_text': 'q'}] and dropped == 0
+
+
+def test_failures_raise_and_count_as_rerequests(parser):
+    with pytest.raises(JSONParseError):
+        parser.parse('抱歉，我无法判断', 'judge')
+    with pytest.raises(JSONParseError) as info:
+        parser.parse('{"reason": "missing verdict"}', 'judge')
+    assert 'missing verdict' in info.value.raw
+    stats = parser.stats()
+    assert stats['methods']['judge']['failed'] == 2
+    assert stats['rerequests'] == 2 and stats['rerequests_avoided'] == 0
+
+
+def test_unknown_method_only_parses(parser):
+    assert parser.parse('result: {"anything": [1, 2]}', 'custom') == {'anything': [1, 2]}
@@ -0,0 +1,71 @@
+import threading
+
+import numpy as np
+import pytest
+
+from services.ai_service import AIService, ai_service
+from services.audio_segments import SAMPLE_RATE, leading_speech
+
+
+def _noise(seconds):
+    return np.random.default_rng(0).normal(0, 3000, int(seconds * SAMPLE_RATE)).astype('<i2').tobytes()
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    """替换讯飞识别：记录每次调用的 (语种, 音频秒数)，按语种返回固定文字"""
+    calls = []
+    lock = threading.Lock()
+    texts = {'zh_cn': '今天我们讲二次函数', 'en_us': 'Today we talk about'}
+
+    def fake(audio_data, language='zh_cn'):
+        with lock:
+            calls.append((language, len(audio_data) / 32000))
+        return texts[language], None
+
+    monkeypatch.setattr(ai_service, '_recognize_xfyun', fake)
+    monkeypatch.setenv('ASR_LANGUAGE_PROBE_SECONDS', '6')
+    return calls, texts
+
+
+def test_long_audio_probes_then_recognizes_once(recorded):
+    calls, texts = recorded
+    audio = bytes(3 * 32000) + _noise(60)
+    assert ai_service._speech_to_text_xfyun(audio, 'auto') == (texts['zh_cn'], None)
+    probes = sorted(calls[:2])
+    assert [language for language, _ in probes] == ['en_us', 'zh_cn']
+    # 探测只用开头静音之后的 6 秒
+    assert all(seconds == pytest.approx(6) for _, seconds in probes)
+    assert calls[2:] == [('zh_cn', len(audio) / 32000)]
+
+
+def test_short_audio_reuses_probe_results(recorded):
+    calls, texts = recorded
+    assert ai_service._speech_to_text_xfyun(_noise(4), 'auto') == (texts['zh_cn'], None)
+    assert len(calls) == 2
+
+
+def test_explicit_language_skips_probe(recorded):
+    calls, _ = recorded
+    ai_service._speech_to_text_xfyun(_noise(30), 'en_us')
+    assert [language for language, _ in calls] == ['en_us']
+
+
+@pytest.mark.parametrize('text_zh, text_en, expected', [
+    ('今天我们讲二次函数', 'Today we talk about', 'zh_cn'),
+    ('hello every one', 'hello everyone and welcome', 'en_us'),
+    ('这个 function 叫做 sine', 'this function', 'zh_cn'),
+    ('', 'hello', 'en_us'),
+    ('你好', None, 'zh_cn'),
+    (None, '', None),
+])
+def test_pick_language(text_zh, text_en, expected):
+    assert AIService._pick_language(text_zh, text_en) == expected
+
+
+def test_leading_speech_skips_silence():
+    audio = bytes(5 * 32000) + _noise(10)
+    probe = leading_speech(audio, 6)
+    assert len(probe) == 6 * 32000
+    # 只保留 200ms 余量的静音
+    assert probe[:int(0.3 * 32000)].count(0) < int(0.3 * 32000)
@@ -0,0 +1,71 @@
+import pytest
+
+from services.mermaid_validator import MermaidValidator
+
+
+@pytest.fixture
+def validator():
+    return MermaidValidator()
+
+
+def test_valid_graph_is_unchanged(validator):
+    code = 'graph TD\n    A[Algebra] --> B[Equations]\n    A --> C[Functions]'
+    assert validator.repair(code) == (code, [])
+    assert validator.stats()['valid'] == 1
+
+
+def test_fence_and_leading_text_are_dropped(validator):
+    code, issues = validator.repair('Here is the map:\n```mermaid\ngraph LR\nA[Root] --> B[Leaf]\n```')
+    assert code == 'graph LR\n    A[Root] --> B[Leaf]'
+    assert {'fence'} <= set(issues)
+
+
+def test_unsafe_labels_are_quoted(validator):
+    code, issues = validator.repair('graph TD\nA[f(x) = x^2] --> B[Derivative]')
+    assert 'A["f(x) = x^2"]' in code
+    assert 'label' in issues
+
+
+def test_invalid_ids_are_renumbered(validator):
+    code, issues = validator.repair('graph TD\nRoot Node[Root] --> end[Leaf]')
+    assert code == 'graph TD\n    N1[Root] --> N2[Leaf]'
+    assert 'node_id' in issues
+
+
+def test_dangling_edges_and_orphans(validator):
+    code, issues = validator.repair('graph TD\nA[Root] --> B[One]\nB -->\nC[Alone]')
+    assert 'A --> C' in code
+    assert '-->\n' not in code + '\n'
+    assert {'dangling_edge', 'orphan'} <= set(issues)
+
+
+def test_unclosed_subgraph_is_closed(validator):
+    code, issues = validator.repair('graph TD\nsubgraph S\nA[Root] --> B[Leaf]')
+    assert code.endswith('    end')
+    assert 'unclosed_subgraph' in issues
+
+
+def test_missing_header_is_inferred(validator):
+    code, issues = validator.repair('A[Root] --> B[Leaf]')
+    assert code.startswith('graph TD\n')
+    assert 'header' in issues
+    code, _ = validator.repair('Topic\n  Branch\n    Leaf')
+    assert code.startswith('mindmap\n')
+
+
+def test_mindmap_labels_and_indentation(validator):
+    code, issues = validator.repair('mindmap\n    root((Calculus))\n        Limits (intro)\n        Derivatives')
+    assert code == 'mindmap\n  root((Calculus))\n    Limits intro\n    Derivatives'
+    assert {'label', 'indentation'} <= set(issues)
+
+
+def test_mindmap_multiple_roots_get_topic_root(validator):
+    code, issues = validator.repair('mindmap\nAlgebra\n  Equations\nGeometry', topic='Math')
+    assert code.splitlines()[1] == '  root((Math))'
+    assert 'multiple_roots' in issues
+
+
+def test_unrecoverable_input_is_counted(validator):
+    assert validator.repair('sorry, no diagram')[0] is None
+    stats = validator.stats()
+    assert stats['unrecoverable'] == 1 and stats['issues']['header'] == 1
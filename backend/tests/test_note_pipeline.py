@@ -0,0 +1,91 @@
+import threading
+
+import pytest
+
+from services.ai_service import ai_service
+from services.note_pipeline import LectureNotePipeline
+
+
+@pytest.fixture
+def fake_ai(monkeypatch):
+    """替换识别和生成：记录提交的草稿与最终调用"""
+    calls = {'drafts': [], 'text': [], 'content': []}
+    lock = threading.Lock()
+
+    def transcribe(texts):
+        def _transcribe(segments, language='auto', on_text=None):
+            for index, text in enumerate(texts):
+                on_text(index, text, False)
+            return ' '.join(t for t in texts if t) or None, None if any(texts) else 'Recognition failed'
+        monkeypatch.setattr(ai_service, 'transcribe_segments', _transcribe)
+
+    def summarize(topic, chunk, index, total=None, target_tokens=None):
+        with lock:
+            calls['drafts'].append((index, chunk))
+            calls.setdefault('totals', []).append(total)
+        return f'outline {index}'
+
+    monkeypatch.setattr(ai_service, 'summarize_chunk', summarize)
+    monkeypatch.setattr(ai_service, 'generate_note_from_text',
+                        lambda text, subject='General': calls['text'].append(text) or {'title': 'short'})
+    monkeypatch.setattr(ai_service, 'generate_note_from_content',
+                        lambda content, text, subject='General': calls['content'].append(content) or {'title': 'long'})
+    monkeypatch.setenv('AI_CONTENT_TOKEN_BUDGET', '100')
+    monkeypatch.setenv('AI_CHUNK_TOKENS', '60')
+    return transcribe, calls
+
+
+def _sentence(i):
+    return f'Part {i} explains one more idea about derivatives and their rules in detail.'
+
+
+def test_short_transcript_uses_single_note_call(fake_ai):
+    transcribe, calls = fake_ai
+    transcribe(['hello class', 'today is limits'])
+    note, transcript, error = LectureNotePipeline('Math').run([b'a', b'b'])
+    assert error is None and note == {'title': 'short'}
+    assert transcript == 'hello class today is limits'
+    assert calls['text'] == [transcript] and calls['drafts'] == []
+
+
+def test_long_transcript_is_drafted_while_transcribing(fake_ai):
+    transcribe, calls = fake_ai
+    texts = [_sentence(i) for i in range(12)]
+    transcribe(texts)
+    pipeline = LectureNotePipeline('Math')
+    note, transcript, error = pipeline.run([b''] * len(texts))
+    assert note == {'title': 'long'} and error is None
+    drafts = [chunk for _, chunk in sorted(calls['drafts'])]
+    assert len(drafts) >= 3 and pipeline.timings['drafts'] == len(drafts)
+    # 草稿按顺序覆盖整份转写稿，没有遗漏或重复
+    assert ''.join(drafts) == transcript
+    assert calls['content'][0].startswith('Part 1:\noutline 0')
+    # 边识别边起草时总数未知
+    assert set(calls['totals']) == {None}
+    assert calls['text'] == []
+
+
+@pytest.mark.parametrize('total, position', [
+    (5, 'Part 3 of 5:'),
+    (None, 'Part 3 (more parts may follow):'),
+])
+def test_summarize_chunk_prompt_position(monkeypatch, total, position):
+    prompts = []
+
+    def chat(method, messages, **kwargs):
+        prompts.append(messages[0]['content'])
+        raise RuntimeError('offline')
+
+    monkeypatch.setattr(ai_service, '_chat_completion', chat)
+    monkeypatch.setenv('AI_CONTENT_TOKEN_BUDGET', '2000')
+    # 失败时退化为分块开头的原文，总数未知时按四分之一预算
+    outline = ai_service.summarize_chunk('Math', 'x' * 1000, 2, total)
+    assert outline == 'x' * (400 if total else 500)
+    assert position in prompts[0] and prompts[0].endswith('x' * 1000)
+
+
+def test_recognition_failure_is_returned(fake_ai):
+    transcribe, _ = fake_ai
+    transcribe(['', ''])
+    note, transcript, error = LectureNotePipeline().run([b'a', b'b'])
+    assert note is None and transcript == '' and error == 'Recognition failed'
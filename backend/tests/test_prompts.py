@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+from services.prompts import PROMPTS, PromptTemplate, get_prompt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+import prompt_benchmark  # noqa: E402
+
+
+def test_variables_come_last_and_render():
+    template = PromptTemplate('t', system='static rules', user='Question:\n{question}\nAnswer: {answer}')
+    assert template.fields == ['question', 'answer']
+    assert template.messages(question='1+1', answer='2') == [
+        {'role': 'system', 'content': 'static rules'},
+        {'role': 'user', 'content': 'Question:\n1+1\nAnswer: 2'},
+    ]
+    assert template.static_text() == 'static rulesQuestion:\n\nAnswer: '
+    assert template.prefix_tokens() <= template.static_tokens()
+
+
+def test_literal_braces_are_kept():
+    template = PromptTemplate('t', user='Output {{"is_correct": true}} for {answer}')
+    assert template.fields == ['answer']
+    assert template.user_text(answer='x') == 'Output {"is_correct": true} for x'
+
+
+@pytest.mark.parametrize('name', sorted(PROMPTS))
+def test_registered_templates_render(name):
+    template = get_prompt(name)
+    messages = template.messages(**{field: 'VALUE' for field in template.fields})
+    assert messages[-1]['role'] == 'user'
+    # 变量之前的静态前缀不应为空，否则无法命中前缀缓存
+    assert template.prefix_tokens() > 0
+
+
+def test_templates_within_budget():
+    over = [row['name'] for row in prompt_benchmark.collect() if row['over_budget']]
+    assert over == []
@@ -0,0 +1,119 @@
+import pytest
+
+from services import resilience
+from services.resilience import (
+    CircuitBreaker, CircuitOpenError, Deadline, ProviderHTTPError, call_with_retries, is_retryable
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动推进的单调时钟"""
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(resilience.time, 'sleep', lambda seconds: now.__setitem__(0, now[0] + seconds))
+    return now
+
+
+def test_breaker_opens_after_threshold_and_probes_once(clock):
+    breaker = CircuitBreaker('p', failure_threshold=2, recovery_timeout=10)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+    clock[0] += 10
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
+    assert not breaker.allow()  # 只放行一个探测请求
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker('p', failure_threshold=1, recovery_timeout=5)
+    breaker.record_failure()
+    clock[0] += 5
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.snapshot()['rejected_calls'] == 0
+
+
+@pytest.mark.parametrize('exc, expected', [
+    (TimeoutError(), True),
+    (ConnectionError(), True),
+    (ProviderHTTPError(429), True),
+    (ProviderHTTPError(503), True),
+    (ProviderHTTPError(400), False),
+    (ValueError('bad'), False),
+])
+def test_is_retryable(exc, expected):
+    assert is_retryable(exc) is expected
+
+
+def test_retries_retryable_errors_until_success(clock):
+    breaker = CircuitBreaker('p', failure_threshold=10)
+    attempts = []
+
+    def flaky(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 3:
+            raise ProviderHTTPError(503)
+        return 'ok'
+
+    assert call_with_retries(flaky, breaker, Deadline(30), max_attempts=3, base_delay=0.1) == 'ok'
+    assert len(attempts) == 3
+    assert breaker.snapshot()['consecutive_failures'] == 0
+
+
+def test_gives_up_after_max_attempts(clock):
+    breaker = CircuitBreaker('p', failure_threshold=10)
+
+    def down(timeout):
+        raise ProviderHTTPError(500)
+
+    with pytest.raises(ProviderHTTPError):
+        call_with_retries(down, breaker, Deadline(30), max_attempts=2, base_delay=0.1)
+    assert breaker.snapshot()['total_failures'] == 2
+
+
+def test_open_breaker_rejects_without_calling(clock):
+    breaker = CircuitBreaker('p', failure_threshold=1)
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        call_with_retries(lambda timeout: pytest.fail('called'), breaker, Deadline(30))
+
+
+def test_expired_deadline_does_not_take_the_probe_slot(clock):
+    breaker = CircuitBreaker('p', failure_threshold=1, recovery_timeout=5)
+    breaker.record_failure()
+    clock[0] += 5
+    expired = Deadline(1, request_bound=True)
+    clock[0] += 2
+    with pytest.raises(resilience.DeadlineExceeded):
+        call_with_retries(lambda timeout: 'ok', breaker, expired)
+    # 探测位仍然可用，下一个调用可以恢复熔断器
+    assert call_with_retries(lambda timeout: 'ok', breaker, Deadline(30)) == 'ok'
+    assert breaker.state == 'closed'
+
+
+def test_client_error_does_not_close_an_open_circuit(clock):
+    breaker = CircuitBreaker('p', failure_threshold=2, recovery_timeout=5)
+    breaker.record_failure()
+
+    def bad_request(timeout):
+        raise ProviderHTTPError(400)
+
+    with pytest.raises(ProviderHTTPError):
+        call_with_retries(bad_request, breaker, Deadline(30))
+    assert breaker.snapshot()['consecutive_failures'] == 1
+
+    breaker.record_failure()
+    clock[0] += 5
+    with pytest.raises(ProviderHTTPError):
+        call_with_retries(bad_request, breaker, Deadline(30))
+    # half-open 探测遇到 4xx：释放探测位但不关闭熔断器
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
@@ -0,0 +1,177 @@
+import hashlib
+import io
+import os
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+from modules import uploads
+from services.resumable_upload import UploadError, UploadSessions
+
+CHUNK = 64 * 1024
+DATA = os.urandom(3 * CHUNK + 1000)
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    return UploadSessions(root=str(tmp_path / 'chunked'))
+
+
+def _chunk(index):
+    return DATA[index * CHUNK:(index + 1) * CHUNK]
+
+
+def _put(sessions, upload_id, index, data=None, user_id='default'):
+    return sessions.put_chunk(upload_id, index, io.BytesIO(_chunk(index) if data is None else data), user_id)
+
+
+def test_out_of_order_chunks_assemble_and_verify(sessions):
+    status = sessions.init('lecture.m4a', len(DATA), chunk_size=CHUNK, sha256=hashlib.sha256(DATA).hexdigest())
+    upload_id = status['upload_id']
+    assert status['total_chunks'] == 4
+    for index in (2, 0, 3):
+        _put(sessions, upload_id, index)
+    assert sessions.status(upload_id)['missing_chunks'] == [1]
+    with pytest.raises(UploadError) as info:
+        sessions.finalize(upload_id)
+    assert info.value.status == 409
+
+    _put(sessions, upload_id, 1)
+    status = sessions.finalize(upload_id)
+    assert status['finalized'] and status['sha256'] == hashlib.sha256(DATA).hexdigest()
+    path, filename = sessions.path(upload_id)
+    assert filename == 'lecture.m4a'
+    with open(path, 'rb') as f:
+        assert f.read() == DATA
+    # 重复 finalize 是幂等的
+    assert sessions.finalize(upload_id)['finalized']
+
+
+def test_resent_chunk_is_rehashed(sessions):
+    upload_id = sessions.init('a.wav', len(DATA), chunk_size=CHUNK)['upload_id']
+    _put(sessions, upload_id, 0, b'x' * CHUNK)
+    _put(sessions, upload_id, 0)
+    for index in (1, 2, 3):
+        _put(sessions, upload_id, index)
+    assert sessions.finalize(upload_id)['sha256'] == hashlib.sha256(DATA).hexdigest()
+
+
+def test_finalize_after_restart_rehashes(sessions):
+    upload_id = sessions.init('a.wav', len(DATA), chunk_size=CHUNK)['upload_id']
+    for index in range(4):
+        _put(sessions, upload_id, index)
+    restarted = UploadSessions(root=sessions.root)
+    assert restarted.finalize(upload_id)['sha256'] == hashlib.sha256(DATA).hexdigest()
+
+
+def test_uploads_do_not_block_each_other(sessions):
+    first = sessions.init('a.wav', len(DATA), chunk_size=CHUNK)['upload_id']
+    second = sessions.init('b.wav', len(DATA), chunk_size=CHUNK)['upload_id']
+    # 一个会话持有自己的锁（例如正在重算大文件的哈希）时，其他会话照常上传
+    with sessions._state(first).lock:
+        worker = threading.Thread(target=_put, args=(sessions, second, 0))
+        worker.start()
+        worker.join(2)
+        assert not worker.is_alive()
+    assert sessions.status(second)['received_chunks'] == 1
+
+
+class _SlowStream(io.BytesIO):
+    """第一次 read 前等待 release，模拟还在传输中的分块"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def read(self, size=-1):
+        self.started.set()
+        self.release.wait(5)
+        return super().read(size)
+
+
+def test_finalize_waits_for_chunks_in_flight(sessions):
+    upload_id = sessions.init('a.wav', len(DATA), chunk_size=CHUNK)['upload_id']
+    for index in range(4):
+        _put(sessions, upload_id, index)
+    stream = _SlowStream(_chunk(3))
+    worker = threading.Thread(target=sessions.put_chunk, args=(upload_id, 3, stream))
+    worker.start()
+    stream.started.wait(5)
+    with pytest.raises(UploadError) as info:
+        sessions.finalize(upload_id)
+    assert info.value.status == 409
+    stream.release.set()
+    worker.join(5)
+    assert sessions.finalize(upload_id)['sha256'] == hashlib.sha256(DATA).hexdigest()
+
+
+def test_chunk_for_removed_data_is_a_conflict(sessions):
+    upload_id = sessions.init('a.wav', len(DATA), chunk_size=CHUNK)['upload_id']
+    os.remove(os.path.join(sessions.root, upload_id, 'data.part'))
+    with pytest.raises(UploadError) as info:
+        _put(sessions, upload_id, 0)
+    assert info.value.status == 409
+
+
+def test_checksum_mismatches_are_rejected(sessions):
+    upload_id = sessions.init('a.wav', len(DATA), chunk_size=CHUNK, sha256='0' * 64)['upload_id']
+    with pytest.raises(UploadError) as info:
+        sessions.put_chunk(upload_id, 0, io.BytesIO(_chunk(0)), chunk_sha256='f' * 64)
+    assert info.value.status == 422
+    for index in range(4):
+        _put(sessions, upload_id, index)
+    with pytest.raises(UploadError) as info:
+        sessions.finalize(upload_id)
+    assert info.value.status == 422
+
+
+@pytest.mark.parametrize('index, data, status', [
+    (0, b'short', 400),
+    (3, os.urandom(2000), 400),
+    (4, b'', 416),
+])
+def test_bad_chunks_are_rejected(sessions, index, data, status):
+    upload_id = sessions.init('a.wav', len(DATA), chunk_size=CHUNK)['upload_id']
+    with pytest.raises(UploadError) as info:
+        _put(sessions, upload_id, index, data)
+    assert info.value.status == status
+
+
+def test_uploads_are_private_to_their_user(sessions):
+    upload_id = sessions.init('a.wav', 100, user_id='alice')['upload_id']
+    with pytest.raises(UploadError) as info:
+        sessions.status(upload_id, 'bob')
+    assert info.value.status == 404
+    with pytest.raises(UploadError):
+        sessions.status('../etc', 'alice')
+
+
+def test_expired_sessions_are_collected(sessions, monkeypatch):
+    upload_id = sessions.init('a.wav', 100)['upload_id']
+    monkeypatch.setenv('UPLOAD_SESSION_TTL_SECONDS', '0')
+    time.sleep(0.01)
+    assert sessions.collect_garbage(force=True) == 1
+    with pytest.raises(UploadError):
+        sessions.status(upload_id)
+
+
+def test_http_flow(sessions, monkeypatch):
+    monkeypatch.setattr(uploads, 'upload_sessions', sessions)
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.register_blueprint(uploads.upload_bp)
+    client = app.test_client()
+
+    status = client.post('/api/upload/init', json={'filename': 'a.wav', 'size': len(DATA), 'chunk_size': CHUNK}).get_json()
+    upload_id = status['upload_id']
+    for index in range(status['total_chunks']):
+        r = client.put(f'/api/upload/{upload_id}/chunk/{index}', data=_chunk(index),
+                       headers={'X-Chunk-SHA256': hashlib.sha256(_chunk(index)).hexdigest()})
+        assert r.status_code == 200
+    r = client.post(f'/api/upload/{upload_id}/finalize')
+    assert r.get_json()['sha256'] == hashlib.sha256(DATA).hexdigest()
+    assert client.delete(f'/api/upload/{upload_id}').status_code == 200
+    assert client.get(f'/api/upload/{upload_id}').status_code == 404
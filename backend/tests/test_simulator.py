@@ -0,0 +1,53 @@
+import json
+
+import requests
+
+from simulator.config import Sampler, _merge, load_config
+from simulator.server import render_response
+
+
+def test_render_response_uses_first_matching_rule_and_groups():
+    rules = [
+        {'match': r'Layout: graph (?P<dir>TD|LR)', 'content': 'graph ${dir} for ${model}'},
+        {'match': r'(?s).*', 'content': 'fallback'},
+    ]
+    assert render_response(rules, 'Layout: graph LR', {'model': 'm'}) == 'graph LR for m'
+    assert render_response(rules, 'other', {}) == 'fallback'
+
+
+def test_render_response_each_builds_json_array():
+    rules = [{'match': 'Grade', 'each': r'### Item (?P<index>\d+)', 'content': '{"index": ${index}}'}]
+    text = 'Grade\n### Item 1\n...\n### Item 2\n'
+    assert json.loads(render_response(rules, text, {})) == [{'index': 1}, {'index': 2}]
+
+
+def test_user_rules_take_precedence_over_defaults():
+    config = _merge(load_config(), {'endpoints': {'chat': {'rules': [{'match': 'x', 'content': 'mine'}],
+                                                           'error_rate': 0.5}}})
+    chat = config['endpoints']['chat']
+    assert chat['rules'][0]['content'] == 'mine'
+    assert len(chat['rules']) > 1
+    assert chat['error_rate'] == 0.5
+    assert chat['latency'] == load_config()['endpoints']['chat']['latency']
+
+
+def test_seeded_sampler_is_reproducible():
+    spec = {'dist': 'lognormal', 'median_ms': 100, 'sigma': 0.5}
+    a, b = Sampler(3), Sampler(3)
+    assert [a.latency(spec) for _ in range(5)] == [b.latency(spec) for _ in range(5)]
+
+
+def test_chat_endpoint_and_error_injection(make_simulator):
+    server = make_simulator({'chat': {'error_rate': 1.0, 'error_statuses': [503]}})
+    r = requests.post(f'{server.url}/v1/chat/completions',
+                      json={'model': 'deepseek-chat', 'messages': [{'role': 'user', 'content': 'hi'}]})
+    assert r.status_code == 503
+    assert server.stats['chat'] == {'requests': 1, 'errors': 1, 'timeouts': 0, 'disconnects': 0}
+
+
+def test_chat_completion_shape(make_simulator):
+    server = make_simulator()
+    r = requests.post(f'{server.url}/v1/chat/completions',
+                      json={'model': 'deepseek-chat', 'messages': [{'role': 'user', 'content': 'hi'}]})
+    body = r.json()
+    assert body['choices'][0]['message']['content'] == 'This is a simulated response from deepseek-chat.'
@@ -0,0 +1,47 @@
+import threading
+import time
+
+from services.single_flight import SingleFlight, make_key
+
+
+def test_concurrent_callers_share_one_call(tmp_db):
+    flight = SingleFlight(poll_interval=0.01)
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return {'n': len(calls)}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.run(make_key('k'), slow)))
+               for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert results == [{'n': 1}] * 5
+
+
+def test_finished_result_is_not_reused_by_later_callers(tmp_db):
+    flight = SingleFlight(poll_interval=0.01, result_ttl=60)
+    counter = iter(range(1, 100))
+    key = make_key('similar', 'u', 1, 3, True)
+    assert flight.run(key, lambda: next(counter)) == 1
+    # 结果仍在 ai_request_lock 表里，但后到的调用（如强制重新生成）必须重新执行
+    assert flight.run(key, lambda: next(counter)) == 2
+
+
+def test_other_worker_waiting_on_running_call_gets_its_result(tmp_db):
+    flight = SingleFlight(poll_interval=0.01)
+    key = make_key('mindmap')
+    state, _ = tmp_db.acquire_request_lock(key, 'other-worker', 30)
+    assert state == 'acquired'
+
+    def publish():
+        time.sleep(0.1)
+        tmp_db.complete_request_lock(key, 'other-worker', '"shared"', 10)
+
+    threading.Thread(target=publish).start()
+    assert flight.run(key, lambda: 'own') == 'shared'
@@ -0,0 +1,98 @@
+import pytest
+
+from services import streaming_asr
+from services.ai_service import ai_service
+from services.streaming_asr import FRAME_BYTES, TranscriptionStream
+
+
+def _frames(count, start=0):
+    return b''.join(bytes([(start + i) % 256]) * FRAME_BYTES for i in range(count))
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    """替换讯飞流式会话：取完本会话的帧；outcomes 里依次给出每个会话的错误（None 表示成功）"""
+    received = []
+    outcomes = []
+
+    def fake(next_frame, language='zh_cn', on_update=None):
+        frames = []
+        while True:
+            frame = next_frame()
+            if frame is None:
+                break
+            frames.append(frame[0])
+        received.append(frames)
+        error = outcomes.pop(0) if outcomes else None
+        if error:
+            return None, error
+        return ' '.join(str(f) for f in frames), None
+
+    monkeypatch.setattr(ai_service, 'stream_xfyun', fake)
+    monkeypatch.setenv('ASR_STREAM_IDLE_SECONDS', '2')
+    return received, outcomes
+
+
+def _run(frames):
+    stream = TranscriptionStream()
+    stream.feed(frames)
+    stream.close()
+    assert stream.wait(5)
+    return stream
+
+
+def test_failed_session_frames_are_resent(sessions):
+    received, outcomes = sessions
+    outcomes.append('connection reset')
+    stream = _run(_frames(5))
+    assert received == [[0, 1, 2, 3, 4], [0, 1, 2, 3, 4]]
+    assert stream.text == '0 1 2 3 4'
+    assert stream.error is None
+    done = stream.events_after(0, 0)[-1]
+    assert done['type'] == 'done' and done['lost_seconds'] == 0
+    assert [e['type'] for e in stream.events_after(0, 0)] == ['error', 'final', 'done']
+
+
+def test_rollover_session_keeps_order_after_failure(sessions, monkeypatch):
+    received, outcomes = sessions
+    monkeypatch.setattr(streaming_asr, '_session_bytes', lambda: 3 * FRAME_BYTES)
+    outcomes.extend([None, 'timeout'])
+    stream = _run(_frames(7))
+    assert received == [[0, 1, 2], [3, 4, 5], [3, 4, 5], [6]]
+    assert stream.text == '0 1 2 3 4 5 6'
+
+
+def test_gap_is_reported_when_retries_run_out(sessions, monkeypatch):
+    received, outcomes = sessions
+    monkeypatch.setenv('ASR_STREAM_MAX_FAILURES', '2')
+    outcomes.extend(['boom', 'boom'])
+    stream = _run(_frames(50))
+    assert stream.error == 'boom'
+    done = stream.events_after(0, 0)[-1]
+    assert done['lost_seconds'] == pytest.approx(50 * FRAME_BYTES / 32000, abs=0.01)
+
+
+def test_auto_language_is_probed_before_the_first_session(sessions, monkeypatch):
+    received, _ = sessions
+    probed = []
+    monkeypatch.setattr(ai_service, 'detect_language', lambda audio: probed.append(len(audio)) or 'en_us')
+    monkeypatch.setenv('ASR_LANGUAGE_PROBE_SECONDS', str(3 * FRAME_BYTES / 32000))
+    stream = TranscriptionStream('auto')
+    stream.feed(_frames(5))
+    stream.close()
+    assert stream.wait(5)
+    # 探测用的帧作为第一个会话的开头发送，不丢也不重复
+    assert probed == [3 * FRAME_BYTES]
+    assert stream.language == 'en_us'
+    assert received == [[0, 1, 2, 3, 4]]
+
+
+def test_auto_language_on_a_recording_shorter_than_the_probe(sessions, monkeypatch):
+    received, _ = sessions
+    monkeypatch.setattr(ai_service, 'detect_language', lambda audio: None)
+    stream = TranscriptionStream('auto')
+    stream.feed(_frames(2))
+    stream.close()
+    assert stream.wait(5)
+    assert stream.language == 'zh_cn'
+    assert received == [[0, 1]] and stream.text == '0 1'
@@ -0,0 +1,54 @@
+import base64
+
+from services.transport import AITransport, DashScopeResponse, _inline_local_images
+
+
+def test_clients_are_created_lazily_and_reused(monkeypatch):
+    transport = AITransport()
+    assert transport._clients == {}
+    monkeypatch.setenv('DEEPSEEK_API_KEY', 'k')
+    client = transport.openai_client('deepseek')
+    assert transport.openai_client('deepseek') is client
+    assert transport.http_session('dashscope') is transport.http_session('dashscope')
+    assert set(transport._clients) == {'deepseek', 'dashscope:session'}
+
+
+def test_extra_provider_config_from_env(monkeypatch):
+    transport = AITransport()
+    monkeypatch.setenv('AI_PROVIDER_BACKUP_BASE_URL', 'http://backup.local/v1')
+    monkeypatch.setenv('AI_PROVIDER_BACKUP_API_KEY', 'secret')
+    monkeypatch.setenv('AI_PROVIDER_BACKUP_MODEL', 'backup-chat')
+    assert transport.base_url('backup') == 'http://backup.local/v1'
+    assert transport.api_key('backup') == 'secret'
+    assert transport.model('backup', 'deepseek-chat') == 'backup-chat'
+    assert transport.model('deepseek', 'deepseek-chat') == 'deepseek-chat'
+
+
+def test_call_timeout_never_exceeds_remaining_budget(monkeypatch):
+    monkeypatch.setenv('AI_READ_TIMEOUT', '120')
+    monkeypatch.setenv('AI_CONNECT_TIMEOUT', '5')
+    timeout = AITransport().call_timeout(2.0)
+    assert timeout.read == 2.0
+    assert timeout.connect == 2.0
+
+
+def test_local_images_are_inlined_as_data_uri(tmp_path):
+    image = tmp_path / 'q.png'
+    image.write_bytes(b'\x89PNG-data')
+    messages = [{'role': 'user', 'content': [{'text': 'read'}, {'image': f'file://{image}'}]}]
+    inlined = _inline_local_images(messages)
+    assert inlined[0]['content'][0] == {'text': 'read'}
+    assert inlined[0]['content'][1]['image'] == 'data:image/png;base64,' + base64.b64encode(b'\x89PNG-data').decode()
+    # 原消息不被修改
+    assert messages[0]['content'][1]['image'].startswith('file://')
+
+
+def test_dashscope_response_matches_sdk_shape():
+    response = DashScopeResponse(200, {
+        'output': {'choices': [{'finish_reason': 'stop',
+                                'message': {'role': 'assistant', 'content': [{'text': 'hi'}]}}]},
+        'usage': {'input_tokens': 3}
+    })
+    assert response.status_code == 200
+    assert response.output.choices[0].message.content[0]['text'] == 'hi'
+    assert response.usage == {'input_tokens': 3}
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from services.vad import SilenceTrimmer, trim_silence
+
+RATE = 16000
+
+
+def _speech(seconds, rms, seed=0):
+    """按 4Hz 音节起伏调制的噪声，平均 RMS 约为 rms"""
+    t = np.arange(int(seconds * RATE)) / RATE
+    envelope = rms * (1 + 0.2 * np.sin(2 * np.pi * 4 * t))
+    return (np.random.default_rng(seed).normal(0, 1, len(t)) * envelope).astype('<i2').tobytes()
+
+
+def _floor(seconds, rms=30, seed=1):
+    return np.random.default_rng(seed).normal(0, rms, int(seconds * RATE)).astype('<i2').tobytes()
+
+
+@pytest.mark.parametrize('rms', [150, 250])
+def test_steady_quiet_speech_is_kept(rms):
+    _, report = trim_silence(_speech(20, rms))
+    assert report['removed_ratio'] == 0.0
+
+
+def test_pauses_are_compressed():
+    audio = b''.join(_speech(5, 3000, seed=i) + _floor(3, seed=10 + i) for i in range(4))
+    trimmed, report = trim_silence(audio, keep_silence=0.6)
+    assert report['compressed_pauses'] == 3
+    # 语音全部保留，每个停顿只剩约 0.6 秒，结尾的静音丢弃
+    assert 20 <= report['kept_seconds'] <= 20 + 3 * 0.7 + 0.4
+    assert len(trimmed) == pytest.approx(report['kept_seconds'] * RATE * 2, abs=2)
+
+
+def test_quiet_speech_between_pauses():
+    audio = b''.join(_speech(5, 200, seed=i) + _floor(3, seed=10 + i) for i in range(4))
+    _, report = trim_silence(audio)
+    assert report['compressed_pauses'] == 3
+    assert report['kept_seconds'] >= 20
+
+
+def test_silence_below_min_rms_is_dropped():
+    _, report = trim_silence(_floor(10))
+    assert report['removed_ratio'] > 0.9
+
+
+def test_streaming_matches_chunk_boundaries():
+    audio = _speech(3, 3000) + _floor(4) + _speech(3, 3000, seed=2)
+    trimmer = SilenceTrimmer(keep_silence=0.6)
+    # 不对齐帧的小块
+    out = b''.join(trimmer.trim(audio[i:i + 3333] for i in range(0, len(audio), 3333)))
+    report = trimmer.report()
+    assert len(out) == trimmer.output_bytes
+    assert report['compressed_pauses'] == 1
+    assert 6 <= report['kept_seconds'] <= 6.8
@@ -159,22 +159,27 @@ class AIChatFloat {
         // Get AI response from backend
         this.showTyping();
         try {
-            const conversationHistory = this.messages
-                .filter(msg => msg.sender === 'user' || msg.sender === 'ai')
-                .map(msg => ({
-                    role: msg.sender === 'user' ? 'user' : 'assistant',
-                    content: msg.text
-                }));
+            // History lives on the server; local history is sent once to seed older sessions
+            const payload = {
+                message: message,
+                session_id: this.currentSessionId
+            };
+            if (!this.currentSession.serverSynced) {
+                payload.history = this.messages
+                    .filter(msg => msg.sender === 'user' || msg.sender === 'ai')
+                    .slice(0, -1)
+                    .map(msg => ({
+                        role: msg.sender === 'user' ? 'user' : 'assistant',
+                        content: msg.text
+                    }));
+            }
 
             const response = await fetch('/api/chat/send', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({
-                    message: message,
-                    history: conversationHistory
-                })
+                body: JSON.stringify(payload)
             });
 
             if (!response.ok) {
@@ -186,6 +191,8 @@ class AIChatFloat {
             this.hideTyping();
             
             if (data.success) {
+                // Anonymous chats are not stored server-side, so keep sending local history
+                this.currentSession.serverSynced = data.persisted !== false;
                 this.addMessage(data.response, 'ai');
             } else {
                 this.addMessage('Sorry, I encountered an error. Please try again.', 'ai');
@@ -410,6 +417,7 @@ class AIChatFloat {
         if (!confirmed) return;
         
         this.sessions = this.sessions.filter(s => s.id !== sessionId);
+        this.clearServerHistory(sessionId);
         
         if (this.currentSessionId === sessionId) {
             if (this.sessions.length === 0) {
@@ -671,8 +679,17 @@ class AIChatFloat {
         this.loadSessions();
     }
     
+    clearServerHistory(sessionId) {
+        fetch('/api/chat/clear', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ session_id: sessionId })
+        }).catch(error => console.error('Error clearing chat history:', error));
+    }
+    
     clearChat() {
         if (this.currentSession) {
+            this.clearServerHistory(this.currentSessionId);
             this.currentSession.messages = [];
             this.currentSession.updatedAt = new Date().toISOString();
             this.saveSessions();
@@ -19,6 +19,9 @@ class NoteAssistantManager {
         this.currentEditingNoteId = null;
         this.allNotesData = null;  // 存储所有笔记数据，用于筛选
         this.uploadedFile = null;
+        this.liveStream = null;  // 实时转写（录音时边录边识别）
+        this.liveResult = Promise.resolve(false);  // 本次录音的实时转写是否成功拿到完整文字
+        this.language = 'auto';  // 识别语种：auto（服务端按开头探测）/ zh_cn / en_us，上传转写与实时转写共用
         this.init();
     }
     
@@ -400,7 +403,14 @@ class NoteAssistantManager {
     }
     
     async handleAudioGenerate() {
-        if (!this.audioBlob) return;
+        if (!this.audioBlob) {
+            // 录音已由实时转写识别完：直接用输入框里的文字生成笔记，不再上传录音
+            const textarea = document.getElementById('manualTextInput');
+            if (textarea && textarea.value.trim()) {
+                await this.generateNoteFromManualInput();
+            }
+            return;
+        }
         
         const audioGenerateBtn = document.getElementById('audioGenerateBtn');
         
@@ -410,6 +420,7 @@ class NoteAssistantManager {
             
             const formData = new FormData();
             formData.append('audio', this.audioBlob, this.audioFileName || 'recording.webm');
+            formData.append('language', this.language);
             
             const transcribeResponse = await fetch('/api/note/transcribe', {
                 method: 'POST',
@@ -492,7 +503,16 @@ class NoteAssistantManager {
                 }
             };
             
-            this.mediaRecorder.onstop = () => {
+            this.mediaRecorder.onstop = async () => {
+                if (await this.liveResult) {
+                    // 实时转写已经把完整文字写进输入框：不保留录音，生成按钮直接用文字生成笔记
+                    this.audioChunks = [];
+                    this.updateRecordingUI();
+                    const audioGenerateBtn = document.getElementById('audioGenerateBtn');
+                    if (audioGenerateBtn) audioGenerateBtn.disabled = false;
+                    Utils.showNotification('Recording complete!', 'success');
+                    return;
+                }
                 this.audioBlob = new Blob(this.audioChunks, { type: 'audio/webm' });
                 this.audioFileName = 'recording.webm'; 
                 console.log('record complete, size:', this.audioBlob.size, 'bytes');
@@ -504,6 +524,7 @@ class NoteAssistantManager {
             };
             
             this.mediaRecorder.start();
+            this.startLiveTranscription(stream);
             this.isRecording = true;
             this.recordingTime = 0;
             
@@ -519,6 +540,8 @@ class NoteAssistantManager {
     }
     
     stopRecording() {
+        // onstop 等实时转写的结果决定是否还需要上传整段录音
+        this.liveResult = this.stopLiveTranscription();
         if (this.mediaRecorder && this.isRecording) {
             this.mediaRecorder.stop();
             this.mediaRecorder.stream.getTracks().forEach(track => track.stop());
@@ -529,6 +552,104 @@ class NoteAssistantManager {
         this.updateRecordingUI();
     }
     
+    /**
+     * 实时转写：麦克风 PCM（16kHz 16-bit）每 250ms 上传一次，识别结果通过 SSE 实时写入输入框。
+     * 失败时静默退回到录音结束后上传整段音频的方式。
+     */
+    async startLiveTranscription(mediaStream) {
+        try {
+            const response = await fetch(window.getApiUrl('/api/note/stream'), {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ language: this.language })
+            });
+            const data = await response.json();
+            if (!data.success) throw new Error(data.error);
+
+            const live = {
+                id: data.stream_id,
+                finals: [],
+                partial: '',
+                pending: [],
+                upload: Promise.resolve(),
+                context: new AudioContext({ sampleRate: data.sample_rate })
+            };
+            const source = live.context.createMediaStreamSource(mediaStream);
+            live.processor = live.context.createScriptProcessor(4096, 1, 1);
+            live.processor.onaudioprocess = (event) => {
+                const samples = event.inputBuffer.getChannelData(0);
+                const pcm = new Int16Array(samples.length);
+                for (let i = 0; i < samples.length; i++) {
+                    pcm[i] = Math.max(-1, Math.min(1, samples[i])) * 0x7fff;
+                }
+                live.pending.push(pcm);
+            };
+            source.connect(live.processor);
+            live.processor.connect(live.context.destination);
+            live.timer = setInterval(() => this.flushLiveAudio(live), 250);
+
+            live.events = new EventSource(window.getApiUrl(`/api/note/stream/${live.id}/events`));
+            const render = () => this.fillTextToInputBox(live.finals.join('') + live.partial, false);
+            live.events.addEventListener('partial', (e) => {
+                live.partial = JSON.parse(e.data).text;
+                render();
+            });
+            live.events.addEventListener('final', (e) => {
+                live.finals.push(JSON.parse(e.data).text);
+                live.partial = '';
+                render();
+            });
+            live.events.addEventListener('done', () => live.events.close());
+
+            this.liveStream = live;
+            console.log('Live transcription started:', live.id);
+        } catch (error) {
+            console.warn('Live transcription unavailable, will transcribe after recording:', error);
+            this.liveStream = null;
+        }
+    }
+
+    flushLiveAudio(live) {
+        if (!live.pending.length) return live.upload;
+        const length = live.pending.reduce((sum, chunk) => sum + chunk.length, 0);
+        const body = new Int16Array(length);
+        let offset = 0;
+        live.pending.forEach(chunk => { body.set(chunk, offset); offset += chunk.length; });
+        live.pending = [];
+        // 串行上传，保证音频顺序
+        live.upload = live.upload.then(() => fetch(window.getApiUrl(`/api/note/stream/${live.id}/audio`), {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/octet-stream' },
+            body: body.buffer
+        })).catch(error => console.warn('Live audio upload failed:', error));
+        return live.upload;
+    }
+
+    async stopLiveTranscription() {
+        const live = this.liveStream;
+        if (!live) return false;
+        this.liveStream = null;
+        clearInterval(live.timer);
+        live.processor.disconnect();
+        live.context.close();
+        try {
+            await this.flushLiveAudio(live);
+            const response = await fetch(window.getApiUrl(`/api/note/stream/${live.id}/stop`), { method: 'POST' });
+            const data = await response.json();
+            if (data.success && data.text) {
+                this.fillTextToInputBox(data.text);
+                Utils.showNotification(`Recognition successful! Total ${data.length} characters`, 'success');
+                // 有音频没能识别（lost_seconds > 0）时文字不完整，仍保留录音以便整段重新识别
+                return !data.lost_seconds;
+            }
+        } catch (error) {
+            console.warn('Live transcription failed:', error);
+        } finally {
+            live.events.close();
+        }
+        return false;
+    }
+    
     async handleTranscribeOrGenerate() {
         if (this.audioBlob) {
             await this.transcribeAudio();
@@ -556,6 +677,7 @@ class NoteAssistantManager {
             
             const fileName = this.audioFileName || 'recording.webm';
             formData.append('audio', this.audioBlob, fileName);
+            formData.append('language', this.language);
             
             console.log('Uploading file:', fileName);
             
@@ -594,7 +716,7 @@ class NoteAssistantManager {
         }
     }
     
-    fillTextToInputBox(text) {
+    fillTextToInputBox(text, highlight = true) {
         if (!text) return;
         
         const textarea = document.getElementById('manualTextInput');
@@ -615,6 +737,9 @@ class NoteAssistantManager {
                 }
             }
             
+            // 实时转写时频繁更新，不滚动、不闪烁
+            if (!highlight) return;
+
             textarea.scrollIntoView({ behavior: 'smooth', block: 'center' });
             
             textarea.style.transition = 'background-color 0.3s';